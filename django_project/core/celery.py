@@ -59,6 +59,18 @@ app.conf.beat_schedule = {
     'sync-default-layers': {
         'task': 'sync_default_layers',
         'schedule': crontab(minute='0', hour='1'),  # Run everyday at 1am
+    },
+    'check-celery-background-tasks': {
+        'task': 'check_celery_background_tasks',
+        'schedule': crontab(minute='*/15'),  # Run every 15 minutes
+    },
+    'dispatch-scenario-tasks': {
+        'task': 'dispatch_scenario_tasks',
+        'schedule': crontab(minute='*'),  # Run every minute
+    },
+    'reap-scenario-directories': {
+        'task': 'reap_scenario_directories',
+        'schedule': crontab(minute='30'),  # Run every hour
     }
 }
 
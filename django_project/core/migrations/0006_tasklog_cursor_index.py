@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0005_sitepreferences_layer_days_to_keep'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='tasklog',
+            name='core_tasklo_content_a6bd52_idx',
+        ),
+        migrations.AddIndex(
+            model_name='tasklog',
+            index=models.Index(fields=['content_type', 'object_id', 'id'], name='core_tasklog_ct_obj_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:40
+
+import core.models.preferences
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_tasklog_cursor_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitepreferences',
+            name='scheduler_config',
+            field=models.JSONField(blank=True, default=core.models.preferences.default_scheduler_config, help_text='Scenario scheduler configuration: concurrency cap per user, priority by user role, fast lane extent and queue capacity.'),
+        ),
+    ]
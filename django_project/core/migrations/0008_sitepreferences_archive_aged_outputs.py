@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_sitepreferences_scheduler_config'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitepreferences',
+            name='archive_aged_outputs',
+            field=models.BooleanField(default=False, help_text='Move output layers older than layer_days_to_keep to archive storage instead of removing them.'),
+        ),
+    ]
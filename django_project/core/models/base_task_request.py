@@ -1,3 +1,4 @@
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 import uuid
 from django.utils.translation import gettext_lazy as _
@@ -5,7 +6,12 @@ from django.conf import settings
 from django.utils import timezone
 import logging
 from traceback import format_tb
-from core.models.task_log import TaskLog
+from core.models.task_log import TaskLog, TaskLogBuffer
+from core.tools.task_state import (
+    TASK_STATE_FIELDS,
+    set_task_state,
+    get_task_state
+)
 
 
 class TaskStatus(models.TextChoices):
@@ -128,6 +134,85 @@ class BaseTaskRequest(models.Model):
             return name
         return '-'
 
+    def cache_state(self, **state):
+        """Store task state in Redis.
+
+        Current values of status, progress, progress_text and last_update
+        are stored when no state is given.
+        """
+        if not state:
+            state = {
+                field: getattr(self, field) for field in TASK_STATE_FIELDS
+            }
+        return set_task_state(self.uuid, **state)
+
+    def apply_cached_state(self):
+        """Overlay task state from Redis if it is newer than database.
+
+        :return: True if cached state is applied
+        :rtype: bool
+        """
+        state = get_task_state(self.uuid)
+        if not state or not state.get('last_update'):
+            return False
+        if self.last_update and state['last_update'] <= self.last_update:
+            return False
+        for field, value in state.items():
+            setattr(self, field, value)
+        return True
+
+    def get_logs(self):
+        """Return logs queryset of this task.
+
+        ContentType is resolved from Django's content type cache, so
+        no additional query is needed after the first lookup.
+        """
+        return TaskLog.objects.filter(
+            content_type=ContentType.objects.get_for_model(self),
+            object_id=self.pk
+        )
+
+    def enable_log_buffer(self, max_size=None, max_seconds=None):
+        """Buffer logs in memory and write them in batches.
+
+        Buffered logs are flushed on size/time threshold, when the task
+        is finished and when flush_logs is called.
+
+        :param max_size: number of logs to trigger flush
+        :type max_size: int, optional
+        :param max_seconds: max age of buffered logs in seconds
+        :type max_seconds: float, optional
+        """
+        self._log_buffer = TaskLogBuffer(
+            max_size=max_size or settings.TASK_LOG_BUFFER_SIZE,
+            max_seconds=(
+                max_seconds if max_seconds is not None else
+                settings.TASK_LOG_BUFFER_SECONDS
+            )
+        )
+
+    def should_flush_logs(self):
+        """Check whether buffered logs have reached the time threshold.
+
+        :return: True if there are buffered logs to be flushed
+        :rtype: bool
+        """
+        log_buffer = getattr(self, '_log_buffer', None)
+        if log_buffer is None:
+            return False
+        return log_buffer.should_flush()
+
+    def flush_logs(self):
+        """Write buffered logs to database.
+
+        :return: number of written logs
+        :rtype: int
+        """
+        log_buffer = getattr(self, '_log_buffer', None)
+        if log_buffer is None:
+            return 0
+        return log_buffer.flush()
+
     def add_log(self, log, level=logging.INFO):
         task_log = TaskLog(
             content_object=self,
@@ -135,7 +220,11 @@ class BaseTaskRequest(models.Model):
             level=level,
             date_time=timezone.now()
         )
-        task_log.save()
+        log_buffer = getattr(self, '_log_buffer', None)
+        if log_buffer is not None:
+            log_buffer.add(task_log)
+        else:
+            task_log.save()
 
     def task_on_sent(self, task_id, task_name, parameters):
         self.task_id = task_id
@@ -154,6 +243,7 @@ class BaseTaskRequest(models.Model):
                 'errors'
             ]
         )
+        self.cache_state()
 
     def task_on_queued(self, task_id, task_name, parameters):
         """
@@ -170,6 +260,7 @@ class BaseTaskRequest(models.Model):
             update_fields=['task_id', 'task_name',
                            'parameters', 'last_update', 'status']
         )
+        self.cache_state()
 
     def task_on_started(self):
         """Initialize fields when task is started."""
@@ -184,6 +275,7 @@ class BaseTaskRequest(models.Model):
             'status', 'started_at', 'finished_at', 'progress',
             'progress_text', 'last_update', 'errors'
         ])
+        self.cache_state()
         self.add_log('Task has been started.')
 
     def task_on_completed(self):
@@ -196,16 +288,20 @@ class BaseTaskRequest(models.Model):
             update_fields=['last_update', 'status', 'finished_at',
                            'progress', 'progress_text']
         )
+        self.cache_state()
         self.add_log('Task has been completed.')
+        self.flush_logs()
 
     def task_on_cancelled(self):
         self.last_update = timezone.now()
         self.status = TaskStatus.CANCELLED
         self.task_id = None
         self.add_log('Task has been cancelled.')
+        self.flush_logs()
         self.save(
             update_fields=['last_update', 'status', 'task_id']
         )
+        self.cache_state()
 
     def task_on_errors(self, exception=None, traceback=None):
         self.last_update = timezone.now()
@@ -221,10 +317,12 @@ class BaseTaskRequest(models.Model):
         self.stack_trace_errors = ex_msg
         self.add_log('Task is stopped with errors.', logging.ERROR)
         self.add_log(str(exception), logging.ERROR)
+        self.flush_logs()
         self.save(
             update_fields=['last_update', 'status',
                            'errors', 'stack_trace_errors']
         )
+        self.cache_state()
 
     def task_on_retried(self, reason):
         self.last_update = timezone.now()
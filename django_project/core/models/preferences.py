@@ -18,6 +18,25 @@ def default_output_group_to_keep():
     return ["weighted_ims"]
 
 
+def default_scheduler_config():
+    """
+    Default value for Preference's scheduler_config.
+    """
+    return {
+        'max_running_per_user': 2,
+        'role_priority': {'Internal': 10, 'External': 0},
+        'fast_lane_max_area_km2': 2500,
+        'fast_lane_max_runtime_seconds': 600,
+        'queue_capacity': {'cplus': 4, 'cplus_fast': 2},
+        'max_estimated_disk_gb': 200,
+        'max_estimated_ram_gb': 48,
+        'tiling_min_pixels': 2000000000,
+        'tile_size_pixels': 20000,
+        'tile_overlap_pixels': 64,
+        'max_tiles': 64
+    }
+
+
 class SitePreferences(SingletonModel):
     """Preference settings specifically for website.
 
@@ -51,6 +70,21 @@ class SitePreferences(SingletonModel):
         default=14,
         help_text='Keep input/output layers until X days.'
     )
+    archive_aged_outputs = models.BooleanField(
+        default=False,
+        help_text=(
+            'Move output layers older than layer_days_to_keep to archive '
+            'storage instead of removing them.'
+        )
+    )
+    scheduler_config = models.JSONField(
+        default=default_scheduler_config,
+        blank=True,
+        help_text=(
+            'Scenario scheduler configuration: concurrency cap per user, '
+            'priority by user role, fast lane extent and queue capacity.'
+        )
+    )
 
     class Meta:  # noqa: D106
         verbose_name_plural = "site preferences"
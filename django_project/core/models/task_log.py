@@ -1,3 +1,4 @@
+import time
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
@@ -16,5 +17,70 @@ class TaskLog(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=["content_type", "object_id"]),
+            # supports incremental log retrieval using id as cursor
+            models.Index(
+                fields=["content_type", "object_id", "id"],
+                name="core_tasklog_ct_obj_id_idx"
+            ),
         ]
+
+
+class TaskLogBuffer(object):
+    """Collect task logs in memory and write them using bulk_create.
+
+    Logs are flushed when the buffer reaches max_size entries or when
+    the oldest entry has waited more than max_seconds.
+    """
+
+    def __init__(self, max_size=50, max_seconds=2):
+        """Initialize TaskLogBuffer.
+
+        :param max_size: number of entries to trigger flush, defaults to 50
+        :type max_size: int, optional
+        :param max_seconds: max age of buffered entries, defaults to 2
+        :type max_seconds: float, optional
+        """
+        self.max_size = max_size
+        self.max_seconds = max_seconds
+        self.entries = []
+        self.first_entry_time = None
+
+    def add(self, task_log: TaskLog):
+        """Add unsaved TaskLog to the buffer.
+
+        :param task_log: TaskLog object
+        :type task_log: TaskLog
+        """
+        if not self.entries:
+            self.first_entry_time = time.monotonic()
+        self.entries.append(task_log)
+        if self.should_flush():
+            self.flush()
+
+    def should_flush(self):
+        """Check whether buffer has reached size or time threshold.
+
+        :return: True if buffer should be flushed
+        :rtype: bool
+        """
+        if not self.entries:
+            return False
+        if len(self.entries) >= self.max_size:
+            return True
+        return (
+            time.monotonic() - self.first_entry_time >= self.max_seconds
+        )
+
+    def flush(self):
+        """Write buffered entries to database.
+
+        :return: number of written entries
+        :rtype: int
+        """
+        entries = self.entries
+        self.entries = []
+        self.first_entry_time = None
+        if not entries:
+            return 0
+        TaskLog.objects.bulk_create(entries)
+        return len(entries)
@@ -83,6 +83,17 @@ STORAGES = {
           "endpoint_url": os.environ.get("MINIO_ENDPOINT"),
         },
     },
+    "output_archive_storage": {
+        "BACKEND": "storages.backends.s3.S3Storage",
+        "OPTIONS": {
+          "access_key": os.environ.get("S3_AWS_ACCESS_KEY_ID"),
+          "secret_key": os.environ.get("S3_AWS_SECRET_ACCESS_KEY"),
+          "bucket_name": os.environ.get("AWS_S3_BUCKET_NAME"),
+          "file_overwrite": True,
+          "endpoint_url": os.environ.get("AWS_S3_ENDPOINT"),
+          "session_profile": None
+        },
+    },
 }
 
 # enable session auth in swagger for dev
@@ -47,6 +47,56 @@ CODE_COMMIT_HASH = code_commit_release_version()
 
 # PATH To temporary referencer layers
 TEMPORARY_LAYER_DIR = '/home/web/user_data'
+# Working directory of scenario analysis, e.g. tmpfs or NVMe volume
+SCRATCH_DIR = os.environ.get('SCRATCH_DIR', '/home/web/media')
+# set to 0 to only check free disk space of SCRATCH_DIR
+SCRATCH_QUOTA_GB = float(os.environ.get('SCRATCH_QUOTA_GB', 0))
+# Reserved scratch space is estimated disk usage multiplied by this factor
+SCRATCH_RESERVE_FACTOR = 1.2
+# Reaper keeps directories of finished tasks that are modified recently
+SCRATCH_REAPER_GRACE_SECONDS = 6 * 3600
+
+# Redis connection used for task events
+REDIS_URL = (
+    f'redis://default:{os.environ.get("REDIS_PASSWORD", "")}'
+    f'@{os.environ.get("REDIS_HOST", "")}'
+)
+# Publish scenario progress/logs to Redis pub/sub for streaming clients
+TASK_EVENT_STREAM_ENABLED = True
+# Stream served by uWSGI (fallback), keep below uwsgi harakiri,
+# clients reconnect using the retry hint
+SCENARIO_STREAM_MAX_SECONDS = 20
+# Stream served by the ASGI application does not hold a worker
+SCENARIO_ASGI_STREAM_MAX_SECONDS = 600
+SCENARIO_STREAM_RETRY_MS = 1000
+# Worker writes task logs in batches using bulk_create
+TASK_LOG_BUFFER_SIZE = 50
+TASK_LOG_BUFFER_SECONDS = 2
+# Keep volatile task state in Redis, database is updated on transitions
+# and on checkpoint interval
+TASK_STATE_CACHE_ENABLED = True
+TASK_STATE_TTL = 24 * 3600
+TASK_STATE_CHECKPOINT_SECONDS = 10
+# Sweeper for queued/running tasks without update, e.g. worker is lost
+TASK_SWEEPER_INTERRUPTED_AFTER_SECONDS = 1800
+TASK_SWEEPER_INSPECT_TIMEOUT = 5
+# set to 0 to disable resubmission of interrupted tasks
+TASK_SWEEPER_MAX_RESUBMIT = 2
+TASK_SWEEPER_BACKOFF_SECONDS = 60
+# Maximum number of scenarios created from a parameter grid
+SCENARIO_BATCH_MAX_SIZE = 50
+# Broadcast removal of batch input cache to every worker host
+SCENARIO_BATCH_BROADCAST_CLEANUP = True
+# Retention task removes layers in batches, and resubmits itself
+# to continue when it runs longer than max seconds
+LAYER_RETENTION_BATCH_SIZE = 1000
+LAYER_RETENTION_MAX_SECONDS = 1800
+# Presigned URLs of upload parts expire after these seconds, unfinished
+# multipart upload is aborted when its session is not extended
+MULTIPART_UPLOAD_URL_EXPIRES_IN = 3 * 3600
+MULTIPART_UPLOAD_SESSION_DAYS = 7
+# Maximum number of part URLs that are presigned in a request
+MULTIPART_UPLOAD_URL_PAGE_SIZE = 100
 
 
 # s3
@@ -57,6 +107,9 @@ AWS_TRANSFER_CONFIG = TransferConfig(
     use_threads=True,
     max_concurrency=10
 )
+# server-side copy using UploadPartCopy
+S3_COPY_PART_SIZE = 512 * MB
+S3_COPY_MAX_CONCURRENCY = 10
 STORAGES = {
     "default": {
         "BACKEND": "storages.backends.s3.S3Storage",
@@ -79,4 +132,20 @@ STORAGES = {
           "transfer_config": AWS_TRANSFER_CONFIG
         },
     },
+    # aged outputs, use cheaper storage class e.g. STANDARD_IA/GLACIER_IR
+    "output_archive_storage": {
+        "BACKEND": "storages.backends.s3.S3Storage",
+        "OPTIONS": {
+          "bucket_name": os.environ.get(
+              "OUTPUT_ARCHIVE_BUCKET_NAME",
+              os.environ.get("AWS_S3_BUCKET_NAME")
+          ),
+          "file_overwrite": True,
+          "object_parameters": {
+              "StorageClass": os.environ.get(
+                  "OUTPUT_ARCHIVE_STORAGE_CLASS", "STANDARD")
+          },
+          "transfer_config": AWS_TRANSFER_CONFIG
+        },
+    },
 }
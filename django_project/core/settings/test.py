@@ -22,6 +22,16 @@ STORAGES = {
           "location": "/home/web/media/minio_test",
         },
     },
+    "output_archive_storage": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {
+          "location": "/home/web/media/archive_test",
+        },
+    },
 }
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+TASK_EVENT_STREAM_ENABLED = False
+TASK_STATE_CACHE_ENABLED = False
+SCENARIO_BATCH_BROADCAST_CLEANUP = False
@@ -0,0 +1,99 @@
+import mock
+import datetime
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from core.models.base_task_request import TaskStatus
+from core.tools.task_state import (
+    get_task_state_key,
+    set_task_state,
+    get_task_state,
+    clear_task_state
+)
+from cplus_api.tests.factories import ScenarioTaskF
+
+
+class FakeRedis(object):
+    """Fake redis client that stores hash in a dict."""
+
+    def __init__(self) -> None:
+        self.data = {}
+        self.expiry = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+    def hset(self, key, mapping=None):
+        self.data.setdefault(key, {})
+        self.data[key].update({
+            k.encode(): v.encode() for k, v in mapping.items()
+        })
+
+    def expire(self, key, seconds):
+        self.expiry[key] = seconds
+
+    def hgetall(self, key):
+        return self.data.get(key, {})
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@override_settings(TASK_STATE_CACHE_ENABLED=True)
+class TestTaskState(TestCase):
+
+    def setUp(self) -> None:
+        self.redis = FakeRedis()
+        patcher = mock.patch(
+            'core.tools.task_state.get_redis_client',
+            return_value=self.redis
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_set_get_task_state(self):
+        task_uuid = 'abc'
+        self.assertIsNone(get_task_state(task_uuid))
+        last_update = timezone.now()
+        self.assertTrue(set_task_state(
+            task_uuid, status=TaskStatus.RUNNING, progress=10.5,
+            last_update=last_update, invalid='test'
+        ))
+        self.assertIn(get_task_state_key(task_uuid), self.redis.expiry)
+        state = get_task_state(task_uuid)
+        self.assertEqual(state['status'], TaskStatus.RUNNING)
+        self.assertEqual(state['progress'], 10.5)
+        self.assertEqual(state['last_update'], last_update)
+        self.assertNotIn('invalid', state)
+        clear_task_state(task_uuid)
+        self.assertIsNone(get_task_state(task_uuid))
+
+    @override_settings(TASK_STATE_CACHE_ENABLED=False)
+    def test_task_state_disabled(self):
+        self.assertFalse(set_task_state('abc', progress=1))
+        self.assertFalse(self.redis.data)
+        self.assertIsNone(get_task_state('abc'))
+
+    def test_apply_cached_state(self):
+        scenario_task = ScenarioTaskF.create()
+        self.assertFalse(scenario_task.apply_cached_state())
+        scenario_task.task_on_started()
+        # transition is stored in both database and redis
+        state = get_task_state(scenario_task.uuid)
+        self.assertEqual(state['status'], TaskStatus.RUNNING)
+        self.assertFalse(scenario_task.apply_cached_state())
+        # progress from worker is only stored in redis
+        scenario_task.cache_state(
+            progress=50.0, progress_text='Running',
+            last_update=(
+                scenario_task.last_update + datetime.timedelta(seconds=5)
+            )
+        )
+        scenario_task.refresh_from_db()
+        self.assertEqual(scenario_task.progress, 0)
+        self.assertTrue(scenario_task.apply_cached_state())
+        self.assertEqual(scenario_task.progress, 50.0)
+        self.assertEqual(scenario_task.progress_text, 'Running')
+        self.assertEqual(scenario_task.status, TaskStatus.RUNNING)
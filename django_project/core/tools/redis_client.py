@@ -0,0 +1,48 @@
+"""Shared Redis client for lightweight task state and events."""
+import logging
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+_redis_client = None
+
+
+def get_redis_client():
+    """Return a process-wide Redis client.
+
+    The client is created lazily so that importing this module does not
+    open a connection; redis-py manages the underlying connection pool.
+
+    :return: Redis client
+    :rtype: redis.Redis
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=2,
+            socket_timeout=5,
+            health_check_interval=30
+        )
+    return _redis_client
+
+
+def get_async_redis_client():
+    """Return a new asyncio Redis client.
+
+    Connections of asyncio client are bound to the running event loop,
+    so the caller creates a client per stream and closes it with
+    aclose().
+
+    :return: asyncio Redis client
+    :rtype: redis.asyncio.Redis
+    """
+    return redis.asyncio.Redis.from_url(
+        settings.REDIS_URL,
+        socket_connect_timeout=2,
+        socket_timeout=5,
+        health_check_interval=30
+    )
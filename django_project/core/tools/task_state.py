@@ -0,0 +1,105 @@
+"""Fast task state store in Redis.
+
+Workers and celery handlers write the volatile task state (status,
+progress, progress_text, last_update) to a Redis hash, while the
+database is updated only on transitions and periodic checkpoints.
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+from core.tools.redis_client import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+TASK_STATE_FIELDS = ['status', 'progress', 'progress_text', 'last_update']
+
+
+def get_task_state_key(task_uuid):
+    """Return Redis key of task state.
+
+    :param task_uuid: UUID of the task
+    :type task_uuid: str
+    :return: Redis key
+    :rtype: str
+    """
+    return f'cplus:task:{str(task_uuid)}:state'
+
+
+def set_task_state(task_uuid, **state):
+    """Update task state in Redis.
+
+    Errors are logged and ignored because database remains the
+    source of truth.
+
+    :param task_uuid: UUID of the task
+    :type task_uuid: str
+    :return: True if state is stored
+    :rtype: bool
+    """
+    if not settings.TASK_STATE_CACHE_ENABLED:
+        return False
+    mapping = {
+        key: json.dumps(value, cls=DjangoJSONEncoder)
+        for key, value in state.items() if key in TASK_STATE_FIELDS
+    }
+    if not mapping:
+        return False
+    key = get_task_state_key(task_uuid)
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, settings.TASK_STATE_TTL)
+        pipe.execute()
+    except Exception as ex:
+        logger.warning(f'Failed to store task state: {ex}')
+        return False
+    return True
+
+
+def get_task_state(task_uuid):
+    """Read task state from Redis.
+
+    :param task_uuid: UUID of the task
+    :type task_uuid: str
+    :return: task state or None if not available
+    :rtype: dict
+    """
+    if not settings.TASK_STATE_CACHE_ENABLED:
+        return None
+    try:
+        values = get_redis_client().hgetall(get_task_state_key(task_uuid))
+    except Exception as ex:
+        logger.warning(f'Failed to read task state: {ex}')
+        return None
+    if not values:
+        return None
+    state = {}
+    for key, value in values.items():
+        key = key.decode() if isinstance(key, bytes) else key
+        if key not in TASK_STATE_FIELDS:
+            continue
+        try:
+            state[key] = json.loads(value)
+        except (TypeError, ValueError):
+            continue
+    if state.get('last_update'):
+        state['last_update'] = parse_datetime(state['last_update'])
+    return state
+
+
+def clear_task_state(task_uuid):
+    """Remove task state from Redis.
+
+    :param task_uuid: UUID of the task
+    :type task_uuid: str
+    """
+    if not settings.TASK_STATE_CACHE_ENABLED:
+        return
+    try:
+        get_redis_client().delete(get_task_state_key(task_uuid))
+    except Exception as ex:
+        logger.warning(f'Failed to clear task state: {ex}')
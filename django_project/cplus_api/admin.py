@@ -1,6 +1,6 @@
 from django.contrib import admin, messages
 from core.celery import cancel_task
-from cplus_api.models.scenario import ScenarioTask
+from cplus_api.models.scenario import ScenarioTask, ScenarioBatch
 from cplus_api.models.layer import (
     InputLayer, OutputLayer, MultipartUpload,
     TemporaryLayer
@@ -8,6 +8,7 @@ from cplus_api.models.layer import (
 from cplus_api.models.profile import UserProfile, UserRoleType
 from cplus_api.models.statistics import ZonalStatisticsTask
 from cplus_api.tasks.verify_input_layer import verify_input_layer
+from cplus_api.tasks.ingest_input_layer import ingest_input_layer
 from cplus_api.utils.api_helper import convert_size
 
 
@@ -34,6 +35,17 @@ def trigger_verify_input_layer(modeladmin, request, queryset):
     )
 
 
+def trigger_ingest_input_layer(modeladmin, request, queryset):
+    """Trigger ingestion of input layer in the background."""
+    for input_layer in queryset:
+        ingest_input_layer.delay(input_layer.id)
+    modeladmin.message_user(
+        request,
+        'Tasks will be run in the background!',
+        messages.INFO
+    )
+
+
 class ScenarioTaskAdmin(admin.ModelAdmin):
     list_display = ('scenario_name', 'uuid', 'submitted_by', 'task_id',
                     'status', 'progress', 'started_at', 'finished_at',
@@ -49,24 +61,35 @@ class ScenarioTaskAdmin(admin.ModelAdmin):
         return obj.detail['scenario_name']
 
 
+class ScenarioBatchAdmin(admin.ModelAdmin):
+    list_display = ('uuid', 'submitted_by', 'submitted_on', 'total_scenarios')
+    search_fields = ['uuid']
+    list_filter = ["submitted_by"]
+
+    def total_scenarios(self, obj: ScenarioBatch):
+        return obj.scenarios.count()
+
+
 class InputLayerAdmin(admin.ModelAdmin):
     list_display = ('name', 'source', 'uuid', 'owner',
                     'created_on', 'layer_type',
-                    'size', 'component_type', 'privacy_type')
+                    'size', 'component_type', 'privacy_type',
+                    'ingestion_status')
     search_fields = ['name', 'uuid']
     list_filter = [
         "layer_type", "owner", "component_type",
-        "privacy_type", "source"
+        "privacy_type", "source", "ingestion_status"
     ]
-    readonly_fields = ['uuid', 'modified_on']
-    actions = [trigger_verify_input_layer]
+    readonly_fields = ['uuid', 'modified_on', 'checksum']
+    actions = [trigger_verify_input_layer, trigger_ingest_input_layer]
 
 
 class OutputLayerAdmin(admin.ModelAdmin):
     list_display = ('name', 'uuid', 'owner', 'created_on', 'layer_type',
-                    'size', 'scenario', 'group', 'is_final_output')
+                    'size', 'scenario', 'group', 'is_final_output',
+                    'storage_tier')
     search_fields = ['name', 'uuid']
-    list_filter = ["layer_type", "owner", "is_final_output"]
+    list_filter = ["layer_type", "owner", "is_final_output", "storage_tier"]
 
 
 class UserRoleTypeAdmin(admin.ModelAdmin):
@@ -103,6 +126,7 @@ class ZonalStatisticsTaskAdmin(admin.ModelAdmin):
 
 
 admin.site.register(ScenarioTask, ScenarioTaskAdmin)
+admin.site.register(ScenarioBatch, ScenarioBatchAdmin)
 admin.site.register(InputLayer, InputLayerAdmin)
 admin.site.register(OutputLayer, OutputLayerAdmin)
 admin.site.register(UserRoleType, UserRoleTypeAdmin)
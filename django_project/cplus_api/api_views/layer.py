@@ -7,6 +7,7 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from django.contrib.gis.geos import Polygon
 from django.core.paginator import Paginator
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.conf import settings
@@ -18,12 +19,14 @@ from cplus_api.models.layer import (
     TemporaryLayer
 )
 from cplus_api.models.profile import UserProfile
+from cplus_api.tasks.ingest_input_layer import ingest_input_layer
 from cplus_api.serializers.layer import (
     InputLayerSerializer,
     PaginatedInputLayerSerializer,
     UploadLayerSerializer,
     UpdateLayerInputSerializer,
     FinishUploadLayerSerializer,
+    MultipartUploadSessionSerializer,
     LAYER_SCHEMA_FIELDS,
     InputLayerListSerializer
 )
@@ -39,7 +42,10 @@ from cplus_api.utils.api_helper import (
     convert_size,
     PARAMS_PAGINATION,
     PARAM_BBOX_IN_QUERY,
+    PARAM_MULTIPART_UPLOAD_ID_IN_QUERY,
     get_multipart_presigned_urls,
+    sign_multipart_part_urls,
+    list_multipart_parts,
     complete_multipart_upload,
     abort_multipart_upload,
     clip_raster
@@ -112,6 +118,25 @@ def validate_bbox(bbox):
     return bbox
 
 
+def get_bbox_filter(request):
+    """Return filter of layers that intersect bbox in query parameter.
+
+    Layers without footprint are included, e.g. the ingestion
+    has not been finished.
+
+    :param request: request object
+    :type request: Request
+    :return: filter of InputLayer queryset
+    :rtype: Q
+    """
+    if 'bbox' not in request.query_params:
+        return Q()
+    bbox = validate_bbox(request.query_params.get('bbox'))
+    polygon = Polygon.from_bbox(bbox)
+    polygon.srid = 4326
+    return Q(footprint__isnull=True) | Q(footprint__intersects=polygon)
+
+
 class LayerList(APIView):
     """API to return available layers."""
     permission_classes = [IsAuthenticated]
@@ -119,7 +144,7 @@ class LayerList(APIView):
     @swagger_auto_schema(
         operation_id='layer-list',
         tags=[LAYER_API_TAG],
-        manual_parameters=PARAMS_PAGINATION,
+        manual_parameters=PARAMS_PAGINATION + [PARAM_BBOX_IN_QUERY],
         responses={
             200: PaginatedInputLayerSerializer,
             400: APIErrorSerializer,
@@ -129,15 +154,19 @@ class LayerList(APIView):
     def get(self, request, *args, **kwargs):
         page = int(request.GET.get('page', '1'))
         page_size = get_page_size(request)
+        bbox_filter = get_bbox_filter(request)
         layers = InputLayer.objects.filter(
+            bbox_filter,
             privacy_type=InputLayer.PrivacyTypes.COMMON
         ).order_by('name')
         if is_internal_user(request.user):
             internal_layers = InputLayer.objects.filter(
+                bbox_filter,
                 privacy_type=InputLayer.PrivacyTypes.INTERNAL
             ).order_by('name')
             layers = layers.union(internal_layers)
         private_layers = InputLayer.objects.filter(
+            bbox_filter,
             privacy_type=InputLayer.PrivacyTypes.PRIVATE,
             owner=request.user
         ).order_by('name')
@@ -171,6 +200,7 @@ class DefaultLayerList(APIView):
     @swagger_auto_schema(
         operation_id='layer-default-list',
         tags=[LAYER_API_TAG],
+        manual_parameters=[PARAM_BBOX_IN_QUERY],
         responses={
             200: InputLayerListSerializer,
             400: APIErrorSerializer,
@@ -179,6 +209,7 @@ class DefaultLayerList(APIView):
     )
     def get(self, request, *args, **kwargs):
         layers = InputLayer.objects.filter(
+            get_bbox_filter(request),
             privacy_type=InputLayer.PrivacyTypes.COMMON
         ).order_by('name')
         return Response(status=200, data=(
@@ -246,10 +277,15 @@ class BaseLayerUpload(APIView):
                 'license',
                 None
             )
+            input_layer.ingestion_status = InputLayer.IngestionStatus.PENDING
+            input_layer.ingestion_error = ''
+            input_layer.checksum = ''
             input_layer.save(update_fields=[
                 'name', 'created_on', 'owner', 'layer_type',
                 'size', 'component_type', 'privacy_type',
-                'client_id', 'version', 'license'
+                'client_id', 'version', 'license',
+                'ingestion_status', 'ingestion_error', 'checksum',
+                'modified_on'
             ])
         else:
             input_layer = InputLayer.objects.create(
@@ -262,7 +298,8 @@ class BaseLayerUpload(APIView):
                 privacy_type=upload_param.validated_data['privacy_type'],
                 client_id=upload_param.validated_data.get('client_id', None),
                 version=upload_param.validated_data.get('version', None),
-                license=upload_param.validated_data.get('license', None)
+                license=upload_param.validated_data.get('license', None),
+                ingestion_status=InputLayer.IngestionStatus.PENDING
             )
         return input_layer, is_new
 
@@ -395,6 +432,7 @@ class LayerUpload(BaseLayerUpload):
         if input_layer.name != input_layer.file.name:
             input_layer.name = input_layer.file.name
             input_layer.save(update_fields=['name'])
+        ingest_input_layer.delay(input_layer.id)
         return Response(status=201, data={
             'uuid': str(input_layer.uuid),
             'name': input_layer.name,
@@ -406,7 +444,7 @@ class LayerUploadStart(BaseLayerUpload):
     """API to upload layer file direct to Minio."""
 
     def generate_upload_url(self, input_layer: InputLayer,
-                            number_of_parts=0):
+                            number_of_parts=0, paged=False):
         storage_backend = select_input_layer_storage()
         filename = input_layer.name
         file_path = input_layer_dir_path(input_layer, filename)
@@ -426,18 +464,21 @@ class LayerUploadStart(BaseLayerUpload):
                 })
         else:
             upload_id, urls = get_multipart_presigned_urls(
-                available_name, number_of_parts
+                available_name, number_of_parts, paged=paged
             )
             if urls:
                 results.extend(urls)
                 # create MultipartUpload to store the upload_id
-                MultipartUpload.objects.create(
+                upload = MultipartUpload(
                     upload_id=upload_id,
                     input_layer_uuid=input_layer.uuid,
                     created_on=timezone.now(),
                     uploader=input_layer.owner,
-                    parts=number_of_parts
+                    parts=number_of_parts,
+                    file_path=available_name
                 )
+                upload.extend_session(save=False)
+                upload.save()
         return results, upload_id
 
     @swagger_auto_schema(
@@ -482,6 +523,13 @@ class LayerUploadStart(BaseLayerUpload):
                         title='Multipart Upload Id',
                         type=openapi.TYPE_STRING
                     ),
+                    'next_part': openapi.Schema(
+                        title=(
+                            'First part number that needs to be signed '
+                            'using layer-upload-sign, only when paged'
+                        ),
+                        type=openapi.TYPE_INTEGER
+                    ),
                 },
                 example={
                     "upload_url": [
@@ -510,14 +558,22 @@ class LayerUploadStart(BaseLayerUpload):
             input_layer.file = None
             input_layer.save()
         upload_urls, upload_id = self.generate_upload_url(
-            input_layer, upload_param.validated_data['number_of_parts'])
+            input_layer, upload_param.validated_data['number_of_parts'],
+            paged=upload_param.validated_data['paged']
+        )
         if len(upload_urls) == 0:
             raise RuntimeError('Cannot generate upload url!')
+        number_of_parts = max(
+            upload_param.validated_data['number_of_parts'], 1)
+        next_part = len(upload_urls) + 1
         return Response(status=201, data={
             'uuid': str(input_layer.uuid),
             'upload_urls': upload_urls,
             'name': input_layer.name,
-            'multipart_upload_id': upload_id
+            'multipart_upload_id': upload_id,
+            'next_part': (
+                next_part if next_part <= number_of_parts else None
+            )
         })
 
 
@@ -565,11 +621,26 @@ class LayerUploadFinish(APIView):
             upload_param.validated_data.get('multipart_upload_id', None)
         )
         if multipart_upload_id:
+            items = upload_param.validated_data.get('items', None)
+            if not items:
+                # use ETags of uploaded parts from the storage
+                upload = get_object_or_404(
+                    MultipartUpload,
+                    upload_id=multipart_upload_id,
+                    input_layer_uuid=input_layer.uuid
+                )
+                upload.update_part_etags(
+                    list_multipart_parts(file_path, multipart_upload_id))
+                missing_parts = upload.get_missing_parts()
+                if missing_parts:
+                    raise ValidationError(
+                        f'Missing upload parts: {missing_parts}!')
+                items = upload.get_uploaded_parts()
             # mark multipart as done
             complete_multipart_upload(
                 file_path,
                 multipart_upload_id,
-                upload_param.validated_data['items']
+                items
             )
             # remove MultipartUpload when upload is completed
             MultipartUpload.objects.filter(
@@ -589,7 +660,8 @@ class LayerUploadFinish(APIView):
                 f'should be {convert_size(input_layer.size)}!'
             )
         input_layer.file.name = file_path
-        input_layer.save(update_fields=['file'])
+        input_layer.save(update_fields=['file', 'modified_on'])
+        ingest_input_layer.delay(input_layer.id)
         return Response(status=200, data={
             'uuid': str(input_layer.uuid),
             'name': input_layer.name,
@@ -641,6 +713,273 @@ class LayerUploadAbort(APIView):
         return Response(status=204)
 
 
+class BaseMultipartUploadSession(APIView):
+    """Base class of APIs to resume multipart upload."""
+    permission_classes = [IsAuthenticated]
+
+    def get_upload(self, request, layer_uuid, multipart_upload_id):
+        """Return multipart upload that can be resumed by the user.
+
+        :param request: request object
+        :type request: Request
+        :param layer_uuid: input layer UUID
+        :type layer_uuid: UUID
+        :param multipart_upload_id: Multipart UploadId
+        :type multipart_upload_id: str
+        :raises PermissionDenied: when user is not the uploader
+        :raises ValidationError: when upload has been aborted
+        :return: tuple of input layer and multipart upload
+        :rtype: tuple
+        """
+        input_layer = get_object_or_404(InputLayer, uuid=layer_uuid)
+        upload = get_object_or_404(
+            MultipartUpload,
+            upload_id=multipart_upload_id,
+            input_layer_uuid=input_layer.uuid
+        )
+        if (
+            upload.uploader != request.user and
+            not request.user.is_superuser
+        ):
+            raise PermissionDenied(
+                f'You are not allowed to resume upload of '
+                f'layer {layer_uuid}!'
+            )
+        if upload.is_aborted:
+            raise ValidationError(
+                f'Upload of layer {input_layer.name} has been aborted!')
+        if not upload.file_path:
+            upload.file_path = input_layer_dir_path(
+                input_layer, input_layer.name)
+        return input_layer, upload
+
+    def sync_uploaded_parts(self, upload: MultipartUpload):
+        """Update ETags of parts that have been uploaded to storage.
+
+        :param upload: multipart upload
+        :type upload: MultipartUpload
+        :return: list of part_number, etag and size
+        :rtype: list
+        """
+        parts = list_multipart_parts(upload.file_path, upload.upload_id)
+        upload.update_part_etags(parts)
+        return parts
+
+    def get_session_data(self, input_layer: InputLayer,
+                         upload: MultipartUpload):
+        return {
+            'uuid': str(input_layer.uuid),
+            'multipart_upload_id': upload.upload_id,
+            'number_of_parts': upload.parts,
+            'missing_parts': upload.get_missing_parts(),
+            'expires_on': upload.expires_on
+        }
+
+
+MULTIPART_UPLOAD_SESSION_PROPERTIES = {
+    'uuid': openapi.Schema(
+        title='Layer UUID',
+        type=openapi.TYPE_STRING
+    ),
+    'multipart_upload_id': openapi.Schema(
+        title='Multipart Upload Id',
+        type=openapi.TYPE_STRING
+    ),
+    'number_of_parts': openapi.Schema(
+        title='Number of parts for multipart upload',
+        type=openapi.TYPE_INTEGER
+    ),
+    'missing_parts': openapi.Schema(
+        title='Part numbers that have not been uploaded',
+        type=openapi.TYPE_ARRAY,
+        items=openapi.Items(type=openapi.TYPE_INTEGER)
+    ),
+    'expires_on': openapi.Schema(
+        title='Unfinished upload is aborted after this time',
+        type=openapi.TYPE_STRING
+    ),
+}
+
+
+class LayerUploadParts(BaseMultipartUploadSession):
+    """API to list uploaded parts of multipart upload."""
+
+    @swagger_auto_schema(
+        operation_id='layer-upload-parts',
+        tags=[LAYER_API_TAG],
+        manual_parameters=[
+            PARAM_LAYER_UUID_IN_PATH,
+            PARAM_MULTIPART_UPLOAD_ID_IN_QUERY
+        ],
+        responses={
+            200: openapi.Schema(
+                description='Uploaded parts',
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    **MULTIPART_UPLOAD_SESSION_PROPERTIES,
+                    'uploaded_parts': openapi.Schema(
+                        title='List of uploaded parts',
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'part_number': openapi.Schema(
+                                    title='Part number',
+                                    type=openapi.TYPE_INTEGER
+                                ),
+                                'etag': openapi.Schema(
+                                    title='Etag value of the part',
+                                    type=openapi.TYPE_STRING
+                                ),
+                                'size': openapi.Schema(
+                                    title='Part size',
+                                    type=openapi.TYPE_INTEGER
+                                )
+                            }
+                        )
+                    ),
+                }
+            ),
+            400: APIErrorSerializer,
+            403: APIErrorSerializer,
+            404: APIErrorSerializer
+        }
+    )
+    def get(self, request, layer_uuid):
+        multipart_upload_id = request.GET.get('multipart_upload_id', None)
+        if not multipart_upload_id:
+            raise ValidationError('Missing multipart_upload_id!')
+        input_layer, upload = self.get_upload(
+            request, layer_uuid, multipart_upload_id)
+        parts = self.sync_uploaded_parts(upload)
+        data = self.get_session_data(input_layer, upload)
+        data['uploaded_parts'] = parts
+        return Response(status=200, data=data)
+
+
+class LayerUploadSign(BaseMultipartUploadSession):
+    """API to generate new presigned URLs of multipart upload."""
+
+    @swagger_auto_schema(
+        operation_id='layer-upload-sign',
+        tags=[LAYER_API_TAG],
+        manual_parameters=[PARAM_LAYER_UUID_IN_PATH],
+        request_body=MultipartUploadSessionSerializer,
+        responses={
+            200: openapi.Schema(
+                description='Presigned URLs of missing parts',
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    **MULTIPART_UPLOAD_SESSION_PROPERTIES,
+                    'next_part': openapi.Schema(
+                        title='First part number of the next page',
+                        type=openapi.TYPE_INTEGER
+                    ),
+                    'upload_urls': openapi.Schema(
+                        title='List of Upload Presigned URL',
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(
+                            type=openapi.TYPE_OBJECT,
+                            title='Presigned URL item',
+                            properties={
+                                'part_number': openapi.Schema(
+                                    title='Part number for multipart upload',
+                                    type=openapi.TYPE_INTEGER
+                                ),
+                                'url': openapi.Schema(
+                                    title='Presigned URL',
+                                    type=openapi.TYPE_STRING
+                                )
+                            }
+                        )
+                    ),
+                }
+            ),
+            400: APIErrorSerializer,
+            403: APIErrorSerializer,
+            404: APIErrorSerializer
+        }
+    )
+    def post(self, request, layer_uuid):
+        upload_param = MultipartUploadSessionSerializer(data=request.data)
+        upload_param.is_valid(raise_exception=True)
+        input_layer, upload = self.get_upload(
+            request, layer_uuid,
+            upload_param.validated_data['multipart_upload_id']
+        )
+        page_size = settings.MULTIPART_UPLOAD_URL_PAGE_SIZE
+        part_numbers = upload_param.validated_data.get('part_numbers', None)
+        from_part = upload_param.validated_data.get('from_part', None)
+        next_part = None
+        if part_numbers:
+            invalid_parts = [
+                part_number for part_number in part_numbers if
+                part_number > upload.parts
+            ]
+            if invalid_parts:
+                raise ValidationError(
+                    f'Invalid part numbers: {invalid_parts}!')
+            if len(part_numbers) > page_size:
+                raise ValidationError(
+                    f'Maximum {page_size} parts can be signed '
+                    'in a request!'
+                )
+        elif from_part:
+            if from_part > upload.parts:
+                raise ValidationError(f'Invalid from_part: {from_part}!')
+            count = min(
+                upload_param.validated_data.get('count', page_size),
+                page_size
+            )
+            to_part = min(from_part + count, upload.parts + 1)
+            part_numbers = list(range(from_part, to_part))
+            if to_part <= upload.parts:
+                next_part = to_part
+        else:
+            self.sync_uploaded_parts(upload)
+            missing_parts = upload.get_missing_parts()
+            part_numbers = missing_parts[:page_size]
+            if len(missing_parts) > page_size:
+                next_part = missing_parts[page_size]
+        upload.extend_session()
+        data = self.get_session_data(input_layer, upload)
+        data['upload_urls'] = sign_multipart_part_urls(
+            upload.file_path, upload.upload_id, part_numbers)
+        data['next_part'] = next_part
+        return Response(status=200, data=data)
+
+
+class LayerUploadExtend(BaseMultipartUploadSession):
+    """API to extend expiry time of multipart upload."""
+
+    @swagger_auto_schema(
+        operation_id='layer-upload-extend',
+        tags=[LAYER_API_TAG],
+        manual_parameters=[PARAM_LAYER_UUID_IN_PATH],
+        request_body=MultipartUploadSessionSerializer,
+        responses={
+            200: openapi.Schema(
+                description='Extended upload session',
+                type=openapi.TYPE_OBJECT,
+                properties=MULTIPART_UPLOAD_SESSION_PROPERTIES
+            ),
+            400: APIErrorSerializer,
+            403: APIErrorSerializer,
+            404: APIErrorSerializer
+        }
+    )
+    def post(self, request, layer_uuid):
+        upload_param = MultipartUploadSessionSerializer(data=request.data)
+        upload_param.is_valid(raise_exception=True)
+        input_layer, upload = self.get_upload(
+            request, layer_uuid,
+            upload_param.validated_data['multipart_upload_id']
+        )
+        upload.extend_session()
+        return Response(
+            status=200, data=self.get_session_data(input_layer, upload))
+
+
 class LayerDetail(APIView):
     """APIs to fetch and remove layer file."""
     permission_classes = [IsAuthenticated]
@@ -16,6 +16,8 @@ from cplus_api.serializers.layer import (
     PaginatedOutputLayerSerializer,
     OutputLayerListSerializer
 )
+from cplus_api.tasks.restore_output_layers import restore_output_layers
+from cplus_api.utils.output_archive import request_output_restore
 from cplus_api.utils.api_helper import (
     get_page_size,
     SCENARIO_OUTPUT_API_TAG,
@@ -121,3 +123,46 @@ class FetchScenarioAnalysisOutput(BaseScenarioReadAccess, APIView):
                 layers, many=True
             ).data
         ))
+
+
+class RestoreScenarioAnalysisOutput(BaseScenarioReadAccess, APIView):
+    """Restore archived scenario outputs by UUIDs."""
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_id='restore-scenario-outputs-by-uuids',
+        tags=[SCENARIO_OUTPUT_API_TAG],
+        manual_parameters=[
+            PARAM_SCENARIO_UUID_IN_PATH
+        ],
+        request_body=openapi.Schema(
+            title='List of scenario output UUID',
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Items(
+                type=openapi.TYPE_STRING
+            )
+        ),
+        responses={
+            202: OutputLayerListSerializer,
+            400: APIErrorSerializer,
+            403: APIErrorSerializer,
+            404: APIErrorSerializer
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        scenario_uuid = kwargs.get('scenario_uuid')
+        scenario_task = get_object_or_404(
+            ScenarioTask, uuid=scenario_uuid)
+        self.validate_user_access(request.user, scenario_task)
+        layers = OutputLayer.objects.filter(
+            scenario=scenario_task,
+            uuid__in=request.data
+        ).order_by('id')
+        restored_ids = request_output_restore(layers)
+        if restored_ids:
+            restore_output_layers.delay(restored_ids)
+        return Response(status=202, data=(
+            OutputLayerSerializer(
+                layers, many=True
+            ).data
+        ))
@@ -1,18 +1,22 @@
 import math
+import logging
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from django.shortcuts import get_object_or_404
 from rest_framework.exceptions import ValidationError
-from django.contrib.contenttypes.models import ContentType
 from django.core.paginator import Paginator
+from django.utils.dateparse import parse_datetime
 from core.celery import cancel_task
 from core.models.base_task_request import READ_ONLY_STATUS, TaskStatus
-from core.models.task_log import TaskLog
-from cplus_api.models.scenario import ScenarioTask
+from cplus_api.models.scenario import ScenarioTask, ScenarioBatch
 from cplus_api.serializers.scenario import (
     ScenarioInputSerializer,
     ScenarioTaskStatusSerializer,
@@ -20,7 +24,9 @@ from cplus_api.serializers.scenario import (
     ScenarioTaskLogSerializer,
     PaginatedScenarioTaskItemSerializer,
     ScenarioDetailSerializer,
-    ScenarioTaskItemSerializer
+    ScenarioTaskItemSerializer,
+    ScenarioBatchInputSerializer,
+    ScenarioBatchSerializer
 )
 from cplus_api.serializers.common import (
     APIErrorSerializer,
@@ -33,7 +39,65 @@ from cplus_api.utils.api_helper import (
     PARAMS_PAGINATION,
     get_page_size
 )
-from cplus_api.tasks.runner import run_scenario_analysis_task
+from cplus_api.utils.batch import expand_parameter_grid
+from cplus_api.utils.estimator import (
+    estimate_scenario_cost,
+    validate_scenario_cost
+)
+from cplus_api.utils.scenario_reuse import (
+    get_scenario_fingerprint,
+    find_reusable_scenario,
+    clone_scenario_outputs
+)
+from cplus_api.utils.scheduler import (
+    get_scheduler_config,
+    select_queue,
+    is_waiting,
+    schedule_scenario_task,
+    unschedule_scenario_task,
+    dispatch_scenario_tasks,
+    get_queue_position
+)
+from cplus_api.utils.task_events import (
+    EventStreamRenderer,
+    scenario_event_stream,
+    async_scenario_event_stream
+)
+from cplus_api.utils.tiling import (
+    TILED_MODE_AUTO,
+    TILED_MODE_ON,
+    TILED_MODE_OFF,
+    get_execution_tiles,
+    validate_scenario_admission,
+    reset_scenario_tiles,
+    create_scenario_tiles,
+    cancel_scenario_tiles
+)
+
+
+COST_ESTIMATE_SCHEMA = openapi.Schema(
+    title='Scenario cost estimate',
+    type=openapi.TYPE_OBJECT,
+    properties={
+        'area_km2': openapi.Schema(type=openapi.TYPE_NUMBER),
+        'resolution_m': openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Items(type=openapi.TYPE_NUMBER)
+        ),
+        'pixels': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'activities': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'pathways': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'carbon_layers': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'priority_layers': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'rasters': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'input_bytes': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'disk_bytes': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'ram_bytes': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'work_units': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'runtime_seconds': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'calibration_samples': openapi.Schema(type=openapi.TYPE_INTEGER)
+    }
+)
 
 
 class ScenarioAnalysisSubmit(APIView):
@@ -74,10 +138,18 @@ class ScenarioAnalysisSubmit(APIView):
                     'uuid': openapi.Schema(
                         title='Scenario UUID',
                         type=openapi.TYPE_STRING
-                    )
+                    ),
+                    'estimate': COST_ESTIMATE_SCHEMA
                 },
                 example={
-                    'uuid': '8c4582ab-15b1-4ed0-b8e4-00640ec10a65'
+                    'uuid': '8c4582ab-15b1-4ed0-b8e4-00640ec10a65',
+                    'estimate': {
+                        'pixels': 2258000,
+                        'rasters': 12,
+                        'disk_bytes': 108384000,
+                        'ram_bytes': 36128000,
+                        'runtime_seconds': 95
+                    }
                 }
             ),
             400: APIErrorSerializer,
@@ -89,15 +161,69 @@ class ScenarioAnalysisSubmit(APIView):
         api_version = self.fetch_api_version(request)
         serializer = ScenarioInputSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        cost_estimate = estimate_scenario_cost(request.data)
+        errors = validate_scenario_admission(
+            request.data, cost_estimate, get_scheduler_config())
+        if errors:
+            raise ValidationError(errors)
         scenario_task = ScenarioTask.objects.create(
             submitted_on=timezone.now(),
             submitted_by=request.user,
             api_version=api_version,
             plugin_version=plugin_version,
-            detail=request.data
+            detail=request.data,
+            cost_estimate=cost_estimate
         )
         return Response(status=201, data={
-            'uuid': str(scenario_task.uuid)
+            'uuid': str(scenario_task.uuid),
+            'estimate': cost_estimate
+        })
+
+
+class ScenarioAnalysisEstimate(APIView):
+    """API to estimate the cost of scenario before submitting it."""
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_id='estimate-scenario-cost',
+        tags=[SCENARIO_API_TAG],
+        request_body=ScenarioInputSerializer,
+        responses={
+            200: openapi.Schema(
+                description=(
+                    'Cost estimate'
+                ),
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'estimate': COST_ESTIMATE_SCHEMA,
+                    'queue': openapi.Schema(
+                        title='Queue that will run the scenario',
+                        type=openapi.TYPE_STRING
+                    ),
+                    'errors': openapi.Schema(
+                        title='Reasons the scenario would be rejected',
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_STRING)
+                    )
+                }
+            ),
+            400: APIErrorSerializer
+        }
+    )
+    def post(self, request, format=None):
+        serializer = ScenarioInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        config = get_scheduler_config()
+        cost_estimate = estimate_scenario_cost(request.data)
+        scenario_task = ScenarioTask(
+            detail=request.data,
+            cost_estimate=cost_estimate
+        )
+        return Response(status=200, data={
+            'estimate': cost_estimate,
+            'queue': select_queue(scenario_task, config),
+            'errors': validate_scenario_admission(
+                request.data, cost_estimate, config)
         })
 
 
@@ -108,7 +234,34 @@ class ExecuteScenarioAnalysis(BaseScenarioReadAccess, APIView):
     @swagger_auto_schema(
         operation_id='execute-scenario-analysis',
         tags=[SCENARIO_API_TAG],
-        manual_parameters=[PARAM_SCENARIO_UUID_IN_PATH],
+        manual_parameters=[
+            PARAM_SCENARIO_UUID_IN_PATH,
+            openapi.Parameter(
+                'force', openapi.IN_QUERY,
+                description=(
+                    'Run the analysis even if there is identical '
+                    'completed scenario'
+                ),
+                type=openapi.TYPE_BOOLEAN,
+                default=False,
+                required=False
+            ),
+            openapi.Parameter(
+                'tiled', openapi.IN_QUERY,
+                description=(
+                    'Run the scenario as tiles in multiple workers, '
+                    'auto uses tiles for large scenario. Scenario that '
+                    'exceeds the disk or memory limit of a worker must '
+                    'be run as tiles. Stages that '
+                    'normalise layers use statistics of each tile, '
+                    'so tiled outputs can differ from a single run.'
+                ),
+                type=openapi.TYPE_STRING,
+                enum=[TILED_MODE_AUTO, TILED_MODE_ON, TILED_MODE_OFF],
+                default=TILED_MODE_OFF,
+                required=False
+            )
+        ],
         responses={
             200: openapi.Schema(
                 description=(
@@ -121,13 +274,34 @@ class ExecuteScenarioAnalysis(BaseScenarioReadAccess, APIView):
                         type=openapi.TYPE_STRING
                     ),
                     'task_id': openapi.Schema(
-                        title='Task ID',
+                        title=(
+                            'Task ID, empty when the task is waiting '
+                            'in the scheduler'
+                        ),
+                        type=openapi.TYPE_STRING
+                    ),
+                    'queue_position': openapi.Schema(
+                        title='Position in the scheduler queue',
+                        type=openapi.TYPE_INTEGER
+                    ),
+                    'reused_from': openapi.Schema(
+                        title=(
+                            'UUID of identical scenario whose outputs '
+                            'are reused'
+                        ),
                         type=openapi.TYPE_STRING
+                    ),
+                    'tiles': openapi.Schema(
+                        title='Number of tiles in distributed mode',
+                        type=openapi.TYPE_INTEGER
                     )
                 },
                 example={
                     'uuid': '8c4582ab-15b1-4ed0-b8e4-00640ec10a65',
-                    'task_id': '8f27c431-d416-492f-98ba-6a52cc20fa2e'
+                    'task_id': '8f27c431-d416-492f-98ba-6a52cc20fa2e',
+                    'queue_position': None,
+                    'reused_from': None,
+                    'tiles': 0
                 }
             ),
             400: APIErrorSerializer,
@@ -145,11 +319,65 @@ class ExecuteScenarioAnalysis(BaseScenarioReadAccess, APIView):
                 "Unable to start job with current status "
                 f"{scenario_task.status}. "
                 "Please cancel the current task first!")
-        task = run_scenario_analysis_task.apply_async(
-            (scenario_task.id,), queue='cplus')
+        if is_waiting(scenario_task):
+            raise ValidationError(
+                "Unable to start job that is waiting in the scheduler. "
+                "Please cancel the current task first!")
+        config = get_scheduler_config()
+        tiled_mode = request.GET.get('tiled', TILED_MODE_OFF).lower()
+        if tiled_mode == TILED_MODE_OFF:
+            errors = validate_scenario_cost(
+                scenario_task.cost_estimate, config)
+            if errors:
+                raise ValidationError(errors + [
+                    'Please execute the scenario with tiled=auto!'
+                ])
+        # clean logs of the previous execution
+        scenario_task.get_logs().delete()
+        scenario_task.fingerprint = get_scenario_fingerprint(
+            scenario_task.detail)
+        scenario_task.save(update_fields=['fingerprint'])
+        force = request.GET.get('force', 'false').lower() == 'true'
+        source_task = (
+            None if force else find_reusable_scenario(scenario_task)
+        )
+        if source_task:
+            clone_scenario_outputs(source_task, scenario_task)
+            return Response(status=201, data={
+                'uuid': str(scenario_task.uuid),
+                'task_id': None,
+                'queue_position': None,
+                'reused_from': str(source_task.uuid),
+                'tiles': 0
+            })
+        tiles = get_execution_tiles(scenario_task, config, tiled_mode)
+        if tiles:
+            create_scenario_tiles(scenario_task, tiles)
+            dispatch_scenario_tasks()
+            return Response(status=201, data={
+                'uuid': str(scenario_task.uuid),
+                'task_id': None,
+                'queue_position': None,
+                'reused_from': None,
+                'tiles': len(tiles)
+            })
+        reset_scenario_tiles(scenario_task)
+        schedule_scenario_task(scenario_task)
+        dispatched = dispatch_scenario_tasks()
+        task_id = None
+        for dispatched_task in dispatched:
+            if dispatched_task.id == scenario_task.id:
+                task_id = str(dispatched_task.task_id)
+        if task_id is None:
+            scenario_task.refresh_from_db()
         return Response(status=201, data={
             'uuid': str(scenario_task.uuid),
-            'task_id': str(task.id)
+            'task_id': task_id,
+            'queue_position': (
+                None if task_id else get_queue_position(scenario_task)
+            ),
+            'reused_from': None,
+            'tiles': 0
         })
 
 
@@ -187,6 +415,25 @@ class CancelScenarioAnalysisTask(BaseScenarioReadAccess, APIView):
         scenario_task = get_object_or_404(
             ScenarioTask, uuid=scenario_uuid)
         self.validate_user_access(request.user, scenario_task, 'cancel')
+        if (
+            scenario_task.is_tiled and
+            scenario_task.status == TaskStatus.RUNNING
+        ):
+            if scenario_task.task_id:
+                # mosaic task is running
+                cancel_task(scenario_task.task_id)
+            scenario_task.task_on_cancelled()
+            cancel_scenario_tiles(scenario_task)
+            return Response(status=200, data={
+                'uuid': str(scenario_task.uuid)
+            })
+        if is_waiting(scenario_task):
+            # task has not been sent to worker
+            unschedule_scenario_task(scenario_task)
+            scenario_task.task_on_cancelled()
+            return Response(status=200, data={
+                'uuid': str(scenario_task.uuid)
+            })
         if scenario_task.status not in READ_ONLY_STATUS:
             raise ValidationError(
                 "Unable to cancel job with current status "
@@ -212,7 +459,19 @@ class ScenarioAnalysisTaskStatus(BaseScenarioReadAccess, APIView):
     @swagger_auto_schema(
         operation_id='scenario-analysis-task-status',
         tags=[SCENARIO_API_TAG],
-        manual_parameters=[PARAM_SCENARIO_UUID_IN_PATH],
+        manual_parameters=[
+            PARAM_SCENARIO_UUID_IN_PATH,
+            openapi.Parameter(
+                'include_logs', openapi.IN_QUERY,
+                description=(
+                    'Include task logs in the response, '
+                    'use logs API to fetch logs incrementally'
+                ),
+                type=openapi.TYPE_BOOLEAN,
+                default=True,
+                required=False
+            )
+        ],
         responses={
             200: ScenarioTaskStatusSerializer,
             400: APIErrorSerializer,
@@ -225,19 +484,115 @@ class ScenarioAnalysisTaskStatus(BaseScenarioReadAccess, APIView):
         scenario_task = get_object_or_404(
             ScenarioTask, uuid=scenario_uuid)
         self.validate_user_access(request.user, scenario_task)
+        # progress from running task is stored in Redis first
+        scenario_task.apply_cached_state()
+        include_logs = (
+            request.GET.get('include_logs', 'true').lower() != 'false'
+        )
         return Response(status=200, data=(
-            ScenarioTaskStatusSerializer(scenario_task).data
+            ScenarioTaskStatusSerializer(
+                scenario_task,
+                context={'include_logs': include_logs}
+            ).data
         ))
 
 
+class ScenarioAnalysisTaskStream(BaseScenarioReadAccess, APIView):
+    """API to stream progress and logs of scenario task (SSE)."""
+    permission_classes = [IsAuthenticated]
+    # EventSource sends Accept: text/event-stream
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    @swagger_auto_schema(
+        operation_id='scenario-analysis-task-stream',
+        operation_description=(
+            'Server-sent events stream of scenario status, progress and '
+            'logs. The stream is closed when the task is finished or after '
+            'a short period; clients should reconnect using retry hint.'
+        ),
+        tags=[SCENARIO_API_TAG],
+        manual_parameters=[PARAM_SCENARIO_UUID_IN_PATH],
+        responses={
+            200: openapi.Response(description='text/event-stream'),
+            400: APIErrorSerializer,
+            403: APIErrorSerializer,
+            404: APIErrorSerializer
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        scenario_uuid = kwargs.get('scenario_uuid')
+        scenario_task = get_object_or_404(
+            ScenarioTask, uuid=scenario_uuid)
+        self.validate_user_access(request.user, scenario_task)
+        if isinstance(request._request, ASGIRequest):
+            stream = async_scenario_event_stream(scenario_task)
+        else:
+            # WSGI worker is held by the stream, see scenario_event_stream
+            stream = scenario_event_stream(scenario_task)
+        response = StreamingHttpResponse(
+            stream,
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # disable nginx buffering so events are delivered immediately
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class ScenarioAnalysisTaskLogs(BaseScenarioReadAccess, APIView):
     """API to fetch logs from scenario task."""
     permission_classes = [IsAuthenticated]
 
+    def filter_logs(self, request, task_log_qs):
+        """Filter logs by cursor (after_id/since) and minimum level."""
+        after_id = request.GET.get('after_id', None)
+        if after_id:
+            try:
+                task_log_qs = task_log_qs.filter(id__gt=int(after_id))
+            except ValueError:
+                raise ValidationError('after_id must be an integer!')
+        since = request.GET.get('since', None)
+        if since:
+            since_dt = parse_datetime(since)
+            if since_dt is None:
+                raise ValidationError(
+                    'since must be a datetime in ISO 8601 format!')
+            task_log_qs = task_log_qs.filter(date_time__gt=since_dt)
+        level = request.GET.get('level', None)
+        if level:
+            level_value = logging.getLevelName(level.upper())
+            if not isinstance(level_value, int):
+                raise ValidationError(f'Invalid log level {level}!')
+            task_log_qs = task_log_qs.filter(level__gte=level_value)
+        return task_log_qs
+
     @swagger_auto_schema(
         operation_id='scenario-analysis-task-logs',
         tags=[SCENARIO_API_TAG],
-        manual_parameters=[PARAM_SCENARIO_UUID_IN_PATH],
+        manual_parameters=[
+            PARAM_SCENARIO_UUID_IN_PATH,
+            openapi.Parameter(
+                'after_id', openapi.IN_QUERY,
+                description='Return logs with id greater than after_id',
+                type=openapi.TYPE_INTEGER,
+                required=False
+            ),
+            openapi.Parameter(
+                'since', openapi.IN_QUERY,
+                description=(
+                    'Return logs created after the datetime (ISO 8601)'
+                ),
+                type=openapi.TYPE_STRING,
+                required=False
+            ),
+            openapi.Parameter(
+                'level', openapi.IN_QUERY,
+                description='Minimum log severity',
+                type=openapi.TYPE_STRING,
+                enum=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                required=False
+            )
+        ],
         responses={
             200: ScenarioTaskLogListSerializer,
             400: APIErrorSerializer,
@@ -250,12 +605,9 @@ class ScenarioAnalysisTaskLogs(BaseScenarioReadAccess, APIView):
         scenario_task = get_object_or_404(
             ScenarioTask, uuid=scenario_uuid)
         self.validate_user_access(request.user, scenario_task)
-        scenario_task_ct = ContentType.objects.get(
-            app_label="cplus_api", model="scenariotask")
-        task_log_qs = TaskLog.objects.filter(
-            content_type=scenario_task_ct,
-            object_id=scenario_task.pk
-        ).order_by('date_time')
+        task_log_qs = self.filter_logs(
+            request, scenario_task.get_logs()
+        ).order_by('id')
         return Response(status=200, data=(
             ScenarioTaskLogSerializer(task_log_qs, many=True).data
         ))
@@ -288,7 +640,8 @@ class ScenarioAnalysisHistory(APIView):
         page = int(request.GET.get('page', '1'))
         page_size = get_page_size(request)
         scenarios = ScenarioTask.objects.filter(
-            submitted_by=request.user
+            submitted_by=request.user,
+            parent__isnull=True
         ).order_by('-submitted_on')
         status = request.GET.get('status', '')
         if status:
@@ -358,3 +711,114 @@ class ScenarioAnalysisTaskDetail(BaseScenarioReadAccess, APIView):
         self.validate_user_access(request.user, scenario_task, 'delete')
         scenario_task.delete()
         return Response(status=204)
+
+
+class ScenarioBatchSubmit(ScenarioAnalysisSubmit):
+    """API to submit and execute scenarios from a parameter grid."""
+
+    @swagger_auto_schema(
+        operation_id='submit-scenario-batch',
+        tags=[SCENARIO_API_TAG],
+        manual_parameters=[
+            openapi.Parameter(
+                'plugin_version', openapi.IN_QUERY,
+                description=(
+                    'Version of the plugin'
+                ),
+                type=openapi.TYPE_STRING,
+                required=False
+            )
+        ],
+        request_body=ScenarioBatchInputSerializer,
+        responses={
+            201: ScenarioBatchSerializer,
+            400: APIErrorSerializer
+        }
+    )
+    def post(self, request, format=None):
+        plugin_version = request.GET.get('plugin_version', '0.0.1')
+        api_version = self.fetch_api_version(request)
+        input_serializer = ScenarioBatchInputSerializer(data=request.data)
+        input_serializer.is_valid(raise_exception=True)
+        base_detail = request.data['base']
+        parameter_grid = request.data['parameters']
+        serializer = ScenarioInputSerializer(data=base_detail)
+        serializer.is_valid(raise_exception=True)
+        try:
+            scenarios = expand_parameter_grid(base_detail, parameter_grid)
+        except ValueError as ex:
+            raise ValidationError(str(ex))
+        config = get_scheduler_config()
+        cost_estimates = []
+        for parameters, detail in scenarios:
+            # grid values may replace layers or change value types
+            serializer = ScenarioInputSerializer(data=detail)
+            if not serializer.is_valid():
+                raise ValidationError({
+                    detail['scenario_name']: serializer.errors
+                })
+            cost_estimate = estimate_scenario_cost(detail)
+            errors = validate_scenario_admission(
+                detail, cost_estimate, config)
+            if errors:
+                raise ValidationError(
+                    [f'{detail["scenario_name"]}: {error}'
+                     for error in errors]
+                )
+            cost_estimates.append(cost_estimate)
+        with transaction.atomic():
+            batch = ScenarioBatch.objects.create(
+                submitted_on=timezone.now(),
+                submitted_by=request.user,
+                base_detail=base_detail,
+                parameter_grid=parameter_grid
+            )
+            for (parameters, detail), cost_estimate in zip(
+                    scenarios, cost_estimates):
+                scenario_task = ScenarioTask.objects.create(
+                    submitted_on=timezone.now(),
+                    submitted_by=request.user,
+                    api_version=api_version,
+                    plugin_version=plugin_version,
+                    detail=detail,
+                    cost_estimate=cost_estimate,
+                    batch=batch,
+                    batch_parameters=parameters,
+                    fingerprint=get_scenario_fingerprint(detail)
+                )
+                source_task = find_reusable_scenario(scenario_task)
+                if source_task:
+                    clone_scenario_outputs(source_task, scenario_task)
+                else:
+                    schedule_scenario_task(scenario_task)
+        dispatch_scenario_tasks()
+        return Response(
+            status=201, data=ScenarioBatchSerializer(batch).data)
+
+
+class ScenarioBatchStatus(BaseScenarioReadAccess, APIView):
+    """API to fetch status of scenarios in the batch."""
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_id='scenario-batch-status',
+        tags=[SCENARIO_API_TAG],
+        manual_parameters=[
+            openapi.Parameter(
+                'batch_uuid', openapi.IN_PATH,
+                description='Scenario Batch UUID',
+                type=openapi.TYPE_STRING
+            )
+        ],
+        responses={
+            200: ScenarioBatchSerializer,
+            403: APIErrorSerializer,
+            404: APIErrorSerializer
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        batch_uuid = kwargs.get('batch_uuid')
+        batch = get_object_or_404(ScenarioBatch, uuid=batch_uuid)
+        self.validate_user_access(request.user, batch)
+        return Response(
+            status=200, data=ScenarioBatchSerializer(batch).data)
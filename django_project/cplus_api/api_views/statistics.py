@@ -7,9 +7,11 @@ from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 
+from cplus_api.models.layer import InputLayer
 from cplus_api.models.statistics import ZonalStatisticsTask
 from cplus_api.serializers.statistics import (
     ZonalStatisticsRequestSerializer,
+    ZonalStatisticsPolygonRequestSerializer,
     ZonalStatisticsTaskSerializer
 )
 from cplus_api.serializers.common import APIErrorSerializer
@@ -20,16 +22,52 @@ from cplus_api.utils.api_helper import LAYER_API_TAG
 class ZonalStatisticsView(APIView):
     """
     GET endpoint to initiate zonal statistics calculation
-     for NatureBase layers.
+     for NatureBase layers within bbox.
+    POST endpoint to initiate the calculation within polygon.
     """
     permission_classes = [IsAuthenticated]
 
+    def submit_task(self, request, bbox_list, **kwargs):
+        """Create zonal statistics task and queue the worker.
+
+        :param request: request object
+        :type request: Request
+        :param bbox_list: minx, miny, maxx, maxy in WGS84
+        :type bbox_list: list
+        :return: response with task uuid
+        :rtype: Response
+        """
+        task = ZonalStatisticsTask.objects.create(
+            submitted_on=timezone.now(),
+            submitted_by=request.user,
+            parameters=",".join(str(v) for v in bbox_list),
+            bbox_minx=bbox_list[0],
+            bbox_miny=bbox_list[1],
+            bbox_maxx=bbox_list[2],
+            bbox_maxy=bbox_list[3],
+            **kwargs
+        )
+        # Queue calculation worker
+        submit_result = calculate_zonal_statistics.delay(task.id)
+        task.task_id = submit_result.id
+        task.task_name = calculate_zonal_statistics.name
+        task.save(update_fields=['task_id', 'task_name'])
+
+        return Response(
+            {
+                'task_uuid': str(task.uuid),
+                'message': 'Zonal statistics calculation started'
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
     @swagger_auto_schema(
         operation_id='zonal-statistics-calculate',
         operation_description=(
-            'Initiate the calculation of mean zonal statistics for all '
+            'Initiate the calculation of zonal statistics for all '
             'nature base layers within the specified bounding box '
-            'in WGS84 coordinates.'
+            'in WGS84 coordinates. Mean is always calculated, other '
+            'statistics are returned in statistics of each layer result.'
         ),
         tags=[LAYER_API_TAG],
         manual_parameters=[
@@ -41,6 +79,25 @@ class ZonalStatisticsView(APIView):
                 type=openapi.TYPE_STRING,
                 required=True,
                 example='28.0,-26.0,29.0,-25.0'
+            ),
+            openapi.Parameter(
+                'statistics',
+                openapi.IN_QUERY,
+                description=(
+                    'Comma separated statistics: mean, min, max, sum, '
+                    'count, std, median, percentile as pNN (e.g. p90) '
+                    'and histogram. Default: mean'
+                ),
+                type=openapi.TYPE_STRING,
+                required=False,
+                example='mean,min,max,p90,histogram'
+            ),
+            openapi.Parameter(
+                'bins',
+                openapi.IN_QUERY,
+                description='Number of histogram bins. Default: 10',
+                type=openapi.TYPE_INTEGER,
+                required=False
             )
         ],
         responses={
@@ -63,33 +120,66 @@ class ZonalStatisticsView(APIView):
         }
     )
     def get(self, request, *args, **kwargs):
-        serializer = ZonalStatisticsRequestSerializer(data={
-            'bbox': request.query_params.get('bbox')
-        })
+        data = {
+            'bbox': request.query_params.get('bbox'),
+            'statistics': request.query_params.get('statistics')
+        }
+        if request.query_params.get('bins'):
+            data['bins'] = request.query_params.get('bins')
+        serializer = ZonalStatisticsRequestSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        bbox_list = serializer.validated_data['bbox_list']
-        bbox_str = serializer.validated_data['bbox']
-        task = ZonalStatisticsTask.objects.create(
-            submitted_on=timezone.now(),
-            submitted_by=request.user,
-            parameters=bbox_str,
-            bbox_minx=bbox_list[0],
-            bbox_miny=bbox_list[1],
-            bbox_maxx=bbox_list[2],
-            bbox_maxy=bbox_list[3]
+        return self.submit_task(
+            request,
+            serializer.validated_data['bbox_list'],
+            statistics=serializer.validated_data['statistics'],
+            histogram_bins=serializer.validated_data['bins']
         )
-        # Queue calculation worker
-        submit_result = calculate_zonal_statistics.delay(task.id)
-        task.task_id = submit_result.id
-        task.task_name = calculate_zonal_statistics.name
-        task.save(update_fields=['task_id', 'task_name'])
 
-        return Response(
-            {
-                'task_uuid': str(task.uuid),
-                'message': 'Zonal statistics calculation started'
-            },
-            status=status.HTTP_202_ACCEPTED
+    @swagger_auto_schema(
+        operation_id='zonal-statistics-calculate-polygon',
+        operation_description=(
+            'Initiate the calculation of zonal statistics for all '
+            'nature base layers within a polygon. The polygon is either '
+            'GeoJSON geometry in WGS84 or uuid of uploaded vector layer. '
+            'Only pixels whose centre is inside the polygon are used.'
+        ),
+        tags=[LAYER_API_TAG],
+        request_body=ZonalStatisticsPolygonRequestSerializer,
+        responses={
+            202: openapi.Schema(
+                description='Task initiated successfully',
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'task_uuid': openapi.Schema(
+                        title='Task UUID',
+                        type=openapi.TYPE_STRING,
+                        format='uuid'
+                    ),
+                    'message': openapi.Schema(
+                        title='Status message',
+                        type=openapi.TYPE_STRING
+                    )
+                }
+            ),
+            400: APIErrorSerializer
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = ZonalStatisticsPolygonRequestSerializer(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        geometry_layer = serializer.validated_data.get('geometry_layer')
+        if geometry_layer:
+            # keep the layer from retention until the worker reads it
+            InputLayer.touch_last_used([geometry_layer.uuid])
+        return self.submit_task(
+            request,
+            serializer.validated_data['bbox_list'],
+            geometry=serializer.validated_data.get('geometry'),
+            geometry_layer=geometry_layer,
+            statistics=serializer.validated_data['statistics'],
+            histogram_bins=serializer.validated_data['bins']
         )
 
 
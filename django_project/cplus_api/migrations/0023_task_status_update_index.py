@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0022_inputlayer_action'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scenariotask',
+            index=models.Index(fields=['status', 'last_update'], name='scenariotask_status_update_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='zonalstatisticstask',
+            index=models.Index(fields=['status', 'last_update'], name='zonalstats_status_update_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0023_task_status_update_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scenariotask',
+            name='queue',
+            field=models.CharField(default='cplus', help_text='Celery queue that runs the scenario.', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='scenariotask',
+            name='priority',
+            field=models.IntegerField(default=0, help_text='Higher priority is dispatched first.'),
+        ),
+        migrations.AddField(
+            model_name='scenariotask',
+            name='scheduled_on',
+            field=models.DateTimeField(blank=True, help_text='Time when the task is waiting in the scheduler.', null=True),
+        ),
+    ]
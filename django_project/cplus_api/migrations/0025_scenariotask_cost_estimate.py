@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0024_scenariotask_scheduler'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scenariotask',
+            name='cost_estimate',
+            field=models.JSONField(blank=True, default=dict, help_text='Estimated pixels, disk, memory and runtime.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0025_scenariotask_cost_estimate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scenariotask',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of scenario detail, input layers and code version that is used to reuse identical results.', max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0026_scenariotask_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outputlayer',
+            name='stage_key',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of the inputs of the analysis stage that produces intermediate output.', max_length=64, null=True),
+        ),
+    ]
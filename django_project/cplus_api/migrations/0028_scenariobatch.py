@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cplus_api', '0027_outputlayer_stage_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScenarioBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, unique=True)),
+                ('submitted_on', models.DateTimeField()),
+                ('base_detail', models.JSONField(default=dict, help_text='Scenario detail that is shared by the batch.')),
+                ('parameter_grid', models.JSONField(default=dict, help_text='Dictionary of parameter path and list of values.')),
+                ('submitted_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='scenariotask',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scenarios', to='cplus_api.scenariobatch'),
+        ),
+        migrations.AddField(
+            model_name='scenariotask',
+            name='batch_parameters',
+            field=models.JSONField(blank=True, default=dict, help_text='Parameter values of the scenario in the batch.'),
+        ),
+    ]
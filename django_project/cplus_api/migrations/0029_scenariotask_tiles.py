@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0028_scenariobatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scenariotask',
+            name='is_tiled',
+            field=models.BooleanField(default=False, help_text='Scenario is run as tiles in distributed mode.'),
+        ),
+        migrations.AddField(
+            model_name='scenariotask',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='Tiled scenario of this tile.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tiles', to='cplus_api.scenariotask'),
+        ),
+        migrations.AddField(
+            model_name='scenariotask',
+            name='tile',
+            field=models.JSONField(blank=True, default=dict, help_text='Index, extent and core extent of the tile.'),
+        ),
+    ]
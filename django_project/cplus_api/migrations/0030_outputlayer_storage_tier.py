@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0029_scenariotask_tiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outputlayer',
+            name='archived_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outputlayer',
+            name='storage_tier',
+            field=models.CharField(choices=[('standard', 'standard'), ('archived', 'archived'), ('restoring', 'restoring')], default='standard', help_text='Archived file is stored in archive storage and needs to be restored before it can be downloaded.', max_length=20),
+        ),
+    ]
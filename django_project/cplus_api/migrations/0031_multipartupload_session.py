@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0030_outputlayer_storage_tier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multipartupload',
+            name='expires_on',
+            field=models.DateTimeField(blank=True, help_text='Unfinished upload is aborted after this time.', null=True),
+        ),
+        migrations.AddField(
+            model_name='multipartupload',
+            name='file_path',
+            field=models.CharField(blank=True, default='', help_text='Object key of the upload in input layer storage.', max_length=512),
+        ),
+        migrations.AddField(
+            model_name='multipartupload',
+            name='part_etags',
+            field=models.JSONField(blank=True, default=dict, help_text='ETag of uploaded parts by part number.'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0031_multipartupload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inputlayer',
+            name='checksum',
+            field=models.CharField(blank=True, default='', help_text='SHA256 of the layer file.', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='inputlayer',
+            name='ingestion_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='inputlayer',
+            name='ingestion_status',
+            field=models.CharField(choices=[('pending', 'pending'), ('processing', 'processing'), ('ready', 'ready'), ('failed', 'failed')], default='ready', help_text='Uploaded file is validated and converted to COG before the layer can be used in scenario analysis.', max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:15
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0032_inputlayer_ingestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inputlayer',
+            name='footprint',
+            field=django.contrib.gis.db.models.fields.PolygonField(blank=True, help_text='Bounding box of the layer in EPSG:4326.', null=True, srid=4326),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0033_inputlayer_footprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zonalstatisticstask',
+            name='histogram_bins',
+            field=models.PositiveIntegerField(default=10, help_text='Number of bins when histogram is requested.'),
+        ),
+        migrations.AddField(
+            model_name='zonalstatisticstask',
+            name='statistics',
+            field=models.JSONField(blank=True, default=list, help_text='List of statistics to be calculated for each layer.'),
+        ),
+    ]
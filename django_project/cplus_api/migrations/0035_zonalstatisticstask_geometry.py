@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:40
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0034_zonalstatisticstask_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zonalstatisticstask',
+            name='geometry',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, help_text='Polygon of the zonal statistics in EPSG:4326.', null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='zonalstatisticstask',
+            name='geometry_layer',
+            field=models.ForeignKey(blank=True, help_text='Vector layer that the geometry is read from.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cplus_api.inputlayer'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 21:10
+
+from django.db import migrations, models
+
+
+def clear_stage_keys(apps, schema_editor):
+    """Stage keys are not checksums of the files."""
+    OutputLayer = apps.get_model('cplus_api', 'OutputLayer')
+    OutputLayer.objects.filter(
+        content_hash__isnull=False
+    ).update(content_hash=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cplus_api', '0035_zonalstatisticstask_geometry'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='outputlayer',
+            old_name='stage_key',
+            new_name='content_hash',
+        ),
+        migrations.AlterField(
+            model_name='outputlayer',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA256 of intermediate output file that is used to skip upload of identical output.', max_length=64, null=True),
+        ),
+        migrations.RunPython(
+            clear_stage_keys, migrations.RunPython.noop
+        ),
+    ]
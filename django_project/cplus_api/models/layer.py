@@ -1,18 +1,24 @@
 import os
 import uuid
 import shutil
+from datetime import timedelta
 from zipfile import ZipFile
-from django.db import models
+from django.db import models, transaction
+from django.contrib.gis.db.models import PolygonField
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.utils import timezone
 from django.core.files.storage import storages, FileSystemStorage
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django_cleanup import cleanup
 
 
 COMMON_LAYERS_DIR = 'common_layers'
 INTERNAL_LAYERS_DIR = 'internal_layers'
+OUTPUT_ARCHIVE_DIR = 'archive'
+# InputLayer file is moved when one of these fields is changed
+FILE_LOCATION_FIELDS = ['privacy_type', 'component_type']
 
 
 def input_layer_dir_path(instance, filename):
@@ -56,6 +62,16 @@ def select_input_layer_storage():
     return storages['input_layer_storage']
 
 
+def select_output_archive_storage():
+    """Return storage for archived output layer."""
+    return storages['output_archive_storage']
+
+
+def output_archive_file_path(file_name):
+    """Return file path of output layer in archive storage."""
+    return f'{OUTPUT_ARCHIVE_DIR}/{file_name}'
+
+
 def default_output_meta():
     """
     Default value for OutputLayer's output_meta.
@@ -123,6 +139,12 @@ class InputLayer(BaseLayer):
         MANAGE = 2, _('Manage')
         UNDEFINED = -1, _('Undefined')
 
+    class IngestionStatus(models.TextChoices):
+        PENDING = 'pending', _('pending')
+        PROCESSING = 'processing', _('processing')
+        READY = 'ready', _('ready')
+        FAILED = 'failed', _('failed')
+
 
     file = models.FileField(
         upload_to=input_layer_dir_path,
@@ -186,28 +208,118 @@ class InputLayer(BaseLayer):
         blank=True
     )
 
+    ingestion_status = models.CharField(
+        max_length=20,
+        choices=IngestionStatus.choices,
+        default=IngestionStatus.READY,
+        help_text=(
+            'Uploaded file is validated and converted to COG before '
+            'the layer can be used in scenario analysis.'
+        )
+    )
+
+    ingestion_error = models.TextField(
+        blank=True,
+        default=''
+    )
+
+    checksum = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text='SHA256 of the layer file.'
+    )
+
+    footprint = PolygonField(
+        srid=4326,
+        null=True,
+        blank=True,
+        spatial_index=True,
+        help_text='Bounding box of the layer in EPSG:4326.'
+    )
+
     def __str__(self):
         return f"{self.name} - {self.component_type}"
 
+    def is_ready(self):
+        return self.ingestion_status == InputLayer.IngestionStatus.READY
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_file_location_fields()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self.snapshot_file_location_fields()
+
+    def snapshot_file_location_fields(self):
+        """Store loaded values of fields that decide the file location."""
+        self._loaded_values = {
+            field: self.__dict__[field] for field in FILE_LOCATION_FIELDS
+            if field in self.__dict__
+        }
+
+    def get_loaded_values(self):
+        """Return values of file location fields in the database.
+
+        Snapshot from loading the object is used when available,
+        otherwise the values are fetched.
+
+        :return: dictionary of field name and value
+        :rtype: dict
+        """
+        loaded_values = getattr(self, '_loaded_values', {})
+        if len(loaded_values) == len(FILE_LOCATION_FIELDS):
+            return loaded_values
+        return InputLayer.objects.filter(
+            pk=self.pk
+        ).values(*FILE_LOCATION_FIELDS).first() or {}
+
     def save(
         self, force_insert=False, force_update=False,
             using=None, update_fields=None
     ):
         if self.pk:
-            old_instance = InputLayer.objects.get(uuid=self.uuid)
             self.move_file = False
-            if old_instance.privacy_type != self.privacy_type:
-                self.move_file = True
-            if old_instance.component_type != self.component_type:
-                self.move_file = True
-        return super().save(
+            if update_fields is None or (
+                set(update_fields) & set(FILE_LOCATION_FIELDS)
+            ):
+                loaded_values = self.get_loaded_values()
+                for field in FILE_LOCATION_FIELDS:
+                    if (
+                        field in loaded_values and
+                        loaded_values[field] != getattr(self, field)
+                    ):
+                        self.move_file = True
+        result = super().save(
             force_insert=False,
             force_update=False,
             using=using,
             update_fields=update_fields
         )
-
-    def download_to_working_directory(self, base_dir: str):
+        self.snapshot_file_location_fields()
+        return result
+
+    @staticmethod
+    def touch_last_used(uuids):
+        """Update last_used_on of input layers in one query.
+
+        :param uuids: list of input layer UUID
+        :type uuids: list
+        :return: number of updated input layers
+        :rtype: int
+        """
+        uuids = list(uuids)
+        if not uuids:
+            return 0
+        return InputLayer.objects.filter(
+            uuid__in=uuids
+        ).update(last_used_on=timezone.now())
+
+    def download_to_working_directory(
+            self, base_dir: str, touch_last_used=True):
         if not self.is_available():
             return None
         dir_path: str = os.path.join(
@@ -233,8 +345,8 @@ class InputLayer(BaseLayer):
                 file_path,
                 Config=settings.AWS_TRANSFER_CONFIG
             )
-        self.last_used_on = timezone.now()
-        self.save(update_fields=['last_used_on'])
+        if touch_last_used:
+            InputLayer.touch_last_used([self.uuid])
         if file_path.endswith('.zip'):
             extract_path = os.path.join(
                 dir_path,
@@ -288,17 +400,26 @@ class InputLayer(BaseLayer):
                 os.path.join(storage.location, old_path),
                 full_correct_path,
             )
-        else:
-            boto3_client = storage.connection.meta.client
-            copy_source = {
-                'Bucket': storage.bucket_name,
-                'Key': old_path
-            }
-            boto3_client.copy(copy_source, storage.bucket_name, correct_path)
-            boto3_client.delete_object(
-                Bucket=storage.bucket_name, Key=old_path)
-        self.file.name = correct_path
-        self.save(update_fields=['file'])
+            self.file.name = correct_path
+            self.save(update_fields=['file'])
+            return
+        from cplus_api.utils.s3_copy import multipart_copy
+        boto3_client = storage.connection.meta.client
+        # layer stays readable from old path until the pointer is flipped
+        multipart_copy(
+            boto3_client, storage.bucket_name, old_path,
+            storage.bucket_name, correct_path
+        )
+        with transaction.atomic():
+            current = InputLayer.objects.select_for_update().get(id=self.id)
+            if current.file.name != old_path:
+                # file is replaced during the copy, discard the copy
+                transaction.on_commit(lambda: boto3_client.delete_object(
+                    Bucket=storage.bucket_name, Key=correct_path))
+                return
+            # old file is removed by django-cleanup after commit
+            self.file.name = correct_path
+            self.save(update_fields=['file'])
 
     def fix_layer_metadata(self):
         if not self.is_available():
@@ -310,7 +431,19 @@ class InputLayer(BaseLayer):
         self.move_file_location()
 
 
+@cleanup.ignore
 class OutputLayer(BaseLayer):
+    """Output layer of scenario analysis.
+
+    The file can be shared by output layers of identical scenarios,
+    hence it is removed by post_delete_output_layer instead of
+    django-cleanup.
+    """
+
+    class StorageTiers(models.TextChoices):
+        STANDARD = 'standard', _('standard')
+        ARCHIVED = 'archived', _('archived')
+        RESTORING = 'restoring', _('restoring')
 
     is_final_output = models.BooleanField(
         default=False
@@ -340,6 +473,29 @@ class OutputLayer(BaseLayer):
         blank=True,
         help_text='Output Metadata.'
     )
+    content_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text=(
+            'SHA256 of intermediate output file that is used to '
+            'skip upload of identical output.'
+        )
+    )
+    storage_tier = models.CharField(
+        max_length=20,
+        choices=StorageTiers.choices,
+        default=StorageTiers.STANDARD,
+        help_text=(
+            'Archived file is stored in archive storage and needs to be '
+            'restored before it can be downloaded.'
+        )
+    )
+    archived_on = models.DateTimeField(
+        null=True,
+        blank=True
+    )
 
     def __str__(self):
         group = self.group if not self.is_final_output else 'Final'
@@ -375,6 +531,73 @@ class MultipartUpload(models.Model):
         blank=True
     )
 
+    file_path = models.CharField(
+        max_length=512,
+        blank=True,
+        default='',
+        help_text='Object key of the upload in input layer storage.'
+    )
+
+    part_etags = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='ETag of uploaded parts by part number.'
+    )
+
+    expires_on = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text='Unfinished upload is aborted after this time.'
+    )
+
+    def extend_session(self, save=True):
+        """Extend expiry time of the upload session.
+
+        :param save: save the expiry time, defaults to True
+        :type save: bool, optional
+        """
+        self.expires_on = timezone.now() + timedelta(
+            days=settings.MULTIPART_UPLOAD_SESSION_DAYS)
+        if save:
+            self.save(update_fields=['expires_on'])
+
+    def update_part_etags(self, parts):
+        """Store ETags of uploaded parts.
+
+        :param parts: list of part_number and etag
+        :type parts: list
+        """
+        self.part_etags = {
+            str(part['part_number']): part['etag'] for part in parts
+        }
+        self.save(update_fields=['part_etags'])
+
+    def get_uploaded_parts(self):
+        """Return uploaded parts sorted by part number.
+
+        :return: list of part_number and etag
+        :rtype: list
+        """
+        return [
+            {
+                'part_number': int(part_number),
+                'etag': etag
+            } for part_number, etag in sorted(
+                self.part_etags.items(), key=lambda item: int(item[0])
+            )
+        ]
+
+    def get_missing_parts(self):
+        """Return part numbers that have not been uploaded.
+
+        :return: list of part number
+        :rtype: list
+        """
+        return [
+            part_number for part_number in range(1, self.parts + 1) if
+            str(part_number) not in self.part_etags
+        ]
+
 
 class TemporaryLayer(models.Model):
     """Model to store temporary layer files."""
@@ -404,3 +627,23 @@ def post_delete_temp_layer(sender, instance, **kwargs):
     file_path = os.path.join(settings.TEMPORARY_LAYER_DIR, instance.file_name)
     if os.path.exists(file_path):
         os.remove(file_path)
+
+
+@receiver(post_delete, sender=OutputLayer)
+def post_delete_output_layer(sender, instance, **kwargs):
+    """Remove output file if no other OutputLayer references it."""
+    file_name = instance.file.name
+    if not file_name:
+        return
+    storage = instance.file.storage
+    archive_file_name = None
+    if instance.storage_tier != OutputLayer.StorageTiers.STANDARD:
+        storage = select_output_archive_storage()
+        archive_file_name = output_archive_file_path(file_name)
+
+    def delete_file():
+        if OutputLayer.objects.filter(file=file_name).exists():
+            return
+        storage.delete(archive_file_name or file_name)
+
+    transaction.on_commit(delete_file)
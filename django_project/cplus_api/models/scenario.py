@@ -1,12 +1,11 @@
 import os
+import uuid
 import shutil
+from django.conf import settings
 from django.db import models
-from django.contrib.contenttypes.models import ContentType
 from core.models.base_task_request import BaseTaskRequest
-from core.models.task_log import TaskLog
 
 
-DEFAULT_BASE_DIR = '/home/web/media'
 EXCLUDED_OUTPUT_DIR_NAMES = [
     'ncs_carbon', 'ncs_pathway', 'priority_layer',
     'ncs_carbons', 'ncs_pathways', 'priority_layers',
@@ -15,6 +14,43 @@ EXCLUDED_OUTPUT_DIR_NAMES = [
 ]
 
 
+class ScenarioBatch(models.Model):
+    """Parent job of scenarios from parameter grid of a base scenario."""
+
+    uuid = models.UUIDField(
+        default=uuid.uuid4,
+        unique=True
+    )
+    submitted_on = models.DateTimeField()
+    submitted_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    base_detail = models.JSONField(
+        default=dict,
+        help_text='Scenario detail that is shared by the batch.'
+    )
+    parameter_grid = models.JSONField(
+        default=dict,
+        help_text='Dictionary of parameter path and list of values.'
+    )
+
+    def __str__(self):
+        return f'{self.uuid} - {self.submitted_by}'
+
+    def get_resources_path(self, base_dir=None):
+        return os.path.join(
+            f"{base_dir or settings.SCRATCH_DIR}",
+            f"{str(self.submitted_by.id)}",
+            f'batch_{str(self.uuid)}',
+        )
+
+    def clear_resources(self, base_dir=None):
+        resources_path = self.get_resources_path(base_dir)
+        if os.path.exists(resources_path):
+            shutil.rmtree(resources_path)
+
+
 class ScenarioTask(BaseTaskRequest):
 
     api_version = models.CharField(
@@ -35,45 +71,155 @@ class ScenarioTask(BaseTaskRequest):
         default='',
         blank=True
     )
+    queue = models.CharField(
+        max_length=50,
+        default='cplus',
+        help_text='Celery queue that runs the scenario.'
+    )
+    priority = models.IntegerField(
+        default=0,
+        help_text='Higher priority is dispatched first.'
+    )
+    scheduled_on = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text='Time when the task is waiting in the scheduler.'
+    )
+    fingerprint = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text=(
+            'Hash of scenario detail, input layers and code version '
+            'that is used to reuse identical results.'
+        )
+    )
+    cost_estimate = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Estimated pixels, disk, memory and runtime.'
+    )
+    batch = models.ForeignKey(
+        ScenarioBatch,
+        null=True,
+        blank=True,
+        related_name='scenarios',
+        on_delete=models.SET_NULL
+    )
+    batch_parameters = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Parameter values of the scenario in the batch.'
+    )
+    is_tiled = models.BooleanField(
+        default=False,
+        help_text='Scenario is run as tiles in distributed mode.'
+    )
+    parent = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        related_name='tiles',
+        on_delete=models.CASCADE,
+        help_text='Tiled scenario of this tile.'
+    )
+    tile = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Index, extent and core extent of the tile.'
+    )
+
+    class Meta:
+        indexes = [
+            # used by the sweeper to find interrupted tasks
+            models.Index(
+                fields=['status', 'last_update'],
+                name='scenariotask_status_update_idx'
+            ),
+        ]
+
+    def publish_status(self):
+        """Publish current status to the scenario event stream."""
+        from cplus_api.utils.task_events import (
+            publish_scenario_event,
+            get_scenario_snapshot,
+            EVENT_STATUS
+        )
+        publish_scenario_event(
+            self.uuid, EVENT_STATUS, get_scenario_snapshot(self))
 
     def task_on_sent(self, task_id, task_name, parameters):
         super().task_on_sent(task_id, task_name, parameters)
-        # clean logs
-        ct = ContentType.objects.get(
-            app_label="cplus_api", model="scenariotask")
-        TaskLog.objects.filter(
-            content_type=ct,
-            object_id=self.pk
-        ).delete()
+        # logs of previous run are cleared by execute, keep the
+        # scheduler and sweeper logs of this run
         self.add_log('Task is sent to worker.')
 
+    def task_on_queued(self, task_id, task_name, parameters):
+        super().task_on_queued(task_id, task_name, parameters)
+        self.publish_status()
+
     def task_on_started(self):
         super().task_on_started()
         self.add_log('Task has been started.')
+        self.publish_status()
+
+    def task_on_completed(self):
+        super().task_on_completed()
+        self.clear_batch_resources()
+        self.notify_tile_finished()
+        self.publish_status()
 
     def task_on_cancelled(self):
         super().task_on_cancelled()
         # clean resources
         self.clear_resources()
+        self.release_scratch()
+        self.clear_batch_resources()
+        self.notify_tile_finished()
+        self.publish_status()
 
     def task_on_errors(self, exception=None, traceback=None):
         super().task_on_errors(exception, traceback)
         # clean resources
         self.clear_resources()
+        self.release_scratch()
+        self.clear_batch_resources()
+        self.notify_tile_finished()
+        self.publish_status()
+
+    def notify_tile_finished(self):
+        """Update tiled scenario when this tile is finished."""
+        if not self.parent_id:
+            return
+        from cplus_api.utils.tiling import on_tile_finished
+        on_tile_finished(self)
+
+    def release_scratch(self):
+        """Release scratch space that is reserved for this task."""
+        from cplus_api.utils.scratch import release_scratch
+        release_scratch(self)
+
+    def clear_batch_resources(self):
+        """Remove shared inputs of the batch after the last scenario."""
+        if not self.batch_id:
+            return
+        from cplus_api.utils.batch import clear_batch_resources
+        clear_batch_resources(self.batch)
 
-    def get_resources_path(self, base_dir=DEFAULT_BASE_DIR):
+    def get_resources_path(self, base_dir=None):
         return os.path.join(
-            f"{base_dir}",
+            f"{base_dir or settings.SCRATCH_DIR}",
             f"{str(self.submitted_by.id)}",
             f'{str(self.uuid)}',
         )
 
-    def clear_resources(self, base_dir=DEFAULT_BASE_DIR):
+    def clear_resources(self, base_dir=None):
         resources_path = self.get_resources_path(base_dir)
         if os.path.exists(resources_path):
             shutil.rmtree(resources_path)
 
-    def get_scenario_output_files(self, base_dir=DEFAULT_BASE_DIR):
+    def get_scenario_output_files(self, base_dir=None):
         directory_path = self.get_resources_path(base_dir)
         results = {}
         total_files = 0
@@ -1,3 +1,4 @@
+from django.contrib.gis.db.models import MultiPolygonField
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from core.models.base_task_request import BaseTaskRequest
@@ -12,7 +13,37 @@ class ZonalStatisticsTask(BaseTaskRequest):
     bbox_maxx = models.FloatField()
     bbox_maxy = models.FloatField()
 
-    # List of {uuid, layer_name, mean_value} for each naturebase layer
+    # Optional polygon inside the bbox, pixels outside are excluded
+    geometry = MultiPolygonField(
+        srid=4326,
+        null=True,
+        blank=True,
+        help_text='Polygon of the zonal statistics in EPSG:4326.'
+    )
+
+    geometry_layer = models.ForeignKey(
+        'cplus_api.InputLayer',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        help_text='Vector layer that the geometry is read from.'
+    )
+
+    # Requested statistics, e.g. ["mean", "max", "p90", "histogram"]
+    statistics = models.JSONField(
+        default=list,
+        blank=True,
+        help_text='List of statistics to be calculated for each layer.'
+    )
+
+    histogram_bins = models.PositiveIntegerField(
+        default=10,
+        help_text='Number of bins when histogram is requested.'
+    )
+
+    # List of {uuid, layer_name, mean_value, statistics} for each
+    # naturebase layer
     result = models.JSONField(null=True, blank=True)
 
     error_message = models.TextField(null=True, blank=True)
@@ -21,6 +52,13 @@ class ZonalStatisticsTask(BaseTaskRequest):
         verbose_name = _("Zonal statistics task")
         verbose_name_plural = _("Zonal statistics tasks")
         ordering = ["-submitted_on"]
+        indexes = [
+            # used by the sweeper to find interrupted tasks
+            models.Index(
+                fields=["status", "last_update"],
+                name="zonalstats_status_update_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"ZonalStatisticsTask {self.uuid}"
@@ -94,6 +94,24 @@ LAYER_SCHEMA_FIELDS = {
                 InputLayer.PathwayTypes.PROTECT
             ]
         ),
+        'ingestion_status': openapi.Schema(
+            title='Layer can be used in scenario analysis when ready',
+            type=openapi.TYPE_STRING,
+            enum=[
+                InputLayer.IngestionStatus.PENDING,
+                InputLayer.IngestionStatus.PROCESSING,
+                InputLayer.IngestionStatus.READY,
+                InputLayer.IngestionStatus.FAILED
+            ]
+        ),
+        'ingestion_error': openapi.Schema(
+            title='Error of failed ingestion',
+            type=openapi.TYPE_STRING
+        ),
+        'checksum': openapi.Schema(
+            title='SHA256 of layer file',
+            type=openapi.TYPE_STRING
+        ),
     },
     'required': [
         'filename', 'size', 'uuid', 'layer_type',
@@ -114,7 +132,10 @@ LAYER_SCHEMA_FIELDS = {
         'license': 'CC BY 4.0',
         'version': '1.0.0',
         'source': InputLayer.LayerSources.NATURE_BASE,
-        'action': InputLayer.PathwayTypes.PROTECT
+        'action': InputLayer.PathwayTypes.PROTECT,
+        'ingestion_status': InputLayer.IngestionStatus.READY,
+        'ingestion_error': '',
+        'checksum': ''
     }
 }
 
@@ -174,6 +195,19 @@ OUTPUT_LAYER_SCHEMA_FIELDS = {
             title='Output Metadata',
             type=openapi.TYPE_OBJECT,
         ),
+        'storage_tier': openapi.Schema(
+            title='Storage Tier',
+            type=openapi.TYPE_STRING,
+            enum=[
+                OutputLayer.StorageTiers.STANDARD,
+                OutputLayer.StorageTiers.ARCHIVED,
+                OutputLayer.StorageTiers.RESTORING
+            ],
+        ),
+        'archived_on': openapi.Schema(
+            title='Archived Date Time',
+            type=openapi.TYPE_STRING
+        ),
     },
     'required': [
         'filename', 'size', 'uuid', 'layer_type'
@@ -187,7 +221,9 @@ OUTPUT_LAYER_SCHEMA_FIELDS = {
         'created_on': '2022-08-15T08:09:15.049806Z',
         'url': '',
         'is_final_output': False,
-        'group': 'weighted_ims'
+        'group': 'weighted_ims',
+        'storage_tier': 'standard',
+        'archived_on': None
     }
 }
 
@@ -222,7 +258,8 @@ class InputLayerSerializer(serializers.ModelSerializer):
             'created_by', 'layer_type', 'size',
             'url', 'component_type', 'privacy_type',
             'client_id', 'metadata', 'description',
-            'license', 'version', 'source', 'action'
+            'license', 'version', 'source', 'action',
+            'ingestion_status', 'ingestion_error', 'checksum'
         ]
 
 
@@ -272,6 +309,7 @@ class UploadLayerSerializer(serializers.Serializer):
     name = serializers.CharField(required=True)
     size = serializers.IntegerField(required=True, min_value=1)
     number_of_parts = serializers.IntegerField(required=False, default=0)
+    paged = serializers.BooleanField(required=False, default=False)
 
     description = serializers.CharField(required=False, allow_blank=True,
                                         allow_null=True)
@@ -341,6 +379,14 @@ class UploadLayerSerializer(serializers.Serializer):
                     type=openapi.TYPE_INTEGER,
                     default=0
                 ),
+                'paged': openapi.Schema(
+                    title=(
+                        'Return presigned URLs of the first page only, '
+                        'next parts are signed using layer-upload-sign.'
+                    ),
+                    type=openapi.TYPE_BOOLEAN,
+                    default=False
+                ),
                 'license': openapi.Schema(
                     title='Layer License',
                     type=openapi.TYPE_STRING
@@ -407,6 +453,45 @@ class FinishUploadLayerSerializer(serializers.Serializer):
         }
 
 
+class MultipartUploadSessionSerializer(serializers.Serializer):
+    multipart_upload_id = serializers.CharField()
+    part_numbers = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False
+    )
+    from_part = serializers.IntegerField(min_value=1, required=False)
+    count = serializers.IntegerField(min_value=1, required=False)
+
+    class Meta:
+        swagger_schema_fields = {
+            'type': openapi.TYPE_OBJECT,
+            'title': 'Multipart Upload Session',
+            'properties': {
+                'multipart_upload_id': openapi.Schema(
+                    title='Upload Id for multipart upload',
+                    type=openapi.TYPE_STRING
+                ),
+                'part_numbers': openapi.Schema(
+                    title=(
+                        'Part numbers to be signed, '
+                        'default to parts that have not been uploaded'
+                    ),
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_INTEGER)
+                ),
+                'from_part': openapi.Schema(
+                    title='First part number of a page to be signed',
+                    type=openapi.TYPE_INTEGER
+                ),
+                'count': openapi.Schema(
+                    title='Number of parts in a page to be signed',
+                    type=openapi.TYPE_INTEGER
+                ),
+            },
+            'required': ['multipart_upload_id']
+        }
+
+
 class OutputLayerSerializer(serializers.ModelSerializer):
     filename = serializers.CharField(source='name')
     created_by = serializers.SerializerMethodField()
@@ -418,6 +503,9 @@ class OutputLayerSerializer(serializers.ModelSerializer):
     def get_url(self, obj: OutputLayer):
         if not obj.file.name:
             return None
+        if obj.storage_tier != OutputLayer.StorageTiers.STANDARD:
+            # archived file must be restored first
+            return None
         if not obj.file.storage.exists(obj.file.name):
             return None
         if settings.DEBUG:
@@ -431,7 +519,7 @@ class OutputLayerSerializer(serializers.ModelSerializer):
             'uuid', 'filename', 'created_on',
             'created_by', 'layer_type', 'size',
             'url', 'is_final_output', 'group',
-            'output_meta'
+            'output_meta', 'storage_tier', 'archived_on'
         ]
 
 
@@ -2,12 +2,13 @@ import uuid
 from logging import getLevelName
 from rest_framework import serializers
 from drf_yasg import openapi
-from django.contrib.contenttypes.models import ContentType
 from core.models.base_task_request import TaskStatus
 from core.models.task_log import TaskLog
 from cplus_api.models.layer import BaseLayer, InputLayer
-from cplus_api.models.scenario import ScenarioTask
+from cplus_api.models.scenario import ScenarioTask, ScenarioBatch
 from cplus_api.utils.default import DEFAULT_VALUES
+from cplus_api.utils.batch import get_batch_status_counts
+from cplus_api.utils.scheduler import get_queue_position
 
 
 def validate_layer_uuid(value):
@@ -31,6 +32,11 @@ def validate_layer_uuid(value):
     if not input_layer.is_available():
         raise serializers.ValidationError(
             f'Missing input layer {value} file!')
+    if not input_layer.is_ready():
+        raise serializers.ValidationError(
+            f'Input layer {value} is not ready: '
+            f'{input_layer.ingestion_status}!'
+        )
 
 
 class BaseLayerSerializer(serializers.Serializer):
@@ -390,6 +396,7 @@ class ScenarioTaskStatusSerializer(serializers.ModelSerializer):
     scenario_name = serializers.SerializerMethodField()
     created_by = serializers.SerializerMethodField()
     logs = serializers.SerializerMethodField()
+    queue_position = serializers.SerializerMethodField()
 
     def get_created_by(self, obj: ScenarioTask):
         return obj.submitted_by.email
@@ -402,13 +409,18 @@ class ScenarioTaskStatusSerializer(serializers.ModelSerializer):
             'scenario_name' in obj.detail else ''
         )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # status poll can exclude the logs using include_logs=False
+        include_logs = self.context.get('include_logs', True)
+        if not include_logs and 'logs' in self.fields:
+            self.fields.pop('logs')
+
     def get_logs(self, obj: ScenarioTask):
-        scenario_task_ct = ContentType.objects.get(
-            app_label="cplus_api", model="scenariotask")
-        return TaskLog.objects.filter(
-            content_type=scenario_task_ct,
-            object_id=obj.pk
-        ).order_by('date_time').values('log', 'date_time')
+        return obj.get_logs().order_by('id').values('id', 'log', 'date_time')
+
+    def get_queue_position(self, obj: ScenarioTask):
+        return get_queue_position(obj)
 
     class Meta:
         swagger_schema_fields = {
@@ -472,6 +484,13 @@ class ScenarioTaskStatusSerializer(serializers.ModelSerializer):
                     title='Progress Description',
                     type=openapi.TYPE_STRING
                 ),
+                'queue_position': openapi.Schema(
+                    title=(
+                        'Estimated position in the scheduler queue, '
+                        'empty when task has been dispatched'
+                    ),
+                    type=openapi.TYPE_INTEGER
+                ),
                 'logs': openapi.Schema(
                     title='Logs',
                     type=openapi.TYPE_ARRAY,
@@ -491,6 +510,7 @@ class ScenarioTaskStatusSerializer(serializers.ModelSerializer):
                 'errors': None,
                 'progress': 70,
                 'progress_text': 'Processing ABC',
+                'queue_position': None,
                 'logs': []
             }
         }
@@ -500,7 +520,7 @@ class ScenarioTaskStatusSerializer(serializers.ModelSerializer):
             'scenario_name', 'status', 'submitted_on',
             'created_by', 'started_at', 'finished_at',
             'errors', 'progress', 'progress_text',
-            'logs'
+            'queue_position', 'logs'
         ]
 
 
@@ -515,6 +535,10 @@ class ScenarioTaskLogSerializer(serializers.ModelSerializer):
             'type': openapi.TYPE_OBJECT,
             'title': 'Scenario Log',
             'properties': {
+                'id': openapi.Schema(
+                    title='Log ID, can be used as after_id cursor',
+                    type=openapi.TYPE_INTEGER
+                ),
                 'date_time': openapi.Schema(
                     title='Log Date Time',
                     type=openapi.TYPE_STRING
@@ -529,6 +553,7 @@ class ScenarioTaskLogSerializer(serializers.ModelSerializer):
                 ),
             },
             'example': {
+                'id': 1,
                 'date_time': '2022-08-15T09:09:15.049806Z',
                 'severity': 'INFO',
                 'log': 'Processing ABC is finished'
@@ -536,7 +561,7 @@ class ScenarioTaskLogSerializer(serializers.ModelSerializer):
         }
         model = TaskLog
         fields = [
-            'date_time', 'severity', 'log'
+            'id', 'date_time', 'severity', 'log'
         ]
 
 
@@ -642,3 +667,126 @@ class ScenarioDetailSerializer(ScenarioTaskStatusSerializer):
                 }
             }
         }
+
+
+class ScenarioBatchInputSerializer(serializers.Serializer):
+    base = serializers.DictField()
+    parameters = serializers.DictField(
+        child=serializers.ListField(allow_empty=False)
+    )
+
+    class Meta:
+        swagger_schema_fields = {
+            'type': openapi.TYPE_OBJECT,
+            'title': 'Scenario Batch Input',
+            'properties': {
+                'base': {
+                    **ScenarioInputSerializer.Meta.swagger_schema_fields
+                },
+                'parameters': openapi.Schema(
+                    title=(
+                        'Dictionary of parameter path and list of values, '
+                        'list item is selected by name, uuid or index'
+                    ),
+                    type=openapi.TYPE_OBJECT
+                )
+            },
+            'required': ['base', 'parameters'],
+            'example': {
+                'base': {},
+                'parameters': {
+                    'priority_layer_groups.Biodiversity.value': [1, 5, 10],
+                    'priority_layer_groups.Livelihood.value': [0, 5]
+                }
+            }
+        }
+
+
+class ScenarioBatchItemSerializer(ScenarioTaskStatusSerializer):
+    parameters = serializers.JSONField(source='batch_parameters')
+
+    class Meta:
+        model = ScenarioTask
+        fields = [
+            'uuid', 'task_id', 'scenario_name', 'status',
+            'started_at', 'finished_at', 'errors', 'progress',
+            'progress_text', 'queue_position', 'parameters'
+        ]
+
+
+class ScenarioBatchSerializer(serializers.ModelSerializer):
+    created_by = serializers.SerializerMethodField()
+    status = serializers.SerializerMethodField()
+    scenarios = serializers.SerializerMethodField()
+
+    def get_created_by(self, obj: ScenarioBatch):
+        return obj.submitted_by.email
+
+    def get_status(self, obj: ScenarioBatch):
+        return get_batch_status_counts(obj)
+
+    def get_scenarios(self, obj: ScenarioBatch):
+        return ScenarioBatchItemSerializer(
+            obj.scenarios.order_by('id'), many=True
+        ).data
+
+    class Meta:
+        swagger_schema_fields = {
+            'type': openapi.TYPE_OBJECT,
+            'title': 'Scenario Batch',
+            'properties': {
+                'uuid': openapi.Schema(
+                    title='Batch UUID',
+                    type=openapi.TYPE_STRING
+                ),
+                'submitted_on': openapi.Schema(
+                    title='Created Date Time',
+                    type=openapi.TYPE_STRING
+                ),
+                'created_by': openapi.Schema(
+                    title='Owner Email',
+                    type=openapi.TYPE_STRING
+                ),
+                'parameter_grid': openapi.Schema(
+                    title='Parameter grid',
+                    type=openapi.TYPE_OBJECT
+                ),
+                'status': openapi.Schema(
+                    title='Number of scenarios by status',
+                    type=openapi.TYPE_OBJECT
+                ),
+                'scenarios': openapi.Schema(
+                    title='Scenarios',
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(type=openapi.TYPE_OBJECT)
+                )
+            },
+            'example': {
+                'uuid': '8c4582ab-15b1-4ed0-b8e4-00640ec10a65',
+                'submitted_on': '2022-08-15T08:09:15.049806Z',
+                'created_by': 'admin@admin.com',
+                'parameter_grid': {
+                    'priority_layer_groups.Biodiversity.value': [1, 5]
+                },
+                'status': {
+                    'Completed': 1,
+                    'Running': 1
+                },
+                'scenarios': [
+                    {
+                        'uuid': '3e0c7dff-51f2-48c5-a316-15d9ca2407cb',
+                        'scenario_name': 'Scenario A (1)',
+                        'status': 'Completed',
+                        'progress': 100,
+                        'parameters': {
+                            'priority_layer_groups.Biodiversity.value': 1
+                        }
+                    }
+                ]
+            }
+        }
+        model = ScenarioBatch
+        fields = [
+            'uuid', 'submitted_on', 'created_by', 'parameter_grid',
+            'status', 'scenarios'
+        ]
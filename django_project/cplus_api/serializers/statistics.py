@@ -1,12 +1,35 @@
 from rest_framework import serializers
-from cplus_api.api_views.layer import validate_bbox
+from cplus_api.api_views.layer import validate_bbox, validate_layer_access
+from cplus_api.models.layer import InputLayer
 from cplus_api.models.statistics import ZonalStatisticsTask
+from cplus_api.utils.api_helper import get_layer_type
+from cplus_api.utils.zonal_statistics import (
+    DEFAULT_HISTOGRAM_BINS,
+    MAX_HISTOGRAM_BINS,
+    parse_geojson_geometry,
+    parse_statistics,
+)
 
 
 class ZonalStatisticsRequestSerializer(serializers.Serializer):
     """bbox expected to be in 'minx,miny,maxx,maxy' form."""
 
     bbox = serializers.CharField(required=True)
+    statistics = serializers.CharField(
+        required=False, allow_blank=True, allow_null=True
+    )
+    bins = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=MAX_HISTOGRAM_BINS,
+        default=DEFAULT_HISTOGRAM_BINS
+    )
+
+    def validate_statistics(self, value):
+        try:
+            return parse_statistics(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
 
     def validate_bbox(self, value):
         # normalize list/tuple or string to eventually return a string
@@ -42,7 +65,71 @@ class ZonalStatisticsRequestSerializer(serializers.Serializer):
 
         data["bbox_list"] = bbox_list
         data["bbox"] = normalized_bbox
+        if not data.get("statistics"):
+            data["statistics"] = parse_statistics(None)
+
+        return data
+
+
+class ZonalStatisticsPolygonRequestSerializer(serializers.Serializer):
+    """Either GeoJSON geometry or uuid of vector input layer."""
+
+    geometry = serializers.JSONField(required=False)
+    layer_uuid = serializers.UUIDField(required=False)
+    statistics = serializers.JSONField(required=False)
+    bins = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=MAX_HISTOGRAM_BINS,
+        default=DEFAULT_HISTOGRAM_BINS
+    )
+
+    def validate_geometry(self, value):
+        try:
+            return parse_geojson_geometry(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+    def validate_statistics(self, value):
+        if value is not None and not isinstance(value, (str, list)):
+            raise serializers.ValidationError(
+                "Statistics must be a list or comma separated string.")
+        try:
+            return parse_statistics(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+    def validate_layer(self, layer_uuid):
+        request = self.context.get("request")
+        input_layer = InputLayer.objects.filter(uuid=layer_uuid).first()
+        if not input_layer or (
+            request and not validate_layer_access(input_layer, request.user)
+        ):
+            raise serializers.ValidationError(
+                f"Invalid input layer object {layer_uuid}!")
+        if get_layer_type(input_layer.file.name) != 1:
+            raise serializers.ValidationError(
+                f"Input layer {layer_uuid} is not a vector layer!")
+        if not input_layer.is_ready() or input_layer.footprint is None:
+            raise serializers.ValidationError(
+                f"Input layer {layer_uuid} is not ready!")
+        return input_layer
 
+    def validate(self, data):
+        geometry = data.get("geometry")
+        layer_uuid = data.get("layer_uuid")
+        if (geometry is None) == (layer_uuid is None):
+            raise serializers.ValidationError(
+                "Either geometry or layer_uuid is required.")
+        if layer_uuid:
+            input_layer = self.validate_layer(layer_uuid)
+            data["geometry_layer"] = input_layer
+            # bbox is updated when geometry is read from the layer
+            data["bbox_list"] = list(input_layer.footprint.extent)
+        else:
+            data["bbox_list"] = list(geometry.extent)
+        if not data.get("statistics"):
+            data["statistics"] = parse_statistics(None)
         return data
 
 
@@ -52,6 +139,7 @@ class LayerStatisticsSerializer(serializers.Serializer):
     uuid = serializers.UUIDField()
     layer_name = serializers.CharField()
     mean_value = serializers.FloatField(allow_null=True)
+    statistics = serializers.DictField(required=False)
 
 
 class ZonalStatisticsTaskSerializer(serializers.ModelSerializer):
@@ -60,6 +148,9 @@ class ZonalStatisticsTaskSerializer(serializers.ModelSerializer):
     results = LayerStatisticsSerializer(
         source="result", many=True, required=False
     )
+    geometry_layer = serializers.SlugRelatedField(
+        slug_field="uuid", read_only=True
+    )
 
     class Meta:
         model = ZonalStatisticsTask
@@ -67,6 +158,9 @@ class ZonalStatisticsTaskSerializer(serializers.ModelSerializer):
             "uuid",
             "status",
             "progress",
+            "statistics",
+            "histogram_bins",
+            "geometry_layer",
             "results",
             "error_message",
             "submitted_on",
@@ -1,7 +1,11 @@
 from .cleaner import *  # noqa
+from .ingest_input_layer import *  # noqa
 from .move_input_layer_file import *  # noqa
+from .mosaic import *  # noqa
 from .runner import *  # noqa
 from .remove_layers import *  # noqa
+from .restore_output_layers import *  # noqa
+from .scheduler import *  # noqa
 from .verify_input_layer import *  # noqa
 from .sync_default_layers import * # noqa
 from .zonal_statistics import * # noqa
@@ -1,14 +1,251 @@
 """Task to remove resources."""
 
 from celery import shared_task
+from celery.result import AsyncResult
 import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Value, CharField
+from django.utils import timezone
+
+from core.celery import app
+from core.models.base_task_request import READ_ONLY_STATUS
+from cplus_api.models.layer import InputLayer, MultipartUpload
+from cplus_api.models.scenario import ScenarioTask
+from cplus_api.models.statistics import ZonalStatisticsTask
+from cplus_api.tasks.ingest_input_layer import ingest_input_layer
+from cplus_api.tasks.zonal_statistics import calculate_zonal_statistics
+from cplus_api.utils.scheduler import (
+    schedule_scenario_task,
+    dispatch_scenario_tasks
+)
+from cplus_api.utils.scratch import reap_scratch_directories
+from cplus_api.utils.tiling import recover_tiled_scenario
 
 
 logger = logging.getLogger(__name__)
 # remove tasks with two months old
 REMOVE_AFTER_DAYS = 60
+SWEEPER_MODELS = {
+    'scenario': ScenarioTask,
+    'zonal_statistics': ZonalStatisticsTask
+}
+
+
+def find_interrupted_candidates(delta):
+    """Find queued/running tasks that have no update within delta.
+
+    Both task tables are read in one query using the
+    (status, last_update) index.
+
+    :param delta: seconds without update
+    :type delta: int
+    :return: list of tuple (model key, id)
+    :rtype: list
+    """
+    cutoff = timezone.now() - timedelta(seconds=delta)
+    querysets = []
+    for key, model in SWEEPER_MODELS.items():
+        queryset = model.objects.filter(
+            status__in=READ_ONLY_STATUS,
+            last_update__lt=cutoff
+        )
+        querysets.append(
+            queryset.annotate(
+                model_key=Value(key, output_field=CharField())
+            ).values_list('model_key', 'id')
+        )
+    return list(querysets[0].union(*querysets[1:], all=True))
+
+
+def get_celery_alive_task_ids():
+    """Return ids of tasks that are active, reserved or scheduled.
+
+    :return: set of task id or None if no worker replies
+    :rtype: set
+    """
+    inspect = app.control.inspect(
+        timeout=settings.TASK_SWEEPER_INSPECT_TIMEOUT)
+    active = inspect.active()
+    if active is None:
+        return None
+    reserved = inspect.reserved() or {}
+    scheduled = inspect.scheduled() or {}
+    task_ids = set()
+    for worker_tasks in list(active.values()) + list(reserved.values()):
+        for task in worker_tasks or []:
+            task_ids.add(task.get('id'))
+    for worker_tasks in scheduled.values():
+        for task in worker_tasks or []:
+            task_ids.add(task.get('request', {}).get('id'))
+    return task_ids
+
+
+def is_celery_task_alive(task_id, alive_task_ids):
+    """Cross check task state in workers and result backend.
+
+    :param task_id: celery task id
+    :type task_id: str
+    :param alive_task_ids: task ids that are known by workers
+    :type alive_task_ids: set
+    :return: True if task may still be running
+    :rtype: bool
+    """
+    if not task_id:
+        return False
+    if task_id in alive_task_ids:
+        return True
+    try:
+        state = AsyncResult(task_id).state
+    except Exception as ex:
+        logger.warning(f'Failed to read state of task {task_id}: {ex}')
+        return True
+    # task is waiting in the broker to be retried
+    return state == 'RETRY'
+
+
+def resubmit_task(task_request):
+    """Re-enqueue interrupted task with exponential backoff.
+
+    Scenario task is put back to the scheduler and is not dispatched
+    before the backoff, so it follows the queue routing and the caps.
+    Other task is sent with the backoff countdown and stays queued
+    until the retry starts.
+
+    :param task_request: interrupted task
+    :type task_request: BaseTaskRequest
+    :return: True if task is resubmitted
+    :rtype: bool
+    """
+    if task_request.celery_retry >= settings.TASK_SWEEPER_MAX_RESUBMIT:
+        return False
+    if isinstance(task_request, ScenarioTask) and (
+        task_request.is_tiled or task_request.parent_id
+    ):
+        # tiled scenario is stopped with its tiles
+        return False
+    countdown = (
+        settings.TASK_SWEEPER_BACKOFF_SECONDS *
+        (2 ** task_request.celery_retry)
+    )
+    task_request.task_on_retried(
+        f'Resubmitted by sweeper after {countdown} seconds.')
+    if isinstance(task_request, ScenarioTask):
+        schedule_scenario_task(
+            task_request,
+            not_before=timezone.now() + timedelta(seconds=countdown)
+        )
+        dispatch_scenario_tasks()
+    else:
+        submit_result = calculate_zonal_statistics.apply_async(
+            (task_request.id,), countdown=countdown
+        )
+        # queued until the retry starts instead of stopped with errors
+        task_request.errors = None
+        task_request.save(update_fields=['errors'])
+        task_request.task_on_queued(
+            submit_result.id,
+            calculate_zonal_statistics.name,
+            task_request.parameters
+        )
+        task_request.add_log(
+            f'Task is queued to be retried in {countdown} seconds.')
+    return True
+
+
+def resubmit_pending_ingestions(delta):
+    """Send ingestion of uploaded layers that are pending without update.
+
+    Layer stays pending when the message of ingest_input_layer is lost,
+    or when ingestion is waiting for scratch space. Layer that is still
+    being uploaded in multipart upload is skipped.
+
+    :param delta: seconds without update
+    :type delta: int
+    :return: total of resubmitted layers
+    :rtype: int
+    """
+    cutoff = timezone.now() - timedelta(seconds=delta)
+    uploading_uuids = MultipartUpload.objects.filter(
+        is_aborted=False
+    ).values_list('input_layer_uuid', flat=True)
+    layer_ids = list(
+        InputLayer.objects.filter(
+            ingestion_status=InputLayer.IngestionStatus.PENDING,
+            modified_on__lt=cutoff
+        ).exclude(
+            file=''
+        ).exclude(
+            uuid__in=uploading_uuids
+        ).values_list('id', flat=True)
+    )
+    if not layer_ids:
+        return 0
+    # wait for another delta before resubmitting again
+    InputLayer.objects.filter(id__in=layer_ids).update(
+        modified_on=timezone.now())
+    for layer_id in layer_ids:
+        ingest_input_layer.delay(layer_id)
+    return len(layer_ids)
 
 
 @shared_task(name="check_celery_background_tasks")
 def check_celery_background_tasks():
+    """Stop tasks that are interrupted, e.g. when worker is lost."""
     logger.info('Triggered check_celery_background_tasks')
+    delta = settings.TASK_SWEEPER_INTERRUPTED_AFTER_SECONDS
+    total_ingestions = resubmit_pending_ingestions(delta)
+    if total_ingestions:
+        logger.info(f'Resubmitted ingestion of {total_ingestions} layers')
+    candidates = find_interrupted_candidates(delta)
+    if not candidates:
+        return
+    alive_task_ids = get_celery_alive_task_ids()
+    if alive_task_ids is None:
+        logger.warning('No celery worker replies, skip checking tasks')
+        return
+    total_stopped = 0
+    total_resubmitted = 0
+    for model_key, task_request_id in candidates:
+        task_request = SWEEPER_MODELS[model_key].objects.filter(
+            id=task_request_id
+        ).first()
+        if task_request is None:
+            continue
+        # progress from running task might be only stored in Redis
+        task_request.apply_cached_state()
+        if not task_request.is_possible_interrupted(delta):
+            continue
+        if (
+            isinstance(task_request, ScenarioTask) and
+            task_request.is_tiled and not task_request.task_id
+        ):
+            # tiled scenario without mosaic task depends on its tiles
+            if recover_tiled_scenario(task_request):
+                total_stopped += 1
+            continue
+        if is_celery_task_alive(task_request.task_id, alive_task_ids):
+            continue
+        if task_request.task_id:
+            # avoid redelivery of the lost task by the broker
+            app.control.revoke(task_request.task_id)
+        task_request.task_on_errors(
+            Exception('Task is interrupted and stopped by the sweeper.'))
+        total_stopped += 1
+        if resubmit_task(task_request):
+            total_resubmitted += 1
+    logger.info(
+        f'Stopped {total_stopped} interrupted tasks, '
+        f'resubmitted {total_resubmitted} tasks')
+
+
+@shared_task(name="reap_scenario_directories")
+def reap_scenario_directories():
+    """Remove working directories of finished or unknown scenarios.
+
+    :return: reclaimed bytes
+    :rtype: int
+    """
+    logger.info('Triggered reap_scenario_directories')
+    _, reclaimed = reap_scratch_directories()
+    return reclaimed
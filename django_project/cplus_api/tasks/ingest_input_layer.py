@@ -0,0 +1,31 @@
+import logging
+from celery import shared_task
+from cplus_api.models import (
+    InputLayer
+)
+from cplus_api.utils.ingestion import ingest_layer_file
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="ingest_input_layer")
+def ingest_input_layer(layer_id):
+    """
+    Validate, convert to COG and read metadata of uploaded layer.
+    """
+    layer = InputLayer.objects.filter(id=layer_id).first()
+    if layer is None:
+        logger.warning(f'Input layer {layer_id} does not exist!')
+        return
+    result = ingest_layer_file(layer)
+    if result is None:
+        logger.info(f'Ingestion of layer {layer.uuid} is superseded')
+    elif result:
+        logger.info(
+            f'Layer {layer.uuid} is ready with size {layer.size} '
+            f'and checksum {layer.checksum}'
+        )
+    else:
+        logger.warning(
+            f'Layer {layer.uuid} is failed: {layer.ingestion_error}')
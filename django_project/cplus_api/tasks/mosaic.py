@@ -0,0 +1,182 @@
+"""Task to mosaic outputs of tiled scenario."""
+import os
+import re
+import shutil
+import logging
+import subprocess
+import traceback
+from celery import shared_task
+from django.utils import timezone
+
+from cplus_api.models.layer import BaseLayer, OutputLayer
+from cplus_api.models.scenario import ScenarioTask
+
+logger = logging.getLogger(__name__)
+# random suffix that is added to output file name by the analysis
+OUTPUT_SUFFIX_PATTERN = re.compile(r'_[0-9a-f]{4,8}$')
+
+
+def get_tile_output_key(output_layer: OutputLayer):
+    """Return key to match the same output across tiles.
+
+    :param output_layer: tile output layer
+    :type output_layer: OutputLayer
+    :return: tuple of group and file name without random suffix
+    :rtype: tuple
+    """
+    if output_layer.is_final_output:
+        return ('final_output', '')
+    name, _ = os.path.splitext(output_layer.name)
+    return (output_layer.group, OUTPUT_SUFFIX_PATTERN.sub('', name))
+
+
+def download_output_file(output_layer: OutputLayer, dir_path: str):
+    """Copy output layer file to working directory.
+
+    :param output_layer: output layer
+    :type output_layer: OutputLayer
+    :param dir_path: working directory
+    :type dir_path: str
+    :return: file path
+    :rtype: str
+    """
+    os.makedirs(dir_path, exist_ok=True)
+    file_path = os.path.join(
+        dir_path, os.path.basename(output_layer.file.name))
+    with output_layer.file.open('rb') as source:
+        with open(file_path, 'wb') as destination:
+            shutil.copyfileobj(source, destination)
+    return file_path
+
+
+def run_gdal_command(args):
+    """Run gdal command line tool.
+
+    :param args: command arguments
+    :type args: list
+    :raises RuntimeError: when command is failed
+    """
+    result = subprocess.run(args, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f'Failed running {args[0]}: {result.stderr.decode()}')
+
+
+def mosaic_tile_rasters(tile_files, output_path):
+    """Mosaic core extent of tile rasters into a COG.
+
+    :param tile_files: list of (file path, core extent)
+    :type tile_files: list
+    :param output_path: COG output path
+    :type output_path: str
+    """
+    core_files = []
+    for file_path, core_extent in tile_files:
+        xmin, xmax, ymin, ymax = core_extent
+        core_path = f'{os.path.splitext(file_path)[0]}_core.vrt'
+        run_gdal_command([
+            'gdal_translate', '-of', 'VRT',
+            '-projwin', str(xmin), str(ymax), str(xmax), str(ymin),
+            file_path, core_path
+        ])
+        core_files.append(core_path)
+    vrt_path = f'{os.path.splitext(output_path)[0]}.vrt'
+    run_gdal_command(['gdalbuildvrt', vrt_path] + core_files)
+    run_gdal_command([
+        'gdal_translate', '-of', 'COG',
+        '-co', 'COMPRESS=DEFLATE',
+        '-co', 'RESAMPLING=BILINEAR',
+        '-co', 'OVERVIEW_RESAMPLING=NEAREST',
+        '-co', 'NUM_THREADS=ALL_CPUS',
+        '-co', 'BLOCKSIZE=512',
+        vrt_path, output_path
+    ])
+
+
+def mosaic_scenario_outputs(scenario_task: ScenarioTask):
+    """Mosaic outputs that exist in every tile of the scenario.
+
+    :param scenario_task: tiled scenario task
+    :type scenario_task: ScenarioTask
+    :return: number of mosaicked outputs
+    :rtype: int
+    """
+    tile_tasks = list(scenario_task.tiles.order_by('id'))
+    outputs = {}
+    for tile_task in tile_tasks:
+        for output_layer in OutputLayer.objects.filter(
+            scenario=tile_task,
+            layer_type=BaseLayer.LayerTypes.RASTER,
+            is_deleted=False
+        ):
+            outputs.setdefault(
+                get_tile_output_key(output_layer), []
+            ).append((tile_task, output_layer))
+    base_dir = scenario_task.get_resources_path()
+    total = 0
+    for key, tile_outputs in outputs.items():
+        if len(tile_outputs) != len(tile_tasks):
+            scenario_task.add_log(
+                f'Skip output {key[1] or key[0]} that is missing in '
+                'some tiles.'
+            )
+            continue
+        group, name = key
+        dir_path = os.path.join(base_dir, group)
+        tile_files = []
+        for tile_task, output_layer in tile_outputs:
+            file_path = download_output_file(
+                output_layer,
+                os.path.join(dir_path, f"tile_{tile_task.tile['index']}")
+            )
+            tile_files.append((file_path, tile_task.tile['core_extent']))
+        first_output = tile_outputs[0][1]
+        filename = first_output.name if name == '' else f'{name}.tif'
+        output_path = os.path.join(dir_path, filename)
+        mosaic_tile_rasters(tile_files, output_path)
+        is_final_output = first_output.is_final_output
+        output_layer = OutputLayer.objects.create(
+            name=filename,
+            created_on=timezone.now(),
+            owner=scenario_task.submitted_by,
+            layer_type=BaseLayer.LayerTypes.RASTER,
+            size=os.stat(output_path).st_size,
+            is_final_output=is_final_output,
+            scenario=scenario_task,
+            group=None if is_final_output else group,
+            output_meta=first_output.output_meta if is_final_output else {}
+        )
+        with open(output_path, 'rb') as output_file:
+            output_layer.file.save(filename, output_file)
+        total += 1
+        scenario_task.progress = 90 + 10 * total / len(outputs)
+        scenario_task.save(update_fields=['progress'])
+    return total
+
+
+@shared_task(name="mosaic_scenario_tiles")
+def mosaic_scenario_tiles(scenario_task_id):
+    """Mosaic tile outputs and complete the tiled scenario.
+
+    :param scenario_task_id: tiled scenario task id
+    :type scenario_task_id: int
+    """
+    scenario_task = ScenarioTask.objects.get(id=scenario_task_id)
+    logger.info(f'Triggered mosaic_scenario_tiles {scenario_task.uuid}')
+    try:
+        scenario_task.clear_resources()
+        total = mosaic_scenario_outputs(scenario_task)
+        scenario_task.add_log(f'Mosaicked {total} tile outputs.')
+        first_tile = scenario_task.tiles.order_by('id').first()
+        scenario_task.updated_detail = first_tile.updated_detail
+        scenario_task.updated_detail['extent'] = (
+            scenario_task.detail.get('extent', [])
+        )
+        scenario_task.save(update_fields=['updated_detail'])
+        scenario_task.task_on_completed()
+    except Exception as ex:
+        logger.error(f'Failed mosaic of scenario {scenario_task.uuid}')
+        logger.error(traceback.format_exc())
+        scenario_task.task_on_errors(ex, traceback.format_exc())
+    finally:
+        scenario_task.clear_resources()
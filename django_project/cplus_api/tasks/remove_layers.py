@@ -1,6 +1,10 @@
+import os
+import time
 import logging
 from datetime import timedelta
 from celery import shared_task
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.utils import timezone
 from django.db.models import Q
 
@@ -10,23 +14,201 @@ from cplus_api.models import (
     TemporaryLayer,
     input_layer_dir_path
 )
+from cplus_api.models.layer import select_input_layer_storage
+from cplus_api.utils.output_archive import archive_output_layers
 from cplus_api.utils.api_helper import (
     abort_multipart_upload
 )
 
 logger = logging.getLogger(__name__)
+MB = 1024 ** 2
+# maximum keys of S3 delete_objects request
+S3_DELETE_MAX_KEYS = 1000
+
+
+def delete_storage_files(storage, file_names):
+    """Delete files from storage in bulk.
+
+    S3 objects are deleted using delete_objects with up to 1000 keys
+    per request.
+
+    :param storage: file storage
+    :type storage: Storage
+    :param file_names: list of file name in the storage
+    :type file_names: list
+    :return: file names that cannot be deleted
+    :rtype: list
+    """
+    file_names = sorted(set(name for name in file_names if name))
+    failed = []
+    if isinstance(storage, FileSystemStorage):
+        for file_name in file_names:
+            try:
+                storage.delete(file_name)
+            except OSError as ex:
+                logger.error(f'Failed to delete {file_name}: {ex}')
+                failed.append(file_name)
+        return failed
+    boto3_client = storage.connection.meta.client
+    for index in range(0, len(file_names), S3_DELETE_MAX_KEYS):
+        keys = file_names[index:index + S3_DELETE_MAX_KEYS]
+        response = boto3_client.delete_objects(
+            Bucket=storage.bucket_name,
+            Delete={
+                'Objects': [{'Key': key} for key in keys],
+                'Quiet': True
+            }
+        )
+        for error in response.get('Errors', []):
+            logger.error(
+                f'Failed to delete {error["Key"]}: {error.get("Message")}')
+            failed.append(error['Key'])
+    return failed
+
+
+def delete_input_layer_files(rows):
+    """Delete files of input layer rows.
+
+    :param rows: list of (id, file name, size)
+    :type rows: list
+    :return: file names that cannot be deleted
+    :rtype: list
+    """
+    return delete_storage_files(
+        select_input_layer_storage(), [row[1] for row in rows])
+
+
+def delete_output_layer_files(rows):
+    """Delete files of output layer rows.
+
+    File that is shared with output layer outside of rows is kept.
+
+    :param rows: list of (id, file name, size)
+    :type rows: list
+    :return: file names that cannot be deleted
+    :rtype: list
+    """
+    file_names = set(row[1] for row in rows if row[1])
+    shared_files = set(
+        OutputLayer.objects.filter(
+            file__in=file_names
+        ).exclude(
+            id__in=[row[0] for row in rows]
+        ).values_list('file', flat=True)
+    )
+    return delete_storage_files(
+        OutputLayer._meta.get_field('file').storage,
+        list(file_names - shared_files)
+    )
+
+
+def delete_temporary_layer_files(rows):
+    """Delete files of temporary layer rows.
+
+    :param rows: list of (id, file name, size)
+    :type rows: list
+    :return: file names that cannot be deleted
+    :rtype: list
+    """
+    failed = []
+    for _, file_name, _ in rows:
+        file_path = os.path.join(settings.TEMPORARY_LAYER_DIR, file_name)
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except OSError as ex:
+            logger.error(f'Failed to delete {file_path}: {ex}')
+            failed.append(file_name)
+    return failed
+
+
+def purge_in_batches(queryset, file_field, delete_files, deadline=None):
+    """Delete storage files and rows of queryset in batches.
+
+    Rows are paged by id. Files of a batch are deleted first in bulk,
+    then the rows are deleted with the delete collector, so on_delete
+    of related models and post_delete handlers are applied. Rows whose
+    file cannot be deleted are kept and retried in the next run.
+
+    :param queryset: candidates to remove
+    :type queryset: QuerySet
+    :param file_field: name of the file field
+    :type file_field: str
+    :param delete_files: function to delete files of rows
+    :type delete_files: function
+    :param deadline: timestamp to stop processing new batch
+    :type deadline: float
+    :return: statistics of the removal
+    :rtype: dict
+    """
+    stats = {
+        'rows': 0,
+        'failed': 0,
+        'bytes': 0,
+        'seconds': 0,
+        'completed': True
+    }
+    start_time = time.time()
+    last_id = 0
+    batch_size = settings.LAYER_RETENTION_BATCH_SIZE
+    while True:
+        if deadline and time.time() > deadline:
+            stats['completed'] = False
+            break
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list(
+                'id', file_field, 'size'
+            )[:batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        failed_files = set(delete_files(rows))
+        removed_rows = [row for row in rows if row[1] not in failed_files]
+        if removed_rows:
+            queryset.model.objects.filter(
+                id__in=[row[0] for row in removed_rows]
+            ).delete()
+        stats['rows'] += len(removed_rows)
+        stats['failed'] += len(rows) - len(removed_rows)
+        stats['bytes'] += sum(row[2] or 0 for row in removed_rows)
+    stats['seconds'] = time.time() - start_time
+    return stats
+
+
+def log_purge_stats(name, stats, action='Removed'):
+    """Log throughput of the removal.
+
+    :param name: name of the removed layer type
+    :type name: str
+    :param stats: statistics from purge_in_batches
+    :type stats: dict
+    :param action: action in the log message
+    :type action: str
+    """
+    seconds = max(stats['seconds'], 0.001)
+    logger.info(
+        f'{action} {stats["rows"]} {name} '
+        f'({stats["bytes"] / MB:.1f}MB, failed {stats["failed"]}) in '
+        f'{stats["seconds"]:.1f}s: {stats["rows"] / seconds:.1f} rows/s, '
+        f'{stats["bytes"] / MB / seconds:.1f} MB/s'
+    )
 
 
 @shared_task(name="remove_layers")
 def remove_layers():
     """
     Remove layer that has been more than 2 weeks.
+
+    Aged output layers are moved to archive storage instead when
+    archive_aged_outputs is enabled in SitePreferences.
+
+    Removal is resumable: when it exceeds LAYER_RETENTION_MAX_SECONDS,
+    the task is submitted again to continue with remaining layers.
     """
-    results = {
-        InputLayer: 0,
-        OutputLayer: 0,
-        TemporaryLayer: 0
-    }
+    deadline = time.time() + settings.LAYER_RETENTION_MAX_SECONDS
+    results = {}
+    completed = True
 
     # Remove private Input Layer that is more 2 weeks
     last_x_days_datetime = (
@@ -42,18 +224,25 @@ def remove_layers():
         ) |
         Q(last_used_on__lt=last_x_days_datetime)
     )
-    results[InputLayer] = input_layers.count()
-    input_layers.delete()
+    results[InputLayer] = purge_in_batches(
+        input_layers, 'file', delete_input_layer_files, deadline)
 
-    # Remove private data that is more 2 weeks
+    # Remove or archive private data that is more 2 weeks
     output_group_to_keep = SitePreferences.preferences().output_group_to_keep
     output_layers = OutputLayer.objects.filter(
-        created_on__lt=last_x_days_datetime
+        created_on__lt=last_x_days_datetime,
+        storage_tier=OutputLayer.StorageTiers.STANDARD
     ).exclude(
         Q(is_final_output=True) | Q(group__in=output_group_to_keep)
     )
-    results[OutputLayer] = output_layers.count()
-    output_layers.delete()
+    if SitePreferences.preferences().archive_aged_outputs:
+        stats = archive_output_layers(
+            output_layers, settings.LAYER_RETENTION_BATCH_SIZE, deadline)
+        log_purge_stats('OutputLayer', stats, action='Archived')
+        completed = stats['completed']
+    else:
+        results[OutputLayer] = purge_in_batches(
+            output_layers, 'file', delete_output_layer_files, deadline)
 
     # Remove temporary layer after a day
     last_x_days_datetime = (
@@ -63,10 +252,18 @@ def remove_layers():
     temp_layers = TemporaryLayer.objects.filter(
         created_on__lte=last_x_days_datetime
     )
-    results[TemporaryLayer] = temp_layers.count()
-    temp_layers.delete()
+    results[TemporaryLayer] = purge_in_batches(
+        temp_layers, 'file_name', delete_temporary_layer_files, deadline)
 
-    logger.info(f'Removed {results}')
+    for model, stats in results.items():
+        log_purge_stats(model.__name__, stats)
+        completed = completed and stats['completed']
+    if not completed:
+        logger.info('Retention deadline is reached, resubmit remove_layers')
+        remove_layers.delay()
+    return {
+        model.__name__: stats['rows'] for model, stats in results.items()
+    }
 
 
 @shared_task(name="clean_multipart_upload")
@@ -79,6 +276,10 @@ def clean_multipart_upload():
     uploads = MultipartUpload.objects.filter(
         Q(
             created_on__lt=last_7_days_datetime,
+            expires_on__isnull=True,
+            is_aborted=False
+        ) | Q(
+            expires_on__lt=timezone.now(),
             is_aborted=False
         ) | Q(
             created_on__lt=last_1_days_datetime,
@@ -92,7 +293,10 @@ def clean_multipart_upload():
         if input_layer is None:
             upload.delete()
             continue
-        file_path = input_layer_dir_path(input_layer, input_layer.name)
+        file_path = (
+            upload.file_path or
+            input_layer_dir_path(input_layer, input_layer.name)
+        )
         parts = abort_multipart_upload(
             file_path,
             upload.upload_id
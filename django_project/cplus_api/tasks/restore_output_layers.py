@@ -0,0 +1,33 @@
+"""Task to restore archived output layers."""
+import logging
+from celery import shared_task
+
+from cplus_api.models.layer import OutputLayer
+from cplus_api.utils.output_archive import restore_output_file
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="restore_output_layers")
+def restore_output_layers(output_layer_ids):
+    """Restore archived files of output layers to output storage.
+
+    :param output_layer_ids: list of output layer id
+    :type output_layer_ids: list
+    :return: number of restored output layers
+    :rtype: int
+    """
+    file_names = set(
+        OutputLayer.objects.filter(
+            id__in=output_layer_ids,
+            storage_tier=OutputLayer.StorageTiers.RESTORING
+        ).values_list('file', flat=True)
+    )
+    total = 0
+    for file_name in file_names:
+        try:
+            total += restore_output_file(file_name)
+        except Exception as ex:
+            logger.error(f'Failed to restore {file_name}: {ex}')
+    logger.info(f'Restored {total} output layers')
+    return total
@@ -5,6 +5,7 @@ import logging
 import time
 from django.conf import settings
 from cplus_api.models.scenario import ScenarioTask
+from cplus_api.utils.scratch import reserve_scratch, release_scratch
 
 logger = logging.getLogger(__name__)
 
@@ -44,7 +45,29 @@ def run_scenario_analysis_task(scenario_task_id):
     scenario_task.save(update_fields=['code_version'])
     logger.info(
         f'Triggered run_scenario_analysis_task {str(scenario_task.uuid)}')
+    # logs from analysis task are written in batches
+    scenario_task.enable_log_buffer()
+    try:
+        # fail fast before downloading input layers
+        reserved = reserve_scratch(scenario_task)
+        scenario_task.add_log(
+            f'Reserved {reserved / 1024 ** 3:.2f}GB of scratch space.')
+        _run_scenario_analysis(scenario_task)
+    finally:
+        release_scratch(scenario_task)
+        # failure handler uses a new object, store pending logs first
+        scenario_task.flush_logs()
+        # slot is released, dispatch next waiting scenario
+        from cplus_api.tasks.scheduler import dispatch_scenario_tasks_task
+        dispatch_scenario_tasks_task.delay()
 
+
+def _run_scenario_analysis(scenario_task: ScenarioTask):
+    """Initialize QGIS and run the scenario analysis.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    """
     # initialize QGIS
     from qgis.core import QgsApplication
     # Supply path to qgis install location
@@ -0,0 +1,16 @@
+"""Task to dispatch scenario tasks from the scheduler."""
+
+from celery import shared_task
+import logging
+from cplus_api.utils.scheduler import dispatch_scenario_tasks
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="dispatch_scenario_tasks")
+def dispatch_scenario_tasks_task():
+    """Send waiting scenario tasks to the worker queues."""
+    dispatched = dispatch_scenario_tasks()
+    logger.info(
+        f'Triggered dispatch_scenario_tasks: {len(dispatched)} dispatched')
@@ -1,22 +1,127 @@
 import logging
 import os
+import tempfile
 import time
 import traceback
 
 from celery import shared_task
 from django.conf import settings
+from django.contrib.gis.geos import Polygon
 from django.utils import timezone
 
 from cplus_api.models.layer import InputLayer
 from cplus_api.models.statistics import ZonalStatisticsTask
-from cplus_api.utils.qgis_helper import (
-    qgis_application,
-    create_bbox_vector_layer,
+from cplus_api.utils.zonal_statistics import (
+    MEAN,
+    calculate_raster_statistics,
+    get_geometry_hash,
+    parse_statistics,
+    read_vector_geometry,
 )
 
 logger = logging.getLogger(__name__)
 
 
+def get_zonal_statistics_cost(layer: InputLayer):
+    """Estimate cost of zonal statistics of a layer.
+
+    The layer is downloaded before it is read, hence the cost is
+    estimated from the file size.
+
+    :param layer: input layer
+    :type layer: InputLayer
+    :return: estimated cost
+    :rtype: int
+    """
+    return max(layer.size or 0, 1)
+
+
+def plan_zonal_statistics(layers, bbox):
+    """Split layers by whether their footprint intersects bbox.
+
+    Layer without footprint is planned, because its coverage is unknown.
+
+    :param layers: input layers queryset
+    :type layers: QuerySet
+    :param bbox: bounding box with minx, miny, maxx, maxy in EPSG:4326
+    :type bbox: dict
+    :return: tuple of skipped layers and planned layers that are sorted
+        by estimated cost
+    :rtype: tuple
+    """
+    polygon = Polygon.from_bbox(
+        (bbox["minx"], bbox["miny"], bbox["maxx"], bbox["maxy"])
+    )
+    polygon.srid = 4326
+    skipped_ids = set(
+        layers.filter(footprint__isnull=False).exclude(
+            footprint__intersects=polygon
+        ).values_list("id", flat=True)
+    )
+    skipped = []
+    planned = []
+    for layer in layers:
+        if layer.id in skipped_ids:
+            skipped.append(layer)
+        else:
+            planned.append(layer)
+    planned.sort(key=get_zonal_statistics_cost)
+    return skipped, planned
+
+
+def get_layer_result(layer: InputLayer, values, statistics):
+    """Build result item of a layer.
+
+    :param layer: input layer
+    :type layer: InputLayer
+    :param values: calculated statistics, None if layer is skipped
+        or failed
+    :type values: dict
+    :param statistics: requested statistics
+    :type statistics: list
+    :return: result item with uuid, layer_name, mean_value and statistics
+    :rtype: dict
+    """
+    if values is None:
+        values = {stat: None for stat in statistics}
+    return {
+        "uuid": str(layer.uuid),
+        "layer_name": layer.name,
+        "mean_value": values.get(MEAN),
+        "statistics": {
+            stat: value for stat, value in values.items() if stat != MEAN
+        },
+    }
+
+
+def load_geometry_layer(zonal_task: ZonalStatisticsTask):
+    """Read geometry of zonal statistics task from its vector layer.
+
+    The bbox of the task is updated to the extent of the geometry.
+
+    :param zonal_task: zonal statistics task with geometry_layer
+    :type zonal_task: ZonalStatisticsTask
+    :raises ValueError: when layer file is missing or invalid
+    """
+    layer = zonal_task.geometry_layer
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = layer.download_to_working_directory(
+            tmp_dir, touch_last_used=False
+        )
+        if not file_path or not os.path.exists(file_path):
+            raise ValueError(f"Missing geometry layer {layer.uuid} file!")
+        geometry = read_vector_geometry(file_path)
+    minx, miny, maxx, maxy = geometry.extent
+    zonal_task.geometry = geometry
+    zonal_task.bbox_minx = minx
+    zonal_task.bbox_miny = miny
+    zonal_task.bbox_maxx = maxx
+    zonal_task.bbox_maxy = maxy
+    zonal_task.save(update_fields=[
+        "geometry", "bbox_minx", "bbox_miny", "bbox_maxx", "bbox_maxy"
+    ])
+
+
 @shared_task(name="calculate_zonal_statistics")
 def calculate_zonal_statistics(zonal_task_id):
     """Worker for calculating zonal statistics of Naturebase layers."""
@@ -29,139 +134,105 @@ def calculate_zonal_statistics(zonal_task_id):
     zonal_task.task_on_started()
 
     try:
-        with qgis_application():
-            from qgis.core import QgsRectangle, QgsRasterLayer
-            from qgis.analysis import QgsZonalStatistics
-
-            start_time = time.time()
-
-            bbox = {
-                "minx": zonal_task.bbox_minx,
-                "miny": zonal_task.bbox_miny,
-                "maxx": zonal_task.bbox_maxx,
-                "maxy": zonal_task.bbox_maxy,
-            }
-
-            extent = QgsRectangle(
-                bbox["minx"], bbox["miny"], bbox["maxx"], bbox["maxy"]
-            )
-
-            nature_base_layers = InputLayer.objects.filter(
-                source=InputLayer.LayerSources.NATURE_BASE
-            )
-            total = nature_base_layers.count()
-            if total == 0:
-                logger.warning("No naturebase layers found.")
-                zonal_task.result = []
-                zonal_task.save(update_fields=["result"])
-                zonal_task.task_on_completed()
-                return
-
-            results = []
-            prefix = "zs_"
-            stat_name = QgsZonalStatistics.shortName(
-                QgsZonalStatistics.Statistic.Mean
+        start_time = time.time()
+
+        if zonal_task.geometry is None and zonal_task.geometry_layer:
+            load_geometry_layer(zonal_task)
+        geometry = zonal_task.geometry
+        geometry_hash = None
+        if geometry is not None:
+            # identify rasterized mask of the geometry
+            geometry_hash = get_geometry_hash(geometry)
+
+        bbox = {
+            "minx": zonal_task.bbox_minx,
+            "miny": zonal_task.bbox_miny,
+            "maxx": zonal_task.bbox_maxx,
+            "maxy": zonal_task.bbox_maxy,
+        }
+        statistics = parse_statistics(zonal_task.statistics)
+        if MEAN not in statistics:
+            # mean_value is always returned
+            statistics = [MEAN] + statistics
+
+        nature_base_layers = InputLayer.objects.filter(
+            source=InputLayer.LayerSources.NATURE_BASE
+        )
+        total = nature_base_layers.count()
+        if total == 0:
+            logger.warning("No naturebase layers found.")
+            zonal_task.result = []
+            zonal_task.save(update_fields=["result"])
+            zonal_task.task_on_completed()
+            return
+
+        # layers outside of bbox do not need to be downloaded
+        skipped_layers, planned_layers = plan_zonal_statistics(
+            nature_base_layers, bbox
+        )
+        layer_results = {}
+        for layer in skipped_layers:
+            layer_results[layer.id] = None
+        if skipped_layers:
+            logger.info(
+                "Skip %s layers outside of bbox", len(skipped_layers)
             )
-            field_name = f"{prefix}{stat_name}"
-
-            for idx, layer in enumerate(nature_base_layers):
-                try:
-                    if not layer.is_available():
-                        logger.warning(
-                            "Layer %s not available; skipping", layer.name
-                        )
-                        results.append(
-                            {
-                                "uuid": str(layer.uuid),
-                                "layer_name": layer.name,
-                                "mean_value": None,
-                            }
-                        )
-                        continue
-
-                    file_path = layer.download_to_working_directory(
-                        settings.TEMPORARY_LAYER_DIR
+        total_cost = sum(
+            get_zonal_statistics_cost(layer) for layer in planned_layers
+        )
+        done_cost = 0
+
+        for layer in planned_layers:
+            layer_results[layer.id] = None
+            try:
+                if not layer.is_available():
+                    logger.warning(
+                        "Layer %s not available; skipping", layer.name
                     )
-                    if not file_path or not os.path.exists(file_path):
-                        logger.warning(
-                            "Download failed or file missing for layer %s",
-                            layer.name,
-                        )
-                        results.append(
-                            {
-                                "uuid": str(layer.uuid),
-                                "layer_name": layer.name,
-                                "mean_value": None,
-                            }
-                        )
-                        continue
-
-                    nature_base_raster = QgsRasterLayer(file_path, layer.name)
-                    if not nature_base_raster.isValid():
-                        logger.warning(
-                            "Invalid raster for layer %s (%s)",
-                            layer.name,
-                            file_path,
-                        )
-                        results.append(
-                            {
-                                "uuid": str(layer.uuid),
-                                "layer_name": layer.name,
-                                "mean_value": None,
-                            }
-                        )
-                        continue
-
-                    reference_layer = create_bbox_vector_layer(extent)
-
-                    zonal_stats = QgsZonalStatistics(
-                        reference_layer,
-                        nature_base_raster,
-                        prefix,
-                        1,
-                        QgsZonalStatistics.Statistic.Mean,
-                    )
-
-                    result = zonal_stats.calculateStatistics(None)
-
-                    if result == QgsZonalStatistics.Result.Success:
-                        feature = next(reference_layer.getFeatures())
-                        mean_value = float(feature.attribute(field_name))
-                    else:
-                        mean_value = None
-
-                    results.append(
-                        {
-                            "uuid": str(layer.uuid),
-                            "layer_name": layer.name,
-                            "mean_value": mean_value,
-                        }
-                    )
-                except Exception:
-                    logger.exception(
-                        "Error processing zonal statistics for layer %s",
+                    continue
+
+                file_path = layer.download_to_working_directory(
+                    settings.TEMPORARY_LAYER_DIR
+                )
+                if not file_path or not os.path.exists(file_path):
+                    logger.warning(
+                        "Download failed or file missing for layer %s",
                         layer.name,
                     )
-                    results.append(
-                        {
-                            "uuid": str(layer.uuid),
-                            "layer_name": layer.name,
-                            "mean_value": None,
-                        }
-                    )
-
-                # Update progress
-                progress = ((idx + 1) / total) * 100.0
-                zonal_task.progress = progress
+                    continue
+
+                # statistics are accumulated while blocks are read once
+                layer_results[layer.id] = calculate_raster_statistics(
+                    file_path,
+                    [bbox["minx"], bbox["miny"], bbox["maxx"], bbox["maxy"]],
+                    statistics,
+                    bins=zonal_task.histogram_bins,
+                    geometry=geometry,
+                    geometry_hash=geometry_hash,
+                )
+            except Exception:
+                logger.exception(
+                    "Error processing zonal statistics for layer %s",
+                    layer.name,
+                )
+            finally:
+                # Update progress by estimated cost
+                done_cost += get_zonal_statistics_cost(layer)
+                zonal_task.progress = (done_cost / total_cost) * 100.0
                 zonal_task.last_update = timezone.now()
                 zonal_task.save(update_fields=["progress", "last_update"])
 
-            zonal_task.result = results
-            zonal_task.save(update_fields=["result"])
-            zonal_task.task_on_completed()
-            logger.info(
-                "Zonal stats finished in %s seconds", time.time() - start_time
-            )
+        # keep the order of layers in the result
+        results = [
+            get_layer_result(layer, layer_results[layer.id], statistics)
+            for layer in nature_base_layers
+        ]
+        zonal_task.result = results
+        zonal_task.save(update_fields=["result"])
+        zonal_task.task_on_completed()
+        logger.info(
+            "Zonal stats finished in %s seconds", time.time() - start_time
+        )
 
     except Exception as exc:
         # Capture error and logs
@@ -0,0 +1,247 @@
+import mock
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from core.models.base_task_request import TaskStatus
+from cplus_api.models.layer import InputLayer, MultipartUpload
+from cplus_api.models.statistics import ZonalStatisticsTask
+from cplus_api.tasks.cleaner import (
+    find_interrupted_candidates,
+    get_celery_alive_task_ids,
+    check_celery_background_tasks,
+    resubmit_pending_ingestions
+)
+from cplus_api.utils.scheduler import dispatch_scenario_tasks
+from cplus_api.tests.factories import ScenarioTaskF, InputLayerF
+
+
+class FakeInspect(object):
+
+    def __init__(self, active=None, reserved=None, scheduled=None):
+        self._active = active
+        self._reserved = reserved
+        self._scheduled = scheduled
+
+    def active(self):
+        return self._active
+
+    def reserved(self):
+        return self._reserved
+
+    def scheduled(self):
+        return self._scheduled
+
+
+class TestCleaner(TestCase):
+
+    def create_zonal_task(self, user, **kwargs):
+        return ZonalStatisticsTask.objects.create(
+            submitted_on=timezone.now(),
+            submitted_by=user,
+            bbox_minx=0, bbox_miny=0, bbox_maxx=1, bbox_maxy=1,
+            **kwargs
+        )
+
+    def test_find_interrupted_candidates(self):
+        old_update = timezone.now() - timedelta(hours=1)
+        scenario_task = ScenarioTaskF.create(
+            status=TaskStatus.RUNNING,
+            last_update=old_update
+        )
+        ScenarioTaskF.create(
+            status=TaskStatus.RUNNING,
+            last_update=timezone.now()
+        )
+        ScenarioTaskF.create(
+            status=TaskStatus.COMPLETED,
+            last_update=old_update
+        )
+        zonal_task = self.create_zonal_task(
+            scenario_task.submitted_by,
+            status=TaskStatus.QUEUED,
+            last_update=old_update
+        )
+        candidates = find_interrupted_candidates(1800)
+        self.assertEqual(len(candidates), 2)
+        self.assertIn(('scenario', scenario_task.id), candidates)
+        self.assertIn(('zonal_statistics', zonal_task.id), candidates)
+
+    @mock.patch('cplus_api.tasks.cleaner.app.control.inspect')
+    def test_get_celery_alive_task_ids(self, mocked_inspect):
+        mocked_inspect.return_value = FakeInspect()
+        self.assertIsNone(get_celery_alive_task_ids())
+        mocked_inspect.return_value = FakeInspect(
+            active={'worker1': [{'id': 'task-1'}]},
+            reserved={'worker1': [{'id': 'task-2'}]},
+            scheduled={'worker2': [{'request': {'id': 'task-3'}}]}
+        )
+        self.assertEqual(
+            get_celery_alive_task_ids(), {'task-1', 'task-2', 'task-3'})
+
+    @override_settings(TASK_SWEEPER_MAX_RESUBMIT=1)
+    @mock.patch('cplus_api.tasks.cleaner.AsyncResult')
+    @mock.patch('cplus_api.tasks.cleaner.calculate_zonal_statistics')
+    @mock.patch('cplus_api.utils.scheduler.run_scenario_analysis_task')
+    @mock.patch('cplus_api.tasks.cleaner.app.control')
+    def test_check_celery_background_tasks(
+            self, mocked_control, mocked_runner, mocked_zonal,
+            mocked_result):
+        mocked_result.return_value.state = 'STARTED'
+        mocked_zonal.apply_async.return_value.id = 'new-zonal-id'
+        mocked_zonal.name = 'calculate_zonal_statistics'
+        old_update = timezone.now() - timedelta(hours=1)
+        alive_task = ScenarioTaskF.create(
+            status=TaskStatus.RUNNING,
+            last_update=old_update,
+            task_id='alive-id'
+        )
+        lost_task = ScenarioTaskF.create(
+            status=TaskStatus.RUNNING,
+            last_update=old_update,
+            task_id='lost-id'
+        )
+        retried_task = ScenarioTaskF.create(
+            status=TaskStatus.RUNNING,
+            last_update=old_update,
+            task_id='retried-id',
+            celery_retry=1
+        )
+        zonal_task = self.create_zonal_task(
+            alive_task.submitted_by,
+            status=TaskStatus.RUNNING,
+            last_update=old_update,
+            task_id='zonal-id'
+        )
+        mocked_control.inspect.return_value = FakeInspect(
+            active={'worker1': [{'id': 'alive-id'}]}
+        )
+        check_celery_background_tasks()
+        alive_task.refresh_from_db()
+        self.assertEqual(alive_task.status, TaskStatus.RUNNING)
+        # lost task is put back to the scheduler after the backoff
+        lost_task.refresh_from_db()
+        self.assertEqual(lost_task.status, TaskStatus.PENDING)
+        self.assertEqual(lost_task.celery_retry, 1)
+        self.assertGreater(
+            lost_task.scheduled_on,
+            timezone.now() + timedelta(seconds=50)
+        )
+        mocked_runner.apply_async.assert_not_called()
+        with mock.patch(
+            'cplus_api.utils.scheduler.timezone.now',
+            return_value=timezone.now() + timedelta(seconds=61)
+        ), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(dispatch_scenario_tasks(), [lost_task])
+        mocked_runner.apply_async.assert_called_once_with(
+            (lost_task.id,), queue=lost_task.queue
+        )
+        # max resubmission is reached
+        retried_task.refresh_from_db()
+        self.assertEqual(retried_task.status, TaskStatus.STOPPED)
+        self.assertEqual(retried_task.celery_retry, 1)
+        # zonal task is queued until the retry starts
+        zonal_task.refresh_from_db()
+        self.assertEqual(zonal_task.status, TaskStatus.QUEUED)
+        self.assertIsNone(zonal_task.errors)
+        self.assertEqual(zonal_task.task_id, 'new-zonal-id')
+        self.assertTrue(
+            zonal_task.get_logs().filter(
+                log__startswith='Task is queued to be retried'
+            ).exists()
+        )
+        mocked_control.revoke.assert_any_call('lost-id')
+        mocked_control.revoke.assert_any_call('zonal-id')
+        # no worker replies
+        lost_task.status = TaskStatus.RUNNING
+        lost_task.last_update = old_update
+        lost_task.save()
+        mocked_control.inspect.return_value = FakeInspect()
+        check_celery_background_tasks()
+        lost_task.refresh_from_db()
+        self.assertEqual(lost_task.status, TaskStatus.RUNNING)
+
+    @mock.patch('cplus_api.utils.tiling.send_mosaic_task')
+    @mock.patch('cplus_api.tasks.cleaner.AsyncResult')
+    @mock.patch('cplus_api.tasks.cleaner.app.control')
+    def test_check_tiled_scenarios(
+            self, mocked_control, mocked_result, mocked_mosaic):
+        mocked_result.return_value.state = 'STARTED'
+        mocked_control.inspect.return_value = FakeInspect(
+            active={'worker1': [{'id': 'tile-id'}]}
+        )
+        old_update = timezone.now() - timedelta(hours=1)
+
+        def create_tiled_scenario(tile_statuses, **kwargs):
+            scenario_task = ScenarioTaskF.create(
+                status=TaskStatus.RUNNING,
+                last_update=old_update,
+                is_tiled=True,
+                **kwargs
+            )
+            for tile_status in tile_statuses:
+                ScenarioTaskF.create(
+                    submitted_by=scenario_task.submitted_by,
+                    status=tile_status,
+                    parent=scenario_task
+                )
+            return scenario_task
+
+        # tile is still running
+        running_task = create_tiled_scenario(
+            [TaskStatus.COMPLETED, TaskStatus.RUNNING])
+        # mosaic task is lost
+        mosaic_task = create_tiled_scenario(
+            [TaskStatus.COMPLETED], task_id='mosaic-id')
+        # last tile update is missed
+        missed_task = create_tiled_scenario(
+            [TaskStatus.COMPLETED, TaskStatus.COMPLETED])
+        # tile is pending but not in the scheduler
+        stuck_task = create_tiled_scenario(
+            [TaskStatus.COMPLETED, TaskStatus.PENDING])
+        with self.captureOnCommitCallbacks(execute=True):
+            check_celery_background_tasks()
+        running_task.refresh_from_db()
+        self.assertEqual(running_task.status, TaskStatus.RUNNING)
+        mosaic_task.refresh_from_db()
+        self.assertEqual(mosaic_task.status, TaskStatus.STOPPED)
+        self.assertEqual(mosaic_task.celery_retry, 0)
+        mocked_control.revoke.assert_called_once_with('mosaic-id')
+        missed_task.refresh_from_db()
+        self.assertEqual(missed_task.status, TaskStatus.RUNNING)
+        self.assertTrue(missed_task.task_id)
+        mocked_mosaic.assert_called_once()
+        stuck_task.refresh_from_db()
+        self.assertEqual(stuck_task.status, TaskStatus.STOPPED)
+        self.assertEqual(
+            stuck_task.tiles.filter(status=TaskStatus.CANCELLED).count(), 1)
+
+    @mock.patch('cplus_api.tasks.cleaner.ingest_input_layer.delay')
+    def test_resubmit_pending_ingestions(self, mocked_ingest):
+        old_time = timezone.now() - timedelta(hours=1)
+        pending_layer = InputLayerF.create(
+            file='test/pending.tif',
+            ingestion_status=InputLayer.IngestionStatus.PENDING
+        )
+        uploading_layer = InputLayerF.create(
+            file='test/uploading.tif',
+            ingestion_status=InputLayer.IngestionStatus.PENDING
+        )
+        MultipartUpload.objects.create(
+            upload_id='upload',
+            input_layer_uuid=uploading_layer.uuid,
+            created_on=old_time,
+            uploader=uploading_layer.owner,
+            parts=2
+        )
+        recent_layer = InputLayerF.create(
+            file='test/recent.tif',
+            ingestion_status=InputLayer.IngestionStatus.PENDING
+        )
+        InputLayer.objects.exclude(id=recent_layer.id).update(
+            modified_on=old_time)
+        self.assertEqual(resubmit_pending_ingestions(1800), 1)
+        mocked_ingest.assert_called_once_with(pending_layer.id)
+        # not resubmitted again before the delta
+        mocked_ingest.reset_mock()
+        self.assertEqual(resubmit_pending_ingestions(1800), 0)
+        mocked_ingest.assert_not_called()
@@ -0,0 +1,115 @@
+import datetime
+from django.test import TestCase
+from django.utils import timezone
+from core.models.base_task_request import TaskStatus
+from cplus_api.tests.factories import ScenarioTaskF, InputLayerF
+from cplus_api.utils.estimator import (
+    get_scenario_layer_uuids,
+    get_layer_resolution_m,
+    count_scenario_rasters,
+    get_runtime_calibration,
+    estimate_scenario_cost,
+    validate_scenario_cost,
+    DEFAULT_BASE_SECONDS,
+    DEFAULT_SECONDS_PER_WORK_UNIT,
+    METRES_PER_DEGREE
+)
+
+
+class TestEstimator(TestCase):
+
+    def get_detail(self, layer_uuid):
+        return {
+            'extent': [0, 10000, 0, 10000],
+            'priority_layers': [
+                {'uuid': 'p1', 'layer_uuid': layer_uuid},
+                {'uuid': 'p2', 'layer_uuid': ''}
+            ],
+            'activities': [
+                {
+                    'uuid': 'a1',
+                    'pathways': [
+                        {'layer_uuid': layer_uuid, 'carbon_uuids': []},
+                        {'layer_uuid': '', 'carbon_uuids': ['c1']}
+                    ]
+                }
+            ],
+            'mask_layer_uuids': []
+        }
+
+    def test_get_scenario_layer_uuids(self):
+        detail = self.get_detail('l1')
+        detail['snap_layer_uuid'] = 's1'
+        self.assertEqual(
+            get_scenario_layer_uuids(detail), {'l1', 'c1', 's1'})
+
+    def test_get_layer_resolution_m(self):
+        self.assertIsNone(get_layer_resolution_m({}))
+        self.assertIsNone(get_layer_resolution_m({'resolution': [0, 10]}))
+        self.assertEqual(
+            get_layer_resolution_m({'resolution': [10, -20]}), (10, 20))
+        res_x, res_y = get_layer_resolution_m({
+            'resolution': [0.001, 0.001],
+            'is_geographic': True
+        })
+        self.assertAlmostEqual(res_x, 0.001 * METRES_PER_DEGREE)
+
+    def test_count_scenario_rasters(self):
+        detail = self.get_detail('l1')
+        counts = count_scenario_rasters(detail)
+        self.assertEqual(counts['activities'], 1)
+        self.assertEqual(counts['pathways'], 2)
+        self.assertEqual(counts['carbon_layers'], 1)
+        self.assertEqual(counts['priority_layers'], 1)
+        # 2 pathways * 2 + activity with 3 landuse outputs
+        # + 1 priority layer + highest position
+        self.assertEqual(counts['rasters'], 4 + 4 + 1 + 1)
+        detail['landuse_weighted'] = False
+        detail['highest_position'] = False
+        self.assertEqual(count_scenario_rasters(detail)['rasters'], 8)
+
+    def test_estimate_scenario_cost(self):
+        input_layer = InputLayerF.create(
+            size=1000,
+            metadata={'resolution': [10, 10], 'is_geographic': False}
+        )
+        estimate = estimate_scenario_cost(
+            self.get_detail(str(input_layer.uuid)))
+        self.assertEqual(estimate['resolution_m'], [10, 10])
+        self.assertEqual(estimate['pixels'], 1000 * 1000)
+        self.assertEqual(estimate['input_bytes'], 1000)
+        self.assertEqual(
+            estimate['disk_bytes'], 1000 + 4 * 1000 * 1000 * 10)
+        self.assertEqual(estimate['work_units'], 1000 * 1000 * 10)
+        self.assertEqual(
+            estimate['runtime_seconds'],
+            int(DEFAULT_BASE_SECONDS + 1e7 * DEFAULT_SECONDS_PER_WORK_UNIT)
+        )
+        # no layer metadata uses default resolution
+        estimate = estimate_scenario_cost(self.get_detail(''))
+        self.assertEqual(estimate['resolution_m'], [30.0, 30.0])
+
+    def test_get_runtime_calibration(self):
+        calibration = get_runtime_calibration()
+        self.assertEqual(calibration['samples'], 0)
+        started_at = timezone.now() - datetime.timedelta(days=1)
+        for work_units, seconds in [(1e6, 30), (2e6, 50), (4e6, 90)]:
+            ScenarioTaskF.create(
+                status=TaskStatus.COMPLETED,
+                started_at=started_at,
+                finished_at=started_at + datetime.timedelta(seconds=seconds),
+                cost_estimate={'work_units': work_units}
+            )
+        calibration = get_runtime_calibration()
+        self.assertEqual(calibration['samples'], 3)
+        self.assertAlmostEqual(calibration['seconds_per_unit'], 2e-5)
+        self.assertAlmostEqual(calibration['base_seconds'], 10)
+
+    def test_validate_scenario_cost(self):
+        gb = 1024 ** 3
+        config = {'max_estimated_disk_gb': 1, 'max_estimated_ram_gb': 1}
+        self.assertFalse(validate_scenario_cost(
+            {'disk_bytes': gb, 'ram_bytes': gb}, config))
+        errors = validate_scenario_cost(
+            {'disk_bytes': 2 * gb, 'ram_bytes': 2 * gb}, config)
+        self.assertEqual(len(errors), 2)
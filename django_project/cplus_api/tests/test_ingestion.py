@@ -0,0 +1,148 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import mock
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework import serializers
+from core.settings.utils import absolute_path
+from cplus_api.models.layer import InputLayer
+from cplus_api.serializers.scenario import validate_layer_uuid
+from cplus_api.tasks.ingest_input_layer import ingest_input_layer
+from cplus_api.tests.common import BaseAPIViewTransactionTest
+from cplus_api.tests.factories import InputLayerF
+from cplus_api.utils.ingestion import is_cog_beneficial, ingest_layer_file
+from cplus_api.utils.scratch import (
+    SCRATCH_LEDGER_FILE,
+    ScratchQuotaExceeded,
+    get_ingestion_scratch_path
+)
+
+
+class TestIngestion(BaseAPIViewTransactionTest):
+
+    def setUp(self):
+        super().setUp()
+        self.scratch_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            SCRATCH_DIR=self.scratch_dir)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        super().tearDown()
+
+    def create_raster_layer(self):
+        input_layer = InputLayerF.create(
+            name='test_model_ingest.tif',
+            privacy_type=InputLayer.PrivacyTypes.PRIVATE,
+            ingestion_status=InputLayer.IngestionStatus.PENDING
+        )
+        file_path = absolute_path(
+            'cplus_api', 'tests', 'data',
+            'models', 'test_model_1.tif'
+        )
+        self.store_layer_file(input_layer, file_path, input_layer.name)
+        return input_layer
+
+    def test_ingest_raster(self):
+        input_layer = InputLayerF.create(
+            name='test_model_ingest.tif',
+            privacy_type=InputLayer.PrivacyTypes.PRIVATE,
+            ingestion_status=InputLayer.IngestionStatus.PENDING
+        )
+        file_path = absolute_path(
+            'cplus_api', 'tests', 'data',
+            'models', 'test_model_1.tif'
+        )
+        self.store_layer_file(input_layer, file_path, input_layer.name)
+        with self.assertRaises(serializers.ValidationError):
+            validate_layer_uuid(str(input_layer.uuid))
+        ingest_input_layer(input_layer.id)
+        input_layer.refresh_from_db()
+        self.assertEqual(
+            input_layer.ingestion_status, InputLayer.IngestionStatus.READY)
+        self.assertTrue(input_layer.metadata['is_raster'])
+        self.assertIn('crs', input_layer.metadata)
+        self.assertEqual(len(input_layer.metadata['bounds']), 4)
+        self.assertEqual(len(input_layer.metadata['resolution']), 2)
+        self.assertEqual(input_layer.footprint.srid, 4326)
+        self.assertTrue(input_layer.footprint.valid)
+        stored_path = input_layer.file.path
+        with open(stored_path, 'rb') as f:
+            self.assertEqual(
+                input_layer.checksum, hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual(input_layer.size, input_layer.file.size)
+        self.assertFalse(is_cog_beneficial(stored_path))
+        validate_layer_uuid(str(input_layer.uuid))
+
+    def test_ingest_invalid_raster(self):
+        input_layer = InputLayerF.create(
+            name='test_invalid_ingest.tif',
+            ingestion_status=InputLayer.IngestionStatus.PENDING
+        )
+        input_layer.file.save(
+            input_layer.name, ContentFile(b'invalid'), save=True)
+        ingest_input_layer(input_layer.id)
+        input_layer.refresh_from_db()
+        self.assertEqual(
+            input_layer.ingestion_status, InputLayer.IngestionStatus.FAILED)
+        self.assertIn('Invalid raster', input_layer.ingestion_error)
+        with self.assertRaises(serializers.ValidationError):
+            validate_layer_uuid(str(input_layer.uuid))
+
+    def test_ingest_in_scratch_dir(self):
+        input_layer = self.create_raster_layer()
+        with mock.patch(
+            'cplus_api.utils.ingestion.validate_raster',
+            side_effect=lambda file_path: self.assertTrue(
+                file_path.startswith(
+                    get_ingestion_scratch_path(input_layer)))
+        ) as mocked_validate:
+            self.assertTrue(ingest_layer_file(input_layer))
+        mocked_validate.assert_called()
+        # working directory and reservation are removed
+        self.assertFalse(
+            os.path.exists(get_ingestion_scratch_path(input_layer)))
+        with open(os.path.join(self.scratch_dir, SCRATCH_LEDGER_FILE)) as f:
+            self.assertEqual(json.load(f), {})
+
+    def test_ingest_uploaded_again(self):
+        input_layer = self.create_raster_layer()
+        with open(input_layer.file.path, 'rb') as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+
+        def upload_again(file_path):
+            InputLayer.objects.filter(id=input_layer.id).update(
+                ingestion_status=InputLayer.IngestionStatus.PENDING)
+
+        with mock.patch(
+            'cplus_api.utils.ingestion.validate_raster',
+            side_effect=upload_again
+        ):
+            self.assertIsNone(ingest_layer_file(input_layer))
+        input_layer.refresh_from_db()
+        self.assertEqual(
+            input_layer.ingestion_status,
+            InputLayer.IngestionStatus.PENDING
+        )
+        # file is not replaced by ingestion of the previous upload
+        with open(input_layer.file.path, 'rb') as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), checksum)
+
+    def test_ingest_without_scratch_space(self):
+        input_layer = self.create_raster_layer()
+        with mock.patch(
+            'cplus_api.utils.ingestion.reserve_scratch_space',
+            side_effect=ScratchQuotaExceeded('Not enough scratch space')
+        ):
+            self.assertFalse(ingest_layer_file(input_layer))
+        input_layer.refresh_from_db()
+        self.assertEqual(
+            input_layer.ingestion_status,
+            InputLayer.IngestionStatus.PENDING
+        )
+        self.assertIn('scratch space', input_layer.ingestion_error)
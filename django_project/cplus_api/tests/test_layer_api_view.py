@@ -1,6 +1,7 @@
 import os
 import uuid
 import mock
+from datetime import timedelta
 from django.contrib.gis.geos import Polygon
 from django.test import override_settings
 from django.conf import settings
@@ -24,6 +25,9 @@ from cplus_api.api_views.layer import (
     is_internal_user,
     validate_layer_access,
     LayerUploadAbort,
+    LayerUploadParts,
+    LayerUploadSign,
+    LayerUploadExtend,
     FetchLayerByClientId,
     DefaultLayerList,
     ReferenceLayerDownload,
@@ -108,6 +112,64 @@ class TestLayerAPIView(BaseAPIViewTransactionTest):
         self.assertTrue(find_layer)
         self.assertTrue(find_layer['url'])
 
+    def test_layer_list_bbox(self):
+        footprint = Polygon.from_bbox((0, 0, 10, 10))
+        footprint.srid = 4326
+        layer_1 = InputLayerF.create(
+            privacy_type=InputLayer.PrivacyTypes.COMMON,
+            footprint=footprint
+        )
+        footprint = Polygon.from_bbox((50, 50, 60, 60))
+        footprint.srid = 4326
+        layer_2 = InputLayerF.create(
+            privacy_type=InputLayer.PrivacyTypes.PRIVATE,
+            owner=self.superuser,
+            footprint=footprint
+        )
+        # layer without footprint is not filtered
+        layer_3 = InputLayerF.create(
+            privacy_type=InputLayer.PrivacyTypes.COMMON
+        )
+        request = self.factory.get(
+            reverse('v1:layer-list') + '?bbox=5,5,6,6'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = LayerList.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted([layer['uuid'] for layer in response.data['results']]),
+            sorted([str(layer_1.uuid), str(layer_3.uuid)])
+        )
+        request = self.factory.get(
+            reverse('v1:layer-list') + '?bbox=55,55,56,56'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = LayerList.as_view()(request)
+        self.assertEqual(
+            sorted([layer['uuid'] for layer in response.data['results']]),
+            sorted([str(layer_2.uuid), str(layer_3.uuid)])
+        )
+        request = self.factory.get(
+            reverse('v1:layer-default-list') + '?bbox=55,55,56,56'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = DefaultLayerList.as_view()(request)
+        self.assertEqual(
+            [layer['uuid'] for layer in response.data],
+            [str(layer_3.uuid)]
+        )
+        # invalid bbox
+        request = self.factory.get(
+            reverse('v1:layer-list') + '?bbox=1,2,3'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = LayerList.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+
     def test_default_layer_list(self):
         request = self.factory.get(
             reverse('v1:layer-default-list')
@@ -307,7 +369,8 @@ class TestLayerAPIView(BaseAPIViewTransactionTest):
         input_layer.refresh_from_db()
         self.assertEqual(input_layer.name, 'test_name')
 
-    def test_layer_upload(self):
+    @mock.patch('cplus_api.api_views.layer.ingest_input_layer.delay')
+    def test_layer_upload(self, mocked_ingest):
         view = LayerUpload.as_view()
         file_path = absolute_path(
             'cplus_api', 'tests', 'data',
@@ -355,6 +418,9 @@ class TestLayerAPIView(BaseAPIViewTransactionTest):
         self.assertEqual(input_layer.client_id, data['client_id'])
         self.assertTrue(input_layer.size > 0)
         self.assertTrue(input_layer.is_available())
+        self.assertEqual(
+            input_layer.ingestion_status, InputLayer.IngestionStatus.PENDING)
+        mocked_ingest.assert_called_once_with(input_layer.id)
         # test update
         file_path = absolute_path(
             'cplus_api', 'tests', 'data',
@@ -582,7 +648,8 @@ class TestLayerAPIView(BaseAPIViewTransactionTest):
             input_layer_uuid=response.data['uuid']
         ).exists())
 
-    def test_layer_upload_finish(self):
+    @mock.patch('cplus_api.api_views.layer.ingest_input_layer.delay')
+    def test_layer_upload_finish(self, mocked_ingest):
         view = LayerUploadFinish.as_view()
         file_path = absolute_path(
             'cplus_api', 'tests', 'data',
@@ -644,8 +711,10 @@ class TestLayerAPIView(BaseAPIViewTransactionTest):
         self.assertTrue(input_layer.file.name)
         self.assertTrue(input_layer.is_available())
 
+    @mock.patch('cplus_api.api_views.layer.ingest_input_layer.delay')
     @mock.patch('boto3.client')
-    def test_layer_upload_finish_with_multipart(self, mocked_s3):
+    def test_layer_upload_finish_with_multipart(self, mocked_s3,
+                                                mocked_ingest):
         s3_client = MockS3Client()
         mocked_s3.return_value = s3_client
         view = LayerUploadFinish.as_view()
@@ -902,6 +971,233 @@ class TestLayerAPIView(BaseAPIViewTransactionTest):
             ).exists()
         )
 
+    @mock.patch('cplus_api.api_views.layer.ingest_input_layer.delay')
+    @mock.patch('boto3.client')
+    def test_resume_multipart_upload(self, mocked_s3, mocked_ingest):
+        s3_client = MockS3Client()
+        mocked_s3.return_value = s3_client
+        file_path = absolute_path(
+            'cplus_api', 'tests', 'data',
+            'models', 'test_model_1.tif'
+        )
+        base_filename = 'test_model_1_resume.tif'
+        input_layer = InputLayerF.create(
+            privacy_type=InputLayer.PrivacyTypes.PRIVATE,
+            name=base_filename,
+            size=os.stat(file_path).st_size,
+            owner=self.superuser
+        )
+        upload = MultipartUpload.objects.create(
+            upload_id='this_is_upload_id',
+            input_layer_uuid=input_layer.uuid,
+            created_on=timezone.now(),
+            uploader=self.superuser,
+            parts=3,
+            file_path=input_layer_dir_path(input_layer, base_filename)
+        )
+        s3_client.mock_parts = {
+            'IsTruncated': False,
+            'Parts': [{
+                'PartNumber': 1,
+                'ETag': 'etag-1',
+                'Size': 10
+            }]
+        }
+        kwargs = {
+            'layer_uuid': str(input_layer.uuid)
+        }
+        # list uploaded parts
+        request = self.factory.get(
+            reverse('v1:layer-upload-parts', kwargs=kwargs) +
+            '?multipart_upload_id=this_is_upload_id'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = LayerUploadParts.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['missing_parts'], [2, 3])
+        self.assertEqual(response.data['uploaded_parts'], [{
+            'part_number': 1,
+            'etag': 'etag-1',
+            'size': 10
+        }])
+        upload.refresh_from_db()
+        self.assertEqual(upload.part_etags, {'1': 'etag-1'})
+        # other user cannot resume the upload
+        request = self.factory.get(
+            reverse('v1:layer-upload-parts', kwargs=kwargs) +
+            '?multipart_upload_id=this_is_upload_id'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = UserF.create()
+        response = LayerUploadParts.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 403)
+        # sign missing parts
+        payload = {
+            'multipart_upload_id': 'this_is_upload_id'
+        }
+        request = self.factory.post(
+            reverse('v1:layer-upload-sign', kwargs=kwargs),
+            data=payload, format='json'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = LayerUploadSign.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['upload_urls'], [{
+            'part_number': 2,
+            'url': 'this_is_url'
+        }, {
+            'part_number': 3,
+            'url': 'this_is_url'
+        }])
+        self.assertTrue(response.data['expires_on'])
+        # sign invalid part number
+        request = self.factory.post(
+            reverse('v1:layer-upload-sign', kwargs=kwargs),
+            data={
+                'multipart_upload_id': 'this_is_upload_id',
+                'part_numbers': [4]
+            }, format='json'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = LayerUploadSign.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 400)
+        # extend session
+        upload.expires_on = timezone.now()
+        upload.save(update_fields=['expires_on'])
+        request = self.factory.post(
+            reverse('v1:layer-upload-extend', kwargs=kwargs),
+            data=payload, format='json'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = LayerUploadExtend.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        upload.refresh_from_db()
+        self.assertGreater(
+            upload.expires_on, timezone.now() + timedelta(days=6))
+        # finish without items fails when there is missing part
+        request = self.factory.post(
+            reverse('v1:layer-upload-finish', kwargs=kwargs),
+            data=payload, format='json'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = LayerUploadFinish.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 400)
+        self.check_validation_error_string(
+            response.data, 'Missing upload parts')
+        # finish using ETags from the storage
+        s3_client.mock_parts['Parts'].extend([{
+            'PartNumber': 2,
+            'ETag': 'etag-2',
+            'Size': 10
+        }, {
+            'PartNumber': 3,
+            'ETag': 'etag-3',
+            'Size': 10
+        }])
+        self.store_layer_file(input_layer, file_path, base_filename)
+        with mock.patch.object(
+            s3_client, 'complete_multipart_upload'
+        ) as mocked_complete:
+            request = self.factory.post(
+                reverse('v1:layer-upload-finish', kwargs=kwargs),
+                data=payload, format='json'
+            )
+            request.resolver_match = FakeResolverMatchV1
+            request.user = self.superuser
+            response = LayerUploadFinish.as_view()(request, **kwargs)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                mocked_complete.call_args.kwargs['MultipartUpload'],
+                {
+                    'Parts': [
+                        {'ETag': f'etag-{i}', 'PartNumber': i}
+                        for i in range(1, 4)
+                    ]
+                }
+            )
+        self.assertFalse(MultipartUpload.objects.filter(
+            id=upload.id).exists())
+
+    @override_settings(
+        MULTIPART_UPLOAD_URL_PAGE_SIZE=2,
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+            }
+        }
+    )
+    @mock.patch('boto3.client')
+    def test_multipart_upload_url_pages(self, mocked_s3):
+        s3_client = MockS3Client()
+        mocked_s3.return_value = s3_client
+        data = {
+            'layer_type': 0,
+            'component_type': 'ncs_carbon',
+            'privacy_type': 'private',
+            'name': 'test_model_1_pages.tif',
+            'size': 100,
+            'number_of_parts': 5
+        }
+        # without paged, all presigned urls are returned
+        request = self.factory.post(
+            reverse('v1:layer-upload-start'), data
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = LayerUploadStart.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['upload_urls']), 5)
+        self.assertIsNone(response.data['next_part'])
+        data['name'] = 'test_model_1_paged.tif'
+        data['paged'] = True
+        request = self.factory.post(
+            reverse('v1:layer-upload-start'), data
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        with mock.patch.object(
+            s3_client, 'generate_presigned_url',
+            wraps=s3_client.generate_presigned_url
+        ) as mocked_sign:
+            response = LayerUploadStart.as_view()(request)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(
+                [item['part_number'] for item in
+                 response.data['upload_urls']],
+                [1, 2]
+            )
+            self.assertEqual(response.data['next_part'], 3)
+            self.assertEqual(mocked_sign.call_count, 2)
+            kwargs = {
+                'layer_uuid': response.data['uuid']
+            }
+            payload = {
+                'multipart_upload_id': response.data['multipart_upload_id'],
+                'from_part': 2,
+                'count': 10
+            }
+            request = self.factory.post(
+                reverse('v1:layer-upload-sign', kwargs=kwargs),
+                data=payload, format='json'
+            )
+            request.resolver_match = FakeResolverMatchV1
+            request.user = self.superuser
+            response = LayerUploadSign.as_view()(request, **kwargs)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [item['part_number'] for item in
+                 response.data['upload_urls']],
+                [2, 3]
+            )
+            self.assertEqual(response.data['next_part'], 4)
+            # part 2 is signed from cache
+            self.assertEqual(mocked_sign.call_count, 3)
+
     def test_layer_fetch_by_client_id(self):
         view = FetchLayerByClientId.as_view()
         payload = [
@@ -195,6 +195,48 @@ class TestModelLayer(BaseAPIViewTransactionTest):
         input_layer.refresh_from_db()
         self.assertTrue(input_layer.is_in_correct_directory())
 
+    @mock.patch('cplus_api.tasks.move_input_layer_file.'
+                'move_input_layer_file.delay')
+    def test_input_layer_dirty_tracking(self, mocked_move):
+        input_layer = InputLayerF.create(
+            privacy_type=InputLayer.PrivacyTypes.PRIVATE
+        )
+        input_layer = InputLayer.objects.get(id=input_layer.id)
+        # save without file location change does not read the row
+        with self.assertNumQueries(1):
+            input_layer.description = 'test'
+            input_layer.save()
+        self.assertFalse(input_layer.move_file)
+        with self.assertNumQueries(1):
+            input_layer.save(update_fields=['description'])
+        input_layer.privacy_type = InputLayer.PrivacyTypes.COMMON
+        with self.assertNumQueries(1):
+            input_layer.save()
+        self.assertTrue(input_layer.move_file)
+        mocked_move.assert_called_once_with(input_layer.uuid)
+        # snapshot is updated after save
+        input_layer.save()
+        self.assertFalse(input_layer.move_file)
+        # deferred fields are fetched
+        input_layer = InputLayer.objects.only('id', 'uuid').get(
+            id=input_layer.id)
+        input_layer.component_type = InputLayer.ComponentTypes.MASK_LAYER
+        input_layer.save()
+        self.assertTrue(input_layer.move_file)
+
+    def test_touch_last_used(self):
+        input_layer_1 = InputLayerF.create()
+        input_layer_2 = InputLayerF.create()
+        modified_on = InputLayer.objects.get(id=input_layer_1.id).modified_on
+        with self.assertNumQueries(1):
+            total = InputLayer.touch_last_used(
+                [input_layer_1.uuid, input_layer_2.uuid])
+        self.assertEqual(total, 2)
+        input_layer_1.refresh_from_db()
+        self.assertTrue(input_layer_1.last_used_on)
+        self.assertEqual(input_layer_1.modified_on, modified_on)
+        self.assertEqual(InputLayer.touch_last_used([]), 0)
+
     def test_verify_input_layer(self):
         input_layer = InputLayerF.create(
             name='test_model_verify_1.tif',
@@ -76,6 +76,41 @@ class TestModelScenarioTask(TestCase):
         scenario_task.add_log('test')
         self.check_log_exists(scenario_task, 'test')
 
+    def test_task_on_sent_keeps_logs(self):
+        scenario_task = ScenarioTaskF.create()
+        scenario_task.add_log('Task is scheduled to queue cplus.')
+        scenario_task.task_on_sent('task-id', 'task-name', '(1,)')
+        self.check_log_exists(
+            scenario_task, 'Task is scheduled to queue cplus.')
+        self.check_log_exists(scenario_task, 'Task is sent to worker.')
+
+    def test_add_log_buffered(self):
+        scenario_task = ScenarioTaskF.create()
+        scenario_task.enable_log_buffer(max_size=3, max_seconds=60)
+        scenario_task.add_log('test 1')
+        scenario_task.add_log('test 2')
+        self.assertFalse(scenario_task.get_logs().exists())
+        self.assertFalse(scenario_task.should_flush_logs())
+        # flush on size threshold
+        scenario_task.add_log('test 3')
+        self.assertEqual(scenario_task.get_logs().count(), 3)
+        # flush on time threshold
+        scenario_task.enable_log_buffer(max_size=10, max_seconds=0)
+        scenario_task.add_log('test 4')
+        self.assertEqual(scenario_task.get_logs().count(), 4)
+        # flush on errors
+        scenario_task.enable_log_buffer(max_size=10, max_seconds=60)
+        scenario_task.add_log('test 5')
+        scenario_task.task_on_errors(Exception('test'))
+        self.check_log_exists(scenario_task, 'test 5')
+        self.check_log_exists(scenario_task, 'Task is stopped with errors.')
+        self.assertEqual(scenario_task.flush_logs(), 0)
+        # flush on cancelled
+        scenario_task.add_log('test 6')
+        scenario_task.task_on_cancelled()
+        self.check_log_exists(scenario_task, 'test 6')
+        self.check_log_exists(scenario_task, 'Task has been cancelled.')
+
     def test_task_on_sent(self):
         scenario_task = ScenarioTaskF.create()
         scenario_task.task_on_sent('task_id', 'task_name', '(1,)')
@@ -0,0 +1,106 @@
+import mock
+from datetime import timedelta
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from django.utils import timezone
+from core.models.preferences import SitePreferences
+from cplus_api.api_views.output import RestoreScenarioAnalysisOutput
+from cplus_api.models.layer import (
+    OutputLayer,
+    select_output_archive_storage,
+    output_archive_file_path
+)
+from cplus_api.tasks.remove_layers import remove_layers
+from cplus_api.tasks.restore_output_layers import restore_output_layers
+from cplus_api.tests.common import (
+    FakeResolverMatchV1,
+    BaseAPIViewTransactionTest
+)
+from cplus_api.tests.factories import ScenarioTaskF, OutputLayerF
+
+
+class TestOutputArchive(BaseAPIViewTransactionTest):
+
+    def setUp(self):
+        super().setUp()
+        preferences = SitePreferences.preferences()
+        preferences.archive_aged_outputs = True
+        preferences.save()
+        self.scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser
+        )
+
+    def create_output_layer(self, days, **kwargs):
+        output_layer = OutputLayerF.create(
+            created_on=timezone.now() - timedelta(days=days),
+            scenario=self.scenario_task,
+            owner=self.superuser,
+            **kwargs
+        )
+        output_layer.file.save('test.tif', ContentFile(b'test'))
+        return output_layer
+
+    def test_archive_and_restore(self):
+        output_layer = self.create_output_layer(
+            15, is_final_output=False, group='activities')
+        recent_layer = self.create_output_layer(
+            1, is_final_output=False, group='activities')
+        file_name = output_layer.file.name
+        remove_layers()
+        output_layer.refresh_from_db()
+        recent_layer.refresh_from_db()
+        self.assertEqual(
+            output_layer.storage_tier, OutputLayer.StorageTiers.ARCHIVED)
+        self.assertTrue(output_layer.archived_on)
+        self.assertEqual(
+            recent_layer.storage_tier, OutputLayer.StorageTiers.STANDARD)
+        self.assertFalse(output_layer.file.storage.exists(file_name))
+        archive_storage = select_output_archive_storage()
+        self.assertTrue(
+            archive_storage.exists(output_archive_file_path(file_name)))
+        # archived layer is not archived again or removed
+        remove_layers()
+        self.assertTrue(
+            OutputLayer.objects.filter(id=output_layer.id).exists())
+        # request restore
+        kwargs = {
+            'scenario_uuid': str(self.scenario_task.uuid)
+        }
+        request = self.factory.post(
+            reverse('v1:scenario-output-restore', kwargs=kwargs),
+            [str(output_layer.uuid)], format='json'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        with mock.patch(
+            'cplus_api.api_views.output.restore_output_layers.delay'
+        ) as mocked_delay:
+            response = RestoreScenarioAnalysisOutput.as_view()(
+                request, **kwargs)
+            mocked_delay.assert_called_once_with([output_layer.id])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(
+            response.data[0]['storage_tier'],
+            OutputLayer.StorageTiers.RESTORING
+        )
+        self.assertIsNone(response.data[0]['url'])
+        self.assertEqual(restore_output_layers([output_layer.id]), 1)
+        output_layer.refresh_from_db()
+        self.assertEqual(
+            output_layer.storage_tier, OutputLayer.StorageTiers.STANDARD)
+        self.assertIsNone(output_layer.archived_on)
+        self.assertTrue(output_layer.file.storage.exists(file_name))
+        self.assertFalse(
+            archive_storage.exists(output_archive_file_path(file_name)))
+
+    def test_delete_archived_layer(self):
+        output_layer = self.create_output_layer(
+            15, is_final_output=False, group='activities')
+        file_name = output_layer.file.name
+        remove_layers()
+        archive_storage = select_output_archive_storage()
+        self.assertTrue(
+            archive_storage.exists(output_archive_file_path(file_name)))
+        OutputLayer.objects.get(id=output_layer.id).delete()
+        self.assertFalse(
+            archive_storage.exists(output_archive_file_path(file_name)))
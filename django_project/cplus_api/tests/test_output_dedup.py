@@ -0,0 +1,45 @@
+from django.test import TestCase
+from cplus_api.models.layer import OutputLayer
+from cplus_api.tests.factories import (
+    ScenarioTaskF,
+    OutputLayerF
+)
+from cplus_api.utils.output_dedup import (
+    find_stored_output,
+    clone_stored_output
+)
+
+
+class TestOutputDedup(TestCase):
+
+    def setUp(self):
+        self.scenario_task = ScenarioTaskF.create()
+
+    def test_find_stored_output(self):
+        output_layer = OutputLayerF.create(
+            owner=self.scenario_task.submitted_by,
+            scenario=self.scenario_task,
+            group='activities',
+            is_final_output=False,
+            content_hash='abc',
+            file='test/activity.tif'
+        )
+        self.assertIsNone(
+            find_stored_output(output_layer.owner, 'activities', 'def'))
+        self.assertIsNone(
+            find_stored_output(output_layer.owner, 'pathways', 'abc'))
+        stored_output = find_stored_output(
+            output_layer.owner, 'activities', 'abc')
+        self.assertEqual(stored_output, output_layer)
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.scenario_task.submitted_by
+        )
+        cloned_output = clone_stored_output(stored_output, scenario_task)
+        self.assertEqual(cloned_output.scenario, scenario_task)
+        self.assertEqual(cloned_output.file.name, 'test/activity.tif')
+        self.assertEqual(cloned_output.content_hash, 'abc')
+        # archived output is not reused
+        OutputLayer.objects.filter(content_hash='abc').update(
+            storage_tier=OutputLayer.StorageTiers.ARCHIVED)
+        self.assertIsNone(
+            find_stored_output(output_layer.owner, 'activities', 'abc'))
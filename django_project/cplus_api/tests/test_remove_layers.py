@@ -1,6 +1,8 @@
 import mock
 import os
+from django.core.files.base import ContentFile
 from datetime import timedelta
+from django.test import override_settings
 from django.utils import timezone
 from django.conf import settings
 from cplus_api.tests.factories import (
@@ -16,8 +18,12 @@ from cplus_api.models.layer import (
 )
 from cplus_api.tasks.remove_layers import (
     remove_layers,
-    clean_multipart_upload
+    clean_multipart_upload,
+    delete_storage_files,
+    purge_in_batches,
+    delete_output_layer_files
 )
+from cplus_api.models.statistics import ZonalStatisticsTask
 from cplus_api.tests.common import BaseAPIViewTransactionTest, MockS3Client
 
 
@@ -41,6 +47,42 @@ class TestRemoveLayers(BaseAPIViewTransactionTest):
             InputLayer.objects.filter(uuid=input_layer.uuid).exists()
         )
 
+    def test_referenced_input_layer_removed(self):
+        """
+        Test aged private input layer that is used as geometry layer of
+        zonal statistics task is removed and the reference is cleared.
+        """
+        input_layer = InputLayerF.create(
+            created_on=timezone.now() - timedelta(days=15),
+            privacy_type=InputLayer.PrivacyTypes.PRIVATE
+        )
+        input_layer.file.save('boundary.geojson', ContentFile(b'{}'))
+        file_name = input_layer.file.name
+        zonal_task = ZonalStatisticsTask.objects.create(
+            bbox_minx=0,
+            bbox_miny=0,
+            bbox_maxx=1,
+            bbox_maxy=1,
+            geometry_layer=input_layer,
+            submitted_by=self.superuser,
+            submitted_on=timezone.now()
+        )
+        output_layer = OutputLayerF.create(
+            created_on=timezone.now() - timedelta(days=15),
+            is_final_output=False
+        )
+        remove_layers()
+        self.assertFalse(
+            InputLayer.objects.filter(uuid=input_layer.uuid).exists()
+        )
+        self.assertFalse(input_layer.file.storage.exists(file_name))
+        zonal_task.refresh_from_db()
+        self.assertIsNone(zonal_task.geometry_layer)
+        # next purges are not blocked
+        self.assertFalse(
+            OutputLayer.objects.filter(uuid=output_layer.uuid).exists()
+        )
+
     def test_input_layers_not_removed(self):
         """
         Test non private input layers or layers that were created
@@ -131,6 +173,68 @@ class TestRemoveLayers(BaseAPIViewTransactionTest):
         )
         self.assertFalse(os.path.exists(file_path))
 
+    def test_delete_storage_files_in_s3(self):
+        """Test S3 objects are deleted with up to 1000 keys per request."""
+        storage = mock.MagicMock()
+        storage.bucket_name = 'test'
+        client = storage.connection.meta.client
+        client.delete_objects.side_effect = [
+            {'Errors': [{'Key': 'layer_1.tif', 'Message': 'Error'}]},
+            {}
+        ]
+        file_names = [f'layer_{idx}.tif' for idx in range(1500)]
+        failed = delete_storage_files(storage, file_names + [''])
+        self.assertEqual(failed, ['layer_1.tif'])
+        self.assertEqual(client.delete_objects.call_count, 2)
+        _, kwargs = client.delete_objects.call_args_list[0]
+        self.assertEqual(len(kwargs['Delete']['Objects']), 1000)
+
+    @override_settings(LAYER_RETENTION_BATCH_SIZE=2)
+    def test_purge_output_layers_in_batches(self):
+        """Test shared output file is kept when removing in batches."""
+        output_layers = [
+            OutputLayerF.create(
+                created_on=timezone.now() - timedelta(days=15),
+                is_final_output=False,
+                size=10
+            ) for _ in range(3)
+        ]
+        shared_layer = OutputLayerF.create(is_final_output=True)
+        for output_layer in output_layers + [shared_layer]:
+            output_layer.file.save('test.tif', ContentFile(b'test'))
+        OutputLayer.objects.filter(
+            id__in=[output_layers[2].id, shared_layer.id]
+        ).update(file=output_layers[2].file.name)
+        stats = purge_in_batches(
+            OutputLayer.objects.filter(is_final_output=False),
+            'file',
+            delete_output_layer_files
+        )
+        self.assertEqual(stats['rows'], 3)
+        self.assertEqual(stats['bytes'], 30)
+        self.assertTrue(stats['completed'])
+        self.assertEqual(OutputLayer.objects.count(), 1)
+        self.assertFalse(
+            output_layers[0].file.storage.exists(
+                output_layers[0].file.name)
+        )
+        self.assertTrue(
+            shared_layer.file.storage.exists(output_layers[2].file.name))
+
+    @override_settings(LAYER_RETENTION_MAX_SECONDS=-1)
+    @mock.patch('cplus_api.tasks.remove_layers.remove_layers.delay')
+    def test_remove_layers_resubmitted(self, mocked_delay):
+        """Test remove_layers continues in a new task after deadline."""
+        output_layer = OutputLayerF.create(
+            created_on=timezone.now() - timedelta(days=15),
+            is_final_output=False
+        )
+        remove_layers()
+        mocked_delay.assert_called_once()
+        self.assertTrue(
+            OutputLayer.objects.filter(uuid=output_layer.uuid).exists()
+        )
+
     @mock.patch('boto3.client')
     def test_clean_multipart_upload(self, mocked_s3):
         input_layer = InputLayerF.create(
@@ -0,0 +1,160 @@
+import mock
+import hashlib
+from django.test import TestCase, override_settings
+from cplus_api.utils.s3_copy import (
+    S3_MIN_PART_SIZE,
+    get_copy_part_ranges,
+    get_etag_part_count,
+    compute_multipart_etag,
+    multipart_copy
+)
+
+MB = 1024 ** 2
+
+
+def get_part_etag(part_number):
+    return f'"{hashlib.md5(str(part_number).encode()).hexdigest()}"'
+
+
+def mock_head_object(source, target, parts=None):
+    """Return head_object mock of source and target object."""
+    def head_object(Bucket, Key, PartNumber=None):
+        if Key != 'old.tif':
+            return target
+        if PartNumber:
+            return {'ContentLength': parts[PartNumber - 1]}
+        return source
+    return head_object
+
+
+class TestS3Copy(TestCase):
+
+    def test_get_copy_part_ranges(self):
+        ranges = get_copy_part_ranges(12 * MB, 5 * MB)
+        self.assertEqual(ranges, [
+            (1, 0, 5 * MB - 1),
+            (2, 5 * MB, 10 * MB - 1),
+            (3, 10 * MB, 12 * MB - 1)
+        ])
+        # part size is at least the S3 minimum
+        ranges = get_copy_part_ranges(12 * MB, 1)
+        self.assertEqual(ranges[0][2], S3_MIN_PART_SIZE - 1)
+        # number of parts is limited to 10000
+        ranges = get_copy_part_ranges(20000 * S3_MIN_PART_SIZE, 1)
+        self.assertEqual(len(ranges), 10000)
+
+    def test_compute_multipart_etag(self):
+        self.assertEqual(get_etag_part_count('"abc"'), 0)
+        self.assertEqual(get_etag_part_count('"abc-3"'), 3)
+        part_etags = [get_part_etag(1), get_part_etag(2)]
+        digests = hashlib.md5(
+            hashlib.md5(b'1').digest() + hashlib.md5(b'2').digest()
+        ).hexdigest()
+        self.assertEqual(
+            compute_multipart_etag(part_etags), f'"{digests}-2"')
+
+    @override_settings(S3_COPY_PART_SIZE=5 * MB, S3_COPY_MAX_CONCURRENCY=2)
+    def test_multipart_copy(self):
+        client = mock.MagicMock()
+        source = {
+            'ContentLength': 12 * MB,
+            'ETag': '"etag"',
+            'ContentType': 'image/tiff',
+            'Metadata': {'layer': 'test'},
+            'ServerSideEncryption': 'AES256'
+        }
+        expected_etag = compute_multipart_etag(
+            [get_part_etag(part) for part in [1, 2, 3]])
+        client.head_object.side_effect = mock_head_object(source, {
+            'ContentLength': 12 * MB,
+            'ETag': expected_etag
+        })
+        client.create_multipart_upload.return_value = {'UploadId': 'upload'}
+        client.upload_part_copy.side_effect = lambda **kwargs: {
+            'CopyPartResult': {'ETag': get_part_etag(kwargs['PartNumber'])}
+        }
+        size = multipart_copy(
+            client, 'bucket', 'old.tif', 'bucket', 'new.tif',
+            extra_args={'StorageClass': 'STANDARD_IA'}
+        )
+        self.assertEqual(size, 12 * MB)
+        client.create_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='new.tif',
+            ContentType='image/tiff',
+            Metadata={'layer': 'test'},
+            ServerSideEncryption='AES256',
+            StorageClass='STANDARD_IA'
+        )
+        self.assertEqual(client.upload_part_copy.call_count, 3)
+        _, kwargs = client.complete_multipart_upload.call_args
+        self.assertEqual(
+            [part['ETag'] for part in kwargs['MultipartUpload']['Parts']],
+            [get_part_etag(part) for part in [1, 2, 3]]
+        )
+        client.copy_object.assert_not_called()
+        # copied object does not match the parts
+        client.head_object.side_effect = mock_head_object(source, {
+            'ContentLength': 12 * MB,
+            'ETag': '"other-3"'
+        })
+        with self.assertRaises(RuntimeError):
+            multipart_copy(client, 'bucket', 'old.tif', 'bucket', 'new.tif')
+
+    @override_settings(S3_COPY_PART_SIZE=5 * MB, S3_COPY_MAX_CONCURRENCY=2)
+    def test_multipart_source_copy(self):
+        client = mock.MagicMock()
+        # source is uploaded with 8MB parts
+        source = {
+            'ContentLength': 12 * MB,
+            'ETag': '"source-2"'
+        }
+        client.head_object.side_effect = mock_head_object(
+            source, source, parts=[8 * MB, 4 * MB])
+        client.create_multipart_upload.return_value = {'UploadId': 'upload'}
+        client.upload_part_copy.side_effect = lambda **kwargs: {
+            'CopyPartResult': {'ETag': get_part_etag(kwargs['PartNumber'])}
+        }
+        multipart_copy(client, 'bucket', 'old.tif', 'bucket', 'new.tif')
+        self.assertEqual(
+            [
+                kwargs['CopySourceRange'] for _, kwargs in
+                client.upload_part_copy.call_args_list
+            ],
+            [f'bytes=0-{8 * MB - 1}', f'bytes={8 * MB}-{12 * MB - 1}']
+        )
+
+    @override_settings(S3_COPY_PART_SIZE=5 * MB, S3_COPY_MAX_CONCURRENCY=2)
+    def test_multipart_copy_failed(self):
+        client = mock.MagicMock()
+        client.head_object.return_value = {
+            'ContentLength': 12 * MB,
+            'ETag': '"etag"'
+        }
+        client.create_multipart_upload.return_value = {'UploadId': 'upload'}
+        client.upload_part_copy.side_effect = Exception('PreconditionFailed')
+        with self.assertRaises(Exception):
+            multipart_copy(client, 'bucket', 'old.tif', 'bucket', 'new.tif')
+        client.abort_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='new.tif', UploadId='upload')
+        client.complete_multipart_upload.assert_not_called()
+
+    @override_settings(S3_COPY_PART_SIZE=5 * MB)
+    def test_small_object_copy(self):
+        client = mock.MagicMock()
+        client.head_object.return_value = {
+            'ContentLength': MB,
+            'ETag': '"etag"',
+            'ContentType': 'image/tiff',
+            'ServerSideEncryption': 'aws:kms',
+            'SSEKMSKeyId': 'key'
+        }
+        multipart_copy(client, 'bucket', 'old.tif', 'bucket', 'new.tif')
+        client.copy_object.assert_called_once_with(
+            CopySource={'Bucket': 'bucket', 'Key': 'old.tif'},
+            CopySourceIfMatch='"etag"',
+            Bucket='bucket',
+            Key='new.tif',
+            ServerSideEncryption='aws:kms',
+            SSEKMSKeyId='key'
+        )
+        client.create_multipart_upload.assert_not_called()
@@ -1,5 +1,10 @@
 import mock
 import json
+import logging
+import datetime
+from urllib.parse import urlencode
+from asgiref.sync import async_to_sync
+from django.test import override_settings, AsyncRequestFactory
 from django.urls import reverse
 from core.models.base_task_request import TaskStatus
 from core.settings.utils import absolute_path
@@ -8,6 +13,7 @@ from cplus_api.api_views.scenario import (
     ExecuteScenarioAnalysis,
     CancelScenarioAnalysisTask,
     ScenarioAnalysisTaskStatus,
+    ScenarioAnalysisTaskStream,
     ScenarioAnalysisTaskLogs,
     ScenarioAnalysisHistory,
     ScenarioAnalysisTaskDetail
@@ -23,6 +29,41 @@ from cplus_api.tests.factories import (
     ScenarioTaskF,
     InputLayerF
 )
+from cplus_api.utils.task_events import async_scenario_event_stream
+
+
+class FakePubSub:
+    """Fake redis pubsub that returns the given messages."""
+
+    def __init__(self, messages) -> None:
+        self.messages = list(messages)
+        self.channels = []
+        self.closed = False
+
+    def subscribe(self, channel):
+        self.channels.append(channel)
+
+    def get_message(self, timeout=None):
+        if self.messages:
+            return {'data': json.dumps(self.messages.pop(0))}
+        return None
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncFakePubSub(FakePubSub):
+    """Fake asyncio redis pubsub that returns the given messages."""
+
+    async def subscribe(self, channel):
+        super().subscribe(channel)
+
+    async def get_message(self, ignore_subscribe_messages=False,
+                          timeout=None):
+        return super().get_message(timeout=timeout)
+
+    async def aclose(self):
+        super().close()
 
 
 class TestScenarioAPIView(BaseAPIViewTransactionTest):
@@ -91,6 +132,9 @@ class TestScenarioAPIView(BaseAPIViewTransactionTest):
         self.assertEqual(scenario_task.detail['scenario_name'],
                          data['scenario_name'])
         self.assertEqual(scenario_task.api_version, 'v1')
+        self.assertEqual(
+            response.data['estimate'], scenario_task.cost_estimate)
+        self.assertGreater(scenario_task.cost_estimate['pixels'], 0)
 
     @mock.patch('cplus_api.tasks.runner.'
                 'run_scenario_analysis_task.apply_async')
@@ -100,6 +144,7 @@ class TestScenarioAPIView(BaseAPIViewTransactionTest):
         scenario_task = ScenarioTaskF.create(
             submitted_by=self.superuser
         )
+        scenario_task.add_log('Log of previous execution')
         kwargs = {
             'scenario_uuid': str(scenario_task.uuid)
         }
@@ -113,6 +158,12 @@ class TestScenarioAPIView(BaseAPIViewTransactionTest):
         self.assertEqual(response.data['uuid'], str(scenario_task.uuid))
         self.assertEqual(response.data['task_id'], '1')
         mocked_task.assert_called_once()
+        # logs are cleared on execute, scheduler log is kept
+        logs = scenario_task.get_logs()
+        self.assertFalse(
+            logs.filter(log='Log of previous execution').exists())
+        self.assertTrue(
+            logs.filter(log__startswith='Task is scheduled').exists())
         # invalid user
         mocked_task.reset_mock()
         request = self.factory.get(
@@ -251,6 +302,163 @@ class TestScenarioAPIView(BaseAPIViewTransactionTest):
         self.assertEqual(test_log['log'], 'This is log')
         self.assertEqual(test_log['severity'], 'INFO')
 
+    def test_get_scenario_logs_incremental(self):
+        view = ScenarioAnalysisTaskLogs.as_view()
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            status=TaskStatus.RUNNING
+        )
+        kwargs = {
+            'scenario_uuid': str(scenario_task.uuid)
+        }
+        scenario_task.add_log('Log 1')
+        scenario_task.add_log('Log 2', logging.WARNING)
+        scenario_task.add_log('Log 3', logging.ERROR)
+        first_log = scenario_task.get_logs().order_by('id').first()
+
+        def get_logs(query):
+            request = self.factory.get(
+                reverse('v1:scenario-logs', kwargs=kwargs) + query
+            )
+            request.resolver_match = FakeResolverMatchV1
+            request.user = self.superuser
+            return view(request, **kwargs)
+
+        # after_id cursor
+        response = get_logs(f'?after_id={first_log.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [log['log'] for log in response.data], ['Log 2', 'Log 3'])
+        self.assertGreater(response.data[0]['id'], first_log.id)
+        response = get_logs(f'?after_id={response.data[-1]["id"]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 0)
+        # minimum level
+        response = get_logs('?level=warning')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [log['log'] for log in response.data], ['Log 2', 'Log 3'])
+        # since datetime
+        since = first_log.date_time - datetime.timedelta(seconds=1)
+        response = get_logs(
+            '?' + urlencode({'since': since.isoformat()}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+        # invalid params
+        response = get_logs('?after_id=abc')
+        self.assertEqual(response.status_code, 400)
+        response = get_logs('?since=abc')
+        self.assertEqual(response.status_code, 400)
+        response = get_logs('?level=abc')
+        self.assertEqual(response.status_code, 400)
+
+    def get_stream_content(self, scenario_task, user):
+        view = ScenarioAnalysisTaskStream.as_view()
+        kwargs = {
+            'scenario_uuid': str(scenario_task.uuid)
+        }
+        # EventSource always sends text/event-stream in Accept header
+        request = self.factory.get(
+            reverse('v1:scenario-stream', kwargs=kwargs),
+            HTTP_ACCEPT='text/event-stream'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = user
+        response = view(request, **kwargs)
+        if response.status_code != 200:
+            return response, ''
+        content = b''.join(response.streaming_content).decode()
+        return response, content
+
+    def test_get_scenario_stream(self):
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            status=TaskStatus.RUNNING,
+            progress=10
+        )
+        # invalid
+        response, _ = self.get_stream_content(scenario_task, self.user_1)
+        self.assertEqual(response.status_code, 403)
+        response.render()
+        self.assertIn('detail', json.loads(response.content))
+        # stream is disabled, only returns the snapshot
+        response, content = self.get_stream_content(
+            scenario_task, self.superuser)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('event: status', content)
+        self.assertIn('"progress": 10', content)
+
+    @override_settings(TASK_EVENT_STREAM_ENABLED=True)
+    @mock.patch('cplus_api.utils.task_events.get_redis_client')
+    def test_get_scenario_stream_events(self, mocked_client):
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            status=TaskStatus.RUNNING
+        )
+        pubsub = FakePubSub([
+            {'type': 'progress', 'progress': 50},
+            {'type': 'log', 'severity': 'INFO', 'log': 'This is log'},
+            {'type': 'status', 'status': TaskStatus.COMPLETED},
+            {'type': 'log', 'severity': 'INFO', 'log': 'Not sent'},
+        ])
+        mocked_client.return_value.pubsub.return_value = pubsub
+        response, content = self.get_stream_content(
+            scenario_task, self.superuser)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('event: progress', content)
+        self.assertIn('This is log', content)
+        self.assertNotIn('Not sent', content)
+        self.assertTrue(pubsub.closed)
+        self.assertEqual(len(pubsub.channels), 1)
+
+    @override_settings(TASK_EVENT_STREAM_ENABLED=True)
+    @mock.patch('cplus_api.utils.task_events.get_async_redis_client')
+    def test_async_scenario_event_stream(self, mocked_client):
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            status=TaskStatus.RUNNING
+        )
+        pubsub = AsyncFakePubSub([
+            {'type': 'progress', 'progress': 50},
+            {'type': 'status', 'status': TaskStatus.COMPLETED},
+            {'type': 'log', 'severity': 'INFO', 'log': 'Not sent'},
+        ])
+        client = mock.MagicMock()
+        client.pubsub.return_value = pubsub
+        client.aclose = mock.AsyncMock()
+        mocked_client.return_value = client
+
+        async def read_stream():
+            return [
+                message async for message in
+                async_scenario_event_stream(scenario_task)
+            ]
+
+        content = ''.join(async_to_sync(read_stream)())
+        self.assertIn('event: status', content)
+        self.assertIn('event: progress', content)
+        self.assertNotIn('Not sent', content)
+        self.assertTrue(pubsub.closed)
+        client.aclose.assert_awaited_once()
+        # ASGI request is served by the async stream
+        kwargs = {
+            'scenario_uuid': str(scenario_task.uuid)
+        }
+        request = AsyncRequestFactory().get(
+            reverse('v1:scenario-stream', kwargs=kwargs),
+            headers={'accept': 'text/event-stream'}
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        with mock.patch(
+            'cplus_api.api_views.scenario.async_scenario_event_stream'
+        ) as mocked_stream:
+            response = ScenarioAnalysisTaskStream.as_view()(
+                request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        mocked_stream.assert_called_once()
+
     def test_get_scenario_status(self):
         view = ScenarioAnalysisTaskStatus.as_view()
         scenario_task = ScenarioTaskF.create(
@@ -295,6 +503,17 @@ class TestScenarioAPIView(BaseAPIViewTransactionTest):
         self.assertEqual(response.data['uuid'], str(scenario_task.uuid))
         self.assertEqual(response.data['task_id'], str(scenario_task.task_id))
         self.assertFalse(response.data['scenario_name'])
+        self.assertIn('logs', response.data)
+        # exclude logs
+        request = self.factory.get(
+            reverse('v1:scenario-status', kwargs=kwargs) +
+            '?include_logs=false'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = view(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('logs', response.data)
 
     def test_scenario_history(self):
         view = ScenarioAnalysisHistory.as_view()
@@ -0,0 +1,250 @@
+import os
+import json
+import uuid
+import mock
+import tempfile
+from django.urls import reverse
+from django.test import override_settings
+from core.models.base_task_request import TaskStatus
+from core.settings.utils import absolute_path
+from cplus_api.api_views.scenario import (
+    ScenarioBatchSubmit,
+    ScenarioBatchStatus
+)
+from cplus_api.models.layer import InputLayer
+from cplus_api.models.scenario import ScenarioBatch, ScenarioTask
+from cplus_api.tests.common import (
+    FakeResolverMatchV1,
+    BaseAPIViewTransactionTest,
+    mocked_process
+)
+from cplus_api.tests.factories import InputLayerF, UserF, ScenarioTaskF
+from cplus_api.utils.batch import (
+    set_parameter_value,
+    expand_parameter_grid,
+    download_batch_input_layer,
+    is_batch_active,
+    clear_batch_resources,
+    CLEAR_BATCH_COMMAND
+)
+from cplus_api.utils.celery_event_handlers import clear_batch_directory
+
+
+class TestScenarioBatch(BaseAPIViewTransactionTest):
+
+    def get_scenario_input(self):
+        scenario_path = absolute_path(
+            'cplus_api', 'tests', 'samples', 'scenario_input.json'
+        )
+        with open(scenario_path, 'r') as f:
+            return json.load(f)
+
+    def test_set_parameter_value(self):
+        detail = {
+            'carbon_coefficient': 0.0,
+            'priority_layer_groups': [
+                {'name': 'Biodiversity', 'value': 0},
+                {'name': 'Livelihood', 'value': 0}
+            ]
+        }
+        set_parameter_value(detail, 'carbon_coefficient', 0.5)
+        set_parameter_value(
+            detail, 'priority_layer_groups.Livelihood.value', 5)
+        set_parameter_value(detail, 'priority_layer_groups.0.value', 1)
+        self.assertEqual(detail['carbon_coefficient'], 0.5)
+        self.assertEqual(detail['priority_layer_groups'][0]['value'], 1)
+        self.assertEqual(detail['priority_layer_groups'][1]['value'], 5)
+        with self.assertRaises(ValueError):
+            set_parameter_value(
+                detail, 'priority_layer_groups.Policy.value', 1)
+        # typo in the key does not create a new key
+        with self.assertRaises(ValueError):
+            set_parameter_value(detail, 'carbon_coeficient', 0.5)
+        with self.assertRaises(ValueError):
+            set_parameter_value(
+                detail, 'priority_layer_groups.Livelihood.valeu', 5)
+        self.assertNotIn('carbon_coeficient', detail)
+        self.assertNotIn('valeu', detail['priority_layer_groups'][1])
+
+    def test_expand_parameter_grid(self):
+        detail = self.get_scenario_input()
+        detail['carbon_coefficient'] = 0.1
+        with self.assertRaises(ValueError):
+            expand_parameter_grid(detail, {})
+        with self.assertRaises(ValueError):
+            expand_parameter_grid(detail, {'carbon_coefficient': 1})
+        with self.assertRaises(ValueError):
+            expand_parameter_grid(
+                detail, {'carbon_coefficient': list(range(51))})
+        scenarios = expand_parameter_grid(detail, {
+            'priority_layer_groups.Livelihood.value': [1, 5, 10],
+            'carbon_coefficient': [0.0, 0.5]
+        })
+        self.assertEqual(len(scenarios), 6)
+        parameters, child_detail = scenarios[-1]
+        self.assertEqual(parameters, {
+            'carbon_coefficient': 0.5,
+            'priority_layer_groups.Livelihood.value': 10
+        })
+        self.assertEqual(child_detail['carbon_coefficient'], 0.5)
+        self.assertEqual(
+            child_detail['scenario_name'],
+            f'{detail["scenario_name"]} (6)'
+        )
+        # base detail is not modified
+        self.assertEqual(detail['carbon_coefficient'], 0.1)
+
+    @mock.patch('cplus_api.tasks.runner.'
+                'run_scenario_analysis_task.apply_async')
+    def test_submit_scenario_batch(self, mocked_task):
+        mocked_task.side_effect = mocked_process
+        input_layer = InputLayerF.create(
+            privacy_type=InputLayer.PrivacyTypes.COMMON
+        )
+        self.store_layer_file(input_layer, absolute_path(
+            'cplus_api', 'tests', 'data',
+            'models', 'test_model_1.tif'
+        ))
+        base = self.get_scenario_input()
+        base['activities'][0]['pathways'][0]['layer_uuid'] = (
+            str(input_layer.uuid)
+        )
+        data = {
+            'base': base,
+            'parameters': {
+                'priority_layer_groups.Livelihood.value': [1, 5]
+            }
+        }
+        # invalid parameter path
+        request = self.factory.post(
+            reverse('v1:scenario-batch-submit'), {
+                'base': base,
+                'parameters': {'activities.Unknown.name': ['a']}
+            }, format='json'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.user_1
+        response = ScenarioBatchSubmit.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+        # invalid value in the parameter grid
+        for parameters in [
+            {'carbon_coefficient': [0.5, 'invalid']},
+            {'activities.0.pathways.0.layer_uuid': [
+                str(input_layer.uuid), str(uuid.uuid4())]}
+        ]:
+            request = self.factory.post(
+                reverse('v1:scenario-batch-submit'), {
+                    'base': base,
+                    'parameters': parameters
+                }, format='json'
+            )
+            request.resolver_match = FakeResolverMatchV1
+            request.user = self.user_1
+            response = ScenarioBatchSubmit.as_view()(request)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(f'{base["scenario_name"]} (2)', response.data)
+        self.assertFalse(ScenarioBatch.objects.exists())
+        request = self.factory.post(
+            reverse('v1:scenario-batch-submit'), data, format='json'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.user_1
+        response = ScenarioBatchSubmit.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+        batch = ScenarioBatch.objects.get(uuid=response.data['uuid'])
+        self.assertEqual(len(response.data['scenarios']), 2)
+        scenarios = ScenarioTask.objects.filter(batch=batch).order_by('id')
+        self.assertEqual(scenarios.count(), 2)
+        self.assertEqual(
+            scenarios[1].batch_parameters,
+            {'priority_layer_groups.Livelihood.value': 5}
+        )
+        self.assertTrue(scenarios[0].fingerprint)
+        self.assertNotEqual(
+            scenarios[0].fingerprint, scenarios[1].fingerprint)
+        self.assertEqual(mocked_task.call_count, 2)
+        self.assertTrue(is_batch_active(batch))
+        # fetch batch status
+        kwargs = {
+            'batch_uuid': str(batch.uuid)
+        }
+        request = self.factory.get(
+            reverse('v1:scenario-batch-status', kwargs=kwargs)
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.user_1
+        response = ScenarioBatchStatus.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], {TaskStatus.QUEUED: 2})
+        # other user cannot access the batch
+        request.user = UserF.create()
+        response = ScenarioBatchStatus.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 403)
+
+    def test_download_batch_input_layer(self):
+        input_layer = InputLayerF.create()
+        self.store_layer_file(input_layer, absolute_path(
+            'cplus_api', 'tests', 'data',
+            'models', 'test_model_1.tif'
+        ))
+        batch = ScenarioBatch.objects.create(
+            submitted_on=input_layer.created_on,
+            submitted_by=self.user_1
+        )
+        batch_dir = tempfile.mkdtemp()
+        with mock.patch.object(
+            ScenarioBatch, 'get_resources_path', return_value=batch_dir
+        ):
+            with mock.patch.object(
+                InputLayer, 'download_to_working_directory',
+                autospec=True,
+                side_effect=InputLayer.download_to_working_directory
+            ) as mocked_download:
+                file_path_1 = download_batch_input_layer(
+                    input_layer, batch, tempfile.mkdtemp())
+                file_path_2 = download_batch_input_layer(
+                    input_layer, batch, tempfile.mkdtemp())
+                mocked_download.assert_called_once()
+        self.assertTrue(os.path.exists(file_path_1))
+        self.assertTrue(os.path.exists(file_path_2))
+        self.assertTrue(os.path.samefile(file_path_1, file_path_2))
+
+    @override_settings(SCENARIO_BATCH_BROADCAST_CLEANUP=True)
+    @mock.patch('cplus_api.utils.batch.app')
+    def test_clear_batch_resources(self, mocked_app):
+        batch = ScenarioBatch.objects.create(
+            submitted_on=self.user_1.date_joined,
+            submitted_by=self.user_1
+        )
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.user_1,
+            batch=batch,
+            status=TaskStatus.RUNNING
+        )
+        batch_dir = tempfile.mkdtemp()
+        with mock.patch.object(
+            ScenarioBatch, 'get_resources_path', return_value=batch_dir
+        ):
+            # batch has running scenario
+            clear_batch_resources(batch)
+            mocked_app.control.broadcast.assert_not_called()
+            self.assertTrue(os.path.exists(batch_dir))
+            result = clear_batch_directory(None, str(batch.uuid))
+            self.assertEqual(result, {'ok': 'skipped'})
+            self.assertTrue(os.path.exists(batch_dir))
+            # all scenarios are finished
+            scenario_task.status = TaskStatus.COMPLETED
+            scenario_task.save(update_fields=['status'])
+            clear_batch_resources(batch)
+            self.assertFalse(os.path.exists(batch_dir))
+            mocked_app.control.broadcast.assert_called_once_with(
+                CLEAR_BATCH_COMMAND,
+                arguments={'batch_uuid': str(batch.uuid)}
+            )
+            # other worker host removes its own batch directory
+            os.makedirs(batch_dir)
+            result = clear_batch_directory(None, str(batch.uuid))
+            self.assertEqual(result, {'ok': 'removed'})
+            self.assertFalse(os.path.exists(batch_dir))
+        result = clear_batch_directory(None, str(uuid.uuid4()))
+        self.assertEqual(result, {'ok': 'skipped'})
@@ -0,0 +1,138 @@
+import mock
+import copy
+from django.urls import reverse
+from django.utils import timezone
+from django.core.files.base import ContentFile
+from core.models.base_task_request import TaskStatus
+from cplus_api.api_views.scenario import ExecuteScenarioAnalysis
+from cplus_api.models.layer import OutputLayer
+from cplus_api.tests.common import (
+    FakeResolverMatchV1,
+    BaseAPIViewTransactionTest,
+    mocked_process
+)
+from cplus_api.tests.factories import (
+    ScenarioTaskF,
+    InputLayerF,
+    OutputLayerF
+)
+from cplus_api.utils.scenario_reuse import (
+    get_scenario_fingerprint,
+    find_reusable_scenario,
+    clone_scenario_outputs
+)
+
+
+class TestScenarioReuse(BaseAPIViewTransactionTest):
+
+    def create_completed_scenario(self, detail):
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            detail=detail,
+            status=TaskStatus.COMPLETED,
+            finished_at=timezone.now()
+        )
+        scenario_task.fingerprint = get_scenario_fingerprint(detail)
+        scenario_task.save()
+        output_layer = OutputLayerF.create(
+            owner=self.superuser,
+            scenario=scenario_task,
+            is_final_output=True
+        )
+        output_layer.file.save('output.tif', ContentFile(b'test'))
+        return scenario_task, output_layer
+
+    def test_get_scenario_fingerprint(self):
+        input_layer = InputLayerF.create()
+        detail = copy.deepcopy(ScenarioTaskF.create().detail)
+        detail['snap_layer_uuid'] = str(input_layer.uuid)
+        fingerprint = get_scenario_fingerprint(detail)
+        self.assertEqual(len(fingerprint), 64)
+        # name and description do not change the result
+        detail['scenario_name'] = 'Other scenario'
+        detail['scenario_desc'] = 'Other description'
+        self.assertEqual(get_scenario_fingerprint(detail), fingerprint)
+        # code version and updated input layer change the result
+        self.assertNotEqual(
+            get_scenario_fingerprint(detail, code_version='0.0.0-x'),
+            fingerprint
+        )
+        input_layer.modified_on = timezone.now()
+        input_layer.save(update_fields=['modified_on'])
+        self.assertNotEqual(get_scenario_fingerprint(detail), fingerprint)
+
+    def test_clone_scenario_outputs(self):
+        detail = copy.deepcopy(ScenarioTaskF.create().detail)
+        source, output_layer = self.create_completed_scenario(detail)
+        target = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            detail=detail,
+            fingerprint=source.fingerprint
+        )
+        # scenario from other user is not reused
+        other_task = ScenarioTaskF.create(
+            submitted_by=self.user_1,
+            detail=detail,
+            fingerprint=source.fingerprint
+        )
+        self.assertIsNone(find_reusable_scenario(other_task))
+        self.assertEqual(find_reusable_scenario(target), source)
+        self.assertEqual(clone_scenario_outputs(source, target), 1)
+        target.refresh_from_db()
+        self.assertEqual(target.status, TaskStatus.COMPLETED)
+        cloned_layer = OutputLayer.objects.get(scenario=target)
+        self.assertEqual(cloned_layer.file.name, output_layer.file.name)
+        self.assertTrue(cloned_layer.is_final_output)
+        # shared file is kept until the last reference is deleted
+        storage = output_layer.file.storage
+        file_name = output_layer.file.name
+        output_layer.delete()
+        self.assertTrue(storage.exists(file_name))
+        cloned_layer.delete()
+        self.assertFalse(storage.exists(file_name))
+
+    @mock.patch('cplus_api.tasks.runner.'
+                'run_scenario_analysis_task.apply_async')
+    def test_execute_reuse_scenario(self, mocked_task):
+        mocked_task.side_effect = mocked_process
+        detail = copy.deepcopy(ScenarioTaskF.create().detail)
+        source, _ = self.create_completed_scenario(detail)
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            detail=detail
+        )
+        kwargs = {
+            'scenario_uuid': str(scenario_task.uuid)
+        }
+        request = self.factory.get(
+            reverse('v1:scenario-execute', kwargs=kwargs)
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = ExecuteScenarioAnalysis.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['reused_from'], str(source.uuid))
+        self.assertIsNone(response.data['task_id'])
+        mocked_task.assert_not_called()
+        scenario_task.refresh_from_db()
+        self.assertEqual(scenario_task.status, TaskStatus.COMPLETED)
+        self.assertEqual(scenario_task.fingerprint, source.fingerprint)
+        self.assertEqual(
+            OutputLayer.objects.filter(scenario=scenario_task).count(), 1)
+        # force to run the analysis
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            detail=detail
+        )
+        kwargs = {
+            'scenario_uuid': str(scenario_task.uuid)
+        }
+        request = self.factory.get(
+            reverse('v1:scenario-execute', kwargs=kwargs) + '?force=true'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = ExecuteScenarioAnalysis.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.data['reused_from'])
+        mocked_task.assert_called_once()
@@ -0,0 +1,142 @@
+import mock
+from django.urls import reverse
+from core.models.base_task_request import TaskStatus
+from core.models.preferences import SitePreferences
+from cplus_api.api_views.scenario import (
+    ExecuteScenarioAnalysis,
+    CancelScenarioAnalysisTask,
+    ScenarioAnalysisTaskStatus
+)
+from cplus_api.models.profile import UserProfile, UserRoleType
+from cplus_api.tests.common import (
+    FakeResolverMatchV1,
+    BaseAPIViewTransactionTest,
+    mocked_process
+)
+from cplus_api.tests.factories import ScenarioTaskF
+from cplus_api.utils.scheduler import (
+    DEFAULT_QUEUE,
+    FAST_QUEUE,
+    get_extent_area_km2,
+    schedule_scenario_task,
+    dispatch_scenario_tasks,
+    get_queue_position
+)
+
+
+class TestScheduler(BaseAPIViewTransactionTest):
+
+    def setUp(self):
+        super().setUp()
+        preferences = SitePreferences.preferences()
+        preferences.scheduler_config = {
+            'max_running_per_user': 1,
+            'role_priority': {'Internal': 10, 'External': 0},
+            'fast_lane_max_area_km2': 2500,
+            'queue_capacity': {DEFAULT_QUEUE: 2, FAST_QUEUE: 2}
+        }
+        preferences.save()
+
+    def test_get_extent_area_km2(self):
+        self.assertIsNone(get_extent_area_km2({}))
+        self.assertIsNone(get_extent_area_km2({'extent': ['a', 1, 2, 3]}))
+        # projected extent in metres
+        self.assertAlmostEqual(
+            get_extent_area_km2({'extent': [0, 10000, 0, 20000]}), 200)
+        # geographic extent in degrees at equator
+        area = get_extent_area_km2({
+            'extent': [0, 1, -0.5, 0.5],
+            'analysis_crs': 'EPSG:4326'
+        })
+        self.assertAlmostEqual(area, 111.32 * 110.57, delta=1)
+
+    @mock.patch('cplus_api.tasks.runner.'
+                'run_scenario_analysis_task.apply_async')
+    def test_dispatch_per_user_cap_and_priority(self, mocked_task):
+        mocked_task.side_effect = mocked_process
+        internal_role, _ = UserRoleType.objects.get_or_create(
+            name='Internal')
+        UserProfile.objects.filter(user=self.user_1).update(
+            role=internal_role)
+        task_1 = ScenarioTaskF.create(submitted_by=self.superuser)
+        task_2 = ScenarioTaskF.create(submitted_by=self.superuser)
+        task_3 = ScenarioTaskF.create(submitted_by=self.user_1)
+        for scenario_task in [task_1, task_2, task_3]:
+            schedule_scenario_task(scenario_task)
+        task_3.refresh_from_db()
+        self.assertEqual(task_3.priority, 10)
+        self.assertEqual(task_3.queue, FAST_QUEUE)
+        self.assertEqual(get_queue_position(task_3), 1)
+        task_2.refresh_from_db()
+        self.assertEqual(get_queue_position(task_2), 3)
+        dispatched = dispatch_scenario_tasks()
+        # second task of superuser waits because of the user cap
+        self.assertEqual(
+            [task.id for task in dispatched], [task_3.id, task_1.id])
+        mocked_task.assert_any_call((task_3.id,), queue=FAST_QUEUE)
+        task_1.refresh_from_db()
+        self.assertEqual(task_1.status, TaskStatus.QUEUED)
+        self.assertIsNone(get_queue_position(task_1))
+        task_2.refresh_from_db()
+        self.assertEqual(task_2.status, TaskStatus.PENDING)
+        self.assertEqual(get_queue_position(task_2), 1)
+        # slot is released
+        task_1.task_on_completed()
+        dispatched = dispatch_scenario_tasks()
+        self.assertEqual([task.id for task in dispatched], [task_2.id])
+        self.assertFalse(dispatch_scenario_tasks())
+
+    @mock.patch('cplus_api.tasks.runner.'
+                'run_scenario_analysis_task.apply_async')
+    def test_execute_waiting_scenario(self, mocked_task):
+        mocked_task.side_effect = mocked_process
+        ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            status=TaskStatus.RUNNING,
+            queue=FAST_QUEUE
+        )
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser
+        )
+        kwargs = {
+            'scenario_uuid': str(scenario_task.uuid)
+        }
+        request = self.factory.get(
+            reverse('v1:scenario-execute', kwargs=kwargs)
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = ExecuteScenarioAnalysis.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.data['task_id'])
+        self.assertEqual(response.data['queue_position'], 1)
+        mocked_task.assert_not_called()
+        # status shows queue position
+        request = self.factory.get(
+            reverse('v1:scenario-status', kwargs=kwargs)
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = ScenarioAnalysisTaskStatus.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['queue_position'], 1)
+        # cannot execute waiting task
+        request = self.factory.get(
+            reverse('v1:scenario-execute', kwargs=kwargs)
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = ExecuteScenarioAnalysis.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 400)
+        # cancel waiting task
+        request = self.factory.get(
+            reverse('v1:scenario-cancel', kwargs=kwargs)
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = CancelScenarioAnalysisTask.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        scenario_task.refresh_from_db()
+        self.assertEqual(scenario_task.status, TaskStatus.CANCELLED)
+        self.assertIsNone(scenario_task.scheduled_on)
+        self.assertFalse(dispatch_scenario_tasks())
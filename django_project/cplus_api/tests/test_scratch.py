@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import mock
+from django.test import override_settings
+from core.models.base_task_request import TaskStatus
+from cplus_api.tests.common import BaseAPIViewTransactionTest
+from cplus_api.models.scenario import ScenarioBatch
+from cplus_api.tests.factories import ScenarioTaskF
+from cplus_api.utils.scratch import (
+    SCRATCH_LEDGER_FILE,
+    ScratchQuotaExceeded,
+    get_scratch_usage,
+    reserve_scratch,
+    release_scratch,
+    reconcile_scratch,
+    reap_scratch_directories
+)
+
+GB = 1024 ** 3
+
+
+class TestScratch(BaseAPIViewTransactionTest):
+
+    def setUp(self):
+        super().setUp()
+        self.scratch_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            SCRATCH_DIR=self.scratch_dir,
+            SCRATCH_QUOTA_GB=10,
+            SCRATCH_RESERVE_FACTOR=1
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        super().tearDown()
+
+    def read_ledger(self):
+        with open(os.path.join(self.scratch_dir, SCRATCH_LEDGER_FILE)) as f:
+            return json.load(f)
+
+    def test_get_scratch_usage(self):
+        scenario_task = ScenarioTaskF.create()
+        path = scenario_task.get_resources_path()
+        self.assertTrue(path.startswith(self.scratch_dir))
+        self.assertEqual(get_scratch_usage(path), 0)
+        os.makedirs(os.path.join(path, 'ncs_pathways'))
+        with open(os.path.join(path, 'ncs_pathways', 'a.tif'), 'wb') as f:
+            f.write(b'0' * 100)
+        self.assertEqual(get_scratch_usage(path), 100)
+
+    def test_reserve_scratch(self):
+        scenario_task_1 = ScenarioTaskF.create(
+            cost_estimate={'disk_bytes': 6 * GB}
+        )
+        scenario_task_2 = ScenarioTaskF.create(
+            cost_estimate={'disk_bytes': 6 * GB}
+        )
+        with mock.patch('cplus_api.utils.scratch.shutil.disk_usage') as \
+                mocked_usage:
+            mocked_usage.return_value = mock.Mock(free=100 * GB)
+            self.assertEqual(reserve_scratch(scenario_task_1), 6 * GB)
+            # quota is exceeded
+            with self.assertRaises(ScratchQuotaExceeded):
+                reserve_scratch(scenario_task_2)
+            # unused reservation is deducted from free space
+            mocked_usage.return_value = mock.Mock(free=10 * GB)
+            with override_settings(SCRATCH_QUOTA_GB=0):
+                with self.assertRaises(ScratchQuotaExceeded):
+                    reserve_scratch(scenario_task_2)
+            release_scratch(scenario_task_1)
+            self.assertEqual(reserve_scratch(scenario_task_2), 6 * GB)
+        ledger = self.read_ledger()
+        self.assertNotIn(str(scenario_task_1.uuid), ledger)
+        self.assertEqual(ledger[str(scenario_task_2.uuid)]['pid'], os.getpid())
+
+    def test_reserve_scratch_removes_dead_reservations(self):
+        killed_task = ScenarioTaskF.create(status=TaskStatus.RUNNING)
+        scenario_task = ScenarioTaskF.create(status=TaskStatus.RUNNING)
+        reserve_scratch(killed_task)
+        os.makedirs(killed_task.get_resources_path())
+        ledger_path = os.path.join(self.scratch_dir, SCRATCH_LEDGER_FILE)
+        ledger = self.read_ledger()
+        ledger[str(killed_task.uuid)]['pid'] = 99
+        with open(ledger_path, 'w') as f:
+            json.dump(ledger, f)
+        with mock.patch(
+            'cplus_api.utils.scratch.is_process_alive',
+            side_effect=lambda pid: pid != 99
+        ):
+            reserve_scratch(scenario_task)
+        self.assertFalse(os.path.exists(killed_task.get_resources_path()))
+        self.assertEqual(list(self.read_ledger().keys()),
+                         [str(scenario_task.uuid)])
+
+    def test_reconcile_scratch(self):
+        running_task = ScenarioTaskF.create(status=TaskStatus.RUNNING)
+        killed_task = ScenarioTaskF.create(status=TaskStatus.RUNNING)
+        stopped_task = ScenarioTaskF.create(status=TaskStatus.STOPPED)
+        for scenario_task in [running_task, killed_task, stopped_task]:
+            os.makedirs(scenario_task.get_resources_path())
+        reserve_scratch(running_task)
+        reserve_scratch(killed_task)
+        with mock.patch(
+            'cplus_api.utils.scratch.is_process_alive',
+            side_effect=lambda pid: pid != 99
+        ):
+            ledger_path = os.path.join(self.scratch_dir, SCRATCH_LEDGER_FILE)
+            ledger = self.read_ledger()
+            ledger[str(killed_task.uuid)]['pid'] = 99
+            with open(ledger_path, 'w') as f:
+                json.dump(ledger, f)
+            released, removed = reconcile_scratch()
+        self.assertEqual(released, [str(killed_task.uuid)])
+        self.assertEqual(len(removed), 2)
+        self.assertTrue(os.path.exists(running_task.get_resources_path()))
+        self.assertFalse(os.path.exists(killed_task.get_resources_path()))
+        self.assertFalse(os.path.exists(stopped_task.get_resources_path()))
+        self.assertEqual(list(self.read_ledger().keys()),
+                         [str(running_task.uuid)])
+
+    def test_reap_scratch_directories(self):
+        running_task = ScenarioTaskF.create(status=TaskStatus.RUNNING)
+        completed_task = ScenarioTaskF.create(status=TaskStatus.COMPLETED)
+        recent_task = ScenarioTaskF.create(status=TaskStatus.CANCELLED)
+        batch = ScenarioBatch.objects.create(
+            submitted_on=running_task.submitted_on,
+            submitted_by=running_task.submitted_by
+        )
+        ScenarioTaskF.create(status=TaskStatus.QUEUED, batch=batch)
+        unknown_dir = os.path.join(
+            self.scratch_dir, str(running_task.submitted_by.id),
+            '2b7a3d5e-4c6f-4c1e-9f0a-1d2e3f4a5b6c'
+        )
+        old_dirs = [
+            running_task.get_resources_path(),
+            completed_task.get_resources_path(),
+            batch.get_resources_path(),
+            unknown_dir
+        ]
+        for path in old_dirs + [recent_task.get_resources_path()]:
+            os.makedirs(path)
+            with open(os.path.join(path, 'output.tif'), 'wb') as f:
+                f.write(b'0' * 10)
+        old_time = time.time() - 7 * 3600
+        for path in old_dirs:
+            os.utime(path, (old_time, old_time))
+        with override_settings(SCRATCH_REAPER_GRACE_SECONDS=6 * 3600):
+            total, reclaimed = reap_scratch_directories()
+        self.assertEqual(total, 2)
+        self.assertEqual(reclaimed, 20)
+        self.assertTrue(os.path.exists(running_task.get_resources_path()))
+        self.assertTrue(os.path.exists(batch.get_resources_path()))
+        self.assertTrue(os.path.exists(recent_task.get_resources_path()))
+        self.assertFalse(
+            os.path.exists(completed_task.get_resources_path()))
+        self.assertFalse(os.path.exists(unknown_dir))
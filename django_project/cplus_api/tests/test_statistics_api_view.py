@@ -1,6 +1,14 @@
 import json
 from unittest import mock
 
+import numpy as np
+import rasterio
+from rasterio.features import geometry_mask
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+
+from django.contrib.gis.geos import Polygon
+from django.core.files.base import ContentFile
 from django.urls import reverse
 from django.utils import timezone
 
@@ -12,11 +20,26 @@ from cplus_api.models.statistics import ZonalStatisticsTask
 from cplus_api.serializers.statistics import (
     ZonalStatisticsRequestSerializer,
 )
-from cplus_api.tasks.zonal_statistics import calculate_zonal_statistics
+from cplus_api.tasks.zonal_statistics import (
+    calculate_zonal_statistics,
+    plan_zonal_statistics,
+)
 from cplus_api.tests.common import (
     BaseAPIViewTransactionTest,
 )
 from cplus_api.tests.factories import InputLayerF
+from cplus_api.utils import zonal_statistics
+from cplus_api.utils.zonal_statistics import (
+    calculate_raster_statistics,
+    calculate_statistics,
+    clear_mask_cache,
+    get_bbox_window,
+    get_block_windows,
+    get_projected_geometry,
+    parse_geojson_geometry,
+    parse_statistics,
+    StatisticsAccumulator,
+)
 
 
 class TestZonalStatisticsAPI(BaseAPIViewTransactionTest):
@@ -161,3 +184,380 @@ class TestZonalStatisticsAPI(BaseAPIViewTransactionTest):
             task.stack_trace_errors is not None and
             str(task.stack_trace_errors) != ""
         )
+
+    def test_zonal_statistics_skips_layer_outside_bbox(self):
+        """Layer with footprint outside bbox is not downloaded."""
+        bbox = self._sample_bbox_list()
+        outside_layer = InputLayerF.create(
+            privacy_type=InputLayer.PrivacyTypes.COMMON,
+            source=InputLayer.LayerSources.NATURE_BASE,
+            footprint=Polygon.from_bbox((100, 10, 110, 20)),
+        )
+        self.store_layer_file(
+            outside_layer,
+            absolute_path(
+                "cplus_api", "tests", "data", "models", "test_model_1.tif"
+            ),
+        )
+        small_layer = InputLayerF.create(
+            privacy_type=InputLayer.PrivacyTypes.COMMON,
+            source=InputLayer.LayerSources.NATURE_BASE,
+            footprint=Polygon.from_bbox((30, -5, 40, 5)),
+            size=1,
+        )
+        self.nature_base_layer.size = 100
+        self.nature_base_layer.save(update_fields=["size"])
+        skipped, planned = plan_zonal_statistics(
+            InputLayer.objects.filter(
+                source=InputLayer.LayerSources.NATURE_BASE
+            ),
+            {
+                "minx": bbox[0],
+                "miny": bbox[1],
+                "maxx": bbox[2],
+                "maxy": bbox[3],
+            },
+        )
+        self.assertEqual(skipped, [outside_layer])
+        self.assertEqual(planned, [small_layer, self.nature_base_layer])
+
+        task = ZonalStatisticsTask.objects.create(
+            bbox_minx=bbox[0],
+            bbox_miny=bbox[1],
+            bbox_maxx=bbox[2],
+            bbox_maxy=bbox[3],
+            submitted_by=self.superuser,
+            submitted_on=timezone.now(),
+        )
+        with mock.patch.object(
+            InputLayer,
+            "download_to_working_directory",
+            autospec=True,
+            return_value=None,
+        ) as mock_download:
+            calculate_zonal_statistics(task.id)
+        downloaded = [
+            call.args[0] for call in mock_download.call_args_list
+        ]
+        self.assertNotIn(outside_layer, downloaded)
+        task.refresh_from_db()
+        results = {item["uuid"]: item for item in task.result}
+        self.assertIsNone(results[str(outside_layer.uuid)]["mean_value"])
+        self.assertEqual(len(results), 3)
+
+    def test_parse_statistics(self):
+        self.assertEqual(parse_statistics(None), ["mean"])
+        self.assertEqual(
+            parse_statistics("Max, p90,histogram,max"),
+            ["max", "p90", "histogram"]
+        )
+        with self.assertRaises(ValueError):
+            parse_statistics("mean,p100")
+
+    def test_calculate_statistics(self):
+        values = np.array([1, 2, 3, 4], dtype="float64")
+        result = calculate_statistics(
+            values,
+            ["mean", "min", "max", "sum", "count", "std", "p50",
+             "histogram"],
+            bins=2
+        )
+        self.assertEqual(result["mean"], 2.5)
+        self.assertEqual(result["min"], 1)
+        self.assertEqual(result["max"], 4)
+        self.assertEqual(result["sum"], 10)
+        self.assertEqual(result["count"], 4)
+        self.assertAlmostEqual(result["std"], float(values.std()))
+        self.assertEqual(result["p50"], 2.5)
+        self.assertEqual(result["histogram"], {
+            "edges": [1.0, 2.5, 4.0],
+            "counts": [2, 2]
+        })
+        result = calculate_statistics(
+            np.array([]), ["mean", "count", "histogram"])
+        self.assertEqual(
+            result, {"mean": None, "count": 0, "histogram": None})
+
+    def test_statistics_accumulator(self):
+        values = np.array([3, 1, 8, 2, 7, 5, 4], dtype="float64")
+        statistics = [
+            "mean", "min", "max", "sum", "count", "std", "median", "p90",
+            "histogram"
+        ]
+        accumulator = StatisticsAccumulator(statistics, bins=3)
+        blocks = [values[:2], values[2:2], values[2:5], values[5:]]
+        for block in blocks:
+            accumulator.add(block)
+        result = accumulator.get_result()
+        expected = calculate_statistics(values, statistics, bins=3)
+        for stat in ["count", "min", "max", "median", "p90", "histogram"]:
+            self.assertEqual(result[stat], expected[stat])
+        for stat in ["mean", "sum", "std"]:
+            self.assertAlmostEqual(result[stat], expected[stat])
+        self.assertAlmostEqual(result["std"], float(values.std()))
+        # values are not kept without median, percentile or histogram
+        accumulator = StatisticsAccumulator(["mean", "std"])
+        for block in blocks:
+            accumulator.add(block)
+        self.assertEqual(accumulator.values, [])
+
+    def test_get_block_windows(self):
+        dataset = mock.Mock(block_shapes=[(256, 256)])
+        windows = list(
+            get_block_windows(dataset, Window(200, 100, 400, 200)))
+        self.assertEqual(windows, [
+            Window(200, 100, 56, 156),
+            Window(256, 100, 256, 156),
+            Window(512, 100, 88, 156),
+            Window(200, 256, 56, 44),
+            Window(256, 256, 256, 44),
+            Window(512, 256, 88, 44),
+        ])
+
+    def test_calculate_raster_statistics(self):
+        file_path = absolute_path(
+            "cplus_api", "tests", "data", "models", "test_model_1.tif"
+        )
+        with rasterio.open(file_path) as dataset:
+            bbox = transform_bounds(
+                dataset.crs, "EPSG:4326", *dataset.bounds
+            )
+            values = dataset.read(1, masked=True).compressed()
+        with mock.patch.object(
+            zonal_statistics, "iter_bbox_values",
+            wraps=zonal_statistics.iter_bbox_values
+        ) as mocked_iter:
+            result = calculate_raster_statistics(
+                file_path, bbox, ["mean", "max", "count", "histogram"],
+                bins=5
+            )
+        # blocks of the layer are read once
+        mocked_iter.assert_called_once()
+        self.assertAlmostEqual(result["mean"], float(values.mean()))
+        self.assertAlmostEqual(result["max"], float(values.max()))
+        self.assertEqual(result["count"], values.size)
+        self.assertEqual(len(result["histogram"]["counts"]), 5)
+        self.assertEqual(sum(result["histogram"]["counts"]), values.size)
+        counts, edges = np.histogram(values.astype("float64"), bins=5)
+        self.assertEqual(result["histogram"], {
+            "edges": edges.tolist(),
+            "counts": counts.tolist()
+        })
+
+    def test_zonal_statistics_multiple_statistics(self):
+        url = reverse("v1:zonal-statistics")
+        api_client = APIClient()
+        api_client.force_authenticate(user=self.superuser)
+        params = {
+            "bbox": self._sample_bbox_string(),
+            "statistics": "p101",
+        }
+        resp = self._get(url, params, client=api_client)
+        self.assertEqual(resp.status_code, 400)
+        params["statistics"] = "max,p90,histogram"
+        params["bins"] = 4
+        with mock.patch(
+            "cplus_api.tasks.zonal_statistics.calculate_zonal_statistics."
+            "delay"
+        ) as mock_delay:
+            mock_delay.return_value = mock.Mock(id="celery-task-id")
+            resp = self._get(url, params, client=api_client)
+        self.assertEqual(resp.status_code, 202)
+        task = ZonalStatisticsTask.objects.get(uuid=resp.json()["task_uuid"])
+        self.assertEqual(task.statistics, ["max", "p90", "histogram"])
+        self.assertEqual(task.histogram_bins, 4)
+
+        with mock.patch(
+            "cplus_api.tasks.zonal_statistics.calculate_raster_statistics",
+            return_value={
+                "mean": 1.5,
+                "max": 2.0,
+                "p90": 1.9,
+                "histogram": {"edges": [1, 2], "counts": [3]},
+            },
+        ):
+            calculate_zonal_statistics(task.id)
+        task.refresh_from_db()
+        self.assertEqual(len(task.result), 1)
+        self.assertEqual(task.result[0]["mean_value"], 1.5)
+        self.assertEqual(task.result[0]["statistics"]["p90"], 1.9)
+        self.assertIn("histogram", task.result[0]["statistics"])
+
+    def _sample_geojson(self):
+        bbox = self._sample_bbox_list()
+        return {
+            "type": "Polygon",
+            "coordinates": [[
+                [bbox[0], bbox[1]],
+                [bbox[2], bbox[1]],
+                [bbox[0], bbox[3]],
+                [bbox[0], bbox[1]],
+            ]],
+        }
+
+    def test_parse_geojson_geometry(self):
+        geojson = self._sample_geojson()
+        geometry = parse_geojson_geometry({
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "geometry": geojson, "properties": {}}
+            ],
+        })
+        self.assertEqual(geometry.geom_type, "MultiPolygon")
+        self.assertEqual(geometry.srid, 4326)
+        self.assertEqual(len(geometry), 1)
+        with self.assertRaises(ValueError):
+            parse_geojson_geometry({"type": "Point", "coordinates": [1, 2]})
+        with self.assertRaises(ValueError):
+            parse_geojson_geometry("invalid")
+
+    def test_calculate_raster_statistics_with_geometry(self):
+        file_path = absolute_path(
+            "cplus_api", "tests", "data", "models", "test_model_1.tif"
+        )
+        with rasterio.open(file_path) as dataset:
+            bbox = transform_bounds(
+                dataset.crs, "EPSG:4326", *dataset.bounds
+            )
+        # triangle covering half of the raster
+        geometry = parse_geojson_geometry({
+            "type": "Polygon",
+            "coordinates": [[
+                [bbox[0], bbox[1]],
+                [bbox[2], bbox[1]],
+                [bbox[0], bbox[3]],
+                [bbox[0], bbox[1]],
+            ]],
+        })
+        with rasterio.open(file_path) as dataset:
+            window = get_bbox_window(dataset, bbox)
+            total_blocks = len(list(get_block_windows(dataset, window)))
+            # mask of the whole window to compare with the block masks
+            window_mask = geometry_mask(
+                [get_projected_geometry(geometry, dataset.crs)],
+                out_shape=(window.height, window.width),
+                transform=dataset.window_transform(window),
+                invert=True
+            )
+            data = dataset.read(1, window=window, masked=True)
+            expected_count = int(
+                (window_mask & ~np.ma.getmaskarray(data)).sum())
+        clear_mask_cache()
+        full = calculate_raster_statistics(file_path, bbox, ["count"])
+        with mock.patch.object(
+            zonal_statistics,
+            "geometry_mask",
+            wraps=zonal_statistics.geometry_mask,
+        ) as mock_mask:
+            result = calculate_raster_statistics(
+                file_path, bbox, ["count"], geometry=geometry
+            )
+            # geometry is rasterized once for each block
+            self.assertEqual(mock_mask.call_count, total_blocks)
+            # mask of the same geometry and grid is reused
+            cached = calculate_raster_statistics(
+                file_path, bbox, ["count"], geometry=geometry
+            )
+            self.assertEqual(mock_mask.call_count, total_blocks)
+        self.assertGreater(result["count"], 0)
+        self.assertLess(result["count"], full["count"])
+        self.assertEqual(result["count"], expected_count)
+        self.assertEqual(result, cached)
+        # least recently used masks are removed from the cache
+        with mock.patch.object(zonal_statistics, "MASK_CACHE_MAX_BYTES", 1):
+            clear_mask_cache()
+            calculate_raster_statistics(
+                file_path, bbox, ["count"], geometry=geometry
+            )
+            self.assertEqual(len(zonal_statistics._mask_cache), 0)
+        clear_mask_cache()
+
+    def test_zonal_statistics_polygon(self):
+        url = reverse("v1:zonal-statistics")
+        api_client = APIClient()
+        api_client.force_authenticate(user=self.superuser)
+        resp = api_client.post(url, data={}, format="json")
+        self.assertEqual(resp.status_code, 400)
+        geojson = self._sample_geojson()
+        with mock.patch(
+            "cplus_api.tasks.zonal_statistics.calculate_zonal_statistics."
+            "delay"
+        ) as mock_delay:
+            mock_delay.return_value = mock.Mock(id="celery-task-id")
+            resp = api_client.post(url, data={
+                "geometry": geojson,
+                "statistics": ["mean", "count"],
+            }, format="json")
+        self.assertEqual(resp.status_code, 202)
+        task = ZonalStatisticsTask.objects.get(uuid=resp.json()["task_uuid"])
+        bbox = self._sample_bbox_list()
+        self.assertEqual(task.geometry.geom_type, "MultiPolygon")
+        self.assertAlmostEqual(task.bbox_minx, bbox[0])
+        self.assertAlmostEqual(task.bbox_maxy, bbox[3])
+        self.assertEqual(task.statistics, ["mean", "count"])
+
+        with mock.patch(
+            "cplus_api.tasks.zonal_statistics.calculate_raster_statistics",
+            return_value={"mean": 1.5, "count": 10},
+        ) as mock_stats:
+            calculate_zonal_statistics(task.id)
+        self.assertEqual(
+            mock_stats.call_args.kwargs["geometry"], task.geometry
+        )
+        task.refresh_from_db()
+        self.assertEqual(task.result[0]["statistics"], {"count": 10})
+
+    def test_zonal_statistics_polygon_layer(self):
+        geojson = self._sample_geojson()
+        boundary_layer = InputLayerF.create(
+            name="boundary.geojson",
+            owner=self.superuser,
+            footprint=Polygon.from_bbox(self._sample_bbox_list()),
+        )
+        boundary_layer.file.save(
+            boundary_layer.name,
+            ContentFile(json.dumps({
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "geometry": geojson,
+                        "properties": {},
+                    }
+                ],
+            }).encode()),
+            save=True,
+        )
+        url = reverse("v1:zonal-statistics")
+        api_client = APIClient()
+        api_client.force_authenticate(user=self.superuser)
+        resp = api_client.post(url, data={
+            "layer_uuid": str(self.nature_base_layer.uuid),
+        }, format="json")
+        self.assertEqual(resp.status_code, 400)
+        with mock.patch(
+            "cplus_api.tasks.zonal_statistics.calculate_zonal_statistics."
+            "delay"
+        ) as mock_delay:
+            mock_delay.return_value = mock.Mock(id="celery-task-id")
+            resp = api_client.post(url, data={
+                "layer_uuid": str(boundary_layer.uuid),
+            }, format="json")
+        self.assertEqual(resp.status_code, 202)
+        task = ZonalStatisticsTask.objects.get(uuid=resp.json()["task_uuid"])
+        self.assertEqual(task.geometry_layer, boundary_layer)
+        self.assertIsNone(task.geometry)
+        boundary_layer.refresh_from_db()
+        self.assertIsNotNone(boundary_layer.last_used_on)
+
+        with mock.patch(
+            "cplus_api.tasks.zonal_statistics.calculate_raster_statistics",
+            return_value={"mean": 1.5},
+        ):
+            calculate_zonal_statistics(task.id)
+        task.refresh_from_db()
+        self.assertIsNotNone(task.geometry)
+        self.assertTrue(
+            task.geometry.equals(parse_geojson_geometry(geojson))
+        )
+        self.assertEqual(task.result[0]["mean_value"], 1.5)
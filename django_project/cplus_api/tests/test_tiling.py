@@ -0,0 +1,220 @@
+import mock
+from django.urls import reverse
+from core.models.base_task_request import TaskStatus
+from core.models.preferences import (
+    SitePreferences,
+    default_scheduler_config
+)
+from cplus_api.api_views.scenario import ExecuteScenarioAnalysis
+from cplus_api.models.layer import OutputLayer
+from cplus_api.models.scenario import ScenarioTask
+from cplus_api.tasks.mosaic import get_tile_output_key
+from cplus_api.tests.common import (
+    FakeResolverMatchV1,
+    BaseAPIViewTransactionTest,
+    mocked_process
+)
+from cplus_api.tests.factories import ScenarioTaskF
+from cplus_api.utils.estimator import (
+    estimate_scenario_cost,
+    validate_scenario_cost
+)
+from cplus_api.utils.scheduler import dispatch_scenario_tasks
+from cplus_api.utils.tiling import (
+    TILED_MODE_AUTO,
+    TILED_MODE_ON,
+    TILED_MODE_OFF,
+    plan_scenario_tiles,
+    get_execution_tiles,
+    validate_scenario_admission,
+    create_scenario_tiles,
+    cancel_scenario_tiles
+)
+
+
+class TestTiling(BaseAPIViewTransactionTest):
+
+    def setUp(self):
+        super().setUp()
+        self.config = default_scheduler_config()
+        self.config['tile_size_pixels'] = 100
+        self.config['tile_overlap_pixels'] = 2
+        self.detail = {
+            'extent': [0, 5000, 0, 2500],
+            'analysis_crs': 'EPSG:32735',
+            'sieve_enabled': False
+        }
+        self.cost_estimate = {
+            'resolution_m': [30, 30],
+            'pixels': 13888
+        }
+
+    def test_plan_scenario_tiles(self):
+        tiles = plan_scenario_tiles(
+            self.detail, self.cost_estimate, self.config)
+        # 3000m tile size
+        self.assertEqual(len(tiles), 2)
+        self.assertEqual(tiles[0]['core_extent'], [0, 2520, 0, 2500])
+        self.assertEqual(tiles[1]['core_extent'], [2520, 5000, 0, 2500])
+        self.assertEqual(tiles[0]['extent'], tiles[0]['core_extent'])
+        # overlap when sieve is enabled
+        self.detail['sieve_enabled'] = True
+        tiles = plan_scenario_tiles(
+            self.detail, self.cost_estimate, self.config)
+        self.assertEqual(tiles[0]['extent'], [0, 2580, 0, 2500])
+        self.assertEqual(tiles[1]['extent'], [2460, 5000, 0, 2500])
+        # limited by max tiles
+        self.config['tile_size_pixels'] = 10
+        self.config['max_tiles'] = 4
+        tiles = plan_scenario_tiles(
+            self.detail, self.cost_estimate, self.config)
+        self.assertEqual(len(tiles), 4)
+        self.assertEqual(plan_scenario_tiles(
+            {'extent': []}, self.cost_estimate, self.config), [])
+
+    def test_get_execution_tiles(self):
+        scenario_task = ScenarioTaskF.create(
+            detail=self.detail,
+            cost_estimate=self.cost_estimate
+        )
+        self.assertFalse(get_execution_tiles(
+            scenario_task, self.config, TILED_MODE_OFF))
+        self.assertFalse(get_execution_tiles(
+            scenario_task, self.config, TILED_MODE_AUTO))
+        self.assertEqual(len(get_execution_tiles(
+            scenario_task, self.config, TILED_MODE_ON)), 2)
+        self.config['tiling_min_pixels'] = 1000
+        self.assertEqual(len(get_execution_tiles(
+            scenario_task, self.config, TILED_MODE_AUTO)), 2)
+
+    @mock.patch('cplus_api.tasks.runner.'
+                'run_scenario_analysis_task.apply_async')
+    def test_over_limit_scenario(self, mocked_task):
+        mocked_task.side_effect = mocked_process
+        cost_estimate = estimate_scenario_cost(self.detail)
+        # scenario exceeds memory limit, but each tile fits
+        gb = 1024 ** 3
+        self.config['max_estimated_disk_gb'] = None
+        self.config['max_estimated_ram_gb'] = (
+            0.75 * cost_estimate['ram_bytes'] / gb
+        )
+        self.assertTrue(validate_scenario_cost(cost_estimate, self.config))
+        self.assertFalse(validate_scenario_admission(
+            self.detail, cost_estimate, self.config))
+        # tile size larger than the extent
+        self.config['tile_size_pixels'] = 1000
+        self.assertTrue(validate_scenario_admission(
+            self.detail, cost_estimate, self.config))
+        self.config['tile_size_pixels'] = 100
+        preferences = SitePreferences.preferences()
+        preferences.scheduler_config = self.config
+        preferences.save()
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            detail=self.detail,
+            cost_estimate=cost_estimate
+        )
+        view = ExecuteScenarioAnalysis.as_view()
+        kwargs = {
+            'scenario_uuid': str(scenario_task.uuid)
+        }
+        # cannot be run in a single worker
+        request = self.factory.get(
+            reverse('v1:scenario-execute', kwargs=kwargs)
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = view(request, **kwargs)
+        self.assertEqual(response.status_code, 400)
+        mocked_task.assert_not_called()
+        # auto mode tiles the scenario below tiling_min_pixels
+        request = self.factory.get(
+            reverse('v1:scenario-execute', kwargs=kwargs) + '?tiled=auto'
+        )
+        request.resolver_match = FakeResolverMatchV1
+        request.user = self.superuser
+        response = view(request, **kwargs)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['tiles'], 2)
+        scenario_task.refresh_from_db()
+        self.assertTrue(scenario_task.is_tiled)
+        for tile_task in scenario_task.tiles.all():
+            self.assertFalse(validate_scenario_cost(
+                tile_task.cost_estimate, self.config))
+
+    def test_get_tile_output_key(self):
+        output_layer = OutputLayer(
+            name='Alien_Plant_Removal_a1b2.tif',
+            group='weighted_activities',
+            is_final_output=False
+        )
+        self.assertEqual(
+            get_tile_output_key(output_layer),
+            ('weighted_activities', 'Alien_Plant_Removal')
+        )
+        output_layer.is_final_output = True
+        self.assertEqual(
+            get_tile_output_key(output_layer), ('final_output', ''))
+
+    @mock.patch('cplus_api.tasks.mosaic.'
+                'mosaic_scenario_tiles.apply_async')
+    @mock.patch('cplus_api.tasks.runner.'
+                'run_scenario_analysis_task.apply_async')
+    def test_tiled_scenario(self, mocked_task, mocked_mosaic):
+        mocked_task.side_effect = mocked_process
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            detail=self.detail,
+            cost_estimate=self.cost_estimate
+        )
+        tiles = plan_scenario_tiles(
+            self.detail, self.cost_estimate, self.config)
+        tile_tasks = create_scenario_tiles(scenario_task, tiles)
+        self.assertEqual(len(tile_tasks), 2)
+        scenario_task.refresh_from_db()
+        self.assertTrue(scenario_task.is_tiled)
+        self.assertEqual(scenario_task.status, TaskStatus.RUNNING)
+        self.assertEqual(
+            tile_tasks[1].detail['extent'], tiles[1]['extent'])
+        # tiles count to the cap of the scenario owner
+        preferences = SitePreferences.preferences()
+        preferences.scheduler_config = {'max_running_per_user': 1}
+        preferences.save()
+        self.assertEqual(dispatch_scenario_tasks(), [tile_tasks[0]])
+        tile_tasks[0].refresh_from_db()
+        tile_tasks[0].task_on_completed()
+        scenario_task.refresh_from_db()
+        self.assertEqual(scenario_task.progress, 45)
+        mocked_mosaic.assert_not_called()
+        self.assertEqual(dispatch_scenario_tasks(), [tile_tasks[1]])
+        tile_tasks[1].refresh_from_db()
+        tile_tasks[1].task_on_completed()
+        scenario_task.refresh_from_db()
+        self.assertTrue(scenario_task.task_id)
+        mocked_mosaic.assert_called_once_with(
+            (scenario_task.id,),
+            task_id=scenario_task.task_id,
+            queue=scenario_task.queue
+        )
+        # tiles are removed when scenario is tiled again
+        create_scenario_tiles(scenario_task, tiles)
+        self.assertEqual(
+            ScenarioTask.objects.filter(parent=scenario_task).count(), 2)
+
+    @mock.patch('cplus_api.utils.tiling.cancel_task')
+    def test_tile_failure(self, mocked_cancel):
+        scenario_task = ScenarioTaskF.create(
+            submitted_by=self.superuser,
+            detail=self.detail,
+            cost_estimate=self.cost_estimate
+        )
+        tiles = plan_scenario_tiles(
+            self.detail, self.cost_estimate, self.config)
+        tile_tasks = create_scenario_tiles(scenario_task, tiles)
+        tile_tasks[0].task_on_errors('Test error')
+        scenario_task.refresh_from_db()
+        self.assertEqual(scenario_task.status, TaskStatus.STOPPED)
+        tile_tasks[1].refresh_from_db()
+        self.assertEqual(tile_tasks[1].status, TaskStatus.CANCELLED)
+        cancel_scenario_tiles(scenario_task)
+        mocked_cancel.assert_not_called()
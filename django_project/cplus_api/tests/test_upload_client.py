@@ -0,0 +1,183 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import requests_mock
+from django.test import TestCase
+from cplus_api.utils.upload_client import (
+    MANIFEST_SUFFIX,
+    UploadError,
+    MultipartUploadClient
+)
+
+MB = 1024 ** 2
+BASE_URL = 'http://test/api/v1'
+LAYER_UUID = 'c0f4e3d6-1b2a-4f8e-9d7c-6b5a4e3d2c1b'
+
+
+class TestUploadClient(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'layer.tif')
+        with open(self.file_path, 'wb') as f:
+            f.write(b'a' * 5 * MB + b'b' * 5 * MB + b'c' * MB)
+        self.file_size = 11 * MB
+        self.client = MultipartUploadClient(
+            BASE_URL, 'token', chunk_size=5 * MB, max_workers=2,
+            max_retries=2, backoff_seconds=0
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def get_part_etag(self, part_number):
+        with open(self.file_path, 'rb') as f:
+            f.seek((part_number - 1) * 5 * MB)
+            return '"' + hashlib.md5(f.read(5 * MB)).hexdigest() + '"'
+
+    def mock_api(self, rm):
+        rm.post(f'{BASE_URL}/layer/upload/start/', status_code=201, json={
+            'uuid': LAYER_UUID,
+            'name': 'layer.tif',
+            'multipart_upload_id': 'upload-id',
+            'upload_urls': [
+                {
+                    'part_number': i,
+                    'url': f'http://minio/layer.tif?partNumber={i}'
+                } for i in range(1, 4)
+            ]
+        })
+        rm.post(f'{BASE_URL}/layer/upload/{LAYER_UUID}/finish/', json={
+            'uuid': LAYER_UUID,
+            'name': 'layer.tif',
+            'size': self.file_size
+        })
+        rm.post(f'{BASE_URL}/layer/upload/{LAYER_UUID}/sign/', json={
+            'uuid': LAYER_UUID,
+            'multipart_upload_id': 'upload-id',
+            'upload_urls': [
+                {
+                    'part_number': 3,
+                    'url': 'http://minio/layer.tif?partNumber=3&signed=2'
+                }
+            ]
+        })
+        for i in range(1, 4):
+            rm.put(f'http://minio/layer.tif?partNumber={i}', headers={
+                'ETag': self.get_part_etag(i)
+            })
+
+    def test_upload(self):
+        with requests_mock.Mocker() as rm:
+            self.mock_api(rm)
+            # first attempt of part 2 fails with server error
+            rm.put('http://minio/layer.tif?partNumber=2', [
+                {'status_code': 503},
+                {'headers': {'ETag': self.get_part_etag(2)}}
+            ])
+            result = self.client.upload(self.file_path, 'ncs_pathway')
+            self.assertEqual(result['size'], self.file_size)
+            start_request = rm.request_history[0]
+            self.assertEqual(
+                start_request.headers['Authorization'], 'Bearer token')
+            self.assertEqual(start_request.json()['number_of_parts'], 3)
+            self.assertTrue(start_request.json()['paged'])
+            finish_request = rm.request_history[-1]
+            self.assertEqual(finish_request.json(), {
+                'multipart_upload_id': 'upload-id',
+                'items': [
+                    {
+                        'part_number': i,
+                        'etag': self.get_part_etag(i)
+                    } for i in range(1, 4)
+                ]
+            })
+            put_requests = [
+                r for r in rm.request_history if r.method == 'PUT'
+            ]
+            self.assertEqual(len(put_requests), 4)
+            self.assertIn('Content-MD5', put_requests[0].headers)
+        self.assertFalse(
+            os.path.exists(self.file_path + MANIFEST_SUFFIX))
+
+    def test_resume_upload(self):
+        with requests_mock.Mocker() as rm:
+            self.mock_api(rm)
+            rm.put('http://minio/layer.tif?partNumber=3', status_code=500)
+            with self.assertRaises(UploadError):
+                self.client.upload(self.file_path, 'ncs_pathway')
+            manifest_path = self.file_path + MANIFEST_SUFFIX
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            self.assertEqual(manifest['uuid'], LAYER_UUID)
+            self.assertEqual(sorted(manifest['parts'].keys()), ['1', '2'])
+        with requests_mock.Mocker() as rm:
+            self.mock_api(rm)
+            result = self.client.upload(self.file_path, 'ncs_pathway')
+            self.assertEqual(result['uuid'], LAYER_UUID)
+            # only part 3 is uploaded using new presigned URL
+            # and upload is not started again
+            self.assertEqual(
+                [r.url for r in rm.request_history],
+                [
+                    f'{BASE_URL}/layer/upload/{LAYER_UUID}/sign/',
+                    'http://minio/layer.tif?partNumber=3&signed=2',
+                    f'{BASE_URL}/layer/upload/{LAYER_UUID}/finish/'
+                ]
+            )
+            self.assertEqual(rm.request_history[0].json(), {
+                'multipart_upload_id': 'upload-id',
+                'part_numbers': [3]
+            })
+            self.assertEqual(len(rm.request_history[-1].json()['items']), 3)
+        self.assertFalse(os.path.exists(manifest_path))
+
+    def test_upload_by_pages(self):
+        self.client.url_page_size = 2
+        with requests_mock.Mocker() as rm:
+            self.mock_api(rm)
+            # start only returns presigned URLs of the first page
+            rm.post(f'{BASE_URL}/layer/upload/start/', status_code=201, json={
+                'uuid': LAYER_UUID,
+                'name': 'layer.tif',
+                'multipart_upload_id': 'upload-id',
+                'upload_urls': [
+                    {
+                        'part_number': i,
+                        'url': f'http://minio/layer.tif?partNumber={i}'
+                    } for i in range(1, 3)
+                ],
+                'next_part': 3
+            })
+            result = self.client.upload(self.file_path, 'ncs_pathway')
+            self.assertEqual(result['size'], self.file_size)
+            sign_requests = [
+                r for r in rm.request_history if r.url.endswith('/sign/')
+            ]
+            self.assertEqual(len(sign_requests), 1)
+            self.assertEqual(sign_requests[0].json()['part_numbers'], [3])
+            self.assertEqual(
+                len(rm.request_history[-1].json()['items']), 3)
+
+    def test_checksum_mismatch(self):
+        with requests_mock.Mocker() as rm:
+            self.mock_api(rm)
+            rm.put('http://minio/layer.tif?partNumber=1', headers={
+                'ETag': self.get_part_etag(2)
+            })
+            with self.assertRaises(UploadError) as context:
+                self.client.upload(self.file_path, 'ncs_pathway')
+            self.assertIn(
+                'Checksum mismatch of part 1', str(context.exception))
+            self.assertFalse(
+                any('finish' in r.url for r in rm.request_history))
+
+    def test_client_error_is_not_retried(self):
+        with requests_mock.Mocker() as rm:
+            rm.post(f'{BASE_URL}/layer/upload/start/', status_code=400,
+                    json={'detail': 'Invalid component_type'})
+            with self.assertRaises(UploadError):
+                self.client.upload(self.file_path, 'invalid')
+            self.assertEqual(rm.call_count, 1)
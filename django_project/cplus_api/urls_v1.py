@@ -8,6 +8,9 @@ from cplus_api.api_views.layer import (
     LayerUploadFinish,
     CheckLayer,
     LayerUploadAbort,
+    LayerUploadParts,
+    LayerUploadSign,
+    LayerUploadExtend,
     FetchLayerByClientId,
     DefaultLayerList,
     ReferenceLayerDownload,
@@ -16,12 +19,16 @@ from cplus_api.api_views.layer import (
 )
 from cplus_api.api_views.scenario import (
     ScenarioAnalysisSubmit,
+    ScenarioAnalysisEstimate,
     ExecuteScenarioAnalysis,
     CancelScenarioAnalysisTask,
     ScenarioAnalysisTaskStatus,
+    ScenarioAnalysisTaskStream,
     ScenarioAnalysisTaskLogs,
     ScenarioAnalysisHistory,
     ScenarioAnalysisTaskDetail,
+    ScenarioBatchSubmit,
+    ScenarioBatchStatus,
 )
 from cplus_api.api_views.statistics import (
     ZonalStatisticsView,
@@ -30,6 +37,7 @@ from cplus_api.api_views.statistics import (
 from cplus_api.api_views.output import (
     UserScenarioAnalysisOutput,
     FetchScenarioAnalysisOutput,
+    RestoreScenarioAnalysisOutput,
 )
 
 
@@ -64,6 +72,21 @@ layer_urls = [
         LayerUploadAbort.as_view(),
         name="layer-upload-abort",
     ),
+    path(
+        "layer/upload/<uuid:layer_uuid>/parts/",
+        LayerUploadParts.as_view(),
+        name="layer-upload-parts",
+    ),
+    path(
+        "layer/upload/<uuid:layer_uuid>/sign/",
+        LayerUploadSign.as_view(),
+        name="layer-upload-sign",
+    ),
+    path(
+        "layer/upload/<uuid:layer_uuid>/extend/",
+        LayerUploadExtend.as_view(),
+        name="layer-upload-extend",
+    ),
     path("layer/upload/", LayerUpload.as_view(), name="layer-upload"),
     path("layer/check/", CheckLayer.as_view(), name="layer-check"),
     path(
@@ -93,6 +116,11 @@ scenario_urls = [
         ScenarioAnalysisSubmit.as_view(),
         name="scenario-submit",
     ),
+    path(
+        "scenario/estimate/",
+        ScenarioAnalysisEstimate.as_view(),
+        name="scenario-estimate",
+    ),
     path(
         "scenario/<uuid:scenario_uuid>/execute/",
         ExecuteScenarioAnalysis.as_view(),
@@ -108,6 +136,11 @@ scenario_urls = [
         ScenarioAnalysisTaskStatus.as_view(),
         name="scenario-status",
     ),
+    path(
+        "scenario/<uuid:scenario_uuid>/stream/",
+        ScenarioAnalysisTaskStream.as_view(),
+        name="scenario-stream",
+    ),
     path(
         "scenario/<uuid:scenario_uuid>/logs/",
         ScenarioAnalysisTaskLogs.as_view(),
@@ -123,6 +156,16 @@ scenario_urls = [
         ScenarioAnalysisTaskDetail.as_view(),
         name="scenario-detail",
     ),
+    path(
+        "scenario/batch/submit/",
+        ScenarioBatchSubmit.as_view(),
+        name="scenario-batch-submit",
+    ),
+    path(
+        "scenario/batch/<uuid:batch_uuid>/status/",
+        ScenarioBatchStatus.as_view(),
+        name="scenario-batch-status",
+    ),
 ]
 
 # SCENARIO OUTPUTS API
@@ -137,6 +180,11 @@ scenario_output_urls = [
         FetchScenarioAnalysisOutput.as_view(),
         name="scenario-output-list-by-uuids",
     ),
+    path(
+        "scenario_output/<uuid:scenario_uuid>/restore/",
+        RestoreScenarioAnalysisOutput.as_view(),
+        name="scenario-output-restore",
+    ),
 ]
 
 # Statistics API
@@ -1,4 +1,5 @@
 import json
+import hashlib
 import logging
 import os
 import traceback
@@ -18,6 +19,7 @@ from botocore.client import Config
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from drf_yasg import openapi
 from rasterio.windows import Window
 from rest_framework.exceptions import PermissionDenied
@@ -48,6 +50,11 @@ PARAM_BBOX_IN_QUERY = openapi.Parameter(
                 "'West,South,East,North', EPSG:4326.",
     type=openapi.TYPE_STRING, required=False
 )
+PARAM_MULTIPART_UPLOAD_ID_IN_QUERY = openapi.Parameter(
+    'multipart_upload_id', openapi.IN_QUERY,
+    description='Upload Id for multipart upload',
+    type=openapi.TYPE_STRING, required=True
+)
 PARAMS_PAGINATION = [
     openapi.Parameter(
         'page', openapi.IN_QUERY,
@@ -110,16 +117,12 @@ def get_page_size(request):
     return page_size
 
 
-def build_minio_absolute_url(url):
-    """Build minio absoulte URL only for Dev/DEBUG env.
+def get_minio_absolute_base_url():
+    """Return absolute base url of minio for Dev/DEBUG env.
 
-    :param url: url
-    :type url: str
-    :return: url with absolute base url
+    :return: base url that ends with slash
     :rtype: str
     """
-    if not settings.DEBUG:
-        return url
     minio_site = Site.objects.filter(
         name__icontains='minio api'
     ).first()
@@ -128,7 +131,24 @@ def build_minio_absolute_url(url):
     domain = current_site.domain
     if not domain.endswith('/'):
         domain = domain + '/'
-    return url.replace('http://minio:9000/', f'{scheme}{domain}')
+    return f'{scheme}{domain}'
+
+
+def build_minio_absolute_url(url, base_url=None):
+    """Build minio absoulte URL only for Dev/DEBUG env.
+
+    :param url: url
+    :type url: str
+    :param base_url: minio base url, queried from Site if None
+    :type base_url: str
+    :return: url with absolute base url
+    :rtype: str
+    """
+    if not settings.DEBUG:
+        return url
+    if base_url is None:
+        base_url = get_minio_absolute_base_url()
+    return url.replace('http://minio:9000/', base_url)
 
 
 def get_upload_client():
@@ -171,7 +191,7 @@ def get_presigned_url(filename):
         response = upload_client.generate_presigned_url(
             ClientMethod='put_object',
             Params=method_parameters,
-            ExpiresIn=3600 * 3)
+            ExpiresIn=settings.MULTIPART_UPLOAD_URL_EXPIRES_IN)
     except ClientError as exc:
         logger.error(f'Unexpected exception occured: {type(exc).__name__} '
                      'in get_presigned_url')
@@ -183,13 +203,19 @@ def get_presigned_url(filename):
     return build_minio_absolute_url(response)
 
 
-def get_multipart_presigned_urls(filename, parts):
-    """Generate presigned urls for a file.
+def get_multipart_presigned_urls(filename, parts, paged=False):
+    """Create multipart upload and generate presigned urls.
+
+    When paged, only presigned urls of the first page are generated and
+    the next parts are signed on request using sign_multipart_part_urls,
+    so number of signatures does not depend on the file size.
 
     :param filename: file name
     :type filename: str
     :param parts: number of parts that will be uploaded
     :type parts: int
+    :param paged: generate presigned urls of the first page only
+    :type paged: bool
     :return: Tuple of Multipart UploadId and presigned_urls
     :rtype: tuple
     """
@@ -200,25 +226,120 @@ def get_multipart_presigned_urls(filename, parts):
         Key=filename
     )
     upload_id = response['UploadId']
+    if paged:
+        parts = min(parts, settings.MULTIPART_UPLOAD_URL_PAGE_SIZE)
+    results = sign_multipart_part_urls(
+        filename, upload_id, range(1, parts + 1),
+        upload_client=upload_client
+    )
+    return upload_id, results
+
+
+def get_part_url_cache_key(upload_id, part_number):
+    """Return cache key of presigned url of a part.
+
+    :param upload_id: Multipart UploadId
+    :type upload_id: str
+    :param part_number: part number
+    :type part_number: int
+    :return: cache key
+    :rtype: str
+    """
+    upload_hash = hashlib.md5(upload_id.encode('utf-8')).hexdigest()
+    return f'multipart-upload-url-{upload_hash}-{part_number}'
+
+
+def sign_multipart_part_urls(filename, upload_id, part_numbers,
+                             upload_client=None):
+    """Generate presigned urls of parts in existing multipart upload.
+
+    Presigned urls are cached for half of their expiry time, so
+    repeated requests of the same parts do not sign them again.
+
+    :param filename: file name
+    :type filename: str
+    :param upload_id: Multipart UploadId
+    :type upload_id: str
+    :param part_numbers: part numbers to be signed
+    :type part_numbers: list
+    :param upload_client: s3 client, created if None
+    :type upload_client: any
+    :return: list of part_number and presigned url
+    :rtype: list
+    """
+    cache_keys = {
+        part_number: get_part_url_cache_key(upload_id, part_number) for
+        part_number in part_numbers
+    }
+    cached_urls = cache.get_many(cache_keys.values())
+    bucket_name = os.environ.get("MINIO_BUCKET_NAME")
+    base_url = None
+    signed_urls = {}
     results = []
-    for i in range(0, parts):
-        part_number = i + 1
-        method_parameters = {
-            'Bucket': bucket_name,
-            'Key': filename,
-            'UploadId': upload_id,
-            'PartNumber': part_number
-        }
-        single_url = upload_client.generate_presigned_url(
-            ClientMethod='upload_part',
-            Params=method_parameters,
-            ExpiresIn=3600 * 3
-        )
+    for part_number, cache_key in cache_keys.items():
+        url = cached_urls.get(cache_key)
+        if url is None:
+            if upload_client is None:
+                upload_client = get_upload_client()
+            if base_url is None and settings.DEBUG:
+                base_url = get_minio_absolute_base_url()
+            method_parameters = {
+                'Bucket': bucket_name,
+                'Key': filename,
+                'UploadId': upload_id,
+                'PartNumber': part_number
+            }
+            url = build_minio_absolute_url(
+                upload_client.generate_presigned_url(
+                    ClientMethod='upload_part',
+                    Params=method_parameters,
+                    ExpiresIn=settings.MULTIPART_UPLOAD_URL_EXPIRES_IN
+                ),
+                base_url
+            )
+            signed_urls[cache_key] = url
         results.append({
             'part_number': part_number,
-            'url': build_minio_absolute_url(single_url)
+            'url': url
         })
-    return upload_id, results
+    if signed_urls:
+        cache.set_many(
+            signed_urls,
+            timeout=settings.MULTIPART_UPLOAD_URL_EXPIRES_IN // 2
+        )
+    return results
+
+
+def list_multipart_parts(filename, upload_id):
+    """List uploaded parts of multipart upload.
+
+    :param filename: file name
+    :type filename: str
+    :param upload_id: Multipart UploadId
+    :type upload_id: str
+    :return: list of part_number, etag and size
+    :rtype: list
+    """
+    upload_client = get_upload_client()
+    bucket_name = os.environ.get("MINIO_BUCKET_NAME")
+    results = []
+    params = {
+        'Bucket': bucket_name,
+        'Key': filename,
+        'UploadId': upload_id
+    }
+    while True:
+        response = upload_client.list_parts(**params)
+        for part in response.get('Parts', []):
+            results.append({
+                'part_number': part['PartNumber'],
+                'etag': part['ETag'],
+                'size': part['Size']
+            })
+        if not response.get('IsTruncated', False):
+            break
+        params['PartNumberMarker'] = response['NextPartNumberMarker']
+    return results
 
 
 def complete_multipart_upload(filename, upload_id, parts):
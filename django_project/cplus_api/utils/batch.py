@@ -0,0 +1,240 @@
+"""Batch of scenarios from a parameter grid of base scenario.
+
+Each combination of the parameter grid creates a child ScenarioTask.
+Input layers of the batch are downloaded once per worker host to the
+batch directory and hard linked into the scenario directory of each
+child. Each child still runs the whole analysis; the stages that are
+shared by the batch are not computed once, because cplus-core runs the
+pipeline in a single call.
+"""
+import os
+import copy
+import fcntl
+import shutil
+import logging
+import itertools
+from django.conf import settings
+
+from core.celery import app
+from core.models.base_task_request import TaskStatus, READ_ONLY_STATUS
+from cplus_api.models.layer import InputLayer
+from cplus_api.models.scenario import ScenarioBatch, ScenarioTask
+
+
+logger = logging.getLogger(__name__)
+BATCH_LOCK_FILE = '.lock'
+# remote control command of workers, see celery_event_handlers
+CLEAR_BATCH_COMMAND = 'clear_batch_directory'
+
+
+def set_parameter_value(detail, path, value):
+    """Set value of parameter path in scenario detail.
+
+    Path is separated by dot. Item of a list is selected by its
+    name, uuid or index, e.g. priority_layer_groups.Biodiversity.value.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :param path: parameter path
+    :type path: str
+    :param value: parameter value
+    :type value: any
+    :raises ValueError: when path does not exist in detail
+    """
+    keys = path.split('.')
+    current = detail
+    for index, key in enumerate(keys):
+        is_last = index == len(keys) - 1
+        if isinstance(current, dict):
+            if key not in current:
+                raise ValueError(f'Invalid parameter {path}!')
+            if is_last:
+                current[key] = value
+                return
+            current = current[key]
+        elif isinstance(current, list):
+            found = None
+            for item_index, item in enumerate(current):
+                if isinstance(item, dict) and key in [
+                    item.get('name'), str(item.get('uuid'))
+                ]:
+                    found = item_index
+                    break
+            if found is None and key.isdigit() and int(key) < len(current):
+                found = int(key)
+            if found is None:
+                raise ValueError(f'Invalid parameter {path}!')
+            if is_last:
+                current[found] = value
+                return
+            current = current[found]
+        else:
+            raise ValueError(f'Invalid parameter {path}!')
+
+
+def expand_parameter_grid(base_detail, parameter_grid):
+    """Create scenario detail for each combination of parameter grid.
+
+    :param base_detail: base scenario detail
+    :type base_detail: dict
+    :param parameter_grid: dictionary of parameter path and list of values
+    :type parameter_grid: dict
+    :raises ValueError: when parameter grid is invalid
+    :return: list of (parameters, scenario detail)
+    :rtype: list
+    """
+    if not parameter_grid or not isinstance(parameter_grid, dict):
+        raise ValueError('Parameter grid cannot be empty!')
+    paths = sorted(parameter_grid.keys())
+    total = 1
+    for path in paths:
+        values = parameter_grid[path]
+        if not isinstance(values, list) or not values:
+            raise ValueError(
+                f'Parameter {path} must be a list of values!')
+        total *= len(values)
+    if total > settings.SCENARIO_BATCH_MAX_SIZE:
+        raise ValueError(
+            f'Parameter grid creates {total} scenarios, '
+            f'maximum is {settings.SCENARIO_BATCH_MAX_SIZE}!'
+        )
+    base_name = base_detail.get('scenario_name', 'Scenario')
+    results = []
+    combinations = itertools.product(
+        *[parameter_grid[path] for path in paths])
+    for index, values in enumerate(combinations):
+        detail = copy.deepcopy(base_detail)
+        parameters = dict(zip(paths, values))
+        for path, value in parameters.items():
+            set_parameter_value(detail, path, value)
+        detail['scenario_name'] = f'{base_name} ({index + 1})'
+        results.append((parameters, detail))
+    return results
+
+
+def is_batch_active(batch: ScenarioBatch):
+    """Check whether batch has scenario that is waiting or running.
+
+    :param batch: scenario batch
+    :type batch: ScenarioBatch
+    :return: True if there is active scenario
+    :rtype: bool
+    """
+    return ScenarioTask.objects.filter(
+        batch=batch,
+        status__in=READ_ONLY_STATUS + [TaskStatus.PENDING],
+    ).exclude(
+        status=TaskStatus.PENDING,
+        scheduled_on__isnull=True
+    ).exists()
+
+
+def get_batch_status_counts(batch: ScenarioBatch):
+    """Return number of scenarios by status in the batch.
+
+    :param batch: scenario batch
+    :type batch: ScenarioBatch
+    :return: dictionary of status and total
+    :rtype: dict
+    """
+    counts = {}
+    for status in ScenarioTask.objects.filter(
+        batch=batch
+    ).values_list('status', flat=True):
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def download_batch_input_layer(
+        input_layer: InputLayer, batch: ScenarioBatch, scenario_path: str):
+    """Download input layer to scenario directory using batch cache.
+
+    The layer is downloaded once to batch directory and then hard linked
+    into scenario directory. Zipped layers are downloaded directly.
+    Caller should update last_used_on of the layers using
+    InputLayer.touch_last_used.
+
+    :param input_layer: input layer
+    :type input_layer: InputLayer
+    :param batch: scenario batch
+    :type batch: ScenarioBatch
+    :param scenario_path: scenario base directory
+    :type scenario_path: str
+    :return: file path in scenario directory
+    :rtype: str
+    """
+    if input_layer.file.name.endswith('.zip'):
+        return input_layer.download_to_working_directory(
+            scenario_path, touch_last_used=False)
+    batch_path = batch.get_resources_path()
+    cache_path = os.path.join(
+        batch_path,
+        str(input_layer.uuid),
+        str(int(input_layer.modified_on.timestamp()))
+    )
+    os.makedirs(batch_path, exist_ok=True)
+    with open(os.path.join(batch_path, BATCH_LOCK_FILE), 'w') as lock_file:
+        # serialize downloads of children in the same host
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            cached_file = os.path.join(
+                cache_path,
+                input_layer.component_type,
+                os.path.basename(input_layer.file.name)
+            )
+            if not os.path.exists(cached_file):
+                cached_file = input_layer.download_to_working_directory(
+                    cache_path, touch_last_used=False)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    if not cached_file:
+        return None
+    dir_path = os.path.join(scenario_path, input_layer.component_type)
+    os.makedirs(dir_path, exist_ok=True)
+    file_path = os.path.join(dir_path, os.path.basename(cached_file))
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    try:
+        os.link(cached_file, file_path)
+    except OSError:
+        shutil.copyfile(cached_file, file_path)
+    return file_path
+
+
+def clear_batch_resources(batch: ScenarioBatch):
+    """Remove batch input cache when no scenario is active.
+
+    Children of the batch may run on different worker hosts, so the
+    removal is broadcast to every worker to clear its own cache.
+
+    :param batch: scenario batch
+    :type batch: ScenarioBatch
+    """
+    if is_batch_active(batch):
+        return
+    batch.clear_resources()
+    if not settings.SCENARIO_BATCH_BROADCAST_CLEANUP:
+        return
+    try:
+        app.control.broadcast(
+            CLEAR_BATCH_COMMAND,
+            arguments={'batch_uuid': str(batch.uuid)}
+        )
+    except Exception as ex:
+        logger.warning(
+            f'Failed to broadcast removal of batch {batch.uuid}: {ex}')
+
+
+def clear_local_batch_resources(batch_uuid):
+    """Remove batch input cache of this host when no scenario is active.
+
+    :param batch_uuid: UUID of scenario batch
+    :type batch_uuid: str
+    :return: True if batch directory is removed
+    :rtype: bool
+    """
+    batch = ScenarioBatch.objects.filter(uuid=batch_uuid).first()
+    if batch is None or is_batch_active(batch):
+        return False
+    batch.clear_resources()
+    return True
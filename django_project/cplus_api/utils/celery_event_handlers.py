@@ -1,6 +1,12 @@
 import logging
 from celery import signals
+from celery.worker.control import control_command
 from cplus_api.models.scenario import ScenarioTask
+from cplus_api.utils.batch import (
+    CLEAR_BATCH_COMMAND,
+    clear_local_batch_resources
+)
+from cplus_api.utils.scratch import reconcile_scratch
 
 
 logger = logging.getLogger(__name__)
@@ -94,3 +100,27 @@ def task_retry_handler(sender, reason, **kwargs):
     task_id = sender.request.id
     logger.info(f'on task_retry_handler {task_id}')
     scenario_task.task_on_retried(str(reason))
+
+
+@signals.worker_ready.connect
+def worker_ready_handler(sender=None, **kwargs):
+    # scratch of tasks that were killed (e.g. SIGKILL) is not cleaned
+    try:
+        reconcile_scratch()
+    except Exception as ex:
+        logger.error(f'Failed scratch reconciliation {ex}')
+
+
+@control_command(
+    name=CLEAR_BATCH_COMMAND,
+    args=[('batch_uuid', str)],
+    signature='<batch_uuid>'
+)
+def clear_batch_directory(state, batch_uuid):
+    # batch input cache is created in every host that runs a child
+    try:
+        removed = clear_local_batch_resources(batch_uuid)
+    except Exception as ex:
+        logger.error(f'Failed removing batch {batch_uuid} directory {ex}')
+        return {'error': str(ex)}
+    return {'ok': 'removed' if removed else 'skipped'}
@@ -0,0 +1,328 @@
+"""Pre-flight cost estimator for scenario analysis.
+
+The estimate is derived from scenario detail (the same dictionary that
+is read by APITaskConfig in the worker) and InputLayer metadata, so it
+can be computed in the API without PyQGIS.
+"""
+import logging
+import math
+from django.core.cache import cache
+from django.contrib.gis.gdal import SpatialReference
+
+from core.models.base_task_request import TaskStatus
+from cplus_api.models.layer import InputLayer
+from cplus_api.models.scenario import ScenarioTask
+from cplus_api.utils.default import DEFAULT_VALUES
+
+
+logger = logging.getLogger(__name__)
+# intermediate rasters are written as float32
+BYTES_PER_PIXEL = 4
+# used when no referenced layer has resolution metadata
+DEFAULT_RESOLUTION_M = 30.0
+METRES_PER_DEGREE = 111320.0
+# number of full rasters that are held in memory by a processing step
+RAM_RASTER_FACTOR = 4
+# fixed overhead of QGIS initialisation, download and upload in seconds
+DEFAULT_BASE_SECONDS = 60.0
+DEFAULT_SECONDS_PER_WORK_UNIT = 2e-8
+CALIBRATION_CACHE_KEY = 'scenario-estimator-calibration'
+CALIBRATION_CACHE_TIMEOUT = 3600
+CALIBRATION_SAMPLE_SIZE = 200
+
+
+def get_scenario_extent(detail):
+    """Return scenario extent as float values.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :return: [xmin, xmax, ymin, ymax] or None if extent is invalid
+    :rtype: list
+    """
+    extent = detail.get('extent', []) if detail else []
+    if len(extent) != 4:
+        return None
+    try:
+        return [float(value) for value in extent]
+    except (TypeError, ValueError):
+        return None
+
+
+def is_geographic_extent(detail, extent):
+    """Check whether scenario extent uses geographic coordinates.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :param extent: [xmin, xmax, ymin, ymax]
+    :type extent: list
+    :return: True if analysis_crs is geographic
+    :rtype: bool
+    """
+    xmin, xmax, ymin, ymax = extent
+    is_geographic = (
+        abs(xmin) <= 180 and abs(xmax) <= 180 and
+        abs(ymin) <= 90 and abs(ymax) <= 90
+    )
+    crs = detail.get('analysis_crs', None)
+    if crs:
+        try:
+            is_geographic = SpatialReference(crs).geographic
+        except Exception as ex:
+            logger.warning(f'Unable to read analysis crs {crs}: {ex}')
+    return is_geographic
+
+
+def get_extent_area_km2(detail):
+    """Return approximate area of scenario extent in km2.
+
+    Extent is in [xmin, xmax, ymin, ymax] order using analysis_crs.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :return: area in km2 or None if extent is invalid
+    :rtype: float
+    """
+    extent = get_scenario_extent(detail)
+    if extent is None:
+        return None
+    xmin, xmax, ymin, ymax = extent
+    is_geographic = is_geographic_extent(detail, extent)
+    width = abs(xmax - xmin)
+    height = abs(ymax - ymin)
+    if is_geographic:
+        mid_lat = math.radians((ymin + ymax) / 2)
+        return (
+            width * 111.32 * math.cos(mid_lat) *
+            height * 110.57
+        )
+    # assume projected crs in metres
+    return (width * height) / 1e6
+
+
+def get_scenario_layer_uuids(detail):
+    """Return uuids of input layers that are referenced by scenario.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :return: set of layer uuid
+    :rtype: set
+    """
+    layer_uuids = set()
+    for priority_layer in detail.get('priority_layers', []):
+        layer_uuids.add(priority_layer.get('layer_uuid'))
+    for activity in detail.get('activities', []):
+        layer_uuids.add(activity.get('layer_uuid'))
+        for pathway in activity.get('pathways', []):
+            layer_uuids.add(pathway.get('layer_uuid'))
+            layer_uuids.update(pathway.get('carbon_uuids', []) or [])
+    layer_uuids.add(detail.get('snap_layer_uuid'))
+    layer_uuids.add(detail.get('sieve_mask_uuid'))
+    layer_uuids.add(detail.get('studyarea_layer_uuid'))
+    layer_uuids.update(detail.get('mask_layer_uuids', []) or [])
+    return {str(layer_uuid) for layer_uuid in layer_uuids if layer_uuid}
+
+
+def get_layer_resolution_m(metadata):
+    """Return pixel size in metres from InputLayer metadata.
+
+    :param metadata: InputLayer metadata
+    :type metadata: dict
+    :return: tuple of resolution x and y or None
+    :rtype: tuple
+    """
+    resolution = metadata.get('resolution', None) if metadata else None
+    if not resolution or len(resolution) != 2:
+        return None
+    try:
+        res_x, res_y = abs(float(resolution[0])), abs(float(resolution[1]))
+    except (TypeError, ValueError):
+        return None
+    if res_x == 0 or res_y == 0:
+        return None
+    if metadata.get('is_geographic', False):
+        res_x *= METRES_PER_DEGREE
+        res_y *= METRES_PER_DEGREE
+    return res_x, res_y
+
+
+def count_scenario_rasters(detail):
+    """Count rasters that are produced by the analysis.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :return: dictionary of counts
+    :rtype: dict
+    """
+    activities = detail.get('activities', [])
+    total_pathways = 0
+    total_carbon = 0
+    for activity in activities:
+        pathways = activity.get('pathways', [])
+        total_pathways += len(pathways)
+        for pathway in pathways:
+            total_carbon += len(pathway.get('carbon_uuids', []) or [])
+    total_priority = len([
+        layer for layer in detail.get('priority_layers', [])
+        if layer.get('layer_uuid')
+    ])
+
+    def get_value(key):
+        return detail.get(key, getattr(DEFAULT_VALUES, key))
+
+    # normalized and weighted pathway
+    per_pathway = 2
+    if get_value('ncs_with_carbon'):
+        per_pathway += 1
+    if get_value('snapping_enabled'):
+        per_pathway += 1
+    # activity raster
+    per_activity = 1
+    for key in ['landuse_project', 'landuse_normalized',
+                'landuse_weighted', 'sieve_enabled']:
+        if get_value(key):
+            per_activity += 1
+    if detail.get('mask_layer_uuids'):
+        per_activity += 1
+    total_rasters = (
+        total_pathways * per_pathway +
+        len(activities) * per_activity +
+        total_priority
+    )
+    if get_value('highest_position'):
+        total_rasters += 1
+    return {
+        'activities': len(activities),
+        'pathways': total_pathways,
+        'carbon_layers': total_carbon,
+        'priority_layers': total_priority,
+        'rasters': total_rasters
+    }
+
+
+def get_runtime_calibration():
+    """Return runtime model calibrated from completed scenario tasks.
+
+    Runtime is modelled as base_seconds + work_units * seconds_per_unit
+    and fitted with least squares on recent completed tasks that have
+    cost estimate.
+
+    :return: dictionary of base_seconds, seconds_per_unit and samples
+    :rtype: dict
+    """
+    calibration = cache.get(CALIBRATION_CACHE_KEY)
+    if calibration:
+        return calibration
+    calibration = {
+        'base_seconds': DEFAULT_BASE_SECONDS,
+        'seconds_per_unit': DEFAULT_SECONDS_PER_WORK_UNIT,
+        'samples': 0
+    }
+    tasks = ScenarioTask.objects.filter(
+        status=TaskStatus.COMPLETED,
+        started_at__isnull=False,
+        finished_at__isnull=False,
+        cost_estimate__work_units__gt=0
+    ).order_by('-finished_at').values_list(
+        'started_at', 'finished_at', 'cost_estimate'
+    )[:CALIBRATION_SAMPLE_SIZE]
+    samples = [
+        (
+            float(cost_estimate['work_units']),
+            (finished_at - started_at).total_seconds()
+        )
+        for started_at, finished_at, cost_estimate in tasks
+    ]
+    if len(samples) >= 2:
+        mean_x = sum(x for x, _ in samples) / len(samples)
+        mean_y = sum(y for _, y in samples) / len(samples)
+        var_x = sum((x - mean_x) ** 2 for x, _ in samples)
+        if var_x > 0:
+            slope = sum(
+                (x - mean_x) * (y - mean_y) for x, y in samples
+            ) / var_x
+            if slope > 0:
+                calibration['seconds_per_unit'] = slope
+                calibration['base_seconds'] = max(
+                    mean_y - slope * mean_x, 0)
+        calibration['samples'] = len(samples)
+    cache.set(
+        CALIBRATION_CACHE_KEY, calibration, CALIBRATION_CACHE_TIMEOUT)
+    return calibration
+
+
+def estimate_scenario_cost(detail):
+    """Estimate pixel count, disk, RAM and runtime of a scenario.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :return: cost estimate
+    :rtype: dict
+    """
+    layer_uuids = get_scenario_layer_uuids(detail)
+    layers = InputLayer.objects.filter(
+        uuid__in=layer_uuids
+    ).values_list('metadata', 'size')
+    resolution = None
+    input_bytes = 0
+    for metadata, size in layers:
+        input_bytes += size or 0
+        layer_resolution = get_layer_resolution_m(metadata)
+        if layer_resolution is None:
+            continue
+        if resolution is None or (
+            layer_resolution[0] * layer_resolution[1] <
+            resolution[0] * resolution[1]
+        ):
+            resolution = layer_resolution
+    if resolution is None:
+        resolution = (DEFAULT_RESOLUTION_M, DEFAULT_RESOLUTION_M)
+    area_km2 = get_extent_area_km2(detail) or 0
+    pixels = int(area_km2 * 1e6 / (resolution[0] * resolution[1]))
+    counts = count_scenario_rasters(detail)
+    raster_bytes = pixels * BYTES_PER_PIXEL
+    work_units = pixels * counts['rasters']
+    calibration = get_runtime_calibration()
+    return {
+        'area_km2': area_km2,
+        'resolution_m': list(resolution),
+        'pixels': pixels,
+        **counts,
+        'input_bytes': input_bytes,
+        'disk_bytes': input_bytes + raster_bytes * counts['rasters'],
+        'ram_bytes': raster_bytes * RAM_RASTER_FACTOR,
+        'work_units': work_units,
+        'runtime_seconds': int(
+            calibration['base_seconds'] +
+            work_units * calibration['seconds_per_unit']
+        ),
+        'calibration_samples': calibration['samples']
+    }
+
+
+def validate_scenario_cost(cost_estimate, config):
+    """Check cost estimate against the limits of a single worker.
+
+    :param cost_estimate: cost estimate
+    :type cost_estimate: dict
+    :param config: scheduler config
+    :type config: dict
+    :return: list of error message
+    :rtype: list
+    """
+    errors = []
+    gb = 1024 ** 3
+    disk_bytes = cost_estimate.get('disk_bytes', 0)
+    max_disk_gb = config.get('max_estimated_disk_gb', None)
+    if max_disk_gb and disk_bytes > max_disk_gb * gb:
+        errors.append(
+            f'Estimated disk usage {disk_bytes / gb:.1f}GB '
+            f'exceeds the limit of {max_disk_gb}GB.'
+        )
+    ram_bytes = cost_estimate.get('ram_bytes', 0)
+    max_ram_gb = config.get('max_estimated_ram_gb', None)
+    if max_ram_gb and ram_bytes > max_ram_gb * gb:
+        errors.append(
+            f'Estimated memory usage {ram_bytes / gb:.1f}GB '
+            f'exceeds the limit of {max_ram_gb}GB.'
+        )
+    return errors
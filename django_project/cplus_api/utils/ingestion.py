@@ -0,0 +1,380 @@
+"""Ingestion of uploaded input layer files.
+
+Uploaded raster is validated and rewritten as a Cloud Optimized GeoTIFF
+when it is not tiled, compressed or missing overviews, so scenario
+analysis does not need to download and read an unoptimized file.
+Metadata, footprint and checksum of the final file are stored in the
+InputLayer. The file is processed in a working directory in SCRATCH_DIR
+with a scratch reservation. Ingestion that is superseded by a new upload
+of the layer is discarded without replacing the file.
+"""
+import os
+import uuid
+import shutil
+import hashlib
+import logging
+import subprocess
+import rasterio
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+from django.conf import settings
+from django.contrib.gis.gdal import DataSource, OGRGeometry
+from django.contrib.gis.geos import Polygon
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+from cplus_api.models.layer import InputLayer, select_input_layer_storage
+from cplus_api.utils.api_helper import get_layer_type
+from cplus_api.utils.scratch import (
+    ScratchQuotaExceeded,
+    reserve_scratch_space,
+    release_scratch_space,
+    get_ingestion_scratch_key,
+    get_ingestion_scratch_path
+)
+
+
+logger = logging.getLogger(__name__)
+COG_BLOCK_SIZE = 512
+# downloaded file, COG output and its overviews
+INGESTION_SCRATCH_FACTOR = 3
+
+
+class IngestionError(Exception):
+    """Raised when layer file is invalid."""
+
+
+class IngestionSuperseded(Exception):
+    """Raised when layer is uploaded again during ingestion."""
+
+
+def compute_file_checksum(file_path, chunk_size=8 * 1024 ** 2):
+    """Compute SHA256 of a file.
+
+    :param file_path: path to the file
+    :type file_path: str
+    :param chunk_size: size of chunk that is read at once
+    :type chunk_size: int
+    :return: sha256 hex digest
+    :rtype: str
+    """
+    checksum = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def validate_raster(file_path):
+    """Check raster can be opened and read.
+
+    :param file_path: path to the raster
+    :type file_path: str
+    :raises IngestionError: when raster is invalid
+    """
+    try:
+        with rasterio.open(file_path) as dataset:
+            if dataset.crs is None:
+                raise IngestionError('Raster does not have CRS!')
+            if dataset.width == 0 or dataset.height == 0:
+                raise IngestionError('Raster is empty!')
+            dataset.read(1, window=Window(
+                0, 0,
+                min(dataset.width, COG_BLOCK_SIZE),
+                min(dataset.height, COG_BLOCK_SIZE)
+            ))
+    except rasterio.errors.RasterioError as ex:
+        raise IngestionError(f'Invalid raster: {ex}')
+
+
+def is_cog_beneficial(file_path):
+    """Check whether raster should be converted to COG.
+
+    :param file_path: path to the raster
+    :type file_path: str
+    :return: True if raster is not compressed, or it is larger than
+        a block but not tiled or without overviews
+    :rtype: bool
+    """
+    with rasterio.open(file_path) as dataset:
+        is_compressed = dataset.compression is not None
+        if max(dataset.width, dataset.height) <= COG_BLOCK_SIZE:
+            return not is_compressed
+        is_tiled = dataset.profile.get('tiled', False)
+        has_overviews = len(dataset.overviews(1)) > 0
+        return not (is_compressed and is_tiled and has_overviews)
+
+
+def convert_to_cog(file_path, output_path):
+    """Convert raster to COG with overviews.
+
+    :param file_path: path to the raster
+    :type file_path: str
+    :param output_path: COG output path
+    :type output_path: str
+    :raises IngestionError: when gdal_translate is failed
+    """
+    result = subprocess.run([
+        'gdal_translate', '-of', 'COG',
+        '-co', 'COMPRESS=DEFLATE',
+        '-co', 'RESAMPLING=BILINEAR',
+        '-co', 'OVERVIEW_RESAMPLING=NEAREST',
+        '-co', 'NUM_THREADS=ALL_CPUS',
+        '-co', f'BLOCKSIZE={COG_BLOCK_SIZE}',
+        file_path, output_path
+    ], capture_output=True)
+    if result.returncode != 0:
+        raise IngestionError(
+            f'Failed converting raster to COG: {result.stderr.decode()}')
+
+
+def get_raster_metadata(file_path):
+    """Read metadata of raster.
+
+    :param file_path: path to the raster
+    :type file_path: str
+    :return: metadata of InputLayer
+    :rtype: dict
+    """
+    with rasterio.open(file_path) as dataset:
+        unit = dataset.crs.units_factor[0]
+        return {
+            'is_raster': True,
+            'crs': str(dataset.crs),
+            'resolution': [abs(dataset.res[0]), abs(dataset.res[1])],
+            'unit': 'm' if unit == 'metre' else unit,
+            'nodata_value': dataset.nodata,
+            'is_geographic': dataset.crs.is_geographic,
+            'bounds': list(dataset.bounds),
+            'width': dataset.width,
+            'height': dataset.height,
+            'dtype': dataset.dtypes[0]
+        }
+
+
+def get_raster_footprint(dataset):
+    """Return footprint of raster in EPSG:4326.
+
+    :param dataset: opened raster dataset
+    :type dataset: rasterio.DatasetReader
+    :return: bounding box polygon, None if raster does not have CRS
+    :rtype: Polygon
+    """
+    if dataset.crs is None:
+        return None
+    bounds = transform_bounds(
+        dataset.crs, 'EPSG:4326', *dataset.bounds, densify_pts=21)
+    footprint = Polygon.from_bbox(bounds)
+    footprint.srid = 4326
+    return footprint
+
+
+def get_vector_footprint(file_path):
+    """Return footprint of the first layer in vector file in EPSG:4326.
+
+    :param file_path: path to shapefile or geojson
+    :type file_path: str
+    :return: bounding box polygon, None if layer does not have SRS
+    :rtype: Polygon
+    """
+    layer = DataSource(file_path)[0]
+    if layer.srs is None:
+        return None
+    envelope = OGRGeometry.from_bbox(layer.extent.tuple)
+    envelope.srs = layer.srs
+    envelope.transform(4326)
+    footprint = Polygon.from_bbox(envelope.extent)
+    footprint.srid = 4326
+    return footprint
+
+
+def replace_layer_file(input_layer: InputLayer, file_path):
+    """Overwrite file of input layer in the storage.
+
+    :param input_layer: input layer
+    :type input_layer: InputLayer
+    :param file_path: path to the new file
+    :type file_path: str
+    """
+    storage = select_input_layer_storage()
+    if isinstance(storage, FileSystemStorage):
+        shutil.copyfile(file_path, storage.path(input_layer.file.name))
+    else:
+        boto3_client = storage.connection.meta.client
+        boto3_client.upload_file(
+            file_path,
+            storage.bucket_name,
+            input_layer.file.name,
+            Config=settings.AWS_TRANSFER_CONFIG
+        )
+
+
+def get_layer_file_version(input_layer: InputLayer):
+    """Return size and modified time of layer file in the storage.
+
+    :param input_layer: input layer
+    :type input_layer: InputLayer
+    :return: tuple of size and modified time
+    :rtype: tuple
+    """
+    storage = input_layer.file.storage
+    return (
+        storage.size(input_layer.file.name),
+        storage.get_modified_time(input_layer.file.name)
+    )
+
+
+def lock_ingesting_layer(input_layer: InputLayer, file_version):
+    """Lock input layer and check it is still in this ingestion.
+
+    Must be called inside a transaction.
+
+    :param input_layer: input layer in ingestion
+    :type input_layer: InputLayer
+    :param file_version: file version when ingestion is started
+    :type file_version: tuple
+    :raises IngestionSuperseded: when layer is uploaded again
+    """
+    current = InputLayer.objects.select_for_update().get(id=input_layer.id)
+    if (
+        current.ingestion_status != InputLayer.IngestionStatus.PROCESSING or
+        current.file.name != input_layer.file.name or
+        (
+            file_version and
+            get_layer_file_version(current) != file_version
+        )
+    ):
+        raise IngestionSuperseded(
+            f'Layer {input_layer.uuid} is uploaded again during ingestion.')
+
+
+def update_ingestion_status(input_layer: InputLayer, file_version, status,
+                            error=''):
+    """Set ingestion status if layer is still in this ingestion.
+
+    :param input_layer: input layer in ingestion
+    :type input_layer: InputLayer
+    :param file_version: file version when ingestion is started
+    :type file_version: tuple
+    :param status: new ingestion status
+    :type status: str
+    :param error: ingestion error
+    :type error: str
+    """
+    input_layer.ingestion_status = status
+    input_layer.ingestion_error = error
+    with transaction.atomic():
+        try:
+            lock_ingesting_layer(input_layer, file_version)
+        except Exception as ex:
+            # layer is uploaded again, or its file cannot be read
+            logger.warning(
+                f'Ingestion status of {input_layer.uuid} is kept: {ex}')
+            return
+        input_layer.save(update_fields=[
+            'ingestion_status', 'ingestion_error', 'modified_on'
+        ])
+
+
+def ingest_layer_file(input_layer: InputLayer):
+    """Validate, optimize and read metadata of uploaded layer file.
+
+    Status and version of the uploaded file are checked again before
+    the file is replaced, so ingestion of a layer that is uploaded
+    again in the meantime is discarded.
+
+    :param input_layer: input layer with uploaded file
+    :type input_layer: InputLayer
+    :return: True if layer is ready, False if ingestion is failed or
+        is waiting for scratch space, None if it is superseded
+    :rtype: bool
+    """
+    input_layer.ingestion_status = InputLayer.IngestionStatus.PROCESSING
+    input_layer.ingestion_error = ''
+    input_layer.checksum = ''
+    input_layer.save(update_fields=[
+        'ingestion_status', 'ingestion_error', 'checksum', 'modified_on'
+    ])
+    scratch_key = get_ingestion_scratch_key(input_layer)
+    scratch_path = get_ingestion_scratch_path(input_layer)
+    # concurrent ingestion of the same layer uses its own directory
+    work_dir = os.path.join(scratch_path, uuid.uuid4().hex)
+    file_version = None
+    try:
+        if not input_layer.is_available():
+            raise IngestionError('Layer file does not exist!')
+        file_version = get_layer_file_version(input_layer)
+        reserve_scratch_space(
+            scratch_key,
+            int(
+                (input_layer.size or 0) * INGESTION_SCRATCH_FACTOR *
+                settings.SCRATCH_RESERVE_FACTOR
+            ),
+            scratch_path
+        )
+        os.makedirs(work_dir)
+        layer_path = input_layer.download_to_working_directory(
+            work_dir, touch_last_used=False)
+        file_path = os.path.join(
+            work_dir, input_layer.component_type,
+            os.path.basename(input_layer.file.name)
+        )
+        metadata = {}
+        footprint = None
+        cog_path = None
+        if get_layer_type(file_path) == 0:
+            validate_raster(file_path)
+            if is_cog_beneficial(file_path):
+                cog_path = os.path.join(work_dir, 'cog.tif')
+                convert_to_cog(file_path, cog_path)
+                validate_raster(cog_path)
+                file_path = cog_path
+            metadata = get_raster_metadata(file_path)
+            with rasterio.open(file_path) as dataset:
+                footprint = get_raster_footprint(dataset)
+        elif layer_path:
+            footprint = get_vector_footprint(layer_path)
+        checksum = compute_file_checksum(file_path)
+        with transaction.atomic():
+            lock_ingesting_layer(input_layer, file_version)
+            if cog_path:
+                replace_layer_file(input_layer, cog_path)
+            input_layer.footprint = footprint
+            input_layer.metadata = {
+                **input_layer.metadata,
+                **metadata
+            }
+            input_layer.checksum = checksum
+            input_layer.size = os.path.getsize(file_path)
+            input_layer.ingestion_status = InputLayer.IngestionStatus.READY
+            input_layer.save(update_fields=[
+                'metadata', 'checksum', 'size', 'footprint',
+                'ingestion_status', 'modified_on'
+            ])
+        return True
+    except IngestionSuperseded as ex:
+        logger.info(str(ex))
+        return None
+    except ScratchQuotaExceeded as ex:
+        # ingestion is resubmitted by the sweeper
+        logger.warning(f'Layer {input_layer.uuid} is waiting: {ex}')
+        update_ingestion_status(
+            input_layer, file_version,
+            InputLayer.IngestionStatus.PENDING, str(ex)
+        )
+        return False
+    except Exception as ex:
+        logger.error(f'Failed ingesting layer {input_layer.uuid}: {ex}')
+        update_ingestion_status(
+            input_layer, file_version,
+            InputLayer.IngestionStatus.FAILED, str(ex)
+        )
+        return False
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        try:
+            os.rmdir(scratch_path)
+        except OSError:
+            # used by other ingestion or not created
+            pass
+        release_scratch_space(scratch_key)
@@ -25,6 +25,7 @@ from cplus_api.models import (
     COMMON_LAYERS_DIR
 )
 from cplus_api.utils.api_helper import get_layer_type, download_file
+from cplus_api.utils.ingestion import get_raster_footprint
 
 
 class ProcessFile:
@@ -130,6 +131,8 @@ class ProcessFile:
                     unit = dataset.crs.units_factor[0]
                     unit = "m" if unit == "metre" else unit
 
+                    self.input_layer.footprint = get_raster_footprint(
+                        dataset)
                     metadata = {
                         "is_raster": get_layer_type(self.file['Key']) == 0,
                         "crs": str(crs),
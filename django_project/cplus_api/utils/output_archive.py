@@ -0,0 +1,211 @@
+"""Storage tiering of aged output layers.
+
+Aged output files are moved to the archive storage (a cheaper storage
+class or bucket) under OUTPUT_ARCHIVE_DIR, while the OutputLayer rows
+stay listable. Archived files are restored to the default storage by
+a background task on request. File is copied and verified before the
+rows are flipped to the new tier, then the source file is deleted.
+"""
+import time
+import logging
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+from cplus_api.models.layer import (
+    OutputLayer,
+    select_output_archive_storage,
+    output_archive_file_path
+)
+from cplus_api.utils.s3_copy import multipart_copy
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_output_storage():
+    """Return storage of output layer file.
+
+    :return: default storage of OutputLayer
+    :rtype: Storage
+    """
+    return OutputLayer._meta.get_field('file').storage
+
+
+def copy_storage_file(source, source_name, target, target_name):
+    """Copy file between storages and verify its size.
+
+    S3 objects are copied in the server using multipart_copy with the
+    object parameters of the target storage, e.g. StorageClass.
+
+    :param source: source storage
+    :type source: Storage
+    :param source_name: file name in source storage
+    :type source_name: str
+    :param target: target storage
+    :type target: Storage
+    :param target_name: file name in target storage
+    :type target_name: str
+    :raises RuntimeError: when copied file does not match the source
+    """
+    if (
+        isinstance(source, FileSystemStorage) or
+        isinstance(target, FileSystemStorage)
+    ):
+        if target.exists(target_name):
+            target.delete(target_name)
+        with source.open(source_name, 'rb') as source_file:
+            saved_name = target.save(target_name, source_file)
+        if saved_name != target_name:
+            raise RuntimeError(f'Failed to copy {source_name}')
+    else:
+        multipart_copy(
+            source.connection.meta.client,
+            source.bucket_name, source_name,
+            target.bucket_name, target_name,
+            extra_args=dict(getattr(target, 'object_parameters', {}))
+        )
+    if target.size(target_name) != source.size(source_name):
+        raise RuntimeError(f'Size of copied {source_name} does not match')
+
+
+def archive_output_file(file_name):
+    """Move output file to archive storage.
+
+    :param file_name: file name in output storage
+    :type file_name: str
+    :return: number of archived output layers
+    :rtype: int
+    """
+    source = get_output_storage()
+    copy_storage_file(
+        source, file_name,
+        select_output_archive_storage(), output_archive_file_path(file_name)
+    )
+    total = OutputLayer.objects.filter(
+        file=file_name,
+        storage_tier=OutputLayer.StorageTiers.STANDARD
+    ).update(
+        storage_tier=OutputLayer.StorageTiers.ARCHIVED,
+        archived_on=timezone.now()
+    )
+    source.delete(file_name)
+    return total
+
+
+def archive_output_layers(queryset, batch_size, deadline=None):
+    """Move files of output layers to archive storage in batches.
+
+    File that is shared with a standard output layer outside of
+    queryset is kept in the output storage.
+
+    :param queryset: output layers to be archived
+    :type queryset: QuerySet
+    :param batch_size: number of output layers in a batch
+    :type batch_size: int
+    :param deadline: timestamp to stop processing new batch
+    :type deadline: float
+    :return: statistics of the archival
+    :rtype: dict
+    """
+    stats = {
+        'rows': 0,
+        'failed': 0,
+        'bytes': 0,
+        'seconds': 0,
+        'completed': True
+    }
+    start_time = time.time()
+    last_id = 0
+    queryset = queryset.filter(
+        storage_tier=OutputLayer.StorageTiers.STANDARD
+    ).exclude(file='')
+    while True:
+        if deadline and time.time() > deadline:
+            stats['completed'] = False
+            break
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'file', 'size'
+            )[:batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        file_sizes = {}
+        for _, file_name, size in rows:
+            file_sizes[file_name] = size or 0
+        shared_files = set(
+            OutputLayer.objects.filter(
+                file__in=file_sizes.keys(),
+                storage_tier=OutputLayer.StorageTiers.STANDARD
+            ).exclude(
+                id__in=queryset.values('id')
+            ).values_list('file', flat=True)
+        )
+        for file_name, size in file_sizes.items():
+            if file_name in shared_files:
+                continue
+            try:
+                stats['rows'] += archive_output_file(file_name)
+                stats['bytes'] += size
+            except Exception as ex:
+                logger.error(f'Failed to archive {file_name}: {ex}')
+                stats['failed'] += 1
+    stats['seconds'] = time.time() - start_time
+    return stats
+
+
+def request_output_restore(output_layers):
+    """Mark archived output layers to be restored.
+
+    :param output_layers: output layers to be restored
+    :type output_layers: QuerySet
+    :return: ids of output layers to be restored
+    :rtype: list
+    """
+    file_names = set(
+        output_layers.filter(
+            storage_tier=OutputLayer.StorageTiers.ARCHIVED
+        ).values_list('file', flat=True)
+    )
+    restored_layers = OutputLayer.objects.filter(
+        file__in=file_names,
+        storage_tier=OutputLayer.StorageTiers.ARCHIVED
+    )
+    ids = list(restored_layers.values_list('id', flat=True))
+    restored_layers.update(storage_tier=OutputLayer.StorageTiers.RESTORING)
+    return ids
+
+
+def restore_output_file(file_name):
+    """Move output file from archive storage back to output storage.
+
+    :param file_name: file name in output storage
+    :type file_name: str
+    :return: number of restored output layers
+    :rtype: int
+    """
+    archive_storage = select_output_archive_storage()
+    archive_file_name = output_archive_file_path(file_name)
+    restored_layers = OutputLayer.objects.filter(
+        file=file_name,
+        storage_tier__in=[
+            OutputLayer.StorageTiers.ARCHIVED,
+            OutputLayer.StorageTiers.RESTORING
+        ]
+    )
+    try:
+        copy_storage_file(
+            archive_storage, archive_file_name,
+            get_output_storage(), file_name
+        )
+    except Exception:
+        restored_layers.update(
+            storage_tier=OutputLayer.StorageTiers.ARCHIVED)
+        raise
+    total = restored_layers.update(
+        storage_tier=OutputLayer.StorageTiers.STANDARD,
+        archived_on=None
+    )
+    archive_storage.delete(archive_file_name)
+    return total
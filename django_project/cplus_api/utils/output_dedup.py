@@ -0,0 +1,61 @@
+"""Deduplication of intermediate outputs of scenario analysis.
+
+Each intermediate output is stored as OutputLayer with the checksum of
+the file produced by the analysis. When a re-run produces an identical
+file, the stored output of the same user is referenced instead of being
+converted to COG and uploaded again.
+
+Only the upload is deduplicated: every stage is still computed by the
+analysis in cplus-core, which runs the whole pipeline in one call and
+has no hook to skip a stage or load its output.
+"""
+from django.utils import timezone
+
+from cplus_api.models.layer import OutputLayer
+
+
+def find_stored_output(owner, group, content_hash):
+    """Find stored intermediate output with the same file checksum.
+
+    :param owner: owner of the output
+    :type owner: User
+    :param group: output group
+    :type group: str
+    :param content_hash: sha256 of the output file
+    :type content_hash: str
+    :return: output layer or None
+    :rtype: OutputLayer
+    """
+    return OutputLayer.objects.filter(
+        owner=owner,
+        group=group,
+        content_hash=content_hash,
+        is_deleted=False,
+        is_final_output=False,
+        storage_tier=OutputLayer.StorageTiers.STANDARD
+    ).exclude(file='').order_by('-created_on').first()
+
+
+def clone_stored_output(stored_output: OutputLayer, scenario_task):
+    """Create output layer of scenario that references stored file.
+
+    :param stored_output: stored intermediate output
+    :type stored_output: OutputLayer
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :return: new output layer
+    :rtype: OutputLayer
+    """
+    return OutputLayer.objects.create(
+        name=stored_output.name,
+        created_on=timezone.now(),
+        owner=scenario_task.submitted_by,
+        layer_type=stored_output.layer_type,
+        size=stored_output.size,
+        is_final_output=False,
+        scenario=scenario_task,
+        group=stored_output.group,
+        file=stored_output.file.name,
+        output_meta=stored_output.output_meta,
+        content_hash=stored_output.content_hash
+    )
@@ -0,0 +1,249 @@
+"""Server-side copy of large S3 objects.
+
+Objects larger than a part are copied using multipart upload with
+UploadPartCopy, the parts are copied concurrently in the S3 server and
+the result is verified against the source object. Multipart source is
+copied with its own part layout, so the copy has the same ETag.
+"""
+import math
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+# limits of S3 multipart upload
+S3_MIN_PART_SIZE = 5 * 1024 ** 2
+S3_MAX_PART_SIZE = 5 * 1024 ** 3
+S3_MAX_PARTS = 10000
+# headers of the source object that are kept in multipart copy,
+# copy_object keeps them with the default COPY metadata directive
+OBJECT_HEADER_KEYS = [
+    'ContentType',
+    'ContentEncoding',
+    'ContentDisposition',
+    'ContentLanguage',
+    'CacheControl',
+    'Metadata'
+]
+# encryption of the source object, both copy methods use the bucket
+# default encryption when it is not set
+ENCRYPTION_KEYS = [
+    'ServerSideEncryption',
+    'SSEKMSKeyId',
+    'BucketKeyEnabled'
+]
+
+
+def get_copy_part_ranges(size, part_size):
+    """Split object size into byte ranges of parts.
+
+    :param size: object size in bytes
+    :type size: int
+    :param part_size: preferred part size in bytes
+    :type part_size: int
+    :return: list of (part number, first byte, last byte)
+    :rtype: list
+    """
+    part_size = max(
+        part_size, S3_MIN_PART_SIZE, math.ceil(size / S3_MAX_PARTS))
+    part_size = min(part_size, S3_MAX_PART_SIZE)
+    ranges = []
+    start = 0
+    while start < size:
+        end = min(start + part_size, size) - 1
+        ranges.append((len(ranges) + 1, start, end))
+        start = end + 1
+    return ranges
+
+
+def get_etag_part_count(etag):
+    """Return number of parts from ETag of multipart object.
+
+    :param etag: ETag of S3 object
+    :type etag: str
+    :return: number of parts, 0 if object is not multipart
+    :rtype: int
+    """
+    etag = etag.strip('"')
+    if '-' not in etag:
+        return 0
+    try:
+        return int(etag.rsplit('-', 1)[1])
+    except ValueError:
+        return 0
+
+
+def compute_multipart_etag(part_etags):
+    """Compute ETag of multipart object from ETag of its parts.
+
+    :param part_etags: ETag of parts in order of part number
+    :type part_etags: list
+    :return: ETag of multipart object
+    :rtype: str
+    """
+    digests = b''.join(
+        bytes.fromhex(etag.strip('"')) for etag in part_etags
+    )
+    return f'"{hashlib.md5(digests).hexdigest()}-{len(part_etags)}"'
+
+
+def is_md5_etag(head):
+    """Check whether ETag of object is based on MD5 of its content.
+
+    ETag of object that is encrypted with SSE-KMS or SSE-C is not.
+
+    :param head: response of head_object
+    :type head: dict
+    :return: True if ETag can be compared
+    :rtype: bool
+    """
+    if head.get('SSECustomerAlgorithm'):
+        return False
+    return not head.get('ServerSideEncryption', '').startswith('aws:kms')
+
+
+def get_copy_args(head, keys, extra_args):
+    """Return object parameters of the copy from the source object.
+
+    :param head: response of head_object of the source
+    :type head: dict
+    :param keys: keys of head to keep
+    :type keys: list
+    :param extra_args: parameters that override the source
+    :type extra_args: dict
+    :return: object parameters
+    :rtype: dict
+    """
+    copy_args = {key: head[key] for key in keys if head.get(key)}
+    copy_args.update(extra_args)
+    return copy_args
+
+
+def get_source_part_size(boto3_client, bucket, key, head):
+    """Return part size of multipart source object.
+
+    :param boto3_client: S3 client
+    :type boto3_client: botocore.client.S3
+    :param bucket: bucket name
+    :type bucket: str
+    :param key: object key
+    :type key: str
+    :param head: response of head_object of the source
+    :type head: dict
+    :return: size of first part, or None if source is not multipart
+    :rtype: int
+    """
+    part_count = get_etag_part_count(head['ETag'])
+    if part_count < 2:
+        return None
+    part_size = boto3_client.head_object(
+        Bucket=bucket, Key=key, PartNumber=1)['ContentLength']
+    if math.ceil(head['ContentLength'] / part_size) != part_count:
+        # parts of the source are not the same size
+        return None
+    return part_size
+
+
+def multipart_copy(boto3_client, source_bucket, source_key,
+                   target_bucket, target_key, extra_args=None):
+    """Copy S3 object in the server using concurrent UploadPartCopy.
+
+    Parts are copied only if the source is not modified during the
+    copy. Multipart upload is aborted when any part fails. Content
+    headers, metadata and encryption of the source are kept unless
+    they are set in extra_args. The copy is verified by its ETag.
+
+    :param boto3_client: S3 client
+    :type boto3_client: botocore.client.S3
+    :param source_bucket: source bucket name
+    :type source_bucket: str
+    :param source_key: source object key
+    :type source_key: str
+    :param target_bucket: target bucket name
+    :type target_bucket: str
+    :param target_key: target object key
+    :type target_key: str
+    :param extra_args: object parameters of the target, e.g. StorageClass
+    :type extra_args: dict
+    :raises RuntimeError: when target does not match the source
+    :return: size of copied object
+    :rtype: int
+    """
+    extra_args = extra_args or {}
+    head = boto3_client.head_object(Bucket=source_bucket, Key=source_key)
+    size = head['ContentLength']
+    copy_source = {
+        'Bucket': source_bucket,
+        'Key': source_key
+    }
+    part_size = settings.S3_COPY_PART_SIZE
+    source_part_size = get_source_part_size(
+        boto3_client, source_bucket, source_key, head)
+    expected_etag = head['ETag']
+    if not get_etag_part_count(head['ETag']) and size <= part_size:
+        boto3_client.copy_object(
+            CopySource=copy_source,
+            CopySourceIfMatch=head['ETag'],
+            Bucket=target_bucket,
+            Key=target_key,
+            **get_copy_args(head, ENCRYPTION_KEYS, extra_args)
+        )
+    else:
+        upload_id = boto3_client.create_multipart_upload(
+            Bucket=target_bucket,
+            Key=target_key,
+            **get_copy_args(
+                head, OBJECT_HEADER_KEYS + ENCRYPTION_KEYS, extra_args)
+        )['UploadId']
+
+        def copy_part(part_range):
+            part_number, first_byte, last_byte = part_range
+            response = boto3_client.upload_part_copy(
+                Bucket=target_bucket,
+                Key=target_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                CopySource=copy_source,
+                CopySourceRange=f'bytes={first_byte}-{last_byte}',
+                CopySourceIfMatch=head['ETag']
+            )
+            return {
+                'PartNumber': part_number,
+                'ETag': response['CopyPartResult']['ETag']
+            }
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=settings.S3_COPY_MAX_CONCURRENCY
+            ) as executor:
+                parts = list(executor.map(
+                    copy_part,
+                    get_copy_part_ranges(size, source_part_size or part_size)
+                ))
+            boto3_client.complete_multipart_upload(
+                Bucket=target_bucket,
+                Key=target_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            logger.error(f'Failed multipart copy of {source_key}')
+            boto3_client.abort_multipart_upload(
+                Bucket=target_bucket, Key=target_key, UploadId=upload_id)
+            raise
+        if source_part_size is None:
+            expected_etag = compute_multipart_etag(
+                [part['ETag'] for part in parts])
+    copied = boto3_client.head_object(Bucket=target_bucket, Key=target_key)
+    if copied['ContentLength'] != size:
+        raise RuntimeError(
+            f'Size of copied {target_key} does not match {source_key}')
+    if (
+        is_md5_etag(head) and is_md5_etag(copied) and
+        copied['ETag'] != expected_etag
+    ):
+        raise RuntimeError(
+            f'ETag of copied {target_key} does not match {source_key}')
+    return size
@@ -0,0 +1,155 @@
+"""Reuse outputs of an identical completed scenario run."""
+import hashlib
+import json
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models.base_task_request import TaskStatus
+from cplus_api.models.layer import InputLayer, OutputLayer
+from cplus_api.models.scenario import ScenarioTask
+from cplus_api.utils.api_helper import CustomJsonEncoder
+from cplus_api.utils.estimator import get_scenario_layer_uuids
+
+
+logger = logging.getLogger(__name__)
+# keys in scenario detail that do not change the analysis result
+FINGERPRINT_EXCLUDED_KEYS = ['scenario_name', 'scenario_desc']
+
+
+def get_code_version():
+    """Return version of the analysis code.
+
+    :return: release version and commit hash
+    :rtype: str
+    """
+    return f"{settings.CODE_RELEASE_VERSION}-{settings.CODE_COMMIT_HASH}"
+
+
+def get_content_hash(payload):
+    """Return sha256 of canonical JSON representation of payload.
+
+    :param payload: JSON serializable object
+    :type payload: dict
+    :return: sha256 hex digest
+    :rtype: str
+    """
+    canonical = json.dumps(
+        payload, sort_keys=True, separators=(',', ':'),
+        cls=CustomJsonEncoder
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def get_scenario_fingerprint(detail, code_version=None):
+    """Return canonical fingerprint of scenario analysis.
+
+    Fingerprint is computed from scenario detail, the modified_on of
+    referenced input layers and the code version.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :param code_version: code version, defaults to current version
+    :type code_version: str, optional
+    :return: sha256 hex digest
+    :rtype: str
+    """
+    if code_version is None:
+        code_version = get_code_version()
+    layers = InputLayer.objects.filter(
+        uuid__in=get_scenario_layer_uuids(detail)
+    ).values_list('uuid', 'modified_on')
+    payload = {
+        'detail': {
+            key: value for key, value in detail.items()
+            if key not in FINGERPRINT_EXCLUDED_KEYS
+        },
+        'layers': sorted(
+            [str(layer_uuid), modified_on]
+            for layer_uuid, modified_on in layers
+        ),
+        'code_version': code_version
+    }
+    return get_content_hash(payload)
+
+
+def find_reusable_scenario(scenario_task: ScenarioTask):
+    """Find completed scenario with the same fingerprint.
+
+    Only scenarios from the same user whose output layers are not
+    removed can be reused.
+
+    :param scenario_task: scenario task object with fingerprint
+    :type scenario_task: ScenarioTask
+    :return: completed scenario task or None
+    :rtype: ScenarioTask
+    """
+    if not scenario_task.fingerprint:
+        return None
+    candidates = ScenarioTask.objects.filter(
+        fingerprint=scenario_task.fingerprint,
+        submitted_by=scenario_task.submitted_by,
+        status=TaskStatus.COMPLETED
+    ).exclude(
+        id=scenario_task.id
+    ).order_by('-finished_at')
+    for candidate in candidates:
+        output_layers = OutputLayer.objects.filter(scenario=candidate)
+        if not output_layers.exists():
+            continue
+        if output_layers.filter(is_deleted=True).exists():
+            continue
+        return candidate
+    return None
+
+
+def clone_scenario_outputs(source: ScenarioTask, target: ScenarioTask):
+    """Complete target scenario using output layers of source.
+
+    Output layers are cloned by copying the storage reference,
+    the files are shared and removed when no layer references them.
+
+    :param source: completed scenario task
+    :type source: ScenarioTask
+    :param target: scenario task to be completed
+    :type target: ScenarioTask
+    :return: number of cloned output layers
+    :rtype: int
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        OutputLayer.objects.filter(scenario=target).delete()
+        cloned_layers = [
+            OutputLayer(
+                name=output_layer.name,
+                created_on=now,
+                owner=target.submitted_by,
+                layer_type=output_layer.layer_type,
+                size=output_layer.size,
+                is_final_output=output_layer.is_final_output,
+                group=output_layer.group,
+                scenario=target,
+                file=output_layer.file.name,
+                output_meta=output_layer.output_meta,
+                content_hash=output_layer.content_hash,
+                storage_tier=output_layer.storage_tier,
+                archived_on=output_layer.archived_on
+            ) for output_layer in OutputLayer.objects.filter(
+                scenario=source
+            ).iterator(chunk_size=500)
+        ]
+        OutputLayer.objects.bulk_create(cloned_layers, batch_size=500)
+        target.task_id = None
+        target.started_at = now
+        target.updated_detail = source.updated_detail
+        target.code_version = source.code_version
+        target.save(update_fields=[
+            'task_id', 'started_at', 'updated_detail', 'code_version'
+        ])
+        target.add_log(
+            f'Reused {len(cloned_layers)} output layers from '
+            f'scenario {source.uuid}.'
+        )
+        target.task_on_completed()
+    return len(cloned_layers)
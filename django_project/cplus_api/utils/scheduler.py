@@ -0,0 +1,232 @@
+"""Priority and fair-share scheduler for scenario tasks.
+
+Executed scenarios wait in the scheduler (status Pending with
+scheduled_on) and are sent to Celery by dispatch_scenario_tasks when
+their queue has free capacity and the user is below the concurrency cap.
+Task whose scheduled_on is in the future is not dispatched before that.
+Tasks are dispatched by priority (from user role) and waiting time.
+"""
+import logging
+from functools import partial
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core.models.base_task_request import TaskStatus, READ_ONLY_STATUS
+from core.models.preferences import (
+    SitePreferences,
+    default_scheduler_config
+)
+from cplus_api.models.profile import UserProfile
+from cplus_api.models.scenario import ScenarioTask
+from cplus_api.tasks.runner import run_scenario_analysis_task
+from cplus_api.utils.estimator import get_extent_area_km2
+
+
+logger = logging.getLogger(__name__)
+DEFAULT_QUEUE = 'cplus'
+FAST_QUEUE = 'cplus_fast'
+
+
+def get_scheduler_config():
+    """Return scheduler config from site preferences.
+
+    :return: scheduler config with default values
+    :rtype: dict
+    """
+    config = default_scheduler_config()
+    config.update(SitePreferences.preferences().scheduler_config or {})
+    return config
+
+
+def get_user_priority(user, config):
+    """Return priority of user based on user role.
+
+    :param user: user object
+    :type user: User
+    :param config: scheduler config
+    :type config: dict
+    :return: priority value
+    :rtype: int
+    """
+    user_profile = UserProfile.objects.filter(
+        user=user
+    ).select_related('role').first()
+    if not user_profile or not user_profile.role:
+        return 0
+    return config['role_priority'].get(user_profile.role.name, 0)
+
+
+def select_queue(scenario_task: ScenarioTask, config):
+    """Select queue based on estimated runtime or scenario extent.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :param config: scheduler config
+    :type config: dict
+    :return: queue name
+    :rtype: str
+    """
+    runtime = scenario_task.cost_estimate.get('runtime_seconds', None)
+    if runtime is not None:
+        if runtime <= config['fast_lane_max_runtime_seconds']:
+            return FAST_QUEUE
+        return DEFAULT_QUEUE
+    area = get_extent_area_km2(scenario_task.detail)
+    if area is not None and area <= config['fast_lane_max_area_km2']:
+        return FAST_QUEUE
+    return DEFAULT_QUEUE
+
+
+def is_waiting(scenario_task: ScenarioTask):
+    """Check whether scenario task is waiting in the scheduler.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :return: True if task is waiting to be dispatched
+    :rtype: bool
+    """
+    return (
+        scenario_task.status == TaskStatus.PENDING and
+        scenario_task.scheduled_on is not None
+    )
+
+
+def get_waiting_tasks():
+    """Return queryset of scenario tasks in the scheduler.
+
+    :return: waiting scenario tasks
+    :rtype: QuerySet
+    """
+    return ScenarioTask.objects.filter(
+        status=TaskStatus.PENDING,
+        scheduled_on__isnull=False
+    )
+
+
+def get_queue_position(scenario_task: ScenarioTask):
+    """Estimate position of scenario task in its queue.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :return: 1-based position or None if task is not waiting
+    :rtype: int
+    """
+    if not is_waiting(scenario_task):
+        return None
+    return get_waiting_tasks().filter(
+        queue=scenario_task.queue
+    ).filter(
+        Q(priority__gt=scenario_task.priority) |
+        Q(
+            priority=scenario_task.priority,
+            scheduled_on__lt=scenario_task.scheduled_on
+        )
+    ).count() + 1
+
+
+def schedule_scenario_task(scenario_task: ScenarioTask, not_before=None):
+    """Put scenario task to the scheduler.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :param not_before: the task is not dispatched before this time
+    :type not_before: datetime
+    """
+    config = get_scheduler_config()
+    scenario_task.status = TaskStatus.PENDING
+    scenario_task.priority = get_user_priority(
+        scenario_task.submitted_by, config)
+    scenario_task.queue = select_queue(scenario_task, config)
+    scenario_task.scheduled_on = not_before or timezone.now()
+    scenario_task.last_update = timezone.now()
+    scenario_task.save(update_fields=[
+        'status', 'priority', 'queue', 'scheduled_on', 'last_update'
+    ])
+    scenario_task.add_log(
+        f'Task is scheduled to queue {scenario_task.queue} '
+        f'with priority {scenario_task.priority}.'
+    )
+
+
+def unschedule_scenario_task(scenario_task: ScenarioTask):
+    """Remove waiting scenario task from the scheduler.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    """
+    scenario_task.scheduled_on = None
+    scenario_task.save(update_fields=['scheduled_on'])
+
+
+def send_scenario_task(scenario_task: ScenarioTask):
+    """Send scenario task to celery queue.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    """
+    result = run_scenario_analysis_task.apply_async(
+        (scenario_task.id,), queue=scenario_task.queue)
+    scenario_task.task_id = result.id
+
+
+def dispatch_scenario_tasks():
+    """Send waiting scenario tasks to celery based on available slots.
+
+    Waiting rows are locked, so concurrent dispatchers are serialized.
+
+    :return: dispatched scenario tasks
+    :rtype: list
+    """
+    config = get_scheduler_config()
+    max_per_user = config['max_running_per_user']
+    dispatched = []
+    with transaction.atomic():
+        waiting_tasks = list(
+            get_waiting_tasks().filter(
+                scheduled_on__lte=timezone.now()
+            ).select_for_update().order_by(
+                '-priority', 'scheduled_on', 'id'
+            )
+        )
+        if not waiting_tasks:
+            return dispatched
+        # tiled scenario does not occupy a worker, its tiles do and
+        # they count to the cap of the scenario owner
+        active_tasks = ScenarioTask.objects.filter(
+            status__in=READ_ONLY_STATUS,
+            is_tiled=False
+        )
+        user_counts = dict(
+            active_tasks.values('submitted_by').annotate(
+                total=Count('id')
+            ).values_list('submitted_by', 'total')
+        )
+        queue_counts = dict(
+            active_tasks.values('queue').annotate(
+                total=Count('id')
+            ).values_list('queue', 'total')
+        )
+        for scenario_task in waiting_tasks:
+            capacity = config['queue_capacity'].get(scenario_task.queue, 1)
+            if queue_counts.get(scenario_task.queue, 0) >= capacity:
+                continue
+            user_id = scenario_task.submitted_by_id
+            if max_per_user and user_counts.get(user_id, 0) >= max_per_user:
+                continue
+            scenario_task.scheduled_on = None
+            scenario_task.status = TaskStatus.QUEUED
+            scenario_task.last_update = timezone.now()
+            scenario_task.save(
+                update_fields=['scheduled_on', 'status', 'last_update'])
+            scenario_task.cache_state()
+            scenario_task.publish_status()
+            queue_counts[scenario_task.queue] = (
+                queue_counts.get(scenario_task.queue, 0) + 1
+            )
+            user_counts[user_id] = user_counts.get(user_id, 0) + 1
+            dispatched.append(scenario_task)
+            transaction.on_commit(partial(send_scenario_task, scenario_task))
+    if dispatched:
+        logger.info(f'Dispatched {len(dispatched)} scenario tasks')
+    return dispatched
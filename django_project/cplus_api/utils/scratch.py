@@ -0,0 +1,508 @@
+"""Scratch space manager for scenario working directories.
+
+Working directories are created in SCRATCH_DIR, which can be a fast
+local volume (tmpfs or NVMe). Before a scenario starts, its estimated
+disk usage is reserved in a ledger file in SCRATCH_DIR, and the task
+fails fast when the reservation does not fit the free disk space or
+SCRATCH_QUOTA_GB. Ingestion of uploaded layers reserves its working
+directory in the same ledger. Reservations and directories that are left behind
+by a killed worker process are removed when the worker starts or when
+the next scenario reserves space in the same host, and a periodic
+reaper removes directories of finished or unknown tasks.
+"""
+import os
+import json
+import uuid
+import fcntl
+import shutil
+import socket
+import logging
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils import timezone
+
+from core.models.base_task_request import TaskStatus, READ_ONLY_STATUS
+from cplus_api.models.layer import InputLayer
+from cplus_api.models.scenario import ScenarioTask
+
+
+logger = logging.getLogger(__name__)
+SCRATCH_LEDGER_FILE = '.scratch_reservations.json'
+SCRATCH_LOCK_FILE = '.scratch.lock'
+BATCH_DIR_PREFIX = 'batch_'
+INGESTION_DIR_PREFIX = 'ingest_'
+GB = 1024 ** 3
+
+
+class ScratchQuotaExceeded(RuntimeError):
+    """Raised when scratch space cannot be reserved for a scenario."""
+
+
+def get_scratch_usage(path):
+    """Return total size of files in a directory.
+
+    :param path: directory path
+    :type path: str
+    :return: size in bytes
+    :rtype: int
+    """
+    total = 0
+    if not os.path.exists(path):
+        return total
+    for dir_path, _, files in os.walk(path):
+        for file in files:
+            file_path = os.path.join(dir_path, file)
+            if os.path.islink(file_path):
+                continue
+            try:
+                total += os.stat(file_path).st_size
+            except OSError:
+                # file is removed while walking the directory
+                continue
+    return total
+
+
+def is_process_alive(pid):
+    """Check whether process is running in this host.
+
+    :param pid: process id
+    :type pid: int
+    :return: True if process exists
+    :rtype: bool
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def scratch_ledger(create=True):
+    """Open reservation ledger with an exclusive lock.
+
+    Changes to the yielded dictionary are written back on exit.
+
+    :param create: create the ledger if it does not exist
+    :type create: bool
+    :return: dictionary of scenario uuid and reservation,
+        or None when ledger does not exist and create is False
+    :rtype: dict
+    """
+    ledger_path = os.path.join(settings.SCRATCH_DIR, SCRATCH_LEDGER_FILE)
+    if not create and not os.path.exists(ledger_path):
+        yield None
+        return
+    os.makedirs(settings.SCRATCH_DIR, exist_ok=True)
+    lock_path = os.path.join(settings.SCRATCH_DIR, SCRATCH_LOCK_FILE)
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            ledger = {}
+            if os.path.exists(ledger_path):
+                try:
+                    with open(ledger_path, 'r') as f:
+                        ledger = json.load(f)
+                except ValueError:
+                    logger.warning('Invalid scratch ledger is reset.')
+            yield ledger
+            tmp_path = f'{ledger_path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(ledger, f)
+            os.replace(tmp_path, ledger_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def prune_dead_reservations(ledger):
+    """Remove reservations of dead processes in this host.
+
+    :param ledger: reservation ledger
+    :type ledger: dict
+    :return: list of removed scenario uuid
+    :rtype: list
+    """
+    hostname = socket.gethostname()
+    removed = []
+    for key, entry in list(ledger.items()):
+        if entry['hostname'] != hostname:
+            continue
+        if is_process_alive(entry['pid']):
+            continue
+        ledger.pop(key)
+        removed.append(key)
+    return removed
+
+
+def get_required_scratch_bytes(scenario_task: ScenarioTask):
+    """Return disk space to reserve for the scenario.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :return: size in bytes
+    :rtype: int
+    """
+    disk_bytes = (scenario_task.cost_estimate or {}).get('disk_bytes', 0)
+    return int(disk_bytes * settings.SCRATCH_RESERVE_FACTOR)
+
+
+def reserve_scratch_space(key, required, path):
+    """Reserve scratch space in the ledger of this host.
+
+    Space that is reserved but not used yet by other reservations is
+    deducted from free disk space.
+
+    :param key: reservation key
+    :type key: str
+    :param required: size to reserve in bytes
+    :type required: int
+    :param path: directory that uses the reservation
+    :type path: str
+    :raises ScratchQuotaExceeded: when there is not enough scratch space
+    :return: reserved size in bytes
+    :rtype: int
+    """
+    with scratch_ledger() as ledger:
+        released = prune_dead_reservations(ledger)
+        if released:
+            # killed process does not remove its own directory
+            remove_orphan_directories(
+                released,
+                grace_seconds=settings.SCRATCH_REAPER_GRACE_SECONDS
+            )
+        ledger.pop(key, None)
+        reserved = sum(entry['bytes'] for entry in ledger.values())
+        pending = sum(
+            max(entry['bytes'] - get_scratch_usage(entry['path']), 0)
+            for entry in ledger.values()
+        )
+        available = shutil.disk_usage(settings.SCRATCH_DIR).free - pending
+        if required > available:
+            raise ScratchQuotaExceeded(
+                f'Not enough scratch space: {required / GB:.1f}GB is '
+                f'required, available {available / GB:.1f}GB.'
+            )
+        quota = settings.SCRATCH_QUOTA_GB * GB
+        if quota and reserved + required > quota:
+            raise ScratchQuotaExceeded(
+                f'Scratch quota of {settings.SCRATCH_QUOTA_GB}GB exceeded: '
+                f'{required / GB:.1f}GB is required, '
+                f'{reserved / GB:.1f}GB is reserved by running tasks.'
+            )
+        ledger[key] = {
+            'bytes': required,
+            'path': path,
+            'pid': os.getpid(),
+            'hostname': socket.gethostname(),
+            'reserved_on': timezone.now().isoformat()
+        }
+    return required
+
+
+def release_scratch_space(key):
+    """Release scratch reservation.
+
+    :param key: reservation key
+    :type key: str
+    :return: removed reservation or None
+    :rtype: dict
+    """
+    with scratch_ledger(create=False) as ledger:
+        if ledger is None:
+            return None
+        return ledger.pop(key, None)
+
+
+def reserve_scratch(scenario_task: ScenarioTask):
+    """Reserve scratch space for the scenario before it starts.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :raises ScratchQuotaExceeded: when there is not enough scratch space
+    :return: reserved size in bytes
+    :rtype: int
+    """
+    return reserve_scratch_space(
+        str(scenario_task.uuid),
+        get_required_scratch_bytes(scenario_task),
+        scenario_task.get_resources_path()
+    )
+
+
+def release_scratch(scenario_task: ScenarioTask):
+    """Release scratch reservation of the scenario.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :return: removed reservation or None
+    :rtype: dict
+    """
+    return release_scratch_space(str(scenario_task.uuid))
+
+
+def get_ingestion_scratch_key(input_layer: InputLayer):
+    """Return reservation key of input layer ingestion.
+
+    The key is also the name of its working directory.
+
+    :param input_layer: input layer
+    :type input_layer: InputLayer
+    :return: reservation key
+    :rtype: str
+    """
+    return f'{INGESTION_DIR_PREFIX}{str(input_layer.uuid)}'
+
+
+def get_ingestion_scratch_path(input_layer: InputLayer):
+    """Return working directory of input layer ingestion.
+
+    :param input_layer: input layer
+    :type input_layer: InputLayer
+    :return: directory path
+    :rtype: str
+    """
+    return os.path.join(
+        settings.SCRATCH_DIR,
+        str(input_layer.owner_id),
+        get_ingestion_scratch_key(input_layer)
+    )
+
+
+def log_scratch_usage(scenario_task: ScenarioTask):
+    """Add scratch usage of the scenario to task log.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :return: size in bytes
+    :rtype: int
+    """
+    used = get_scratch_usage(scenario_task.get_resources_path())
+    required = get_required_scratch_bytes(scenario_task)
+    scenario_task.add_log(
+        f'Scratch usage {used / GB:.2f}GB of reserved {required / GB:.2f}GB.'
+    )
+    if required and used > required:
+        logger.warning(
+            f'Scenario {scenario_task.uuid} uses more scratch space '
+            'than reserved.'
+        )
+    return used
+
+
+def parse_uuid(value):
+    """Return UUID from directory name.
+
+    :param value: directory name
+    :type value: str
+    :return: UUID or None if value is not a valid UUID
+    :rtype: uuid.UUID
+    """
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        return None
+
+
+def find_resource_directories():
+    """Scan scenario and batch directories in the per-user tree.
+
+    :return: list of (kind, uuid, path) where kind is scenario, batch
+        or ingestion
+    :rtype: list
+    """
+    results = []
+    if not os.path.isdir(settings.SCRATCH_DIR):
+        return results
+    for user_dir in os.scandir(settings.SCRATCH_DIR):
+        if not user_dir.is_dir() or not user_dir.name.isdigit():
+            continue
+        for resource_dir in os.scandir(user_dir.path):
+            if not resource_dir.is_dir(follow_symlinks=False):
+                continue
+            name = resource_dir.name
+            kind = 'scenario'
+            if name.startswith(BATCH_DIR_PREFIX):
+                kind = 'batch'
+                name = name[len(BATCH_DIR_PREFIX):]
+            elif name.startswith(INGESTION_DIR_PREFIX):
+                kind = 'ingestion'
+                name = name[len(INGESTION_DIR_PREFIX):]
+            resource_uuid = parse_uuid(name)
+            if resource_uuid is None:
+                continue
+            results.append((kind, str(resource_uuid), resource_dir.path))
+    return results
+
+
+def get_active_resource_uuids(directories):
+    """Return uuid of scenarios, batches and layers that are in use.
+
+    :param directories: list from find_resource_directories
+    :type directories: list
+    :return: set of scenario uuid, set of batch uuid and set of
+        uuid of layers in ingestion
+    :rtype: tuple
+    """
+    scenario_uuids = [
+        value for kind, value, _ in directories if kind == 'scenario'
+    ]
+    batch_uuids = [
+        value for kind, value, _ in directories if kind == 'batch'
+    ]
+    active_scenarios = set()
+    if scenario_uuids:
+        active_scenarios = set(
+            str(value) for value in ScenarioTask.objects.filter(
+                uuid__in=scenario_uuids,
+                status__in=READ_ONLY_STATUS
+            ).values_list('uuid', flat=True)
+        )
+    active_batches = set()
+    if batch_uuids:
+        # same condition as is_batch_active
+        active_batches = set(
+            str(value) for value in ScenarioTask.objects.filter(
+                batch__uuid__in=batch_uuids,
+                status__in=READ_ONLY_STATUS + [TaskStatus.PENDING]
+            ).exclude(
+                status=TaskStatus.PENDING,
+                scheduled_on__isnull=True
+            ).values_list('batch__uuid', flat=True).distinct()
+        )
+    layer_uuids = [
+        value for kind, value, _ in directories if kind == 'ingestion'
+    ]
+    active_ingestions = set()
+    if layer_uuids:
+        active_ingestions = get_ingesting_layer_uuids(layer_uuids)
+    return active_scenarios, active_batches, active_ingestions
+
+
+def get_ingesting_layer_uuids(layer_uuids):
+    """Return uuid of layers whose ingestion is in progress.
+
+    :param layer_uuids: list of input layer uuid
+    :type layer_uuids: list
+    :return: set of input layer uuid
+    :rtype: set
+    """
+    return set(
+        str(value) for value in InputLayer.objects.filter(
+            uuid__in=layer_uuids,
+            ingestion_status=InputLayer.IngestionStatus.PROCESSING
+        ).values_list('uuid', flat=True)
+    )
+
+
+def remove_orphan_directories(released=None, grace_seconds=0):
+    """Remove scenario, batch and ingestion directories not in use.
+
+    Directory is removed when its scenario is finished, cancelled or
+    unknown, when its batch has no active scenario, or when its layer
+    is not in ingestion. Directories that are modified within
+    grace_seconds are kept, except for released reservations whose
+    process is dead.
+
+    :param released: reservation keys whose process is dead
+    :type released: list
+    :param grace_seconds: minimum age of the directory
+    :type grace_seconds: int
+    :return: list of (directory path, size in bytes)
+    :rtype: list
+    """
+    released = released or []
+    directories = find_resource_directories()
+    active_scenarios, active_batches, active_ingestions = (
+        get_active_resource_uuids(directories)
+    )
+    cutoff = timezone.now().timestamp() - grace_seconds
+    removed = []
+    for kind, resource_uuid, path in directories:
+        is_released = os.path.basename(path) in released
+        if kind == 'batch':
+            is_active = resource_uuid in active_batches
+        elif kind == 'ingestion':
+            is_active = (
+                resource_uuid in active_ingestions and not is_released
+            )
+        else:
+            is_active = (
+                resource_uuid in active_scenarios and not is_released
+            )
+        if is_active:
+            continue
+        if not is_released:
+            try:
+                if os.stat(path).st_mtime > cutoff:
+                    continue
+            except OSError:
+                continue
+        size = get_scratch_usage(path)
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append((path, size))
+    return removed
+
+
+def reap_scratch_directories():
+    """Remove orphan directories that are older than the grace period.
+
+    :return: tuple of total removed directories and reclaimed bytes
+    :rtype: tuple
+    """
+    removed = remove_orphan_directories(
+        grace_seconds=settings.SCRATCH_REAPER_GRACE_SECONDS)
+    reclaimed = sum(size for _, size in removed)
+    logger.info(
+        f'Scratch reaper removed {len(removed)} directories, '
+        f'reclaimed {reclaimed / GB:.2f}GB.'
+    )
+    return len(removed), reclaimed
+
+
+def reconcile_scratch():
+    """Remove reservations and directories left by killed tasks.
+
+    Reservation is released when its process in this host is dead, or
+    when the scenario or layer ingestion from other host is no longer
+    running.
+
+    :return: tuple of released reservations and removed directories
+    :rtype: tuple
+    """
+    if not os.path.isdir(settings.SCRATCH_DIR):
+        return [], []
+    with scratch_ledger() as ledger:
+        released = prune_dead_reservations(ledger)
+        other_keys = [
+            key for key in ledger.keys() if key not in released
+        ]
+        ingestion_keys = [
+            key for key in other_keys if key.startswith(INGESTION_DIR_PREFIX)
+        ]
+        active_keys = set(
+            str(value) for value in ScenarioTask.objects.filter(
+                uuid__in=[
+                    key for key in other_keys if key not in ingestion_keys
+                ],
+                status__in=READ_ONLY_STATUS
+            ).values_list('uuid', flat=True)
+        )
+        active_keys.update(
+            f'{INGESTION_DIR_PREFIX}{value}' for value in
+            get_ingesting_layer_uuids([
+                key[len(INGESTION_DIR_PREFIX):] for key in ingestion_keys
+            ])
+        )
+        for key in other_keys:
+            if key not in active_keys:
+                ledger.pop(key)
+                released.append(key)
+        removed = remove_orphan_directories(released)
+    if released or removed:
+        logger.info(
+            f'Scratch reconciliation released {len(released)} '
+            f'reservations and removed {len(removed)} directories.'
+        )
+    return released, removed
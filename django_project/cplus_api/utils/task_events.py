@@ -0,0 +1,292 @@
+"""Publish and stream scenario task events through Redis pub/sub.
+
+The stream is served by the ASGI application (see core/asgi.py) using
+an asyncio Redis subscriber, so open streams do not hold uWSGI workers.
+The synchronous stream is kept as a short fallback for WSGI servers.
+"""
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from core.models.base_task_request import COMPLETED_STATUS
+from core.tools.redis_client import (
+    get_redis_client,
+    get_async_redis_client
+)
+from cplus_api.utils.api_helper import CustomJsonEncoder
+
+logger = logging.getLogger(__name__)
+
+EVENT_STATUS = 'status'
+EVENT_PROGRESS = 'progress'
+EVENT_PROGRESS_TEXT = 'progress_text'
+EVENT_LOG = 'log'
+KEEP_ALIVE_IN_SECONDS = 10
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Renderer so that text/event-stream passes content negotiation.
+
+    The stream itself is not rendered, only error responses that are
+    returned before the stream is started, which are rendered as JSON.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, cls=CustomJsonEncoder).encode(self.charset)
+
+
+def get_scenario_channel(scenario_uuid):
+    """Return pub/sub channel name of a scenario task.
+
+    :param scenario_uuid: UUID of scenario task
+    :type scenario_uuid: str
+    :return: channel name
+    :rtype: str
+    """
+    return f'cplus:scenario:{str(scenario_uuid)}:events'
+
+
+def publish_scenario_event(scenario_uuid, event_type, data):
+    """Publish scenario event to the subscribers.
+
+    Failure to publish should never break the running task, hence
+    all errors are logged and ignored.
+
+    :param scenario_uuid: UUID of scenario task
+    :type scenario_uuid: str
+    :param event_type: type of the event
+    :type event_type: str
+    :param data: event payload
+    :type data: dict
+    :return: True if event is published
+    :rtype: bool
+    """
+    if not settings.TASK_EVENT_STREAM_ENABLED:
+        return False
+    payload = {
+        'type': event_type,
+        'date_time': timezone.now(),
+        **data
+    }
+    try:
+        get_redis_client().publish(
+            get_scenario_channel(scenario_uuid),
+            json.dumps(payload, cls=CustomJsonEncoder)
+        )
+    except Exception as ex:
+        logger.warning(f'Failed to publish scenario event: {ex}')
+        return False
+    return True
+
+
+def format_sse(event_type, data, retry=None):
+    """Format server-sent event message.
+
+    :param event_type: type of the event
+    :type event_type: str
+    :param data: event payload
+    :type data: dict
+    :param retry: reconnection time in ms, defaults to None
+    :type retry: int, optional
+    :return: SSE message
+    :rtype: str
+    """
+    message = ''
+    if retry:
+        message += f'retry: {retry}\n'
+    message += f'event: {event_type}\n'
+    message += f'data: {json.dumps(data, cls=CustomJsonEncoder)}\n\n'
+    return message
+
+
+def get_scenario_snapshot(scenario_task):
+    """Return current status of scenario task as event payload.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :return: status payload
+    :rtype: dict
+    """
+    return {
+        'uuid': str(scenario_task.uuid),
+        'status': scenario_task.status,
+        'progress': scenario_task.progress,
+        'progress_text': scenario_task.progress_text,
+        'last_update': scenario_task.last_update
+    }
+
+
+def get_stream_snapshot(scenario_task):
+    """Read current status of scenario task for the start of stream.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :return: status event payload
+    :rtype: dict
+    """
+    scenario_task.refresh_from_db(
+        fields=['status', 'progress', 'progress_text', 'last_update']
+    )
+    scenario_task.apply_cached_state()
+    return {
+        'type': EVENT_STATUS,
+        **get_scenario_snapshot(scenario_task)
+    }
+
+
+def parse_event_message(message):
+    """Parse payload of pub/sub message.
+
+    :param message: pub/sub message
+    :type message: dict
+    :return: event payload, None if message is invalid
+    :rtype: dict
+    """
+    try:
+        return json.loads(message['data'])
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+def is_final_event(data):
+    """Check whether event is the status of finished task.
+
+    :param data: event payload
+    :type data: dict
+    :return: True if the stream should be closed
+    :rtype: bool
+    """
+    return (
+        data.get('type') == EVENT_STATUS and
+        data.get('status') in COMPLETED_STATUS
+    )
+
+
+def scenario_event_stream(scenario_task, max_seconds=None):
+    """Generate server-sent events of a scenario task.
+
+    The stream starts with a status snapshot and then relays the events
+    published by the worker until the task is finished or max_seconds
+    is reached. Clients reconnect using the retry hint. This is used
+    when the API is served by WSGI server, where the stream holds the
+    worker, hence max_seconds is kept short.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :param max_seconds: maximum stream duration, defaults to None
+    :type max_seconds: int, optional
+    :yield: SSE message
+    :rtype: Iterator[str]
+    """
+    if max_seconds is None:
+        max_seconds = settings.SCENARIO_STREAM_MAX_SECONDS
+    retry = settings.SCENARIO_STREAM_RETRY_MS
+    pubsub = None
+    if settings.TASK_EVENT_STREAM_ENABLED:
+        try:
+            pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+            # subscribe before reading snapshot so no event is missed
+            pubsub.subscribe(get_scenario_channel(scenario_task.uuid))
+        except Exception as ex:
+            logger.warning(f'Failed to subscribe scenario events: {ex}')
+            pubsub = None
+    try:
+        snapshot = get_stream_snapshot(scenario_task)
+        yield format_sse(EVENT_STATUS, snapshot, retry=retry)
+        if pubsub is None or snapshot['status'] in COMPLETED_STATUS:
+            return
+        deadline = time.monotonic() + max_seconds
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=1.0)
+            if message is None:
+                if time.monotonic() - last_sent >= KEEP_ALIVE_IN_SECONDS:
+                    last_sent = time.monotonic()
+                    yield ': keep-alive\n\n'
+                continue
+            data = parse_event_message(message)
+            if data is None:
+                continue
+            last_sent = time.monotonic()
+            yield format_sse(data.get('type', EVENT_STATUS), data)
+            if is_final_event(data):
+                return
+    finally:
+        if pubsub is not None:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+
+async def async_scenario_event_stream(scenario_task, max_seconds=None):
+    """Generate server-sent events of a scenario task in ASGI server.
+
+    Same events as scenario_event_stream, the worker events are read
+    with asyncio Redis subscriber so the stream does not hold a thread.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :param max_seconds: maximum stream duration, defaults to None
+    :type max_seconds: int, optional
+    :yield: SSE message
+    :rtype: AsyncIterator[str]
+    """
+    if max_seconds is None:
+        max_seconds = settings.SCENARIO_ASGI_STREAM_MAX_SECONDS
+    retry = settings.SCENARIO_STREAM_RETRY_MS
+    client = None
+    pubsub = None
+    if settings.TASK_EVENT_STREAM_ENABLED:
+        try:
+            client = get_async_redis_client()
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            # subscribe before reading snapshot so no event is missed
+            await pubsub.subscribe(get_scenario_channel(scenario_task.uuid))
+        except Exception as ex:
+            logger.warning(f'Failed to subscribe scenario events: {ex}')
+            pubsub = None
+    try:
+        snapshot = await sync_to_async(get_stream_snapshot)(scenario_task)
+        yield format_sse(EVENT_STATUS, snapshot, retry=retry)
+        if pubsub is None or snapshot['status'] in COMPLETED_STATUS:
+            return
+        deadline = time.monotonic() + max_seconds
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=1.0)
+            if message is None:
+                if time.monotonic() - last_sent >= KEEP_ALIVE_IN_SECONDS:
+                    last_sent = time.monotonic()
+                    yield ': keep-alive\n\n'
+                continue
+            data = parse_event_message(message)
+            if data is None:
+                continue
+            last_sent = time.monotonic()
+            yield format_sse(data.get('type', EVENT_STATUS), data)
+            if is_final_event(data):
+                return
+    finally:
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        if client is not None:
+            try:
+                await client.aclose()
+            except Exception:
+                pass
@@ -0,0 +1,389 @@
+"""Distributed mode that runs scenario extent as tiles.
+
+Scenario extent is split into tiles aligned to the pixel grid. Each tile
+is a child ScenarioTask that runs the full pipeline on its extent
+(with overlap when sieve or pixel connectivity is enabled) in any
+worker. When all tiles are completed, the core extent of every tile
+output is mosaicked into the outputs of the tiled scenario.
+
+Scenario that exceeds the disk or memory limits of a single worker is
+admitted when its largest tile fits the limits, and it is run as tiles.
+"""
+import copy
+import math
+import uuid
+import logging
+from functools import partial
+from django.db import transaction
+from django.utils import timezone
+
+from core.celery import cancel_task
+from core.models.base_task_request import (
+    TaskStatus,
+    COMPLETED_STATUS,
+    READ_ONLY_STATUS
+)
+from cplus_api.models.layer import OutputLayer
+from cplus_api.models.scenario import ScenarioTask
+from cplus_api.utils.default import DEFAULT_VALUES
+from cplus_api.utils.estimator import (
+    DEFAULT_RESOLUTION_M,
+    METRES_PER_DEGREE,
+    get_scenario_extent,
+    is_geographic_extent,
+    estimate_scenario_cost,
+    validate_scenario_cost
+)
+from cplus_api.utils.scheduler import (
+    is_waiting,
+    schedule_scenario_task,
+    unschedule_scenario_task
+)
+
+
+logger = logging.getLogger(__name__)
+TILED_MODE_AUTO = 'auto'
+TILED_MODE_ON = 'true'
+TILED_MODE_OFF = 'false'
+
+
+def get_tile_grid_size(total_size, cell_size, max_cells):
+    """Return number of tiles in one axis.
+
+    :param total_size: size of extent
+    :type total_size: float
+    :param cell_size: size of a tile
+    :type cell_size: float
+    :param max_cells: maximum number of tiles
+    :type max_cells: int
+    :return: number of tiles
+    :rtype: int
+    """
+    if cell_size <= 0:
+        return 1
+    return min(max(math.ceil(total_size / cell_size), 1), max_cells)
+
+
+def plan_scenario_tiles(detail, cost_estimate, config):
+    """Split scenario extent into tiles aligned to the pixel grid.
+
+    Extent of the tile includes overlap with the neighbour tiles when
+    sieve or pixel connectivity is enabled, core_extent is the part of
+    the tile that is used in the mosaic.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :param cost_estimate: cost estimate of scenario
+    :type cost_estimate: dict
+    :param config: scheduler config
+    :type config: dict
+    :return: list of tile dictionary
+    :rtype: list
+    """
+    extent = get_scenario_extent(detail)
+    if extent is None:
+        return []
+    xmin, xmax, ymin, ymax = extent
+    res_x, res_y = cost_estimate.get(
+        'resolution_m', [DEFAULT_RESOLUTION_M, DEFAULT_RESOLUTION_M])
+    if is_geographic_extent(detail, extent):
+        res_x /= METRES_PER_DEGREE
+        res_y /= METRES_PER_DEGREE
+    max_tiles = max(config['max_tiles'], 1)
+    tile_pixels = config['tile_size_pixels']
+    cols = get_tile_grid_size(xmax - xmin, tile_pixels * res_x, max_tiles)
+    rows = get_tile_grid_size(ymax - ymin, tile_pixels * res_y, max_tiles)
+    while cols * rows > max_tiles:
+        if cols >= rows:
+            cols -= 1
+        else:
+            rows -= 1
+    # step is a multiple of pixel size to keep tiles on the same grid
+    step_x = math.ceil((xmax - xmin) / cols / res_x) * res_x
+    step_y = math.ceil((ymax - ymin) / rows / res_y) * res_y
+    overlap_x = overlap_y = 0
+    if (
+        detail.get('sieve_enabled', DEFAULT_VALUES.sieve_enabled) or
+        detail.get(
+            'pixel_connectivity_enabled',
+            DEFAULT_VALUES.pixel_connectivity_enabled
+        )
+    ):
+        overlap_x = config['tile_overlap_pixels'] * res_x
+        overlap_y = config['tile_overlap_pixels'] * res_y
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            core_extent = [
+                xmin + col * step_x,
+                xmax if col == cols - 1 else xmin + (col + 1) * step_x,
+                ymin + row * step_y,
+                ymax if row == rows - 1 else ymin + (row + 1) * step_y
+            ]
+            if core_extent[0] >= xmax or core_extent[2] >= ymax:
+                continue
+            tiles.append({
+                'index': len(tiles),
+                'row': row,
+                'col': col,
+                'extent': [
+                    max(core_extent[0] - overlap_x, xmin),
+                    min(core_extent[1] + overlap_x, xmax),
+                    max(core_extent[2] - overlap_y, ymin),
+                    min(core_extent[3] + overlap_y, ymax)
+                ],
+                'core_extent': core_extent
+            })
+    return tiles
+
+
+def get_tile_cost_estimate(detail, tiles):
+    """Estimate cost of the largest tile.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :param tiles: list of tile from plan_scenario_tiles
+    :type tiles: list
+    :return: cost estimate of the tile
+    :rtype: dict
+    """
+    largest_tile = max(
+        tiles,
+        key=lambda tile: (
+            (tile['extent'][1] - tile['extent'][0]) *
+            (tile['extent'][3] - tile['extent'][2])
+        )
+    )
+    tile_detail = copy.deepcopy(detail)
+    tile_detail['extent'] = largest_tile['extent']
+    return estimate_scenario_cost(tile_detail)
+
+
+def validate_scenario_admission(detail, cost_estimate, config):
+    """Check scenario against admission limits.
+
+    Scenario that exceeds the limits is checked again using the cost
+    of its largest tile, since it will be run as tiles.
+
+    :param detail: scenario detail
+    :type detail: dict
+    :param cost_estimate: cost estimate of scenario
+    :type cost_estimate: dict
+    :param config: scheduler config
+    :type config: dict
+    :return: list of error message
+    :rtype: list
+    """
+    errors = validate_scenario_cost(cost_estimate, config)
+    if not errors:
+        return errors
+    tiles = plan_scenario_tiles(detail, cost_estimate, config)
+    if len(tiles) <= 1:
+        return errors
+    return validate_scenario_cost(
+        get_tile_cost_estimate(detail, tiles), config)
+
+
+def get_execution_tiles(scenario_task: ScenarioTask, config, mode):
+    """Return tiles if scenario should be run in distributed mode.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :param config: scheduler config
+    :type config: dict
+    :param mode: auto, true or false
+    :type mode: str
+    :return: list of tile or empty list
+    :rtype: list
+    """
+    if mode == TILED_MODE_OFF:
+        return []
+    if mode == TILED_MODE_AUTO:
+        # scenario that does not fit a single worker is always tiled
+        pixels = scenario_task.cost_estimate.get('pixels', 0)
+        if (
+            pixels < config['tiling_min_pixels'] and
+            not validate_scenario_cost(scenario_task.cost_estimate, config)
+        ):
+            return []
+    tiles = plan_scenario_tiles(
+        scenario_task.detail, scenario_task.cost_estimate, config)
+    return tiles if len(tiles) > 1 else []
+
+
+def reset_scenario_tiles(scenario_task: ScenarioTask):
+    """Remove tiles from previous execution of scenario.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    """
+    if not scenario_task.is_tiled:
+        return
+    ScenarioTask.objects.filter(parent=scenario_task).delete()
+    scenario_task.is_tiled = False
+    scenario_task.save(update_fields=['is_tiled'])
+
+
+def create_scenario_tiles(scenario_task: ScenarioTask, tiles):
+    """Create tile scenarios and put them to the scheduler.
+
+    :param scenario_task: scenario task object
+    :type scenario_task: ScenarioTask
+    :param tiles: list of tile from plan_scenario_tiles
+    :type tiles: list
+    :return: tile scenario tasks
+    :rtype: list
+    """
+    scenario_name = scenario_task.get_detail_value(
+        'scenario_name', str(scenario_task.uuid))
+    tile_tasks = []
+    with transaction.atomic():
+        reset_scenario_tiles(scenario_task)
+        OutputLayer.objects.filter(scenario=scenario_task).delete()
+        for tile in tiles:
+            detail = copy.deepcopy(scenario_task.detail)
+            detail['extent'] = tile['extent']
+            detail['scenario_name'] = (
+                f"{scenario_name} - tile {tile['index'] + 1}"
+            )
+            tile_task = ScenarioTask.objects.create(
+                submitted_on=timezone.now(),
+                submitted_by=scenario_task.submitted_by,
+                api_version=scenario_task.api_version,
+                plugin_version=scenario_task.plugin_version,
+                detail=detail,
+                cost_estimate=estimate_scenario_cost(detail),
+                parent=scenario_task,
+                tile=tile
+            )
+            schedule_scenario_task(tile_task)
+            tile_tasks.append(tile_task)
+        scenario_task.is_tiled = True
+        scenario_task.task_id = None
+        scenario_task.save(update_fields=['is_tiled', 'task_id'])
+        scenario_task.task_on_started()
+        scenario_task.add_log(
+            f'Scenario is split into {len(tile_tasks)} tiles.')
+    return tile_tasks
+
+
+def cancel_scenario_tiles(scenario_task: ScenarioTask):
+    """Cancel tiles that are waiting or running.
+
+    :param scenario_task: tiled scenario task
+    :type scenario_task: ScenarioTask
+    """
+    for tile_task in ScenarioTask.objects.filter(
+        parent=scenario_task,
+        status__in=[
+            TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.RUNNING
+        ]
+    ):
+        if is_waiting(tile_task):
+            unschedule_scenario_task(tile_task)
+            tile_task.task_on_cancelled()
+        elif tile_task.task_id:
+            cancel_task(tile_task.task_id)
+            if tile_task.status == TaskStatus.QUEUED:
+                tile_task.task_on_cancelled()
+
+
+def send_mosaic_task(scenario_task: ScenarioTask):
+    """Send task to mosaic tile outputs.
+
+    :param scenario_task: tiled scenario task
+    :type scenario_task: ScenarioTask
+    """
+    from cplus_api.tasks.mosaic import mosaic_scenario_tiles
+    mosaic_scenario_tiles.apply_async(
+        (scenario_task.id,),
+        task_id=scenario_task.task_id,
+        queue=scenario_task.queue
+    )
+
+
+def on_tile_finished(tile_task: ScenarioTask):
+    """Update progress of tiled scenario when a tile is finished.
+
+    The tiled scenario is stopped when a tile fails, and the mosaic is
+    submitted once after all tiles are completed.
+
+    :param tile_task: tile scenario task
+    :type tile_task: ScenarioTask
+    """
+    failed_tiles = []
+    with transaction.atomic():
+        scenario_task = ScenarioTask.objects.select_for_update().get(
+            id=tile_task.parent_id)
+        if scenario_task.status != TaskStatus.RUNNING:
+            return
+        if scenario_task.task_id:
+            # mosaic has been submitted
+            return
+        statuses = list(
+            scenario_task.tiles.values_list('status', flat=True))
+        total = len(statuses)
+        completed = statuses.count(TaskStatus.COMPLETED)
+        failed_tiles = [
+            status for status in statuses if status in [
+                TaskStatus.STOPPED, TaskStatus.CANCELLED
+            ]
+        ]
+        if failed_tiles:
+            scenario_task.task_on_errors(
+                f'{len(failed_tiles)} of {total} tiles are not completed.')
+        elif completed == total:
+            scenario_task.task_id = str(uuid.uuid4())
+            scenario_task.progress_text = 'Mosaicking tile outputs.'
+            scenario_task.last_update = timezone.now()
+            scenario_task.save(
+                update_fields=['task_id', 'progress_text', 'last_update'])
+            transaction.on_commit(partial(send_mosaic_task, scenario_task))
+        else:
+            # keep remaining progress for the mosaic
+            scenario_task.progress = 90 * completed / total
+            scenario_task.progress_text = (
+                f'{completed} of {total} tiles are completed.'
+            )
+            scenario_task.last_update = timezone.now()
+            scenario_task.save(
+                update_fields=['progress', 'progress_text', 'last_update'])
+            scenario_task.cache_state()
+            scenario_task.publish_status()
+    if failed_tiles:
+        cancel_scenario_tiles(scenario_task)
+
+
+def recover_tiled_scenario(scenario_task: ScenarioTask):
+    """Update tiled scenario that waits for tiles which are not active.
+
+    Tiles that are queued, running or waiting in the scheduler are
+    checked by the sweeper themselves. When none of them is active, the
+    tiled scenario has missed the update from its last tile, hence it
+    is updated again from the tiles. Tile that is neither active nor
+    finished is cancelled, which stops the tiled scenario.
+
+    :param scenario_task: tiled scenario task that waits for tiles
+    :type scenario_task: ScenarioTask
+    :return: True if tiled scenario is stopped
+    :rtype: bool
+    """
+    tiles = list(scenario_task.tiles.all())
+    if any(
+        tile.status in READ_ONLY_STATUS or is_waiting(tile)
+        for tile in tiles
+    ):
+        return False
+    if not tiles:
+        scenario_task.task_on_errors(
+            Exception('Tiled scenario does not have any tile.'))
+        return True
+    stuck_tiles = [
+        tile for tile in tiles if tile.status not in COMPLETED_STATUS
+    ]
+    for tile in stuck_tiles:
+        tile.task_on_cancelled()
+    if not stuck_tiles:
+        on_tile_finished(tiles[-1])
+    scenario_task.refresh_from_db()
+    return scenario_task.status == TaskStatus.STOPPED
@@ -0,0 +1,492 @@
+"""Client to upload large layer files using multipart upload API.
+
+The client only depends on requests, hence it can be used outside of
+the project, e.g.:
+
+    python -m cplus_api.utils.upload_client --url http://localhost/api/v1 \\
+        --token <token> --component-type ncs_pathway layer.tif
+
+Parts are uploaded concurrently to the presigned URLs from
+LayerUploadStart. Each part is sent with Content-MD5 and its ETag is
+verified, failed requests are retried with exponential backoff.
+Completed parts are stored in a manifest file next to the uploaded
+file, so an interrupted upload can be resumed by running the same
+command again.
+"""
+import os
+import sys
+import json
+import math
+import time
+import base64
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+logger = logging.getLogger(__name__)
+MB = 1024 ** 2
+# chunk_size must be greater than 5MB
+DEFAULT_CHUNK_SIZE = 100 * MB
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+# maximum number of presigned URLs in a sign request
+DEFAULT_URL_PAGE_SIZE = 100
+MANIFEST_SUFFIX = '.upload.json'
+RETRY_STATUS_CODES = [408, 429, 500, 502, 503, 504]
+
+
+class UploadError(Exception):
+    """Raised when upload cannot be completed."""
+
+
+def get_part_md5(data):
+    """Return MD5 digest of part data.
+
+    :param data: part data
+    :type data: bytes
+    :return: tuple of hex digest and base64 digest for Content-MD5
+    :rtype: tuple
+    """
+    digest = hashlib.md5(data).digest()
+    return digest.hex(), base64.b64encode(digest).decode('ascii')
+
+
+class UploadManifest(object):
+    """Local checkpoint of multipart upload for resume."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load manifest file if exists.
+
+        :return: True if manifest is loaded
+        :rtype: bool
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r') as f:
+            self.data = json.load(f)
+        return True
+
+    def save(self):
+        """Write manifest file atomically."""
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+    def is_valid_for(self, file_path, chunk_size):
+        """Check whether manifest belongs to the same file and chunking.
+
+        :param file_path: path to the uploaded file
+        :type file_path: str
+        :param chunk_size: part size
+        :type chunk_size: int
+        :return: True if manifest can be used to resume
+        :rtype: bool
+        """
+        stat = os.stat(file_path)
+        return (
+            self.data.get('file_size') == stat.st_size and
+            self.data.get('file_mtime') == stat.st_mtime and
+            self.data.get('chunk_size') == chunk_size and
+            bool(self.data.get('uuid'))
+        )
+
+    def get_completed_parts(self):
+        """Return completed parts.
+
+        :return: dictionary of part number and part item
+        :rtype: dict
+        """
+        return {
+            int(part_number): item for part_number, item in
+            self.data.get('parts', {}).items()
+        }
+
+    def add_completed_part(self, item):
+        """Checkpoint completed part.
+
+        :param item: part item with part_number, etag and md5
+        :type item: dict
+        """
+        with self._lock:
+            self.data.setdefault('parts', {})[
+                str(item['part_number'])] = item
+            self.save()
+
+    def remove(self):
+        """Remove manifest file."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MultipartUploadClient(object):
+    """Client of layer upload API."""
+
+    def __init__(self, base_url, api_token,
+                 chunk_size=DEFAULT_CHUNK_SIZE,
+                 max_workers=DEFAULT_MAX_WORKERS,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_seconds=1, max_backoff_seconds=60,
+                 url_page_size=DEFAULT_URL_PAGE_SIZE, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.api_token = api_token
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.url_page_size = url_page_size
+        self.session = session or requests.Session()
+
+    def get_backoff(self, attempt):
+        """Return waiting time before retry with full jitter.
+
+        :param attempt: number of failed attempts
+        :type attempt: int
+        :return: seconds to wait
+        :rtype: float
+        """
+        backoff = min(
+            self.max_backoff_seconds,
+            self.backoff_seconds * (2 ** attempt)
+        )
+        return random.uniform(0, backoff)
+
+    def with_retry(self, name, func):
+        """Call func and retry with exponential backoff.
+
+        :param name: name of the request for logging
+        :type name: str
+        :param func: function that returns requests.Response
+        :type func: function
+        :raises UploadError: when the request fails after retries
+        :return: response
+        :rtype: requests.Response
+        """
+        attempt = 0
+        while True:
+            error = None
+            try:
+                response = func()
+                if response.status_code < 400:
+                    return response
+                error = f'{response.status_code} {response.text}'
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise UploadError(f'Failed {name}: {error}')
+            except requests.RequestException as ex:
+                error = str(ex)
+            attempt += 1
+            if attempt > self.max_retries:
+                raise UploadError(
+                    f'Failed {name} after {self.max_retries} retries: '
+                    f'{error}'
+                )
+            wait = self.get_backoff(attempt)
+            logger.warning(
+                f'Retry {name} in {wait:.1f}s ({attempt}): {error}')
+            time.sleep(wait)
+
+    def request_api(self, path, payload):
+        """Send POST request to the API.
+
+        :param path: path after base url
+        :type path: str
+        :param payload: JSON payload
+        :type payload: dict
+        :return: JSON response or None
+        :rtype: dict
+        """
+        url = f'{self.base_url}/{path}'
+        response = self.with_retry(path, lambda: self.session.post(
+            url, json=payload, headers={
+                'Authorization': f'Bearer {self.api_token}'
+            }
+        ))
+        if response.status_code == 204 or not response.content:
+            return None
+        return response.json()
+
+    def start_upload(self, file_path, component_type, layer_type=0,
+                     privacy_type='private', name=None, **kwargs):
+        """Create input layer and get presigned URLs of parts.
+
+        :param file_path: path to the uploaded file
+        :type file_path: str
+        :param component_type: component type of input layer
+        :type component_type: str
+        :param layer_type: 0 (Raster), 1 (Vector)
+        :type layer_type: int
+        :param privacy_type: privacy type of input layer
+        :type privacy_type: str
+        :param name: layer name, default to file name
+        :type name: str
+        :return: response of LayerUploadStart
+        :rtype: dict
+        """
+        file_size = os.stat(file_path).st_size
+        payload = {
+            'layer_type': layer_type,
+            'component_type': component_type,
+            'privacy_type': privacy_type,
+            'name': name or os.path.basename(file_path),
+            'size': file_size,
+            'number_of_parts': math.ceil(file_size / self.chunk_size),
+            'paged': True
+        }
+        payload.update(kwargs)
+        return self.request_api('layer/upload/start/', payload)
+
+    def upload_part(self, url, file_path, part_number):
+        """Upload a part and verify its checksum.
+
+        :param url: presigned URL of the part
+        :type url: str
+        :param file_path: path to the uploaded file
+        :type file_path: str
+        :param part_number: part number starts from 1
+        :type part_number: int
+        :raises UploadError: when ETag does not match MD5 of the part
+        :return: part item with part_number, etag and md5
+        :rtype: dict
+        """
+        with open(file_path, 'rb') as f:
+            f.seek((part_number - 1) * self.chunk_size)
+            data = f.read(self.chunk_size)
+        md5_hex, md5_b64 = get_part_md5(data)
+        response = self.with_retry(
+            f'upload part {part_number}',
+            lambda: self.session.put(
+                url, data=data, headers={'Content-MD5': md5_b64})
+        )
+        etag = response.headers.get('ETag', '')
+        # ETag is MD5 of the part unless the object is encrypted with KMS
+        clean_etag = etag.strip('"')
+        if len(clean_etag) == 32 and clean_etag != md5_hex:
+            raise UploadError(
+                f'Checksum mismatch of part {part_number}: '
+                f'{clean_etag} != {md5_hex}'
+            )
+        return {
+            'part_number': part_number,
+            'etag': etag,
+            'md5': md5_hex
+        }
+
+    def finish_upload(self, layer_uuid, upload_id, items):
+        """Complete the upload.
+
+        :param layer_uuid: input layer UUID
+        :type layer_uuid: str
+        :param upload_id: multipart upload id, None for single upload
+        :type upload_id: str
+        :param items: list of part_number and etag
+        :type items: list
+        :return: response of LayerUploadFinish
+        :rtype: dict
+        """
+        payload = {
+            'items': [
+                {
+                    'part_number': item['part_number'],
+                    'etag': item['etag']
+                } for item in sorted(items, key=lambda i: i['part_number'])
+            ]
+        }
+        if upload_id:
+            payload['multipart_upload_id'] = upload_id
+        return self.request_api(
+            f'layer/upload/{layer_uuid}/finish/', payload)
+
+    def abort_upload(self, layer_uuid, upload_id):
+        """Abort multipart upload.
+
+        :param layer_uuid: input layer UUID
+        :type layer_uuid: str
+        :param upload_id: multipart upload id
+        :type upload_id: str
+        """
+        self.request_api(f'layer/upload/{layer_uuid}/abort/', {
+            'multipart_upload_id': upload_id
+        })
+
+    def sign_parts(self, layer_uuid, upload_id, part_numbers=None):
+        """Generate new presigned URLs of parts.
+
+        :param layer_uuid: input layer UUID
+        :type layer_uuid: str
+        :param upload_id: multipart upload id
+        :type upload_id: str
+        :param part_numbers: part numbers, default to missing parts
+        :type part_numbers: list
+        :return: response of LayerUploadSign
+        :rtype: dict
+        """
+        payload = {
+            'multipart_upload_id': upload_id
+        }
+        if part_numbers:
+            payload['part_numbers'] = part_numbers
+        return self.request_api(f'layer/upload/{layer_uuid}/sign/', payload)
+
+    def upload(self, file_path, component_type, manifest_path=None,
+               restart=False, **kwargs):
+        """Upload file as input layer, resume from manifest if exists.
+
+        :param file_path: path to the uploaded file
+        :type file_path: str
+        :param component_type: component type of input layer
+        :type component_type: str
+        :param manifest_path: path to manifest, default next to the file
+        :type manifest_path: str
+        :param restart: ignore existing manifest
+        :type restart: bool
+        :raises UploadError: when the upload fails
+        :return: response of LayerUploadFinish
+        :rtype: dict
+        """
+        manifest = UploadManifest(
+            manifest_path or f'{file_path}{MANIFEST_SUFFIX}')
+        if (
+            restart or not manifest.load() or
+            not manifest.is_valid_for(file_path, self.chunk_size)
+        ):
+            stat = os.stat(file_path)
+            result = self.start_upload(file_path, component_type, **kwargs)
+            manifest.data = {
+                'file_size': stat.st_size,
+                'file_mtime': stat.st_mtime,
+                'chunk_size': self.chunk_size,
+                'uuid': result['uuid'],
+                'multipart_upload_id': result.get('multipart_upload_id'),
+                'upload_urls': result['upload_urls'],
+                'parts': {}
+            }
+            manifest.save()
+            is_resumed = False
+        else:
+            logger.info(f'Resume upload of layer {manifest.data["uuid"]}')
+            is_resumed = True
+        completed = manifest.get_completed_parts()
+        number_of_parts = max(
+            math.ceil(manifest.data['file_size'] / self.chunk_size), 1)
+        pending = [
+            part_number for part_number in range(1, number_of_parts + 1)
+            if part_number not in completed
+        ]
+        # presigned URLs in the manifest may have expired when resumed
+        is_resigned = is_resumed and manifest.data['multipart_upload_id']
+        known_urls = {} if is_resigned else {
+            item['part_number']: item['url'] for item in
+            manifest.data['upload_urls']
+        }
+
+        def upload_pending_part(url_item):
+            item = self.upload_part(
+                url_item['url'], file_path, url_item['part_number'])
+            manifest.add_completed_part(item)
+            logger.info(f'Finished upload part {item["part_number"]}')
+            return item
+
+        # request presigned URLs by pages, so they do not expire
+        # before the parts are uploaded
+        for i in range(0, len(pending), self.url_page_size):
+            page = pending[i:i + self.url_page_size]
+            url_items = [
+                {
+                    'part_number': part_number,
+                    'url': known_urls[part_number]
+                } for part_number in page if part_number in known_urls
+            ]
+            unsigned_parts = [
+                part_number for part_number in page if
+                part_number not in known_urls
+            ]
+            if unsigned_parts and manifest.data['multipart_upload_id']:
+                url_items.extend(self.sign_parts(
+                    manifest.data['uuid'],
+                    manifest.data['multipart_upload_id'],
+                    unsigned_parts
+                )['upload_urls'])
+            with ThreadPoolExecutor(
+                max_workers=self.max_workers
+            ) as executor:
+                list(executor.map(upload_pending_part, url_items))
+        items = list(manifest.get_completed_parts().values())
+        upload_id = manifest.data['multipart_upload_id']
+        result = self.finish_upload(manifest.data['uuid'], upload_id, items)
+        if result['size'] != manifest.data['file_size']:
+            raise UploadError(
+                f'Uploaded size {result["size"]} does not match '
+                f'{manifest.data["file_size"]}'
+            )
+        manifest.remove()
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Upload layer file using multipart upload.')
+    parser.add_argument('file_path')
+    parser.add_argument('--url', required=True,
+                        help='API base URL, e.g. https://host/api/v1')
+    parser.add_argument('--token', default=os.environ.get('CPLUS_API_TOKEN'),
+                        help='API token, default to CPLUS_API_TOKEN')
+    parser.add_argument('--component-type', required=True)
+    parser.add_argument('--layer-type', type=int, default=0)
+    parser.add_argument('--privacy-type', default='private')
+    parser.add_argument('--name', default=None)
+    parser.add_argument('--chunk-size-mb', type=int,
+                        default=DEFAULT_CHUNK_SIZE // MB)
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument('--retries', type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument('--manifest', default=None)
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore manifest and start a new upload')
+    parser.add_argument('--abort', action='store_true',
+                        help='Abort upload in the manifest')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    client = MultipartUploadClient(
+        args.url, args.token,
+        chunk_size=args.chunk_size_mb * MB,
+        max_workers=args.workers,
+        max_retries=args.retries
+    )
+    if args.abort:
+        manifest = UploadManifest(
+            args.manifest or f'{args.file_path}{MANIFEST_SUFFIX}')
+        if not manifest.load():
+            parser.error('Manifest does not exist!')
+        client.abort_upload(
+            manifest.data['uuid'], manifest.data['multipart_upload_id'])
+        manifest.remove()
+        return 0
+    try:
+        result = client.upload(
+            args.file_path, args.component_type,
+            manifest_path=args.manifest,
+            restart=args.restart,
+            layer_type=args.layer_type,
+            privacy_type=args.privacy_type,
+            name=args.name
+        )
+    except UploadError as ex:
+        logger.error(f'{ex}, run the same command to resume the upload.')
+        return 1
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
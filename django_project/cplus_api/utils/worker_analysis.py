@@ -27,7 +27,20 @@ from cplus_api.utils.api_helper import (
     CustomJsonEncoder,
     get_layer_type
 )
+from cplus_api.utils.batch import download_batch_input_layer
 from cplus_api.utils.default import DEFAULT_VALUES
+from cplus_api.utils.ingestion import compute_file_checksum
+from cplus_api.utils.output_dedup import (
+    find_stored_output,
+    clone_stored_output
+)
+from cplus_api.utils.scratch import log_scratch_usage
+from cplus_api.utils.task_events import (
+    publish_scenario_event,
+    EVENT_LOG,
+    EVENT_PROGRESS,
+    EVENT_PROGRESS_TEXT
+)
 
 logger = logging.getLogger(__name__)
 
@@ -566,6 +579,7 @@ class WorkerScenarioAnalysisTask(object):
         self.task_config = task_config
         self.scenario_task = scenario_task
         self.last_update_progress = None
+        self.last_published_progress = None
         self.downloaded_layers = {}
         self.downloaded_layer_count = 0
         self.scenario = task_config.scenario
@@ -769,7 +783,12 @@ class WorkerScenarioAnalysisTask(object):
             self.task_config.total_input_layers > 0 else 1
         )
         for layer in layers:
-            file_path = layer.download_to_working_directory(scenario_path)
+            if self.scenario_task.batch:
+                file_path = download_batch_input_layer(
+                    layer, self.scenario_task.batch, scenario_path)
+            else:
+                file_path = layer.download_to_working_directory(
+                    scenario_path, touch_last_used=False)
             self.downloaded_layer_count += 1
             self.set_custom_progress(
                 100 * (
@@ -782,6 +801,7 @@ class WorkerScenarioAnalysisTask(object):
             if not os.path.exists(file_path):
                 continue
             results[str(layer.uuid)] = file_path
+        InputLayer.touch_last_used(results.keys())
         return results
 
     def patch_layer_path_to_priority_layers(self, priority_layer_paths):
@@ -885,6 +905,8 @@ class WorkerScenarioAnalysisTask(object):
         :type exception: Exception, optional
         """
         self.error = exception
+        # make sure buffered logs are stored before task is stopped
+        self.scenario_task.flush_logs()
         self.cancel()
 
     def log_message(self, message: str, name: str = "qgis_cplus",
@@ -902,6 +924,11 @@ class WorkerScenarioAnalysisTask(object):
         """
         self.scenario_task.add_log(
             message, logging.INFO if info else logging.ERROR)
+        publish_scenario_event(self.scenario_task.uuid, EVENT_LOG, {
+            'severity': logging.getLevelName(
+                logging.INFO if info else logging.ERROR),
+            'log': message
+        })
         level = logging.INFO if info else logging.WARNING
         logger.log(level, message)
 
@@ -913,7 +940,19 @@ class WorkerScenarioAnalysisTask(object):
         """
         self.status_message = message
         self.scenario_task.progress_text = message
-        self.scenario_task.save(update_fields=['progress_text'])
+        self.scenario_task.last_update = timezone.now()
+        cached = self.scenario_task.cache_state(
+            progress_text=message,
+            last_update=self.scenario_task.last_update
+        )
+        if not cached:
+            self.scenario_task.save(
+                update_fields=['progress_text', 'last_update'])
+        publish_scenario_event(
+            self.scenario_task.uuid, EVENT_PROGRESS_TEXT, {
+                'progress_text': message
+            }
+        )
 
     def set_info_message(self, message, level):
         """Handle when info message is received.
@@ -936,31 +975,55 @@ class WorkerScenarioAnalysisTask(object):
         """
         self.custom_progress = value
         self.scenario_task.progress = value
+        self.scenario_task.last_update = timezone.now()
+        # publish only when the displayed progress is changed
+        published_value = round(value, 1)
+        if published_value != self.last_published_progress:
+            self.last_published_progress = published_value
+            self.scenario_task.cache_state(
+                progress=value,
+                last_update=self.scenario_task.last_update
+            )
+            publish_scenario_event(
+                self.scenario_task.uuid, EVENT_PROGRESS, {
+                    'progress': value
+                }
+            )
         # check how to control the frequency of updating progress
         # if too frequent, then the process becomes slower
         should_update_progress = self.should_update_progress()
         if should_update_progress:
             self.last_update_progress = timezone.now()
-            self.scenario_task.save(update_fields=['progress'])
+            # checkpoint state from Redis to database
+            self.scenario_task.save(
+                update_fields=['progress', 'progress_text', 'last_update'])
+            if self.scenario_task.should_flush_logs():
+                self.scenario_task.flush_logs()
 
     def should_update_progress(self):
         """Check whether should update back to database.
 
-        :return: True if last update time is more than 1s
+        When task state is stored in Redis, database is only updated
+        on checkpoint interval.
+
+        :return: True if last update time is more than the interval
         :rtype: bool
         """
         if self.last_update_progress is None:
             return True
+        interval = self.MIN_UPDATE_PROGRESS_IN_SECONDS
+        if settings.TASK_STATE_CACHE_ENABLED:
+            interval = max(interval, settings.TASK_STATE_CHECKPOINT_SECONDS)
         ct = timezone.now()
         return (
-            (ct - self.last_update_progress).total_seconds() >=
-            self.MIN_UPDATE_PROGRESS_IN_SECONDS
+            (ct - self.last_update_progress).total_seconds() >= interval
         )
 
     def create_and_upload_output_layer(
             self, file_path: str, scenario_task: ScenarioTask,
             is_final_output: bool, group: str,
-            output_meta: dict = None) -> OutputLayer:
+            output_meta: dict = None,
+            content_hash: str = None) -> OutputLayer:
         """Update output layer to object storage.
 
         :param file_path: output layer file path
@@ -973,6 +1036,8 @@ class WorkerScenarioAnalysisTask(object):
         :type group: str
         :param output_meta: Metadata of layer, defaults to None
         :type output_meta: dict, optional
+        :param content_hash: SHA256 of the output file, defaults to None
+        :type content_hash: str, optional
         :return: saved OutputLayer object
         :rtype: OutputLayer
         """
@@ -1023,7 +1088,8 @@ class WorkerScenarioAnalysisTask(object):
             is_final_output=is_final_output,
             scenario=scenario_task,
             group=group,
-            output_meta={} if not output_meta else output_meta
+            output_meta={} if not output_meta else output_meta,
+            content_hash=content_hash
         )
 
         # save the binary file to object storage
@@ -1059,12 +1125,38 @@ class WorkerScenarioAnalysisTask(object):
                     100 * (total_uploaded_files / total_files))
             else:
                 for file in files:
-                    self.create_and_upload_output_layer(
-                        file, self.scenario_task, False, group)
+                    self.upload_intermediate_output(file, group)
                     total_uploaded_files += 1
                     self.set_custom_progress(
                         100 * (total_uploaded_files / total_files))
 
+    def upload_intermediate_output(self, file_path: str, group: str):
+        """Upload intermediate output or reference stored output.
+
+        Output with the same file checksum from previous run of the user
+        is referenced without converting and uploading the file. The
+        output has already been computed by the analysis at this point.
+
+        :param file_path: output layer file path
+        :type file_path: str
+        :param group: layer group
+        :type group: str
+        :return: OutputLayer object
+        :rtype: OutputLayer
+        """
+        content_hash = compute_file_checksum(file_path)
+        stored_output = find_stored_output(
+            self.scenario_task.submitted_by, group, content_hash)
+        if stored_output:
+            self.log_message(
+                f'Skip upload of {file_path}, '
+                f'same as stored output {stored_output.name}')
+            return clone_stored_output(stored_output, self.scenario_task)
+        return self.create_and_upload_output_layer(
+            file_path, self.scenario_task, False, group,
+            content_hash=content_hash
+        )
+
     def notify_user(self, is_success: bool):
         """Send email to notify user that analysis task is finished.
 
@@ -1243,6 +1335,7 @@ class WorkerScenarioAnalysisTask(object):
             self.log_message(
                 f"Error from task scenario task {self.error}", info=False)
 
+        log_scratch_usage(self.scenario_task)
         # clean directory
         self.scenario_task.clear_resources()
 
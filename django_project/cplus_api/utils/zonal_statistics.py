@@ -0,0 +1,514 @@
+"""Zonal statistics of raster layer within a bounding box or polygon.
+
+Pixels inside the bounding box are read once, block by block, and all
+requested statistics are accumulated from the valid values of each
+block. Values are only kept in memory when median, percentile or
+histogram is requested. Polygon is rasterized block by block into
+the grid of the raster, and the mask of each block is reused by the
+layers that share the same grid.
+"""
+import json
+import math
+import re
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import rasterio
+from rasterio.features import geometry_mask
+from rasterio.warp import transform_bounds, transform_geom
+from rasterio.windows import Window
+from django.contrib.gis.gdal import DataSource
+from django.contrib.gis.geos import (
+    GEOSGeometry,
+    GEOSException,
+    MultiPolygon
+)
+
+
+MEAN = 'mean'
+HISTOGRAM = 'histogram'
+BASIC_STATISTICS = [MEAN, 'min', 'max', 'sum', 'count', 'std', 'median']
+PERCENTILE_PATTERN = re.compile(r'^p(\d{1,2})$')
+DEFAULT_STATISTICS = [MEAN]
+DEFAULT_HISTOGRAM_BINS = 10
+MAX_HISTOGRAM_BINS = 256
+# total size of the cached block masks
+MASK_CACHE_MAX_BYTES = 256 * 1024 ** 2
+_mask_cache = OrderedDict()
+_mask_cache_bytes = 0
+
+
+def parse_statistics(value):
+    """Parse requested statistics.
+
+    Supported statistics are mean, min, max, sum, count, std, median,
+    percentile as pNN (e.g. p10, p90) and histogram.
+
+    :param value: comma separated statistics or list of statistics
+    :type value: str or list
+    :raises ValueError: when there is unsupported statistic
+    :return: unique statistics in requested order
+    :rtype: list
+    """
+    if not value:
+        return list(DEFAULT_STATISTICS)
+    if isinstance(value, str):
+        value = value.split(',')
+    statistics = []
+    for stat in value:
+        stat = str(stat).strip().lower()
+        if not stat or stat in statistics:
+            continue
+        if (
+            stat not in BASIC_STATISTICS and stat != HISTOGRAM and
+            not PERCENTILE_PATTERN.match(stat)
+        ):
+            raise ValueError(f'Unsupported statistic: {stat}')
+        statistics.append(stat)
+    if not statistics:
+        return list(DEFAULT_STATISTICS)
+    return statistics
+
+
+def get_bbox_window(dataset, bbox):
+    """Return window of pixels whose centre is inside bbox.
+
+    :param dataset: opened raster dataset
+    :type dataset: rasterio.DatasetReader
+    :param bbox: minx, miny, maxx, maxy in EPSG:4326
+    :type bbox: list
+    :return: window, None if bbox is outside of raster
+    :rtype: Window
+    """
+    bounds = bbox
+    if dataset.crs is not None and dataset.crs.to_epsg() != 4326:
+        bounds = transform_bounds(
+            'EPSG:4326', dataset.crs, *bbox, densify_pts=21)
+    # include pixel when its centre is inside the bbox
+    inv_transform = ~dataset.transform
+    col_min, row_min = inv_transform * (bounds[0], bounds[3])
+    col_max, row_max = inv_transform * (bounds[2], bounds[1])
+    col_start = max(math.floor(min(col_min, col_max) + 0.5), 0)
+    col_stop = min(math.floor(max(col_min, col_max) + 0.5), dataset.width)
+    row_start = max(math.floor(min(row_min, row_max) + 0.5), 0)
+    row_stop = min(math.floor(max(row_min, row_max) + 0.5), dataset.height)
+    if col_stop <= col_start or row_stop <= row_start:
+        return None
+    return Window(
+        col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+
+def to_multipolygon(geometry):
+    """Convert polygonal geometry to MultiPolygon in EPSG:4326.
+
+    :param geometry: Polygon, MultiPolygon or GeometryCollection
+    :type geometry: GEOSGeometry
+    :raises ValueError: when geometry is invalid or not polygonal
+    :return: multipolygon
+    :rtype: MultiPolygon
+    """
+    if geometry.geom_type == 'Polygon':
+        geometry = MultiPolygon(geometry, srid=geometry.srid)
+    elif geometry.geom_type == 'GeometryCollection':
+        polygons = []
+        for geom in geometry:
+            if geom.geom_type == 'Polygon':
+                polygons.append(geom)
+            elif geom.geom_type == 'MultiPolygon':
+                polygons.extend(geom)
+        if not polygons:
+            raise ValueError('Geometry does not have any polygon!')
+        geometry = MultiPolygon(*polygons, srid=geometry.srid)
+    elif geometry.geom_type != 'MultiPolygon':
+        raise ValueError(
+            f'Geometry must be polygon, got {geometry.geom_type}!')
+    if geometry.empty:
+        raise ValueError('Geometry is empty!')
+    if not geometry.valid:
+        raise ValueError(f'Invalid geometry: {geometry.valid_reason}')
+    if geometry.srid is None:
+        geometry.srid = 4326
+    elif geometry.srid != 4326:
+        geometry.transform(4326)
+    return geometry
+
+
+def parse_geojson_geometry(value):
+    """Parse GeoJSON polygon into MultiPolygon in EPSG:4326.
+
+    :param value: GeoJSON Polygon, MultiPolygon, Feature or
+        FeatureCollection
+    :type value: dict or str
+    :raises ValueError: when GeoJSON is invalid or not polygonal
+    :return: multipolygon
+    :rtype: MultiPolygon
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError('Invalid GeoJSON!')
+    if not isinstance(value, dict):
+        raise ValueError('Invalid GeoJSON!')
+    if value.get('type') == 'Feature':
+        geometries = [value.get('geometry')]
+    elif value.get('type') == 'FeatureCollection':
+        geometries = [
+            feature.get('geometry') for feature in
+            value.get('features', [])
+        ]
+    else:
+        geometries = [value]
+    polygons = []
+    for geometry in geometries:
+        if not geometry:
+            continue
+        try:
+            geom = GEOSGeometry(json.dumps(geometry))
+        except (GEOSException, ValueError, TypeError):
+            raise ValueError('Invalid GeoJSON geometry!')
+        polygons.extend(to_multipolygon(geom))
+    if not polygons:
+        raise ValueError('GeoJSON does not have any polygon!')
+    return MultiPolygon(*polygons, srid=4326)
+
+
+def read_vector_geometry(file_path):
+    """Read polygons of the first layer in vector file.
+
+    :param file_path: path to shapefile or geojson
+    :type file_path: str
+    :raises ValueError: when layer does not have SRS or polygon
+    :return: multipolygon in EPSG:4326
+    :rtype: MultiPolygon
+    """
+    layer = DataSource(file_path)[0]
+    if layer.srs is None:
+        raise ValueError('Vector layer does not have CRS!')
+    polygons = []
+    for feature in layer:
+        geom = feature.geom
+        geom.transform(4326)
+        if geom.geom_type.name in ['Polygon', 'MultiPolygon']:
+            polygons.extend(to_multipolygon(geom.geos))
+    if not polygons:
+        raise ValueError('Vector layer does not have any polygon!')
+    return MultiPolygon(*polygons, srid=4326)
+
+
+def get_geometry_hash(geometry):
+    """Return hash of geometry to identify its rasterized mask.
+
+    :param geometry: geometry
+    :type geometry: GEOSGeometry
+    :return: sha256 hex digest of geometry WKB
+    :rtype: str
+    """
+    return hashlib.sha256(bytes(geometry.wkb)).hexdigest()
+
+
+def get_projected_geometry(geometry, crs):
+    """Return GeoJSON of geometry in the CRS of the raster.
+
+    :param geometry: multipolygon in EPSG:4326
+    :type geometry: GEOSGeometry
+    :param crs: CRS of the raster
+    :type crs: rasterio.crs.CRS
+    :return: GeoJSON geometry
+    :rtype: dict
+    """
+    geojson = json.loads(geometry.geojson)
+    if crs is not None and crs.to_epsg() != 4326:
+        geojson = transform_geom('EPSG:4326', crs, geojson)
+    return geojson
+
+
+def get_geometry_mask(geojson, geometry_hash, crs, transform, shape):
+    """Rasterize geometry into a block of the raster grid.
+
+    Mask is cached by geometry hash, CRS and the transform and shape
+    of the block, so layers that share the same grid do not rasterize
+    the geometry again. Least recently used masks are removed when
+    the cache is larger than MASK_CACHE_MAX_BYTES.
+
+    :param geojson: geometry from get_projected_geometry
+    :type geojson: dict
+    :param geometry_hash: hash from get_geometry_hash
+    :type geometry_hash: str
+    :param crs: CRS of the grid
+    :type crs: rasterio.crs.CRS
+    :param transform: affine transform of the block
+    :type transform: affine.Affine
+    :param shape: height and width of the block
+    :type shape: tuple
+    :return: boolean array, True if pixel centre is inside geometry
+    :rtype: numpy.ndarray
+    """
+    global _mask_cache_bytes
+    key = (geometry_hash, str(crs), tuple(transform)[:6], tuple(shape))
+    mask = _mask_cache.get(key)
+    if mask is not None:
+        _mask_cache.move_to_end(key)
+        return mask
+    mask = geometry_mask(
+        [geojson], out_shape=shape, transform=transform, invert=True)
+    _mask_cache[key] = mask
+    _mask_cache_bytes += mask.nbytes
+    while _mask_cache_bytes > MASK_CACHE_MAX_BYTES:
+        _, removed = _mask_cache.popitem(last=False)
+        _mask_cache_bytes -= removed.nbytes
+    return mask
+
+
+def clear_mask_cache():
+    """Remove all cached geometry masks."""
+    global _mask_cache_bytes
+    _mask_cache.clear()
+    _mask_cache_bytes = 0
+
+
+def get_block_windows(dataset, window, band=1):
+    """Split window into the internal blocks of the band.
+
+    Returns the same blocks as dataset.block_windows, cropped to the
+    window, without iterating the blocks outside of the window.
+
+    :param dataset: opened raster dataset
+    :type dataset: rasterio.DatasetReader
+    :param window: window from get_bbox_window
+    :type window: Window
+    :param band: band index
+    :type band: int
+    :return: generator of windows
+    :rtype: generator
+    """
+    block_height, block_width = dataset.block_shapes[band - 1]
+    row_stop = window.row_off + window.height
+    col_stop = window.col_off + window.width
+    row = (window.row_off // block_height) * block_height
+    while row < row_stop:
+        row_start = max(row, window.row_off)
+        row_end = min(row + block_height, row_stop)
+        col = (window.col_off // block_width) * block_width
+        while col < col_stop:
+            col_start = max(col, window.col_off)
+            col_end = min(col + block_width, col_stop)
+            yield Window(
+                col_start, row_start,
+                col_end - col_start, row_end - row_start
+            )
+            col += block_width
+        row += block_height
+
+
+def iter_bbox_values(file_path, bbox, band=1, geometry=None,
+                     geometry_hash=None):
+    """Read valid pixel values of raster inside bbox block by block.
+
+    Only one block of values and its geometry mask are kept in memory
+    at a time. Blocks outside of the geometry are not read.
+
+    :param file_path: path to the raster
+    :type file_path: str
+    :param bbox: minx, miny, maxx, maxy in EPSG:4326
+    :type bbox: list
+    :param band: band index
+    :type band: int
+    :param geometry: optional multipolygon in EPSG:4326 inside bbox,
+        only pixels whose centre is inside the geometry are read
+    :type geometry: GEOSGeometry
+    :param geometry_hash: hash of geometry to cache the mask
+    :type geometry_hash: str
+    :return: generator of 1-D arrays of values that are not nodata or NaN
+    :rtype: generator
+    """
+    with rasterio.open(file_path) as dataset:
+        window = get_bbox_window(dataset, bbox)
+        if window is None:
+            return
+        geojson = None
+        if geometry is not None:
+            if geometry_hash is None:
+                geometry_hash = get_geometry_hash(geometry)
+            geojson = get_projected_geometry(geometry, dataset.crs)
+        for block in get_block_windows(dataset, window, band):
+            mask = None
+            if geojson is not None:
+                mask = get_geometry_mask(
+                    geojson,
+                    geometry_hash,
+                    dataset.crs,
+                    dataset.window_transform(block),
+                    (block.height, block.width)
+                )
+                if not mask.any():
+                    continue
+            data = dataset.read(band, window=block, masked=True)
+            valid = ~np.ma.getmaskarray(data)
+            if mask is not None:
+                valid &= mask
+            values = data.data[valid].astype('float64')
+            values = values[np.isfinite(values)]
+            if values.size > 0:
+                yield values
+
+
+class StatisticsAccumulator(object):
+    """Accumulate statistics of pixel values block by block.
+
+    Count, sum, sum of squared differences from the mean, min and max
+    are combined from each block. Values are only kept when median,
+    percentile or histogram is requested. Histogram bins are between
+    min and max of all values, so it is counted from the kept values.
+    """
+
+    def __init__(self, statistics, bins=DEFAULT_HISTOGRAM_BINS):
+        """Initialize StatisticsAccumulator class.
+
+        :param statistics: statistics from parse_statistics
+        :type statistics: list
+        :param bins: number of histogram bins
+        :type bins: int
+        """
+        self.statistics = statistics
+        self.bins = bins
+        self.percentiles = [
+            stat for stat in statistics if PERCENTILE_PATTERN.match(stat)
+        ]
+        self.keep_values = (
+            bool(self.percentiles) or
+            'median' in statistics or
+            HISTOGRAM in statistics
+        )
+        self.count = 0
+        self.sum = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.values = []
+
+    def add(self, values):
+        """Add block of valid pixel values.
+
+        :param values: 1-D array of valid pixel values
+        :type values: numpy.ndarray
+        """
+        count = int(values.size)
+        if count == 0:
+            return
+        block_sum = float(values.sum())
+        if 'std' in self.statistics:
+            block_mean = block_sum / count
+            block_m2 = float(np.square(values - block_mean).sum())
+            if self.count > 0:
+                # combine variance of the blocks (Chan et al.)
+                delta = block_mean - self.sum / self.count
+                block_m2 += (
+                    delta ** 2 * self.count * count / (self.count + count)
+                )
+            self.m2 += block_m2
+        block_min = float(values.min())
+        block_max = float(values.max())
+        self.min = block_min if self.min is None else min(
+            self.min, block_min)
+        self.max = block_max if self.max is None else max(
+            self.max, block_max)
+        self.count += count
+        self.sum += block_sum
+        if self.keep_values:
+            self.values.append(values)
+
+    def get_result(self):
+        """Return the requested statistics.
+
+        :return: dictionary of statistic name and its value, value is None
+            when there is no valid pixel except count
+        :rtype: dict
+        """
+        result = {}
+        values = None
+        if self.count > 0 and self.keep_values:
+            values = np.concatenate(self.values)
+        if values is not None and self.percentiles:
+            percentile_values = np.percentile(
+                values,
+                [int(PERCENTILE_PATTERN.match(stat).group(1))
+                 for stat in self.percentiles]
+            )
+            for stat, stat_value in zip(
+                    self.percentiles, percentile_values):
+                result[stat] = float(stat_value)
+        for stat in self.statistics:
+            if stat == 'count':
+                result[stat] = self.count
+            elif self.count == 0:
+                result[stat] = None
+            elif stat == MEAN:
+                result[stat] = self.sum / self.count
+            elif stat == 'min':
+                result[stat] = self.min
+            elif stat == 'max':
+                result[stat] = self.max
+            elif stat == 'sum':
+                result[stat] = self.sum
+            elif stat == 'std':
+                result[stat] = math.sqrt(self.m2 / self.count)
+            elif stat == 'median':
+                result[stat] = float(np.median(values))
+            elif stat == HISTOGRAM:
+                counts, edges = np.histogram(
+                    values, bins=self.bins, range=(self.min, self.max))
+                result[stat] = {
+                    'edges': edges.tolist(),
+                    'counts': counts.tolist()
+                }
+        return {stat: result[stat] for stat in self.statistics}
+
+
+def calculate_statistics(values, statistics,
+                         bins=DEFAULT_HISTOGRAM_BINS):
+    """Calculate statistics from pixel values.
+
+    :param values: 1-D array of valid pixel values
+    :type values: numpy.ndarray
+    :param statistics: statistics from parse_statistics
+    :type statistics: list
+    :param bins: number of histogram bins
+    :type bins: int
+    :return: dictionary of statistic name and its value, value is None
+        when there is no valid pixel except count
+    :rtype: dict
+    """
+    accumulator = StatisticsAccumulator(statistics, bins=bins)
+    accumulator.add(values)
+    return accumulator.get_result()
+
+
+def calculate_raster_statistics(file_path, bbox, statistics,
+                                bins=DEFAULT_HISTOGRAM_BINS,
+                                geometry=None, geometry_hash=None):
+    """Calculate zonal statistics of raster within bbox block by block.
+
+    Each block is read once and added to StatisticsAccumulator.
+
+    :param file_path: path to the raster
+    :type file_path: str
+    :param bbox: minx, miny, maxx, maxy in EPSG:4326
+    :type bbox: list
+    :param statistics: statistics from parse_statistics
+    :type statistics: list
+    :param bins: number of histogram bins
+    :type bins: int
+    :param geometry: optional multipolygon in EPSG:4326 inside bbox
+    :type geometry: GEOSGeometry
+    :param geometry_hash: hash of geometry to cache the mask
+    :type geometry_hash: str
+    :return: dictionary of statistic name and its value
+    :rtype: dict
+    """
+    accumulator = StatisticsAccumulator(statistics, bins=bins)
+    for values in iter_bbox_values(
+            file_path, bbox, geometry=geometry,
+            geometry_hash=geometry_hash):
+        accumulator.add(values)
+    return accumulator.get_result()
@@ -9,12 +9,13 @@ echo "STARTING WORKER COMMAND $(date)"
 echo "-----------------------------------------------------"
 
 CPLUS_C=${CPLUS_QUEUE_CONCURRENCY:-1}
+CPLUS_FAST_C=${CPLUS_FAST_QUEUE_CONCURRENCY:-1}
 
 # remove pids
-rm -f /var/run/celery/cplus.pid
+rm -f /var/run/celery/cplus.pid /var/run/celery/cplus_fast.pid
 
-# start cplus workers
-celery -A core multi start cplus -c:cplus $CPLUS_C -Q:cplus cplus -l INFO --logfile=/proc/1/fd/1 --statedb=/var/run/celery/%n.state
+# start cplus workers, cplus_fast is for scenario with small extent
+celery -A core multi start cplus cplus_fast -c:cplus $CPLUS_C -c:cplus_fast $CPLUS_FAST_C -Q:cplus cplus -Q:cplus_fast cplus_fast -l INFO --logfile=/proc/1/fd/1 --statedb=/var/run/celery/%n.state
 
 # start default worker
 celery -A core worker -l INFO --logfile=/proc/1/fd/1